@@ -5,15 +5,120 @@ import json
 import logging
 import os
 import re
+import select
+import socket
 import tempfile
-from dns import rdatatype, rdataclass
-from unbound import ub_ctx
+import threading
+import time
+from Queue import Queue, Empty
 
 # Local Import(s)
-from namecoin import NamecoinClient
+from admission import AdmissionController, OverloadException, PRIORITY_INTERACTIVE, PRIORITY_REFRESH
+from backends import CacheBackend, MemcachedCache, MemoryCacheBackend
+from bloom import BloomFilter, NameIndex
+from cache import TTLCache
+from hotset import HeavyHitters
+from prefetch import PrefetchPolicy
+from namecoin import NamecoinClient, NamecoinException, load_requests
+from pending import PendingUpdateWatcher
+from records import Delegation, NamecoinRecord
+from shm import SharedMemoryCache
+from stats import LatencyTracker
+import wire
 
 # Setup Logging
-log = logging.getLogger()
+log = logging.getLogger(__name__)
+
+# pyUnbound is imported on first use (see load_unbound) to keep "import bcresolver" cheap
+ub_ctx = None
+
+# Precomputed RR Type / Class values so common queries do not need dns.rdatatype / dns.rdataclass
+RDATATYPE = {
+    'A': 1,
+    'NS': 2,
+    'CNAME': 5,
+    'SOA': 6,
+    'PTR': 12,
+    'MX': 15,
+    'TXT': 16,
+    'AAAA': 28,
+    'SRV': 33,
+    'DS': 43,
+    'RRSIG': 46,
+    'NSEC': 47,
+    'DNSKEY': 48,
+    'NSEC3': 50,
+    'TLSA': 52,
+    'ANY': 255
+}
+RDATACLASS_IN = 1
+QTYPE_NAMES = dict([(rrtype, qtype) for qtype, rrtype in RDATATYPE.items()])
+
+# Query types that can be answered from Namecoin value data (ip, ip6, alias)
+NATIVE_QTYPES = ('A', 'AAAA', 'CNAME')
+
+# Nameserver address lookups
+NS_ADDRESS_QTYPES = ('A', 'AAAA')
+
+# TTL of answers served stale, per RFC 8767
+STALE_ANSWER_TTL = 30
+
+def load_unbound():
+    '''
+
+    Import pyUnbound on first use
+
+    :return: ub_ctx class
+    '''
+
+    global ub_ctx
+    if ub_ctx is None:
+        from unbound import ub_ctx
+    return ub_ctx
+
+def get_result_ttl(result):
+    '''
+
+    Get the TTL of a resolution result
+
+    :param result: Unbound result object
+    :return: TTL in seconds, None if the result does not carry one
+    '''
+
+    ttl = getattr(result, 'ttl', None)
+    return ttl if isinstance(ttl, (int, long)) else None
+
+def is_ip_address(value):
+    '''
+
+    Check whether a string is an IPv4 or IPv6 address
+
+    :param value: String to check
+    :return: Boolean
+    '''
+
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, value)
+            return True
+        except (socket.error, ValueError):
+            pass
+    return False
+
+def rdatatype_from_text(qtype):
+    '''
+
+    Convert a query type string to its numeric RR Type, falling back to dnspython for uncommon types
+
+    :param qtype: String representation of query type (for example: A, AAAA, TXT)
+    :return: Numeric RR Type
+    '''
+
+    if qtype in RDATATYPE:
+        return RDATATYPE[qtype]
+
+    from dns import rdatatype
+    return rdatatype.from_text(qtype)
 
 class NamecoinValueException(BaseException):
     pass
@@ -36,31 +141,207 @@ class BogusResultException(BaseException):
 class EmptyResultException(BaseException):
     pass
 
+class NXDomainException(EmptyResultException):
+    pass
+
+class ResolutionTimeoutException(BaseException):
+    pass
+
+class ImportChainException(NamecoinValueException):
+    pass
+
+# Failures after which expired Namecoin records / answers are served stale
+STALE_NAMECOIN_ERRORS = (NamecoinException, ResolutionTimeoutException)
+STALE_ANSWER_ERRORS = (NamecoinException, ResolutionTimeoutException, InvalidNameserverException, OverloadException)
+
+class Deadline:
+
+    def __init__(self, seconds):
+        '''
+
+        Initialize a Deadline: a time budget shared by every stage of one resolution
+
+        :param seconds: Time budget in seconds
+        :return: Deadline object
+        '''
+
+        self.expires = time.time() + seconds
+
+    def remaining(self):
+        '''
+
+        :return: Seconds left in the budget (0 once it is spent)
+        '''
+
+        return max(0.0, self.expires - time.time())
+
+    def check(self, stage):
+        '''
+
+        Raise ResolutionTimeoutException if the budget is spent
+
+        :param stage: Description of the stage about to start (used in the exception message)
+        :return: Seconds left in the budget
+        '''
+
+        remaining = self.remaining()
+        if remaining <= 0:
+            log.info('Resolution Deadline Exceeded Before: %s' % stage)
+            raise ResolutionTimeoutException('Resolution deadline exceeded before %s' % stage)
+        return remaining
+
 class LocalNamecoinResolver:
 
-    def __init__(self, host, user, password, port):
+    def __init__(self, host, user, password, port, hedge_percentile=None, hedge_hosts=None, hedge_min_samples=20):
+        '''
+
+        Initialize a LocalNamecoinResolver object
+
+        :param host: Namecoin Node Hostname (DNS Name or IP Address)
+        :param user: Namecoin Node Username
+        :param password: Namecoin Node Password
+        :param port: Namecoin Node Port (Default is 8336)
+        :param hedge_percentile: Send a second, identical name_show request if the first has not finished within this latency percentile (for example: 0.95). None disables hedging
+        :param hedge_hosts: List of (host, port) endpoints used for hedged requests, in rotation (Default is a new connection to host / port)
+        :param hedge_min_samples: Number of latency samples required before requests are hedged
+        :return: LocalNamecoinResolver object
+        '''
 
         self.host = host if host else '127.0.0.1'
         self.user = user if user else ''
         self.password = password if password else ''
         self.port = port if port else 8336
 
-    def name_show(self, name):
+        self.hedge_percentile = hedge_percentile
+        self.hedge_hosts = list(hedge_hosts) if hedge_hosts else [(self.host, self.port)]
+        self.latency = LatencyTracker(min_samples=hedge_min_samples)
+        self.stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0}
+
+        self._hedge_index = 0
+        self._stats_lock = threading.Lock()
+
+    def warm(self):
+        '''
+
+        Import the HTTP client library ahead of the first name_show call
+
+        :return: None
+        '''
+
+        load_requests()
+
+    def name_show(self, name, timeout=None):
+
+        if not self.hedge_percentile:
+            return self._name_show(self.host, self.port, name, timeout)
+
+        return self._hedged_name_show(name, timeout)
+
+    def _name_show(self, host, port, name, timeout=None):
 
         client = NamecoinClient(
-            host=self.host,
-            port=self.port,
+            host=host,
+            port=port,
             user=self.user,
             password=self.password,
-            timeout=60
+            timeout=60 if timeout is None else min(60, timeout)
         )
 
         # Get Namecoin-based Domain Info from Namecoin Blockchain
         return client.get_domain(name)
 
+    def _count(self, stat):
+
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def _hedged_name_show(self, name, timeout=None):
+        '''
+
+        Run name_show, sending a second identical request to the next hedge endpoint if the first has not finished within
+        the configured latency percentile. The first successful reply wins and the other one is dropped. Both requests
+        share the timeout: the hedged request only gets what is left of it.
+
+        :param name: Namecoin-based Domain Name (without the d/ prefix)
+        :param timeout: Request timeout in seconds (None for the default)
+        :return: name_show result
+        '''
+
+        replies = Queue()
+        expires = time.time() + timeout if timeout is not None else None
+
+        def remaining():
+            return None if expires is None else max(0.0, expires - time.time())
+
+        def fetch(host, port, hedged, timeout):
+            start = time.time()
+            try:
+                response = self._name_show(host, port, name, timeout)
+            except BaseException as e:
+                replies.put((False, hedged, e))
+                return
+            self.latency.record(time.time() - start)
+            replies.put((True, hedged, response))
+
+        def start(host, port, hedged, timeout):
+            thread = threading.Thread(target=fetch, args=(host, port, hedged, timeout))
+            thread.daemon = True
+            thread.start()
+
+        def wait(seconds=None):
+            left = remaining()
+            if left is not None and (seconds is None or left < seconds):
+                seconds = left
+            return replies.get(timeout=seconds) if seconds is not None else replies.get()
+
+        def timed_out():
+            log.info('Namecoin name_show Timed Out: d/%s' % name)
+            return NamecoinException('Namecoin name_show timed out', 500)
+
+        self._count('requests')
+        hedge_delay = self.latency.percentile(self.hedge_percentile)
+        start(self.host, self.port, False, timeout)
+
+        outstanding = 1
+        try:
+            reply = wait(hedge_delay)
+        except Empty:
+            if hedge_delay is None or remaining() == 0:
+                raise timed_out()
+
+            with self._stats_lock:
+                host, port = self.hedge_hosts[self._hedge_index % len(self.hedge_hosts)]
+                self._hedge_index += 1
+                self.stats['hedged'] += 1
+
+            log.debug('Hedging name_show Request for d/%s to %s:%d After %.3fs' % (name, host, port, hedge_delay))
+            start(host, port, True, remaining())
+            outstanding = 2
+            try:
+                reply = wait()
+            except Empty:
+                raise timed_out()
+
+        # If the first reply is an error, wait for the other request (if any) before giving up
+        if not reply[0] and outstanding == 2:
+            try:
+                other = wait()
+            except Empty:
+                raise timed_out()
+            if other[0]:
+                reply = other
+
+        success, hedged, response = reply
+        if not success:
+            raise response
+
+        if hedged:
+            self._count('hedge_wins')
+        return response
+
 class NamecoinResolver:
 
-    def __init__(self, resolv_conf='/etc/resolv.conf', dnssec_root_key='/usr/local/etc/unbound/root.key', host=None, user=None, password=None, port=8336, temp_dir=None, nc_name_resolver=LocalNamecoinResolver):
+    def __init__(self, resolv_conf='/etc/resolv.conf', dnssec_root_key='/usr/local/etc/unbound/root.key', host=None, user=None, password=None, port=8336, temp_dir=None, nc_name_resolver=LocalNamecoinResolver, nc_name_resolver_options=None, nc_cache_ttl=60, nc_cache_size=10000, nc_cache_bytes=8*1024*1024, answer_cache_size=100000, answer_cache_bytes=32*1024*1024, native_records=False, serve_stale=0, stale_answer_timeout=1.8, max_concurrent=None, max_queue=256, engine='unbound', shared_cache=None, max_chain_depth=4, name_index=None, prefetch=None, zone_mirror=None, heavy_hitters=None):
         '''
 
         Initialize a NamecoinResolver object
@@ -70,13 +351,111 @@ class NamecoinResolver:
         :param password: Namecoin Node Password
         :param port: Namecoin Node Port (Default is 8336)
         :param temp_dir: Directory for temporary Unbound config files. We suggest a ramdisk-backed volume
+        :param nc_name_resolver: Class used to look up Namecoin names (Default is LocalNamecoinResolver)
+        :param nc_name_resolver_options: Dict of additional keyword arguments for nc_name_resolver (for example: hedge_percentile)
+        :param nc_cache_ttl: Seconds to cache Namecoin records and delegations (0 disables caching)
+        :param nc_cache_size: Maximum number of cached Namecoin records (and of cached delegations, import / delegate chains and nameserver addresses)
+        :param nc_cache_bytes: Memory budget in bytes for cached Namecoin records (and for cached delegations, import / delegate chains and nameserver addresses)
+        :param answer_cache_size: Maximum number of cached validated answers (and of cached wire-format responses)
+        :param answer_cache_bytes: Memory budget in bytes for cached validated answers (and for cached wire-format responses)
+        :param native_records: Answer A, AAAA and CNAME queries from ip, ip6, map and alias data stored in the Namecoin value
+        :param serve_stale: Seconds expired Namecoin records and answers are kept and served when a refresh fails (RFC 8767). 0 disables serve-stale
+        :param stale_answer_timeout: Seconds to wait for a refresh before serving stale data (the refresh continues in the background)
+        :param max_concurrent: Maximum number of uncached resolutions running at once (None disables admission control)
+        :param max_queue: Maximum number of resolutions waiting for a slot before OverloadException is raised
+        :param engine: DNSSEC validation engine: 'unbound' (pyUnbound, Default), 'dnspython' (direct queries validated with dns.dnssec, no pyUnbound required) or an engine object with the DnspythonEngine interface
+        :param shared_cache: CacheBackend used as a second level for Namecoin records, delegations and answers behind the process-local caches: a SharedMemoryCache shared by the worker processes on the host, or a MemcachedCache shared by every node (None for process-local caches only)
+        :param max_chain_depth: Maximum number of import / delegate links followed from a Namecoin name
+        :param name_index: NameIndex of registered d/ names; names it reports as definitely unregistered fail with NamecoinValueException without a name_show call (None to always call name_show)
+        :param prefetch: PrefetchPolicy queueing likely follow-up queries after each successful resolve() (None disables prefetching)
+        :param zone_mirror: ZoneMirror transferring heavily queried zones with AXFR and answering resolve() / resolve_all() queries for them from the validated copy (None always queries the nameservers)
+        :param heavy_hitters: HeavyHitters counting the SLDs and queries resolve() is asked for; its top entries are pinned in the caches and refreshed ahead of expiry once HeavyHitters.start() is called (None disables tracking)
         :return: NamecoinResolver object
         '''
 
         self.resolv_conf = resolv_conf
         self.dnssec_root_key = dnssec_root_key
         self.temp_dir = temp_dir
-        self.nc_name_resolver = nc_name_resolver(host, user, password, port)
+        self.nc_name_resolver = nc_name_resolver(host, user, password, port, **(nc_name_resolver_options or {}))
+        self.nc_cache = TTLCache(ttl=nc_cache_ttl, max_entries=nc_cache_size, max_bytes=nc_cache_bytes, stale_ttl=serve_stale, shared=shared_cache, namespace='nc')
+        self.delegation_cache = TTLCache(ttl=nc_cache_ttl, max_entries=nc_cache_size, max_bytes=nc_cache_bytes, shared=shared_cache, namespace='delegation')
+        self.answer_cache = TTLCache(max_entries=answer_cache_size, max_bytes=answer_cache_bytes, stale_ttl=serve_stale, shared=shared_cache, namespace='answer')
+        self.wire_cache = TTLCache(max_entries=answer_cache_size, max_bytes=answer_cache_bytes, shared=shared_cache, namespace='wire')
+        self.ns_address_cache = TTLCache(max_entries=nc_cache_size, max_bytes=nc_cache_bytes, shared=shared_cache, namespace='ns')
+        self.chain_cache = TTLCache(ttl=nc_cache_ttl, max_entries=nc_cache_size, max_bytes=nc_cache_bytes, shared=shared_cache, namespace='chain')
+        self.max_chain_depth = max_chain_depth
+        self.name_index = name_index
+        self.prefetch = prefetch
+        self.zone_mirror = zone_mirror
+        self.heavy_hitters = heavy_hitters
+        self.native_records = native_records
+        self.serve_stale = serve_stale
+        self.stale_answer_timeout = stale_answer_timeout
+        self.admission = AdmissionController(max_concurrent, max_queue) if max_concurrent else None
+
+        if engine == 'dnspython':
+            from dnssec import DnspythonEngine
+            self.engine = DnspythonEngine(resolv_conf)
+        elif engine == 'unbound':
+            self.engine = None
+        elif not isinstance(engine, basestring):
+            self.engine = engine
+        else:
+            raise ValueError('Unknown DNSSEC Engine: %s' % engine)
+
+        self._refreshes = {}
+        self._refresh_lock = threading.Lock()
+
+        # Linked SLD -> set of SLDs whose memoized chain includes it
+        self._chain_dependents = {}
+        self._chain_lock = threading.Lock()
+
+        self._ns_ctx = None
+        self._ns_ctx_lock = threading.Lock()
+
+    def warm(self):
+        '''
+
+        Move one-time initialization cost out of the first query: import pyUnbound and requests, and build the
+        shared Unbound context (or the dnspython engine's stub resolver) used for nameserver address lookups
+
+        :return: None
+        '''
+
+        if hasattr(self.nc_name_resolver, 'warm'):
+            self.nc_name_resolver.warm()
+
+        if self.engine is not None:
+            self.engine.warm()
+        else:
+            load_unbound()
+            self._get_ns_ctx()
+
+    def _get_ns_ctx(self):
+        '''
+
+        Get (building on first use) the Unbound context used to look up nameserver addresses
+
+        :return: ub_ctx object
+        '''
+
+        if self._ns_ctx is not None:
+            return self._ns_ctx
+
+        with self._ns_ctx_lock:
+            if self._ns_ctx is None:
+                ns_ctx = load_unbound()()
+                ns_ctx.resolvconf(self.resolv_conf)
+
+                if not os.path.isfile(self.dnssec_root_key):
+                    log.error("Trust anchor missing or inaccessible")
+                    raise Exception("Trust anchor is missing or inaccessible: %s" % self.dnssec_root_key)
+                else:
+                    ns_ctx.add_ta_file(self.dnssec_root_key)
+
+                self._ns_ctx = ns_ctx
+
+        return self._ns_ctx
 
     def _build_temp_unbound_config(self, zone, nameserver):
         '''
@@ -133,27 +512,13 @@ forward-zone:
             log.error('Unable to Remove Temp Unbound Config File: %s' % str(e))
             return False
 
-    def resolve(self, name, qtype):
+    def _split_name(self, name):
         '''
 
-        Resolves a Blockchain-based (Namecoin) DNS Name via 2 step process using DNSSEC
-
-        Step 1:
-        -------
-        Get NS and DS records for the Namecoin name (for example: www.mattdavid.bit) from the Namecoin Client
-
-        Step 2:
-        -------
-        For each listed nameserver:
-
-            - Create a temporary config file for use with unbound
-            - Set Unbound's Trust Anchor to be the given DS records for the Namecoin-based domain name
-            - Do DNSSEC-enabled DNS resolution for the given name / qtype
-
+        Validate a .bit name and split it into its labels (TLD first)
 
         :param name: DNS Record Name Query (for example: www.mattdavid.bit)
-        :param qtype: String representation of query type (for example: A, AAAA, TXT, NS, SOA, etc...)
-        :return: Resolved value if successful, None if un-successful
+        :return: Tuple of (name without trailing dot, reversed list of labels)
         '''
 
         name = name.rstrip('.')
@@ -165,104 +530,930 @@ forward-zone:
         if len(domains) < 2:
             raise ValueError('At least SLD Required')
 
+        return name, domains
+
+    def _get_nc_record(self, sld, deadline=None):
+        '''
+
+        Get the Namecoin record for a Second Level Domain, using the Namecoin record cache
+
+        :param sld: Second Level Domain label (for example: mattdavid)
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :return: NamecoinRecord object
+        '''
+
+        nc_record = self.nc_cache.get(sld)
+        if nc_record is not None:
+            return nc_record
+
+        if self.serve_stale:
+            nc_record = self.nc_cache.get_stale(sld)
+            if nc_record is not None:
+                return self._refresh_or_stale(('nc', sld), nc_record, lambda: self._fetch_nc_record(sld, deadline), STALE_NAMECOIN_ERRORS)
+
+        return self._fetch_nc_record(sld, deadline)
+
+    def _refresh_or_stale(self, key, stale, fetch, stale_errors):
+        '''
+
+        Refresh an expired cache entry, falling back to its stale value (RFC 8767) if the refresh fails with one of
+        stale_errors, returns no data, or does not finish within stale_answer_timeout. A refresh that outlasts the timeout
+        keeps running in the background and updates the cache when it completes. Concurrent refreshes of one key are
+        coalesced.
+
+        :param key: Refresh key
+        :param stale: Value returned when the refresh does not succeed in time
+        :param fetch: Function performing the refresh (and updating the cache)
+        :param stale_errors: Tuple of exception classes that lead to serving the stale value
+        :return: Refreshed or stale value
+        '''
+
+        with self._refresh_lock:
+            refresh = self._refreshes.get(key)
+            if refresh is None:
+                refresh = {'done': threading.Event()}
+                self._refreshes[key] = refresh
+
+                thread = threading.Thread(target=self._run_refresh, args=(key, refresh, fetch))
+                thread.daemon = True
+                thread.start()
+
+        refresh['done'].wait(self.stale_answer_timeout)
+
+        error = refresh.get('error')
+        if error is not None and not isinstance(error, stale_errors):
+            raise error
+
+        value = refresh.get('value')
+        if value is None:
+            log.info('Serving Stale Data for %s: %s' % (str(key), error.__class__.__name__ if error else 'refresh pending'))
+            return stale
+
+        return value
+
+    def _run_refresh(self, key, refresh, fetch):
+
+        try:
+            refresh['value'] = fetch()
+        except BaseException as e:
+            refresh['error'] = e
+        finally:
+            with self._refresh_lock:
+                self._refreshes.pop(key, None)
+            refresh['done'].set()
+
+    def _fetch_nc_record(self, sld, deadline=None):
+        '''
+
+        Fetch the Namecoin record for a Second Level Domain from the Namecoin Blockchain and cache it
+
+        :param sld: Second Level Domain label (for example: mattdavid)
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :return: NamecoinRecord object
+        '''
+
+        if self.name_index is not None and not self.name_index.might_exist(sld):
+            log.info('Namecoin Name Not Registered (Name Index): d/%s' % sld)
+            raise NamecoinValueException('Name Not Registered: d/%s' % sld)
+
         # Get Namecoin-based Domain Info from Namecoin Blockchain
-        nc_domain = self.nc_name_resolver.name_show(domains[1])
+        if deadline is None:
+            nc_domain = self.nc_name_resolver.name_show(sld)
+        else:
+            try:
+                nc_domain = self.nc_name_resolver.name_show(sld, timeout=deadline.check('Namecoin name_show'))
+            except NamecoinException:
+                if not deadline.remaining():
+                    log.info('Resolution Deadline Exceeded During: Namecoin name_show')
+                    raise ResolutionTimeoutException('Resolution deadline exceeded during Namecoin name_show')
+                raise
+
         if not nc_domain or not nc_domain.get('value'):
-            log.error('No Name Value Data Found for Namecoin-based Domain Name: d/%s' % domains[1])
-            raise NamecoinValueException('No Name Value Data Found for: d/%s' % domains[1])
+            log.error('No Name Value Data Found for Namecoin-based Domain Name: d/%s' % sld)
+            raise NamecoinValueException('No Name Value Data Found for: d/%s' % sld)
+
+        nc_record = NamecoinRecord(json.loads(nc_domain.get('value', '{}').replace('\'','"')))
+        if self._chain_dependents and nc_record != self.nc_cache.get_stale(sld):
+            self._invalidate_chains(sld)
+
+        self.nc_cache.set(intern(sld) if isinstance(sld, str) else sld, nc_record)
+        return nc_record
+
+    def _get_resolved_record(self, sld, deadline=None):
+        '''
+
+        Get the Namecoin record for a Second Level Domain with its import and delegate chain applied, using the chain
+        cache. Every linked name is fetched through the Namecoin record cache, so names importing a common record share
+        one fetch of it.
+
+        :param sld: Second Level Domain label (for example: mattdavid)
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :return: NamecoinRecord object
+        '''
+
+        nc_record = self._get_nc_record(sld, deadline)
+        if not nc_record.links():
+            return nc_record
+
+        # A memoized chain is used as long as every record it read is still cached; once one has expired the chain is
+        # resolved again, re-fetching that record (and invalidating dependents if it changed)
+        chain = self.chain_cache.get(sld)
+        if chain is not None and all([link in self.nc_cache for link in chain[1]]):
+            return chain[0]
+
+        linked = set([sld])
+        resolved = self._resolve_chain(nc_record, deadline, (sld,), linked)
+
+        with self._chain_lock:
+            for link in linked:
+                self._chain_dependents.setdefault(link, set()).add(sld)
+        self.chain_cache.set(sld, (resolved, tuple(linked)))
+        return resolved
+
+    def _resolve_chain(self, nc_record, deadline, path, linked):
+        '''
+
+        Apply a record's delegate (which replaces the record) or imports (earlier imports win over later ones, the
+        record's own items win over all of them), recursively
 
-        nc_value = json.loads(nc_domain.get('value', '{}').replace('\'','"'))
-        if not nc_value.get('ds'):
+        :param nc_record: NamecoinRecord object
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :param path: Tuple of SLDs followed so far, for cycle and depth checks
+        :param linked: Set collecting every SLD the chain reads
+        :return: NamecoinRecord object without imports or delegate
+        '''
+
+        if nc_record.delegate:
+            return self._resolve_link(nc_record.delegate, deadline, path, linked)
+
+        resolved = nc_record
+        for link in nc_record.imports:
+            resolved = resolved.merge(self._resolve_link(link, deadline, path, linked))
+        return resolved
+
+    def _resolve_link(self, link, deadline, path, linked):
+        '''
+
+        Fetch and resolve one import or delegate target
+
+        :param link: Tuple of (Namecoin name, selector)
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :param path: Tuple of SLDs followed so far
+        :param linked: Set collecting every SLD the chain reads
+        :return: NamecoinRecord object
+        '''
+
+        name, selector = link
+        if not name.startswith('d/') or len(name) < 3:
+            log.error('Unsupported Namecoin Import / Delegate Target: %s' % name)
+            raise ImportChainException('Only d/ names can be imported or delegated to: %s' % name)
+
+        sld = name[2:]
+        if sld in path:
+            log.error('Namecoin Import / Delegate Cycle: %s' % ' -> '.join(['d/%s' % x for x in path + (sld,)]))
+            raise ImportChainException('Import / delegate cycle at d/%s' % sld)
+
+        if len(path) > self.max_chain_depth:
+            log.error('Namecoin Import / Delegate Chain Too Deep: d/%s' % path[0])
+            raise ImportChainException('Import / delegate chain of d/%s exceeds %d links' % (path[0], self.max_chain_depth))
+
+        linked.add(sld)
+        nc_record = self._get_nc_record(sld, deadline).select(selector)
+        if nc_record is None:
+            log.error('Namecoin Import / Delegate Selector Not Found: %s in d/%s' % (selector, sld))
+            raise ImportChainException('Selector %s not found in d/%s' % (selector, sld))
+
+        return self._resolve_chain(nc_record, deadline, path + (sld,), linked)
+
+    def _invalidate_chains(self, sld):
+        '''
+
+        Drop the memoized chains (and delegations) of every name whose chain reads sld
+
+        :param sld: Second Level Domain label whose record changed
+        :return: None
+        '''
+
+        with self._chain_lock:
+            dependents = self._chain_dependents.pop(sld, ())
+
+        for dependent in dependents:
+            log.info('Invalidating Namecoin Import Chain of d/%s (d/%s changed)' % (dependent, sld))
+            self.chain_cache.delete(dependent)
+            self.delegation_cache.delete(dependent)
+
+    def _get_delegation(self, name, domains, nc_record):
+        '''
+
+        Get the NS and DS records for a Namecoin-based domain from its Namecoin record, using the delegation cache
+
+        :param name: DNS Record Name Query (for example: www.mattdavid.bit)
+        :param domains: Reversed list of labels for name
+        :param nc_record: NamecoinRecord for the domain's SLD
+        :return: Delegation object
+        '''
+
+        delegation = self.delegation_cache.get(domains[1])
+        if delegation is not None:
+            return delegation
+
+        delegation = self._build_delegation(name, '%s.%s.' % (domains[1], domains[0]), nc_record)
+        self.delegation_cache.set(domains[1], delegation)
+        return delegation
+
+    def _build_delegation(self, name, sld, nc_record):
+        '''
+
+        Parse the NS and DS records of a Namecoin record into a Delegation
+
+        :param name: DNS Record Name Query (for logging)
+        :param sld: Zone name (for example: mattdavid.bit.)
+        :param nc_record: NamecoinRecord for the zone
+        :return: Delegation object
+        '''
+
+        if not nc_record.ds:
             log.error('No DS Records Present for Namecoin-based Domain Name: %s' % name)
             raise NoDSRecordException()
 
-        if not nc_value.get('ns'):
+        if not nc_record.ns:
             log.error('No NS Records Present for Namecoin-based Domain Name: %s' % name)
             raise NoNameserverException()
 
-        sld = '%s.%s.' % (domains[1], domains[0])
-        ds_record = ' '.join([str(x) for x in nc_value['ds'][0][0:3]])
+        ds_record = ' '.join([str(x) for x in nc_record.ds[0][0:3]])
 
         # Handle both Hex and Base64 encoding (Base64 is the preferred encoding) per:
         # https://wiki.namecoin.info/index.php?title=Domain_Name_Specification
-        if re.match('^[0-9a-fA-F]*$', nc_value['ds'][0][3]):
-            ds_record += ' %s' % nc_value['ds'][0][3]
+        if re.match('^[0-9a-fA-F]*$', nc_record.ds[0][3]):
+            ds_record += ' %s' % nc_record.ds[0][3]
         else:
-            ds_record += ' %s' % base64.b64decode(nc_value['ds'][0][3]).encode('hex').upper()
+            ds_record += ' %s' % base64.b64decode(nc_record.ds[0][3]).encode('hex').upper()
 
         ds_ta = '%s IN DS %s' % (sld, ds_record)
 
-        ns_ctx = ub_ctx()
-        ns_ctx.resolvconf(self.resolv_conf)
+        return Delegation(sld, nc_record.ns, ds_ta)
+
+    def _stage_update(self, sld, nc_record):
+        '''
+
+        Prepare a pending Namecoin update for a Second Level Domain without touching the caches in use: apply its import
+        and delegate chain, parse the new delegation, look up the new nameservers' addresses and, if the engine supports
+        it, fetch and validate the zone's DNSKEY set against the new DS record. The DNSKEY set is fetched from each
+        address in turn until it validates. The default Unbound engine builds a validating context per query, so only
+        the address lookups are staged for it.
+
+        :param sld: Second Level Domain label (for example: mattdavid)
+        :param nc_record: NamecoinRecord of the pending value
+        :return: Dict of record, resolved (record with its chain applied), linked (SLDs read), delegation (None if the resolved record has none) and prepared (whether the engine validated the DNSKEY set)
+        '''
+
+        linked = set([sld])
+        resolved = self._resolve_chain(nc_record, None, (sld,), linked) if nc_record.links() else nc_record
+        staged = {'record': nc_record, 'resolved': resolved, 'linked': tuple(linked), 'delegation': None, 'prepared': False}
+
+        if not resolved.ns or not resolved.ds:
+            return staged
+
+        delegation = self._build_delegation('d/%s' % sld, '%s.bit.' % sld, resolved)
+        staged['delegation'] = delegation
+
+        ns_ctx = self._get_ns_ctx() if self.engine is None else None
+        for ns in delegation.ns:
+            addresses = self._get_ns_addresses(ns_ctx, ns)
+            for address in addresses:
+                if staged['prepared'] or not hasattr(self.engine, 'prepare'):
+                    break
+                staged['prepared'] = self.engine.prepare(delegation.sld, address, delegation.ds_ta)
+        return staged
+
+    def _install_update(self, sld, staged):
+        '''
+
+        Swap a staged update (see _stage_update) into the caches once it has confirmed. The delegation is replaced before
+        the Namecoin record, so a resolution never pairs the new record with the old delegation. Answers validated under
+        the old delegation are left in the answer caches until their TTL runs out, as they would be after a DS change in
+        the DNS.
+
+        :param sld: Second Level Domain label
+        :param staged: Dict returned by _stage_update
+        :return: None
+        '''
+
+        if self._chain_dependents and staged['record'] != self.nc_cache.get_stale(sld):
+            self._invalidate_chains(sld)
 
-        if not os.path.isfile(self.dnssec_root_key):
-            log.error("Trust anchor missing or inaccessible")
-            raise Exception("Trust anchor is missing or inaccessible: %s" % self.dnssec_root_key)
+        if staged['record'].links():
+            with self._chain_lock:
+                for link in staged['linked']:
+                    self._chain_dependents.setdefault(link, set()).add(sld)
+            self.chain_cache.set(sld, (staged['resolved'], staged['linked']))
+
+        if staged['delegation'] is not None:
+            self.delegation_cache.set(sld, staged['delegation'])
         else:
-            ns_ctx.add_ta_file(self.dnssec_root_key)
+            self.delegation_cache.delete(sld)
 
-        last_error = None
-        for ns in nc_value.get('ns', []):
+        self.nc_cache.set(intern(sld) if isinstance(sld, str) else sld, staged['record'])
+        log.info('Installed Confirmed Namecoin Update: d/%s' % sld)
 
-            lookup_value = None
+    def _query(self, ctx, name, qtype, rrtype, deadline=None):
+        '''
 
-            status, result = ns_ctx.resolve(ns, rdatatype.from_text('A'), rdataclass.from_text('IN'))
+        Run one Unbound query, bounded by the deadline if one is given
 
-            # NOTE: We do not require secure DNS resolution here because the Blockchain-stored DS records work as the trust anchor
-            # and the signed RRSIG DNS results from the final DNS+DNSSEC lookup will be able to complete the chain of trust
-            if status == 0 and result and result.data and not result.bogus:
-                tmp_config_file = self._build_temp_unbound_config(sld, result.data.as_address_list()[0])
-            else:
-                last_error = InvalidNameserverException()
-                log.warn('No or Invalid Resolution Result for Nameserver: %s' % ns)
-                continue
+        :param ctx: ub_ctx object
+        :param name: DNS Record Name Query
+        :param qtype: String representation of query type
+        :param rrtype: Numeric RR Type
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :return: Tuple of (Unbound status, Unbound result object)
+        '''
 
-            ctx = ub_ctx()
-            ctx.config(tmp_config_file)
-            ctx.add_ta(str(ds_ta))
+        if deadline is None:
+            return ctx.resolve(name, rrtype, RDATACLASS_IN)
 
-            _qtype = None
-            try:
-                _qtype = rdatatype.from_text(qtype)
-            except Exception as e:
-                log.error('Unable to get RDATAType for Given Query Type [%s]: %s' % (qtype, str(e)))
-                raise ValueError('Unable to get RDATAType for Query Type %s' % qtype)
+        return self._query_async(ctx, name, {qtype: rrtype}, deadline)[qtype]
+
+    def _query_async(self, ctx, name, rrtypes, deadline=None):
+        '''
+
+        Send several queries for one name to an Unbound context concurrently and wait for all of them
 
-            status, result = ctx.resolve(name, _qtype, rdataclass.from_text('IN'))
+        :param ctx: ub_ctx object
+        :param name: DNS Record Name Query
+        :param rrtypes: Dict of query type string -> numeric RR Type
+        :param deadline: Deadline object for the resolution (None for no limit). Outstanding queries are cancelled once it is spent
+        :return: Dict of query type string -> (Unbound status, Unbound result object)
+        '''
+
+        replies = {}
+        def callback(qtype, status, result):
+            replies[qtype] = (status, result)
+
+        async_ids = {}
+        for qtype, rrtype in rrtypes.items():
+            status, async_id = ctx.resolve_async(name, qtype, callback, rrtype, RDATACLASS_IN)
             if status != 0:
-                log.info("DNS Resolution Failed: %s [%s]" % (name, _qtype))
-            elif status == 0:
+                log.info("DNS Resolution Failed: %s [%s]" % (name, qtype))
+                replies[qtype] = (status, None)
+            else:
+                async_ids[qtype] = async_id
 
-                if not result.secure:
-                    log.info("DNS Resolution Returned Insecure Result: %s [%s]" % (name, qtype))
-                    last_error = InsecureResultException()
+        if deadline is None:
+            ctx.wait()
+            return replies
 
-                elif result.bogus:
-                    log.info("DNS Resolution Returned Bogus Result: %s [%s]" % (name, qtype))
-                    last_error = BogusResultException()
+        try:
+            while len(replies) < len(rrtypes):
+                remaining = deadline.check('DNS resolution of %s' % name)
 
-                elif not result.havedata:
-                    log.info("DNS Resolution Returned Empty Result: %s [%s]" % (name, qtype))
-                    last_error = EmptyResultException()
+                # Wake up periodically: another thread sharing this context may process our answer
+                if select.select([ctx.fd()], [], [], min(remaining, 0.1))[0]:
+                    ctx.process()
+        except ResolutionTimeoutException:
+            for qtype, async_id in async_ids.items():
+                if qtype not in replies:
+                    ctx.cancel(async_id)
+            raise
 
-                else:
-                    # Get appropriate data by query type
-                    if qtype in ['A','AAAA']:
-                        lookup_value = result.data.as_address_list()
-                    elif qtype in ['CNAME','TXT']:
-                        lookup_value = result.data.as_domain_list()
-                    elif qtype in ['MX']:
-                        lookup_value = result.data.as_mx_list()
-                    else:
-                        last_error = NotImplementedError('Unsupported DNS Query Type: %s' % qtype)
+        return replies
+
+    def _query_nameserver(self, delegation, address, name, rrtypes, deadline=None, concurrent=False):
+        '''
 
+        Send queries for one name to a nameserver of the delegation, validating the answers against the delegation's
+        DS record with the configured engine
+
+        :param delegation: Delegation object for the name's zone
+        :param address: Nameserver IP Address
+        :param name: DNS Record Name Query
+        :param rrtypes: Dict of query type string -> numeric RR Type (a single entry unless concurrent)
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :param concurrent: Send the Unbound queries asynchronously, even if there is a single one
+        :return: Dict of query type string -> (status, result object)
+        '''
+
+        if self.engine is not None:
+            replies = {}
+            for qtype, rrtype in rrtypes.items():
+                timeout = deadline.check('DNS resolution of %s' % name) if deadline else None
+                replies[qtype] = self.engine.query(delegation.sld, address, delegation.ds_ta, name, rrtype, timeout)
+            return replies
+
+        tmp_config_file = self._build_temp_unbound_config(delegation.sld, address)
+        try:
+            ctx = self._build_validating_ctx(tmp_config_file, delegation.ds_ta)
+            if not concurrent:
+                qtype, rrtype = rrtypes.items()[0]
+                return {qtype: self._query(ctx, name, qtype, rrtype, deadline)}
+            return self._query_async(ctx, name, rrtypes, deadline)
+        finally:
             self._delete_temp_unbound_config(tmp_config_file)
 
-            if lookup_value:
-                return lookup_value[0]
+    def _get_ns_addresses(self, ns_ctx, ns, deadline=None):
+        '''
+
+        Get the IPv4 and IPv6 addresses of a nameserver, caching them for the TTL of their A / AAAA records. Nameservers
+        given as IP addresses are used as-is.
 
-            if last_error and isinstance(last_error, NotImplementedError):
-                raise last_error
+        :param ns_ctx: Unbound context used for nameserver lookups
+        :param ns: Nameserver hostname or IP address (from the Namecoin value)
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :return: List of IP Addresses of the nameserver (IPv4 first), empty if resolution failed
+        '''
+
+        if is_ip_address(ns):
+            return [ns]
+
+        addresses = self.ns_address_cache.get(ns.lower())
+        if addresses is not None:
+            return list(addresses)
+
+        if self.engine is not None:
+            addresses, ttl = self.engine.resolve_addresses(ns, deadline.check('nameserver %s' % ns) if deadline else None)
+        else:
+            if deadline is None:
+                replies = dict([(qtype, self._query(ns_ctx, ns, qtype, RDATATYPE[qtype])) for qtype in NS_ADDRESS_QTYPES])
+            else:
+                replies = self._query_async(ns_ctx, ns, dict([(qtype, RDATATYPE[qtype]) for qtype in NS_ADDRESS_QTYPES]), deadline)
+
+            addresses = []
+            ttls = []
+            for qtype in NS_ADDRESS_QTYPES:
+                status, result = replies.get(qtype, (-1, None))
+
+                # NOTE: We do not require secure DNS resolution here because the Blockchain-stored DS records work as the trust anchor
+                # and the signed RRSIG DNS results from the final DNS+DNSSEC lookup will be able to complete the chain of trust
+                if status == 0 and result and result.data and not result.bogus:
+                    addresses.extend([address for address in result.data.as_address_list() if address not in addresses])
+                    if get_result_ttl(result) is not None:
+                        ttls.append(get_result_ttl(result))
+            ttl = min(ttls) if ttls else None
+
+        if not addresses:
+            log.warn('No or Invalid Resolution Result for Nameserver: %s' % ns)
+            return []
+
+        if ttl:
+            self.ns_address_cache.set(ns.lower(), tuple(addresses), ttl)
+        return addresses
+
+    def _build_validating_ctx(self, tmp_config_file, ds_ta):
+        '''
+
+        Build an Unbound context forwarding to the zone's nameserver with the Blockchain DS record as Trust Anchor
+
+        :param tmp_config_file: Path to the temporary forward-zone config file
+        :param ds_ta: DS trust anchor string for the zone
+        :return: ub_ctx object
+        '''
+
+        ctx = load_unbound()()
+        ctx.config(tmp_config_file)
+        ctx.add_ta(str(ds_ta))
+        return ctx
+
+    def _rdatatype(self, qtype):
+        '''
+
+        Get the numeric RR Type for a query type, raising ValueError if it is unknown
+
+        :param qtype: String representation of query type (for example: A, AAAA, TXT)
+        :return: Numeric RR Type
+        '''
+
+        try:
+            return rdatatype_from_text(qtype)
+        except Exception as e:
+            log.error('Unable to get RDATAType for Given Query Type [%s]: %s' % (qtype, str(e)))
+            raise ValueError('Unable to get RDATAType for Query Type %s' % qtype)
+
+    def _get_result_value(self, name, qtype, status, result):
+        '''
+
+        Check an Unbound result for DNSSEC validity and extract its data by query type
+
+        :param name: DNS Record Name Query
+        :param qtype: String representation of query type
+        :param status: Unbound resolution status
+        :param result: Unbound result object
+        :return: Tuple of (list of values or None, error or None)
+        '''
+
+        if status != 0:
+            log.info("DNS Resolution Failed: %s [%s]" % (name, qtype))
+            return None, None
+
+        if not result.secure:
+            log.info("DNS Resolution Returned Insecure Result: %s [%s]" % (name, qtype))
+            return None, InsecureResultException()
+
+        if result.bogus:
+            log.info("DNS Resolution Returned Bogus Result: %s [%s]" % (name, qtype))
+            return None, BogusResultException()
+
+        # Only an NXDOMAIN whose NSEC / NSEC3 proof was checked holds for every nameserver of the zone. libunbound only
+        # reports a negative answer secure once it has checked the proof; other engines set proven on the result
+        proven = self.engine is None or getattr(result, 'proven', 0)
+        if not result.havedata and proven and getattr(result, 'rcode', None) == wire.RCODE_NXDOMAIN:
+            log.info("DNS Resolution Returned Validated NXDOMAIN: %s [%s]" % (name, qtype))
+            return None, NXDomainException()
+
+        if not result.havedata:
+            log.info("DNS Resolution Returned Empty Result: %s [%s]" % (name, qtype))
+            return None, EmptyResultException()
+
+        # Get appropriate data by query type
+        if qtype in ['A','AAAA']:
+            return result.data.as_address_list(), None
+        elif qtype in ['CNAME','TXT']:
+            return result.data.as_domain_list(), None
+        elif qtype in ['MX']:
+            return result.data.as_mx_list(), None
+
+        return None, NotImplementedError('Unsupported DNS Query Type: %s' % qtype)
+
+    def _get_native_node(self, nc_record, domains):
+        '''
+
+        Walk the Namecoin record's map for the subdomain labels of a name
+
+        :param nc_record: NamecoinRecord for the domain's SLD
+        :param domains: Reversed list of labels for name
+        :return: NamecoinRecord or Namecoin value dict for the name, None if it is not present in the map
+        '''
+
+        node = nc_record
+        for label in domains[2:]:
+            entries = node.get('map')
+            if not isinstance(entries, dict):
+                return None
+
+            node = entries.get(label, entries.get('*'))
+            if node is None:
+                return None
+
+            # A plain string map entry is a legacy IPv4 address
+            if not isinstance(node, dict):
+                node = {'ip': node}
+
+        # The empty label holds records for the node itself
+        entries = node.get('map')
+        if isinstance(entries, dict) and isinstance(entries.get(''), dict):
+            merged = dict(entries[''])
+            merged.update(dict([(k, node.get(k)) for k in NamecoinRecord.__slots__ if k != 'map' and node.get(k) is not None]))
+            node = merged
+
+        return node
+
+    def _resolve_native(self, name, domains, nc_record, qtype):
+        '''
+
+        Answer a query straight from ip, ip6 and alias data stored in the Namecoin value (no DNS round trip)
+
+        :param name: DNS Record Name Query (for example: www.mattdavid.bit)
+        :param domains: Reversed list of labels for name
+        :param nc_record: NamecoinRecord for the domain's SLD
+        :param qtype: String representation of query type (A, AAAA or CNAME)
+        :return: Resolved value
+        '''
+
+        node = self._get_native_node(nc_record, domains)
+        if node is None:
+            log.info("Name Not Present in Namecoin Value: %s [%s]" % (name, qtype))
+            raise EmptyResultException()
+
+        if qtype == 'CNAME':
+            alias = node.get('alias')
+            if alias is not None:
+                if alias.endswith('.'):
+                    return alias
+                # Relative aliases are relative to the Namecoin-based domain
+                if alias in ('', '@'):
+                    return '%s.%s.' % (domains[1], domains[0])
+                return '%s.%s.%s.' % (alias, domains[1], domains[0])
+        else:
+            addresses = node.get('ip' if qtype == 'A' else 'ip6')
+            if isinstance(addresses, basestring):
+                addresses = [addresses]
+            if addresses:
+                return addresses[0]
+
+        log.info("Namecoin Value Returned Empty Result: %s [%s]" % (name, qtype))
+        raise EmptyResultException()
+
+    def _is_native(self, nc_record, qtype):
+        '''
+
+        Check whether a query should be answered from the Namecoin record instead of DNS
+
+        :param nc_record: NamecoinRecord for the domain's SLD
+        :param qtype: String representation of query type
+        :return: Boolean
+        '''
+
+        # Per the Domain Name Specification an ns item takes precedence over all other items
+        return self.native_records and qtype in NATIVE_QTYPES and not nc_record.ns
+
+    def resolve(self, name, qtype, deadline=None, priority=PRIORITY_INTERACTIVE):
+        '''
+
+        Resolves a Blockchain-based (Namecoin) DNS Name using DNSSEC (see resolve_with_ttl)
+
+        :param name: DNS Record Name Query (for example: www.mattdavid.bit)
+        :param qtype: String representation of query type (for example: A, AAAA, TXT, NS, SOA, etc...)
+        :param deadline: Time budget in seconds for the whole resolution (None for no limit)
+        :param priority: Admission priority class (PRIORITY_INTERACTIVE or PRIORITY_REFRESH)
+        :return: Resolved value if successful, None if un-successful
+        '''
+
+        return self.resolve_with_ttl(name, qtype, deadline, priority)[0]
+
+    def resolve_with_ttl(self, name, qtype, deadline=None, priority=PRIORITY_INTERACTIVE):
+        '''
+
+        Resolves a Blockchain-based (Namecoin) DNS Name via 2 step process using DNSSEC, also returning the answer's TTL
+
+        Step 1:
+        -------
+        Get NS and DS records for the Namecoin name (for example: www.mattdavid.bit) from the Namecoin Client
+
+        Step 2:
+        -------
+        For each listed nameserver:
+
+            - Create a temporary config file for use with unbound
+            - Set Unbound's Trust Anchor to be the given DS records for the Namecoin-based domain name
+            - Do DNSSEC-enabled DNS resolution for the given name / qtype
+
+        If a deadline is given, the remaining time budget bounds the Namecoin RPC call, the nameserver address lookups
+        and every nameserver attempt. ResolutionTimeoutException is raised as soon as the budget is spent.
+
+        If admission control is enabled (max_concurrent), cache misses wait for a resolution slot and
+        OverloadException is raised when the wait queue is full or no slot frees up within the deadline.
+
+        :param name: DNS Record Name Query (for example: www.mattdavid.bit)
+        :param qtype: String representation of query type (for example: A, AAAA, TXT, NS, SOA, etc...)
+        :param deadline: Time budget in seconds for the whole resolution (None for no limit)
+        :param priority: Admission priority class (PRIORITY_INTERACTIVE or PRIORITY_REFRESH)
+        :return: Tuple of (resolved value, TTL in seconds). Value is None if un-successful, TTL is None if unknown
+        '''
+
+        name, domains = self._split_name(name)
+        deadline = Deadline(deadline) if deadline is not None else None
+
+        if self.heavy_hitters is not None:
+            self.heavy_hitters.observe(domains[1], name, qtype)
+
+        answer = self.answer_cache.get_with_ttl((name.lower(), qtype))
+        cached = answer[0] is not None
+        if not cached:
+            answer = self._resolve_answer(name, domains, qtype, deadline, priority)
+
+        if self.prefetch is not None and answer[0] is not None:
+            self.prefetch.observe(self, name, qtype, answer[0], cached)
+        return answer
+
+    def _resolve_answer(self, name, domains, qtype, deadline=None, priority=PRIORITY_INTERACTIVE):
+        '''
+
+        Resolve a name missing from the answer cache, serving stale answers while refreshing, or with an admitted
+        resolution
+
+        :param name: DNS Record Name Query (for example: www.mattdavid.bit)
+        :param domains: Reversed list of labels for name
+        :param qtype: String representation of query type
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :param priority: Admission priority class
+        :return: Tuple of (resolved value, TTL in seconds). Value is None if un-successful, TTL is None if unknown
+        '''
+
+        if self.serve_stale:
+            value = self.answer_cache.get_stale((name.lower(), qtype))
+            if value is not None:
+                def fetch():
+                    answer = self._run_admitted(PRIORITY_REFRESH, deadline, self._resolve_uncached, name, domains, qtype, deadline)
+                    return answer if answer[0] is not None else None
+                return self._refresh_or_stale(('answer', name.lower(), qtype), (value, STALE_ANSWER_TTL), fetch, STALE_ANSWER_ERRORS)
+
+        return self._run_admitted(priority, deadline, self._resolve_uncached, name, domains, qtype, deadline)
+
+    def _prefetch(self, name, qtype):
+        '''
+
+        Resolve a predicted query into the answer cache at PRIORITY_REFRESH, reusing the cached Namecoin record,
+        delegation and nameserver addresses of the query it follows
+
+        :param name: DNS Record Name Query
+        :param qtype: String representation of query type
+        :return: TTL of the fetched answer, 0 if it was already cached, None if it could not be resolved
+        '''
+
+        name, domains = self._split_name(name)
+        if self.answer_cache.get_with_ttl((name.lower(), qtype))[0] is not None:
+            return 0
+
+        value, ttl = self._run_admitted(PRIORITY_REFRESH, None, self._resolve_uncached, name, domains, qtype, None)
+        if value is None:
+            return None
+        return ttl or self.nc_cache.ttl
+
+    def _pin_hot(self, slds, queries):
+        '''
+
+        Protect the most queried SLDs and queries from eviction in the resolver's caches (see HeavyHitters)
+
+        :param slds: Iterable of Second Level Domain labels
+        :param queries: Iterable of (lowercase name, qtype) tuples
+        :return: None
+        '''
+
+        for cache in (self.nc_cache, self.delegation_cache, self.chain_cache):
+            cache.pin(slds)
+        self.answer_cache.pin(queries)
+
+    def _refresh_hot_record(self, sld, refresh_before):
+        '''
+
+        Fetch the Namecoin record of a heavily queried SLD at PRIORITY_REFRESH if it expires within refresh_before seconds
+
+        :param sld: Second Level Domain label
+        :param refresh_before: Remaining TTL in seconds below which the record is fetched
+        :return: Boolean, True if the record was fetched
+        '''
+
+        ttl = self.nc_cache.get_with_ttl(sld)[1]
+        if ttl is not None and ttl > refresh_before:
+            return False
+
+        self._run_admitted(PRIORITY_REFRESH, None, self._fetch_nc_record, sld)
+        return True
+
+    def _refresh_hot_answer(self, name, qtype, refresh_before):
+        '''
+
+        Resolve a heavily queried name into the answer cache at PRIORITY_REFRESH if its answer expires within
+        refresh_before seconds
+
+        :param name: DNS Record Name Query
+        :param qtype: String representation of query type
+        :param refresh_before: Remaining TTL in seconds below which the answer is resolved
+        :return: Boolean, True if the answer was resolved
+        '''
+
+        ttl = self.answer_cache.get_with_ttl((name.lower(), qtype))[1]
+        if ttl is not None and ttl > refresh_before:
+            return False
+
+        name, domains = self._split_name(name)
+        return self._run_admitted(PRIORITY_REFRESH, None, self._resolve_uncached, name, domains, qtype, None)[0] is not None
+
+    def _run_admitted(self, priority, deadline, func, *args):
+        '''
+
+        Run func once admission control grants a resolution slot
+
+        :param priority: Admission priority class
+        :param deadline: Deadline object bounding the wait for a slot (None for no limit)
+        :param func: Function to run
+        :param args: Arguments for func
+        :return: Return value of func
+        '''
+
+        if self.admission is None:
+            return func(*args)
+
+        self.admission.acquire(priority, deadline.check('admission') if deadline else None)
+        try:
+            return func(*args)
+        finally:
+            self.admission.release()
+
+    def _resolve_uncached(self, name, domains, qtype, deadline=None):
+        '''
+
+        Resolve a name without consulting the answer cache (see resolve_with_ttl)
+
+        :param name: DNS Record Name Query (for example: www.mattdavid.bit)
+        :param domains: Reversed list of labels for name
+        :param qtype: String representation of query type
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :return: Tuple of (resolved value, TTL in seconds). Value is None if un-successful, TTL is None if unknown
+        '''
+
+        nc_record = self._get_resolved_record(domains[1], deadline)
+        if self._is_native(nc_record, qtype):
+            return self._resolve_native(name, domains, nc_record, qtype), self.nc_cache.ttl
+
+        delegation = self._get_delegation(name, domains, nc_record)
+
+        answer = self._lookup_mirror(name, delegation, qtype)
+        if answer is not None:
+            return answer
+
+        def extract(status, result):
+            lookup_value, error = self._get_result_value(name, qtype, status, result)
+            if not lookup_value:
+                return None, error
+
+            ttl = get_result_ttl(result)
+            if ttl:
+                self.answer_cache.set((name.lower(), qtype), lookup_value[0], ttl)
+            return (lookup_value[0], ttl), error
+
+        answer = self._query_delegation(name, delegation, qtype, deadline, extract)
+        return answer if answer is not None else (None, None)
+
+    def _lookup_mirror(self, name, delegation, qtype):
+        '''
+
+        Answer a query from the zone mirror's validated copy of the delegated zone, caching the answer
+
+        :param name: DNS Record Name Query
+        :param delegation: Delegation object for the name's zone
+        :param qtype: String representation of query type
+        :return: Tuple of (resolved value, TTL in seconds), None if the query must be sent to the nameservers
+        '''
+
+        if self.zone_mirror is None:
+            return None
+
+        reply = self.zone_mirror.lookup(self, delegation, name, self._rdatatype(qtype))
+        if reply is None:
+            return None
+
+        lookup_value, error = self._get_result_value(name, qtype, *reply)
+        if not lookup_value:
+            return None
+
+        ttl = get_result_ttl(reply[1])
+        if ttl:
+            self.answer_cache.set((name.lower(), qtype), lookup_value[0], ttl)
+        return lookup_value[0], ttl
+
+    def _get_delegation_addresses(self, delegation):
+        '''
+
+        Get the IP addresses of every nameserver of a delegation
+
+        :param delegation: Delegation object
+        :return: List of IP Addresses, in nameserver order
+        '''
+
+        ns_ctx = self._get_ns_ctx() if self.engine is None else None
+
+        addresses = []
+        for ns in delegation.ns:
+            addresses.extend([address for address in self._get_ns_addresses(ns_ctx, ns) if address not in addresses])
+        return addresses
+
+    def _query_delegation(self, name, delegation, qtype, deadline, extract):
+        '''
+
+        Query the nameservers of a delegation in turn, each through a validating Unbound context, until one of them
+        gives a usable answer
+
+        :param name: DNS Record Name Query
+        :param delegation: Delegation object for the name's zone
+        :param qtype: String representation of query type
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :param extract: Function (Unbound status, Unbound result) -> (answer or None, error or None)
+        :return: First answer returned by extract, None if there was none and no error was reported
+        '''
+
+        ns_ctx = self._get_ns_ctx() if self.engine is None else None
+        rrtypes = {qtype: self._rdatatype(qtype)}
+
+        last_error = None
+        for ns in delegation.ns:
+
+            if deadline:
+                deadline.check('nameserver %s' % ns)
+
+            addresses = self._get_ns_addresses(ns_ctx, ns, deadline)
+            if not addresses:
+                last_error = InvalidNameserverException()
+                continue
+
+            for address in addresses:
+                status, result = self._query_nameserver(delegation, address, name, rrtypes, deadline)[qtype]
+                answer, error = extract(status, result)
+                if error:
+                    last_error = error
+
+                if answer is not None:
+                    return answer
+
+                # A proven NXDOMAIN holds for every nameserver of the zone
+                if last_error and isinstance(last_error, (NotImplementedError, NXDomainException)):
+                    raise last_error
+
+                # Only an address that did not answer at all is worth retrying on the nameserver's next address
+                if status == 0:
+                    break
+
+                if deadline:
+                    deadline.check('nameserver %s' % ns)
 
         log.error('DNS Resolution Failed: %s [%s]' % (name, qtype))
         if last_error:
@@ -270,6 +1461,219 @@ forward-zone:
 
         return None
 
+    def resolve_all(self, name, qtypes, deadline=None, priority=PRIORITY_INTERACTIVE):
+        '''
+
+        Resolves several query types for one Blockchain-based (Namecoin) DNS Name in a single pass
+
+        The Namecoin delegation is fetched once and, for each nameserver tried, a single validating Unbound context is
+        built and all outstanding queries are sent to it concurrently. Query types that fail on one nameserver are
+        retried on the next one.
+
+        :param name: DNS Record Name Query (for example: www.mattdavid.bit)
+        :param qtypes: List of query type strings (for example: ['TXT', 'A', 'AAAA'])
+        :param deadline: Time budget in seconds for the whole resolution (None for no limit). ResolutionTimeoutException is raised once it is spent
+        :param priority: Admission priority class (PRIORITY_INTERACTIVE or PRIORITY_REFRESH)
+        :return: Dict of qtype -> resolved value. Failed query types map to the exception resolve() would have raised (None if no error was reported)
+        '''
+
+        name, domains = self._split_name(name)
+        deadline = Deadline(deadline) if deadline is not None else None
+
+        qtypes = list(qtypes)
+        results = {}
+        for qtype in qtypes:
+            value = self.answer_cache.get((name.lower(), qtype))
+            if value is not None:
+                results[qtype] = value
+
+        if len(results) == len(set(qtypes)):
+            return results
+
+        return self._run_admitted(priority, deadline, self._resolve_all_uncached, name, domains, qtypes, results, deadline)
+
+    def _resolve_all_uncached(self, name, domains, qtypes, results, deadline=None):
+        '''
+
+        Resolve the query types missing from results without consulting the answer cache (see resolve_all)
+
+        :param name: DNS Record Name Query (for example: www.mattdavid.bit)
+        :param domains: Reversed list of labels for name
+        :param qtypes: List of query type strings
+        :param results: Dict of qtype -> value already answered from the cache (updated in place)
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :return: Dict of qtype -> resolved value or exception (see resolve_all)
+        '''
+
+        nc_record = self._get_resolved_record(domains[1], deadline)
+        for qtype in qtypes:
+            if qtype not in results and self._is_native(nc_record, qtype):
+                try:
+                    results[qtype] = self._resolve_native(name, domains, nc_record, qtype)
+                except EmptyResultException as e:
+                    results[qtype] = e
+
+        if len(results) == len(set(qtypes)):
+            return results
+
+        delegation = self._get_delegation(name, domains, nc_record)
+        for qtype in qtypes:
+            if qtype not in results:
+                answer = self._lookup_mirror(name, delegation, qtype)
+                if answer is not None:
+                    results[qtype] = answer[0]
+
+        if len(results) == len(set(qtypes)):
+            return results
+
+        _qtypes = dict([(qtype, self._rdatatype(qtype)) for qtype in qtypes if qtype not in results])
+
+        ns_ctx = self._get_ns_ctx() if self.engine is None else None
+
+        errors = {}
+        for ns in delegation.ns:
+
+            pending = [qtype for qtype in _qtypes if qtype not in results and not isinstance(errors.get(qtype), (NotImplementedError, NXDomainException))]
+            if not pending:
+                break
+
+            if deadline:
+                deadline.check('nameserver %s' % ns)
+
+            addresses = self._get_ns_addresses(ns_ctx, ns, deadline)
+            if not addresses:
+                for qtype in pending:
+                    errors[qtype] = InvalidNameserverException()
+                continue
+
+            # Queries the nameserver did not answer at all are retried on its next address
+            for address in addresses:
+                replies = self._query_nameserver(delegation, address, name, dict([(qtype, _qtypes[qtype]) for qtype in pending]), deadline, concurrent=True)
+
+                unanswered = []
+                for qtype in pending:
+                    status, result = replies.get(qtype, (-1, None))
+                    lookup_value, error = self._get_result_value(name, qtype, status, result)
+                    if lookup_value:
+                        results[qtype] = lookup_value[0]
+                        errors.pop(qtype, None)
+
+                        ttl = get_result_ttl(result)
+                        if ttl:
+                            self.answer_cache.set((name.lower(), qtype), lookup_value[0], ttl)
+                    elif error:
+                        errors[qtype] = error
+
+                    if status != 0:
+                        unanswered.append(qtype)
+
+                pending = unanswered
+                if not pending:
+                    break
+
+                if deadline:
+                    deadline.check('nameserver %s' % ns)
+
+        for qtype in qtypes:
+            if qtype not in results:
+                log.error('DNS Resolution Failed: %s [%s]' % (name, qtype))
+                results[qtype] = errors.get(qtype)
+
+                if self.serve_stale and (results[qtype] is None or isinstance(results[qtype], STALE_ANSWER_ERRORS)):
+                    value = self.answer_cache.get_stale((name.lower(), qtype))
+                    if value is not None:
+                        log.info('Serving Stale Data for %s [%s]' % (name, qtype))
+                        results[qtype] = value
+
+        return results
+
+    def resolve_wire(self, query, deadline=None, priority=PRIORITY_INTERACTIVE):
+        '''
+
+        Answers a raw DNS query for a Blockchain-based (Namecoin) DNS Name with a ready-to-send DNS response
+
+        DNSSEC-validated responses (including validated NXDOMAIN / NODATA answers) are cached as packed bytes, so a cache
+        hit only copies the cached response and patches its message ID, RD flag, question and TTLs. Names missing from
+        the blockchain get NXDOMAIN, non-.bit names REFUSED, other opcodes and classes NOTIMP and failed resolutions
+        SERVFAIL.
+
+        :param query: DNS query message
+        :param deadline: Time budget in seconds for the whole resolution (None for no limit)
+        :param priority: Admission priority class (PRIORITY_INTERACTIVE or PRIORITY_REFRESH)
+        :return: DNS response message, None if the query cannot be parsed
+        '''
+
+        try:
+            question = wire.parse_question(query)
+        except wire.WireFormatException as e:
+            log.info('Unable to Parse DNS Query: %s' % str(e))
+            return None
+
+        if question.flags & wire.FLAG_OPCODE or question.rrclass != RDATACLASS_IN:
+            return wire.build_response(question, wire.RCODE_NOTIMP)
+
+        try:
+            name, domains = self._split_name(question.name)
+        except ValueError:
+            return wire.build_response(question, wire.RCODE_REFUSED)
+
+        entry = self.wire_cache.get((name.lower(), question.rrtype))
+        if entry is not None:
+            packet, offsets, ttls, cached_at = entry
+            return wire.patch_response(packet, offsets, ttls, question, int(time.time() - cached_at))
+
+        deadline = Deadline(deadline) if deadline is not None else None
+        try:
+            return self._run_admitted(priority, deadline, self._resolve_wire_uncached, question, name, domains, deadline)
+        except NamecoinValueException:
+            return wire.build_response(question, wire.RCODE_NXDOMAIN)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except BaseException as e:
+            log.error('DNS Resolution Failed: %s [%d]: %s' % (name, question.rrtype, e.__class__.__name__))
+            return wire.build_response(question, wire.RCODE_SERVFAIL)
+
+    def _resolve_wire_uncached(self, question, name, domains, deadline=None):
+        '''
+
+        Answer a parsed DNS query without consulting the wire-format cache (see resolve_wire)
+
+        :param question: wire.Question object for the query
+        :param name: DNS Record Name Query
+        :param domains: Reversed list of labels for name
+        :param deadline: Deadline object for the resolution (None for no limit)
+        :return: DNS response message
+        '''
+
+        qtype = QTYPE_NAMES.get(question.rrtype, 'TYPE%d' % question.rrtype)
+
+        nc_record = self._get_resolved_record(domains[1], deadline)
+        if self._is_native(nc_record, qtype):
+            try:
+                value = self._resolve_native(name, domains, nc_record, qtype)
+            except EmptyResultException:
+                return wire.build_response(question)
+            return wire.build_response(question, answers=[(question.rrtype, self.nc_cache.ttl, wire.encode_rdata(question.rrtype, value))])
+
+        delegation = self._get_delegation(name, domains, nc_record)
+
+        def extract(status, result):
+            if status != 0 or result is None:
+                return None, None
+            if not result.secure or result.bogus or not result.packet:
+                return None, self._get_result_value(name, qtype, status, result)[1]
+            return wire.set_flags(str(bytearray(result.packet)), wire.FLAG_AD), None
+
+        packet = self._query_delegation(name, delegation, qtype, deadline, extract)
+        if packet is None:
+            return wire.build_response(question, wire.RCODE_SERVFAIL)
+
+        offsets, ttls = wire.ttl_offsets(packet)
+        if ttls and min(ttls) > 0:
+            self.wire_cache.set((name.lower(), question.rrtype), (packet, offsets, ttls, time.time()), min(ttls))
+
+        return wire.patch_response(packet, offsets, ttls, question, 0)
+
 if __name__ == '__main__':
 
     resolver = NamecoinResolver(
@@ -0,0 +1,105 @@
+__author__ = 'mdavid'
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+# Setup Logging
+log = logging.getLogger(__name__)
+
+# Priority classes (lower values are admitted first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_REFRESH = 1
+
+class OverloadException(BaseException):
+    pass
+
+class AdmissionController:
+
+    def __init__(self, max_concurrent=64, max_queue=256, max_refresh_queue=None):
+        '''
+
+        Initialize an AdmissionController: limits concurrent resolutions, queueing a bounded number of callers by
+        priority class and failing fast with OverloadException once the queue is full
+
+        :param max_concurrent: Maximum number of resolutions running at once
+        :param max_queue: Maximum number of callers waiting for a slot
+        :param max_refresh_queue: Maximum number of PRIORITY_REFRESH callers waiting for a slot (Default is max_queue / 4), so refreshes are shed before interactive queries
+        :return: AdmissionController object
+        '''
+
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_refresh_queue = max_queue // 4 if max_refresh_queue is None else max_refresh_queue
+
+        self.active = 0
+        self.stats = {'admitted': 0, 'queued': 0, 'shed': 0, 'timeouts': 0}
+
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition(threading.Lock())
+
+    def waiting(self, priority=None):
+        '''
+
+        :param priority: Priority class to count (None for all)
+        :return: Number of callers waiting for a slot
+        '''
+
+        with self._cond:
+            return len([w for w in self._waiters if priority is None or w[0] == priority])
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        '''
+
+        Wait for a resolution slot
+
+        :param priority: Priority class (PRIORITY_INTERACTIVE or PRIORITY_REFRESH)
+        :param timeout: Maximum seconds to wait for a slot (None to wait until one is free)
+        :return: None
+        '''
+
+        with self._cond:
+            if self.active < self.max_concurrent and not self._waiters:
+                self.active += 1
+                self.stats['admitted'] += 1
+                return
+
+            if len(self._waiters) >= self.max_queue or (priority != PRIORITY_INTERACTIVE and len([w for w in self._waiters if w[0] == priority]) >= self.max_refresh_queue):
+                self.stats['shed'] += 1
+                log.warn('Resolution Queue Full, Shedding Priority %d Request' % priority)
+                raise OverloadException('Resolution queue is full')
+
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            self.stats['queued'] += 1
+
+            expires = time.time() + timeout if timeout is not None else None
+            while self._waiters[0] != ticket or self.active >= self.max_concurrent:
+                remaining = expires - time.time() if expires is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                    self.stats['timeouts'] += 1
+                    raise OverloadException('Timed out waiting for a resolution slot')
+                self._cond.wait(remaining)
+
+            heapq.heappop(self._waiters)
+            self.active += 1
+            self.stats['admitted'] += 1
+            self._cond.notify_all()
+
+    def release(self):
+        '''
+
+        Release a resolution slot
+
+        :return: None
+        '''
+
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
@@ -0,0 +1,406 @@
+__author__ = 'mdavid'
+
+import hashlib
+import logging
+import marshal
+import math
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# Local Import(s)
+from records import Delegation, NamecoinRecord
+
+# Setup Logging
+log = logging.getLogger(__name__)
+
+# Classes whose instances can be stored in a cache backend, encoded by their __slots__
+ENTRY_CLASSES = dict([(cls.__name__, cls) for cls in (NamecoinRecord, Delegation)])
+OBJECT_TAG = '\x00bcr'
+
+# expires timestamp
+ENTRY_HEADER = struct.Struct('<d')
+
+# memcached item flags
+FLAG_ZLIB = 1
+
+# memcached reads expiry times above 30 days as absolute timestamps
+MEMCACHED_MAX_RELATIVE_EXPIRY = 30 * 24 * 3600
+
+def _flatten(obj):
+
+    if isinstance(obj, (NamecoinRecord, Delegation)):
+        return OBJECT_TAG, obj.__class__.__name__, tuple([_flatten(getattr(obj, slot, None)) for slot in obj.__slots__])
+    if isinstance(obj, tuple):
+        return tuple([_flatten(x) for x in obj])
+    if isinstance(obj, list):
+        return [_flatten(x) for x in obj]
+    if isinstance(obj, dict):
+        return dict([(_flatten(k), _flatten(v)) for k, v in obj.iteritems()])
+    return obj
+
+def _restore(obj):
+
+    if isinstance(obj, tuple):
+        if len(obj) == 3 and obj[0] == OBJECT_TAG:
+            cls = ENTRY_CLASSES.get(obj[1])
+            if cls is None or not isinstance(obj[2], tuple) or len(obj[2]) != len(cls.__slots__):
+                raise ValueError('Unknown cache entry object: %r' % (obj[1],))
+
+            restored = cls.__new__(cls)
+            for slot, value in zip(cls.__slots__, obj[2]):
+                setattr(restored, slot, _restore(value))
+            return restored
+        return tuple([_restore(x) for x in obj])
+    if isinstance(obj, list):
+        return [_restore(x) for x in obj]
+    if isinstance(obj, dict):
+        return dict([(_restore(k), _restore(v)) for k, v in obj.iteritems()])
+    return obj
+
+def encode_entry(key, value, expires, compress_min=512):
+    '''
+
+    Serialize a cache entry: the expiry timestamp followed by the marshalled key and value, zlib-compressed when that
+    makes it smaller. Only plain data (str, unicode, numbers, None, tuples, lists, dicts) and NamecoinRecord / Delegation
+    objects can be encoded, so decoding never runs code from the cache.
+
+    :param key: Cache key
+    :param value: Cache value
+    :param expires: Expiry timestamp
+    :param compress_min: Minimum encoded size in bytes before compression is tried (None never compresses)
+    :return: Tuple of (payload, flags)
+    '''
+
+    payload = ENTRY_HEADER.pack(expires) + marshal.dumps((_flatten(key), _flatten(value)), 2)
+    if compress_min is not None and len(payload) >= compress_min:
+        compressed = zlib.compress(payload)
+        if len(compressed) < len(payload):
+            return compressed, FLAG_ZLIB
+    return payload, 0
+
+def decode_entry(payload, flags=0):
+    '''
+
+    Deserialize a cache entry written by encode_entry
+
+    :param payload: Encoded entry
+    :param flags: Flags returned by encode_entry
+    :return: Tuple of (key, value, expires)
+    '''
+
+    try:
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        expires = ENTRY_HEADER.unpack_from(payload)[0]
+        key, value = marshal.loads(payload[ENTRY_HEADER.size:])
+    except (zlib.error, struct.error, ValueError, EOFError, TypeError) as e:
+        raise ValueError('Malformed cache entry: %s' % str(e))
+
+    return _restore(key), _restore(value), expires
+
+class CacheBackend:
+    '''
+
+    Second-level cache behind a TTLCache (see TTLCache shared): entries of (key, value, expiry timestamp). get() returns
+    entries whether or not they have expired; the TTLCache applies the expiry and its stale grace period.
+    '''
+
+    def get(self, key):
+        '''
+
+        :param key: Cache key
+        :return: Tuple of (value, expires timestamp), (None, None) if the key is not stored
+        '''
+
+        raise NotImplementedError
+
+    def set(self, key, value, expires):
+        '''
+
+        :param key: Cache key
+        :param value: Value to store
+        :param expires: Expiry timestamp
+        :return: Boolean, False if the entry was not stored
+        '''
+
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class MemoryCacheBackend(CacheBackend):
+
+    def __init__(self, max_entries=100000):
+        '''
+
+        Initialize a MemoryCacheBackend: an in-process CacheBackend, shared by the caches of every resolver in the
+        process that uses it. The oldest entries are evicted first.
+
+        :param max_entries: Maximum number of entries kept
+        :return: MemoryCacheBackend object
+        '''
+
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0, 'sets': 0}
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None, None
+
+        self.stats['hits'] += 1
+        return entry
+
+    def set(self, key, value, expires):
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        self.stats['sets'] += 1
+        return True
+
+    def delete(self, key):
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+
+class MemcachedCache(CacheBackend):
+
+    def __init__(self, servers=('127.0.0.1:11211',), prefix='bcr:', timeout=0.25, grace=0, compress_min=512, max_item_size=1000*1000, retry_interval=30, max_idle=4):
+        '''
+
+        Initialize a MemcachedCache: a CacheBackend on memcached servers (text protocol), shared by the resolvers of
+        every node using them. Keys are spread over the servers by hash. A server that cannot be reached is skipped
+        (reads miss, writes are dropped) for retry_interval seconds, so a cache outage only costs cache hits.
+
+        Entries are stored with encode_entry. The cache supplies trust anchors (DS records) to every node reading it, so
+        the memcached servers must only be reachable by trusted hosts.
+
+        :param servers: List of memcached servers, as "host:port" strings or (host, port) tuples
+        :param prefix: Prefix of every memcached key (keys are prefix + SHA-1 of the cache key)
+        :param timeout: Socket timeout in seconds for each request
+        :param grace: Seconds entries are kept in memcached after they expire (set to at least the resolver's serve_stale)
+        :param compress_min: Minimum encoded entry size in bytes before zlib compression is tried (None never compresses)
+        :param max_item_size: Largest encoded entry stored, in bytes (memcached's item size limit)
+        :param retry_interval: Seconds a server that failed is skipped
+        :param max_idle: Idle connections kept per server
+        :return: MemcachedCache object
+        '''
+
+        self.servers = [self._parse_server(server) for server in servers]
+        self.prefix = prefix
+        self.timeout = timeout
+        self.grace = grace
+        self.compress_min = compress_min
+        self.max_item_size = max_item_size
+        self.retry_interval = retry_interval
+        self.max_idle = max_idle
+        self.stats = {'hits': 0, 'misses': 0, 'sets': 0, 'too_large': 0, 'errors': 0}
+
+        self._idle = {}
+        self._down = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _parse_server(self, server):
+
+        if isinstance(server, basestring):
+            host, _, port = server.rpartition(':')
+            return host or '127.0.0.1', int(port or 11211)
+        return server[0], int(server[1])
+
+    def _key(self, key):
+        return self.prefix + hashlib.sha1(repr(key)).hexdigest()
+
+    def _server(self, mkey):
+        return self.servers[int(mkey[-8:], 16) % len(self.servers)]
+
+    def _connect(self, server):
+        '''
+
+        Take an idle connection to a server, or open one
+
+        :param server: Tuple of (host, port)
+        :return: Tuple of (socket, file object for reading)
+        '''
+
+        with self._lock:
+            # Connections inherited from a parent process are not reused (they are the parent's)
+            if os.getpid() != self._pid:
+                self._idle = {}
+                self._pid = os.getpid()
+
+            idle = self._idle.get(server)
+            if idle:
+                return idle.pop()
+
+        sock = socket.create_connection(server, self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock, sock.makefile('rb')
+
+    def _release(self, server, conn):
+
+        with self._lock:
+            idle = self._idle.setdefault(server, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn[0].close()
+
+    def _request(self, server, request, read=None):
+        '''
+
+        Send a request to a server and read its reply
+
+        :param server: Tuple of (host, port)
+        :param request: Request bytes
+        :param read: Function (file object) -> reply, None if the request has no reply (noreply)
+        :return: Tuple of (success, reply)
+        '''
+
+        if self._down.get(server, 0) > time.time():
+            return False, None
+
+        conn = None
+        try:
+            conn = self._connect(server)
+            conn[0].sendall(request)
+            reply = read(conn[1]) if read is not None else None
+        except (socket.error, IOError) as e:
+            if conn is not None:
+                conn[0].close()
+            self.stats['errors'] += 1
+            self._down[server] = time.time() + self.retry_interval
+            log.warn('memcached Server %s:%d Unavailable for %ds: %s' % (server[0], server[1], self.retry_interval, str(e)))
+            return False, None
+        except ValueError as e:
+            if conn is not None:
+                conn[0].close()
+            self.stats['errors'] += 1
+            log.warn('Unexpected Reply from memcached Server %s:%d: %s' % (server[0], server[1], str(e)))
+            return False, None
+
+        self._release(server, conn)
+        return True, reply
+
+    def _read_value(self, rfile):
+        '''
+
+        Read the reply to a single-key get
+
+        :param rfile: File object of the connection
+        :return: Tuple of (data, flags), None if the key is not stored
+        '''
+
+        line = rfile.readline()
+        if line == 'END\r\n':
+            return None
+
+        parts = line.split()
+        if len(parts) != 4 or parts[0] != 'VALUE':
+            raise ValueError(repr(line[:64]))
+
+        data = rfile.read(int(parts[3]) + 2)
+        if len(data) != int(parts[3]) + 2:
+            raise IOError('Connection closed during reply')
+        if rfile.readline() != 'END\r\n':
+            raise ValueError('Missing END')
+        return data[:-2], int(parts[2])
+
+    def get(self, key):
+
+        mkey = self._key(key)
+        reply = self._request(self._server(mkey), 'get %s\r\n' % mkey, self._read_value)[1]
+        if reply is None:
+            self.stats['misses'] += 1
+            return None, None
+
+        try:
+            stored_key, value, expires = decode_entry(*reply)
+        except ValueError as e:
+            log.warn('Unable to Load memcached Entry: %s' % str(e))
+            self.stats['misses'] += 1
+            return None, None
+
+        # Guards against SHA-1 key collisions and other writers sharing the prefix
+        if stored_key != key:
+            self.stats['misses'] += 1
+            return None, None
+
+        self.stats['hits'] += 1
+        return value, expires
+
+    def set(self, key, value, expires):
+
+        ttl = int(math.ceil(expires + self.grace - time.time()))
+        if ttl <= 0:
+            return False
+
+        try:
+            payload, flags = encode_entry(key, value, expires, self.compress_min)
+        except ValueError as e:
+            log.warn('Unable to Encode Cache Entry for memcached: %s' % str(e))
+            return False
+
+        if len(payload) > self.max_item_size:
+            self.stats['too_large'] += 1
+            return False
+
+        exptime = ttl if ttl <= MEMCACHED_MAX_RELATIVE_EXPIRY else int(expires + self.grace)
+        mkey = self._key(key)
+        ok = self._request(self._server(mkey), 'set %s %d %d %d noreply\r\n%s\r\n' % (mkey, flags, exptime, len(payload), payload))[0]
+        if ok:
+            self.stats['sets'] += 1
+        return ok
+
+    def delete(self, key):
+
+        mkey = self._key(key)
+        self._request(self._server(mkey), 'delete %s noreply\r\n' % mkey)
+
+    def clear(self):
+        '''
+
+        Remove every entry (memcached flush_all: this also removes entries stored by other users of the servers)
+
+        :return: None
+        '''
+
+        for server in self.servers:
+            self._request(server, 'flush_all noreply\r\n')
+
+    def close(self):
+
+        with self._lock:
+            idle, self._idle = self._idle, {}
+
+        for conns in idle.values():
+            for conn in conns:
+                conn[0].close()
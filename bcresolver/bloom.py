@@ -0,0 +1,305 @@
+__author__ = 'mdavid'
+
+import hashlib
+import logging
+import math
+import struct
+import threading
+
+from namecoin import NamecoinClient, NamecoinException
+
+# Setup Logging
+log = logging.getLogger(__name__)
+
+HASH_PAIR = struct.Struct('<QQ')
+
+class BloomFilter:
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        '''
+
+        Initialize a BloomFilter: a bit array answering "definitely absent" or "probably present"
+
+        :param capacity: Number of items the filter is sized for
+        :param error_rate: False-positive rate once capacity items are added
+        :return: BloomFilter object
+        '''
+
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(float(self.size) / self.capacity * math.log(2))))
+        self.count = 0
+
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, item):
+
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, item):
+        '''
+
+        Add an item. Items that set no new bit are not counted: items added before (name updates and renewals), and
+        the few new items the filter already reported as present
+
+        :param item: String to add
+        :return: None
+        '''
+
+        bits = self._bits
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+
+        if added:
+            self.count += 1
+
+    def _positions(self, item):
+        '''
+
+        Bit positions of an item (double hashing of one MD5 digest)
+
+        :param item: String
+        :return: List of bit positions
+        '''
+
+        if isinstance(item, unicode):
+            item = item.encode('utf-8')
+
+        h1, h2 = HASH_PAIR.unpack(hashlib.md5(item).digest())
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def false_positive_rate(self):
+        '''
+
+        :return: Estimated false-positive rate for the items added so far
+        '''
+
+        return (1 - math.exp(-float(self.hashes) * self.count / self.size)) ** self.hashes
+
+    def memory_bytes(self):
+        '''
+
+        :return: Size of the bit array in bytes
+        '''
+
+        return len(self._bits)
+
+class NameIndex:
+
+    def __init__(self, host=None, user=None, password=None, port=8336, capacity=1000000, error_rate=0.001, scan_batch=1000, poll_interval=30, reorg_depth=100, client=None):
+        '''
+
+        Initialize a NameIndex: a BloomFilter of every registered d/ name, built with name_scan and kept current by
+        reading the name operations of each new block. Until the first build completes every name is reported as
+        possibly registered.
+
+        :param host: Namecoin Node Hostname (DNS Name or IP Address)
+        :param user: Namecoin Node Username
+        :param password: Namecoin Node Password
+        :param port: Namecoin Node Port (Default is 8336)
+        :param capacity: Minimum number of names the filter is sized for (it is sized for twice the scanned names if that is more)
+        :param error_rate: Target false-positive rate at capacity
+        :param scan_batch: Names requested per name_scan call (at least 2, as each call repeats the last name of the previous one)
+        :param poll_interval: Seconds between checks for new blocks (see start)
+        :param reorg_depth: Number of recent block hashes kept to follow chain reorganizations. Deeper reorganizations rebuild the filter
+        :param client: NamecoinClient object (Default is a new client for host / port)
+        :return: NameIndex object
+        '''
+
+        self.client = client or NamecoinClient(host or '127.0.0.1', port or 8336, user, password)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.scan_batch = max(2, scan_batch)
+        self.poll_interval = poll_interval
+        self.reorg_depth = max(1, reorg_depth)
+
+        self.filter = None
+        self.height = None
+        self.stats = {'checks': 0, 'rejected': 0, 'blocks': 0, 'builds': 0, 'reorgs': 0}
+
+        self._hashes = {}
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.filter is not None
+
+    def might_exist(self, sld):
+        '''
+
+        Check whether d/<sld> may be registered
+
+        :param sld: Second Level Domain label (for example: mattdavid)
+        :return: Boolean, False only if the name is definitely not registered
+        '''
+
+        name_filter = self.filter
+        if name_filter is None:
+            return True
+
+        self.stats['checks'] += 1
+        if sld in name_filter:
+            return True
+
+        self.stats['rejected'] += 1
+        return False
+
+    def build(self):
+        '''
+
+        Build a new filter from a full name_scan and swap it in
+
+        :return: None
+        '''
+
+        # Blocks found during the scan are replayed by the next update (adding a name twice is harmless)
+        height = self.client.get_block_count()
+        block_hash = self.client.get_block_hash(height)
+
+        names = []
+        start = ''
+        while True:
+            batch = self.client.name_scan(start, self.scan_batch)
+            for entry in batch:
+                name = entry.get('name', '')
+                if name != start and name.startswith('d/'):
+                    names.append(name[2:])
+
+            if len(batch) < self.scan_batch:
+                break
+            start = batch[-1].get('name', '')
+
+        name_filter = BloomFilter(max(self.capacity, 2 * len(names)), self.error_rate)
+        for name in names:
+            name_filter.add(name)
+
+        self.filter = name_filter
+        self.height = height
+        self._hashes = {height: block_hash}
+        self.stats['builds'] += 1
+        log.info('Built Namecoin Name Index: %d names at height %d, %d bytes' % (len(names), height, name_filter.memory_bytes()))
+
+    def update(self):
+        '''
+
+        Add the names registered or updated in blocks since the last build or update, rebuilding the filter if it has
+        outgrown its capacity. After a chain reorganization the blocks that replaced the ones already read are read as
+        well (names of the replaced blocks stay in the filter, which only costs false positives).
+
+        :return: None
+        '''
+
+        if self.filter is None:
+            return self.build()
+
+        height = self.client.get_block_count()
+
+        # Walk back to the last block read that is still on the chain
+        reorganized = False
+        while self.height > height or self.client.get_block_hash(self.height) != self._hashes[self.height]:
+            del self._hashes[self.height]
+            self.height -= 1
+            reorganized = True
+            if self.height not in self._hashes:
+                log.warn('Namecoin Chain Reorganized Deeper Than %d Blocks: Rebuilding Name Index' % self.reorg_depth)
+                self.stats['reorgs'] += 1
+                return self.build()
+
+        if reorganized:
+            log.info('Namecoin Chain Reorganized: Re-reading Blocks From Height %d' % (self.height + 1))
+            self.stats['reorgs'] += 1
+
+        while self.height < height:
+            block_hash = self.client.get_block_hash(self.height + 1)
+            self._add_block(block_hash)
+            self.height += 1
+            self._hashes[self.height] = block_hash
+            self._hashes.pop(self.height - self.reorg_depth, None)
+            self.stats['blocks'] += 1
+
+        if len(self.filter) > self.filter.capacity:
+            self.build()
+
+    def _add_block(self, block_hash):
+        '''
+
+        Add the d/ names of every name operation in a block
+
+        :param block_hash: Block hash
+        :return: None
+        '''
+
+        # Verbosity 2 returns decoded transactions; older nodes take it as verbose=true and return txids
+        block = self.client.get_block(block_hash, 2) or {}
+        for tx in block.get('tx', []):
+            if not isinstance(tx, dict):
+                tx = self.client.get_raw_transaction(tx) or {}
+
+            for vout in tx.get('vout', []):
+                name_op = vout.get('scriptPubKey', {}).get('nameOp') or {}
+                name = name_op.get('name', '')
+                if name.startswith('d/'):
+                    self.filter.add(name[2:])
+
+    def report(self):
+        '''
+
+        :return: Dict with names, capacity, memory_bytes, false_positive_rate, height and the check / rejection / reorganization counts
+        '''
+
+        name_filter = self.filter
+        report = dict(self.stats)
+        report['height'] = self.height
+        report['names'] = len(name_filter) if name_filter is not None else 0
+        report['capacity'] = name_filter.capacity if name_filter is not None else 0
+        report['memory_bytes'] = name_filter.memory_bytes() if name_filter is not None else 0
+        report['false_positive_rate'] = name_filter.false_positive_rate() if name_filter is not None else None
+        return report
+
+    def start(self):
+        '''
+
+        Build the filter and keep it current from a background thread, every poll_interval seconds
+
+        :return: None
+        '''
+
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+
+        while not self._stop.is_set():
+            try:
+                self.update()
+            except NamecoinException as e:
+                log.warn('Unable to Update Namecoin Name Index: %s' % str(e))
+            except Exception as e:
+                log.error('Namecoin Name Index Update Failed: %s' % str(e))
+            self._stop.wait(self.poll_interval)
@@ -0,0 +1,271 @@
+__author__ = 'mdavid'
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+def sizeof(obj):
+    '''
+
+    Estimate the memory used by an object, including the containers and __slots__ objects it references
+
+    :param obj: Object to measure
+    :return: Approximate size in bytes
+    '''
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum([sizeof(k) + sizeof(v) for k, v in obj.iteritems()])
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum([sizeof(x) for x in obj])
+    elif hasattr(obj, '__slots__'):
+        size += sum([sizeof(getattr(obj, slot, None)) for slot in obj.__slots__])
+
+    return size
+
+class TTLCache:
+
+    def __init__(self, ttl=60, max_entries=10000, max_bytes=None, stale_ttl=0, shared=None, namespace=None):
+        '''
+
+        Initialize a thread-safe LRU cache whose entries expire after a time-to-live
+
+        :param ttl: Default entry lifetime in seconds
+        :param max_entries: Maximum number of entries kept before the least recently used entry is evicted
+        :param max_bytes: Memory budget in bytes (keys and values, as estimated by sizeof). None for no byte limit
+        :param stale_ttl: Seconds expired entries are kept for get_stale() (0 drops entries as soon as they expire)
+        :param shared: CacheBackend used as a second level shared with other processes or nodes, for example a SharedMemoryCache or MemcachedCache (None for a process-local cache)
+        :param namespace: Prefix separating this cache's keys from other caches using the same shared cache
+        :return: TTLCache object
+        '''
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self.shared = shared
+        self.namespace = namespace
+        self.bytes = 0
+
+        self._entries = OrderedDict()
+        self._pinned = frozenset()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        '''
+
+        Get a cached value
+
+        :param key: Cache key
+        :param default: Value returned if the key is missing or expired
+        :return: Cached value or default
+        '''
+
+        value, ttl = self.get_with_ttl(key)
+        return default if value is None else value
+
+    def get_with_ttl(self, key):
+        '''
+
+        Get a cached value along with its remaining lifetime
+
+        :param key: Cache key
+        :return: Tuple of (value, remaining TTL in seconds), (None, None) if the key is missing or expired
+        '''
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                value, ttl = self._check(key, entry)
+                if value is not None or self.shared is None:
+                    return value, ttl
+
+        # The shared cache may be remote: it is read without holding the lock. It is read when the local entry has
+        # expired as well, as another process may have stored a fresh one since
+        entry = self._load_shared(key)
+        if entry is None:
+            return None, None
+
+        with self._lock:
+            self._add_loaded(key, entry)
+            return self._check(key, self._entries.pop(key))
+
+    def _check(self, key, entry):
+        '''
+
+        Re-insert a popped entry as most recently used if it is fresh, or for get_stale() if it is within the grace period
+
+        :param key: Cache key
+        :param entry: Entry tuple of (value, expires, size)
+        :return: Tuple of (value, remaining TTL in seconds), (None, None) if the entry has expired
+        '''
+
+        value, expires, size = entry
+        now = time.time()
+        if expires <= now:
+            if expires + self.stale_ttl > now:
+                self._entries[key] = entry
+            else:
+                self.bytes -= size
+            return None, None
+
+        self._entries[key] = entry
+        self._evict()
+        return value, int(expires - now)
+
+    def get_stale(self, key):
+        '''
+
+        Get a cached value even if it has expired, as long as it is within the stale grace period
+
+        :param key: Cache key
+        :return: Cached value, None if the key is missing or past its grace period
+        '''
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return self._check_stale(key, entry)
+
+        entry = self._load_shared(key)
+        if entry is None:
+            return None
+
+        with self._lock:
+            self._add_loaded(key, entry)
+            return self._check_stale(key, self._entries[key])
+
+    def _check_stale(self, key, entry):
+
+        value, expires, size = entry
+        if expires + self.stale_ttl <= time.time():
+            self._remove(key)
+            return None
+
+        self._evict()
+        return value
+
+    def set(self, key, value, ttl=None):
+        '''
+
+        Store a value, evicting least recently used entries until the cache is within its entry and byte budgets
+
+        :param key: Cache key
+        :param value: Value to store
+        :param ttl: Entry lifetime in seconds (defaults to the cache TTL). Values with a TTL of 0 or less are not stored
+        :return: None
+        '''
+
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+
+        size = sizeof(key) + sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        expires = time.time() + ttl
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires, size)
+            self.bytes += size
+            self._evict()
+
+        if self.shared is not None:
+            self.shared.set((self.namespace, key), value, expires)
+
+    def delete(self, key):
+        '''
+
+        Remove a cached value (from the shared cache as well)
+
+        :param key: Cache key
+        :return: None
+        '''
+
+        with self._lock:
+            self._remove(key)
+
+        if self.shared is not None:
+            self.shared.delete((self.namespace, key))
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def pin(self, keys):
+        '''
+
+        Protect keys from LRU eviction, replacing the previously pinned keys. Pinned entries still expire, and are only
+        evicted (least recently used first) when every entry in the cache is pinned.
+
+        :param keys: Iterable of cache keys
+        :return: None
+        '''
+
+        self._pinned = frozenset(keys)
+
+    def _load_shared(self, key):
+        '''
+
+        Fetch an entry another process (or node) stored in the shared cache, if it is still within its stale grace period
+
+        :param key: Cache key
+        :return: Entry tuple of (value, expires, size), None if there is none
+        '''
+
+        if self.shared is None:
+            return None
+
+        value, expires = self.shared.get((self.namespace, key))
+        if value is None or expires + self.stale_ttl <= time.time():
+            return None
+
+        size = sizeof(key) + sizeof(value) if self.max_bytes is not None else 0
+        return value, expires, size
+
+    def _add_loaded(self, key, entry):
+        '''
+
+        Add an entry loaded from the shared cache, unless the local entry for the key expires no earlier, for example
+        because the key was set locally while it was being loaded (lock held)
+
+        :param key: Cache key
+        :param entry: Entry tuple of (value, expires, size)
+        :return: None
+        '''
+
+        current = self._entries.get(key)
+        if current is None or current[1] < entry[1]:
+            self._remove(key)
+            self._entries[key] = entry
+            self.bytes += entry[2]
+
+    def _evict(self):
+
+        while len(self._entries) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            # Least recently used entry that is not pinned (the least recently used pinned one if there is none)
+            evicted_key = next(iter(self._entries))
+            if self._pinned:
+                for key in self._entries:
+                    if key not in self._pinned:
+                        evicted_key = key
+                        break
+
+            self.bytes -= self._entries.pop(evicted_key)[2]
+
+    def _remove(self, key):
+
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
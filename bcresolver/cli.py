@@ -0,0 +1,190 @@
+__author__ = 'mdavid'
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from Queue import Queue
+
+from bcresolver import HeavyHitters, MemcachedCache, NamecoinResolver
+
+# Marks the end of the input (workers) and the exit of a worker (result stream)
+_DONE = object()
+
+def parse_line(line, default_qtype='A'):
+    '''
+
+    Parse one input line of the form "name [qtype]"
+
+    :param line: Input line
+    :param default_qtype: Query type used when the line only holds a name
+    :return: Tuple of (name, qtype), None for blank and comment lines
+    '''
+
+    fields = line.split()
+    if not fields or fields[0].startswith('#'):
+        return None
+
+    return fields[0], fields[1].upper() if len(fields) > 1 else default_qtype
+
+def resolve_one(resolver, name, qtype, deadline=None):
+    '''
+
+    Resolve a single name and describe the outcome as a JSON-serializable dict
+
+    :param resolver: NamecoinResolver object
+    :param name: DNS Record Name Query
+    :param qtype: String representation of query type
+    :param deadline: Time budget in seconds for the resolution (None for no limit)
+    :return: Dict with name, qtype, value, ttl, error (exception class name) and latency_ms
+    '''
+
+    record = {'name': name, 'qtype': qtype, 'value': None, 'ttl': None, 'error': None}
+
+    start = time.time()
+    try:
+        record['value'], record['ttl'] = resolver.resolve_with_ttl(name, qtype, deadline)
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except BaseException as e:
+        record['error'] = e.__class__.__name__
+
+    record['latency_ms'] = round((time.time() - start) * 1000, 3)
+    return record
+
+def resolve_stream(resolver, queries, concurrency=8, deadline=None):
+    '''
+
+    Resolve (name, qtype) pairs with a fixed number of worker threads, yielding results as they finish
+
+    Input is consumed lazily through a bounded queue, so neither the input nor the results are buffered in full.
+
+    :param resolver: NamecoinResolver object
+    :param queries: Iterable of (name, qtype) tuples
+    :param concurrency: Number of resolutions in flight
+    :param deadline: Time budget in seconds for each resolution (None for no limit)
+    :return: Generator of result dicts (see resolve_one), in completion order
+    '''
+
+    concurrency = max(1, concurrency)
+    pending = Queue(maxsize=concurrency)
+    results = Queue(maxsize=concurrency)
+
+    def feed():
+        try:
+            for query in queries:
+                pending.put(query)
+        finally:
+            for _ in range(concurrency):
+                pending.put(_DONE)
+
+    def work():
+        try:
+            while True:
+                query = pending.get()
+                if query is _DONE:
+                    break
+                results.put(resolve_one(resolver, query[0], query[1], deadline))
+        finally:
+            results.put(_DONE)
+
+    threads = [threading.Thread(target=feed)] + [threading.Thread(target=work) for _ in range(concurrency)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    running = concurrency
+    while running:
+        result = results.get()
+        if result is _DONE:
+            running -= 1
+        else:
+            yield result
+
+def build_resolver(args):
+    '''
+
+    Build a NamecoinResolver from parsed command line arguments
+
+    :param args: argparse Namespace
+    :return: NamecoinResolver object
+    '''
+
+    heavy_hitters = HeavyHitters(top=args.top_k, dump_path=args.top_k_dump) if args.top_k else None
+    resolver = NamecoinResolver(
+        resolv_conf=args.resolv_conf,
+        dnssec_root_key=args.root_key,
+        host=args.host,
+        user=args.user,
+        password=args.password,
+        port=args.port,
+        temp_dir=args.temp_dir,
+        native_records=args.native_records,
+        shared_cache=MemcachedCache(args.memcached) if args.memcached else None,
+        heavy_hitters=heavy_hitters
+    )
+
+    if heavy_hitters is not None:
+        heavy_hitters.start(resolver)
+    return resolver
+
+def add_resolver_arguments(parser):
+    '''
+
+    Add the NamecoinResolver options shared by the bcresolver command line tools
+
+    :param parser: argparse.ArgumentParser object
+    :return: None
+    '''
+
+    parser.add_argument('--host', default='127.0.0.1', help='Namecoin node hostname (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8336, help='Namecoin node RPC port (default: %(default)s)')
+    parser.add_argument('--user', default=os.environ.get('BCRESOLVER_RPC_USER'), help='Namecoin node RPC user (default: $BCRESOLVER_RPC_USER)')
+    parser.add_argument('--password', default=os.environ.get('BCRESOLVER_RPC_PASSWORD'), help='Namecoin node RPC password (default: $BCRESOLVER_RPC_PASSWORD)')
+    parser.add_argument('--resolv-conf', default='/etc/resolv.conf', help='resolv.conf used for nameserver lookups (default: %(default)s)')
+    parser.add_argument('--root-key', default='/usr/local/etc/unbound/root.key', help='DNSSEC root trust anchor file (default: %(default)s)')
+    parser.add_argument('--temp-dir', default=None, help='Directory for temporary Unbound config files')
+    parser.add_argument('--native-records', action='store_true', help='Answer A/AAAA/CNAME from Namecoin value data when possible')
+    parser.add_argument('--memcached', action='append', metavar='HOST:PORT', help='memcached server shared by the resolvers of every node (repeat for several servers)')
+    parser.add_argument('--top-k', type=int, default=0, metavar='K', help='Track the K most queried SLDs and names, keeping them cached and refreshed (default: off)')
+    parser.add_argument('--top-k-dump', default=None, metavar='PATH', help='File the --top-k report is written to as JSON every 5 minutes')
+
+def main(argv=None, stdin=None, stdout=None):
+    '''
+
+    bcresolver console entry point: bulk-resolve names read from a file or stdin, writing one JSON line per result
+
+    :param argv: Command line arguments (defaults to sys.argv[1:])
+    :param stdin: Input stream used when no file is given (defaults to sys.stdin)
+    :param stdout: Output stream (defaults to sys.stdout)
+    :return: Exit status
+    '''
+
+    parser = argparse.ArgumentParser(prog='bcresolver', description='Resolve .bit names (one "name [qtype]" per line) and stream JSON lines results')
+    parser.add_argument('file', nargs='?', help='Input file (default: stdin)')
+    parser.add_argument('-t', '--qtype', default='A', help='Query type for lines without one (default: %(default)s)')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='Number of resolutions in flight (default: %(default)s)')
+    parser.add_argument('-d', '--deadline', type=float, default=None, help='Time budget in seconds for each resolution (default: no limit)')
+    add_resolver_arguments(parser)
+    args = parser.parse_args(argv)
+
+    stdout = stdout or sys.stdout
+    infile = open(args.file) if args.file else (stdin or sys.stdin)
+
+    queries = (query for query in (parse_line(line, args.qtype.upper()) for line in iter(infile.readline, '')) if query)
+
+    try:
+        resolver = build_resolver(args)
+        for record in resolve_stream(resolver, queries, args.concurrency, args.deadline):
+            stdout.write(json.dumps(record) + '\n')
+            stdout.flush()
+    finally:
+        if args.file:
+            infile.close()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
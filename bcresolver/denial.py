@@ -0,0 +1,506 @@
+__author__ = 'mdavid'
+
+import base64
+import hashlib
+import logging
+import string
+import threading
+import time
+from bisect import bisect_right, insort
+from collections import OrderedDict
+
+import dns.name
+import dns.rdatatype
+
+# Setup Logging
+log = logging.getLogger(__name__)
+
+# NSEC3 owner labels are base32 with the extended hex alphabet (RFC 4648 section 7)
+BASE32HEX_TO_BASE32 = string.maketrans('0123456789ABCDEFGHIJKLMNOPQRSTUV', 'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567')
+
+# NSEC3 hash algorithm 1 (SHA-1) and the Opt-Out flag
+NSEC3_SHA1 = 1
+NSEC3_OPT_OUT = 1
+
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+
+def type_in_bitmap(windows, rrtype):
+    '''
+
+    Check whether an NSEC / NSEC3 type bitmap lists an RR Type
+
+    :param windows: List of (window, bitmap) tuples of the NSEC / NSEC3 rdata
+    :param rrtype: Numeric RR Type
+    :return: Boolean
+    '''
+
+    window, offset = divmod(rrtype, 256)
+    for number, bitmap in windows:
+        if number == window:
+            return offset // 8 < len(bitmap) and bool(bitmap[offset // 8] & (0x80 >> (offset % 8)))
+    return False
+
+def nsec3_hash(name, salt, iterations):
+    '''
+
+    Hash a name with NSEC3 hash algorithm 1 (RFC 5155 section 5)
+
+    :param name: dns.name.Name
+    :param salt: Salt bytes
+    :param iterations: Additional iterations
+    :return: Hash bytes
+    '''
+
+    digest = hashlib.sha1(name.canonicalize().to_wire() + salt).digest()
+    for _ in range(iterations):
+        digest = hashlib.sha1(digest + salt).digest()
+    return digest
+
+def covers(owner, next, value):
+    '''
+
+    Check whether value falls strictly between an NSEC / NSEC3 owner and its next name (the last record of a zone
+    wraps around to the first)
+
+    :param owner: Owner name or hash
+    :param next: Next name or hash
+    :param value: Name or hash to check
+    :return: Boolean
+    '''
+
+    if owner < next:
+        return owner < value < next
+    return value > owner or value < next
+
+def signed_records(zone, response):
+    '''
+
+    Collect the in-zone authority records of a response
+
+    :param zone: dns.name.Name of the zone
+    :param response: dns.message.Message
+    :return: Dict of (name, rdtype) -> rrset for the in-zone authority records, with RRSIG rrsets keyed by (name, (RRSIG, covered type))
+    '''
+
+    signed = {}
+    for rrset in response.authority:
+        if rrset.name.is_subdomain(zone):
+            signed[(rrset.name, rrset.rdtype if rrset.rdtype != dns.rdatatype.RRSIG else (rrset.rdtype, rrset.covers))] = rrset
+    return signed
+
+def _response_denials(zone, signed, max_iterations):
+    '''
+
+    :param zone: dns.name.Name of the zone
+    :param signed: Dict returned by signed_records
+    :param max_iterations: Highest NSEC3 iteration count accepted
+    :return: ZoneDenials holding the NSEC / NSEC3 records of a single validated response
+    '''
+
+    # The records were just validated: their TTLs do not matter here, and they are looked up with now=0
+    denials = ZoneDenials()
+    denials.fill(zone, signed, lambda rrset, rrsigs: 1, len(signed), max_iterations)
+    return denials
+
+def prove_denial(zone, response, qname, rrtype, max_iterations=100):
+    '''
+
+    Check that the denial records of a validated negative response prove its query's name or type absent. Without this
+    check, a signed SOA replayed from any earlier negative response of the zone would deny every name.
+
+    :param zone: dns.name.Name of the zone
+    :param response: Validated dns.message.Message with no answer to the query
+    :param qname: dns.name.Name of the query (the last in-zone CNAME target if the answer is a CNAME chain)
+    :param rrtype: Numeric RR Type
+    :param max_iterations: Highest NSEC3 iteration count accepted
+    :return: Response code the records prove (NOERROR for NODATA, NXDOMAIN), None if they prove neither
+    '''
+
+    signed = signed_records(zone, response)
+    if (zone, dns.rdatatype.SOA) not in signed or (zone, (dns.rdatatype.RRSIG, dns.rdatatype.SOA)) not in signed:
+        return None
+    if not qname.is_subdomain(zone):
+        return None
+
+    proof = _response_denials(zone, signed, max_iterations).lookup(zone, qname, rrtype, 0)
+    return proof[0] if proof is not None else None
+
+def prove_wildcard(zone, response, qname, encloser, max_iterations=100):
+    '''
+
+    Check that the denial records of a validated answer synthesized from a wildcard prove that no closer name than the
+    wildcard exists (RFC 4035 section 5.3.4, RFC 5155 section 8.8). Without this check, a wildcard answer replayed for a
+    name that exists would hide the name's own records.
+
+    :param zone: dns.name.Name of the zone
+    :param response: Validated dns.message.Message
+    :param qname: dns.name.Name of the answer owner
+    :param encloser: dns.name.Name of the wildcard's parent (the owner's last RRSIG labels labels)
+    :param max_iterations: Highest NSEC3 iteration count accepted
+    :return: Boolean
+    '''
+
+    if not qname.is_subdomain(encloser) or qname == encloser or not encloser.is_subdomain(zone):
+        return False
+
+    return _response_denials(zone, signed_records(zone, response), max_iterations).lookup_next_closer(qname, encloser, 0) is not None
+
+class ZoneDenials:
+
+    def __init__(self):
+        '''
+
+        Initialize a ZoneDenials: the validated SOA and NSEC / NSEC3 records cached for one zone, and the denials they
+        prove
+
+        :return: ZoneDenials object
+        '''
+
+        self.soa = None
+        self.params = None
+
+        # Owner name (NSEC) or hash (NSEC3) -> (rrset, RRSIG rrset, expires), with their keys kept sorted
+        self.nsec = {}
+        self.nsec_keys = []
+        self.nsec3 = {}
+        self.nsec3_keys = []
+
+    def add(self, records, keys, key, entry, max_records):
+
+        if key not in records:
+            if len(records) >= max_records:
+                return False
+            insort(keys, key)
+        records[key] = entry
+        return True
+
+    def find(self, records, keys, value, now):
+        '''
+
+        Find the unexpired record owning or covering a name / hash
+
+        :param records: nsec or nsec3 dict
+        :param keys: Sorted keys of records
+        :param value: Owner name or hash
+        :param now: Timestamp
+        :return: Tuple of (key, entry), (None, None) if no cached record applies
+        '''
+
+        if not keys:
+            return None, None
+
+        # Index -1 is the last record of the zone, whose range wraps around to the first
+        key = keys[bisect_right(keys, value) - 1]
+        entry = records[key]
+        if entry[2] <= now:
+            return None, None
+        return key, entry
+
+    def fill(self, zone, signed, expires, max_records, max_iterations):
+        '''
+
+        Add the signed NSEC / NSEC3 records of a response
+
+        :param zone: dns.name.Name of the zone
+        :param signed: Dict returned by signed_records
+        :param expires: Function (rrset, RRSIG rrset) -> timestamp the record expires at
+        :param max_records: Maximum number of NSEC and of NSEC3 records kept
+        :param max_iterations: Highest NSEC3 iteration count accepted
+        :return: Number of denial records stored
+        '''
+
+        stored = 0
+        for (name, rdtype), rrset in signed.items():
+            rrsigs = signed.get((name, (dns.rdatatype.RRSIG, rdtype)))
+            if rrsigs is None:
+                continue
+
+            if rdtype == dns.rdatatype.NSEC:
+                stored += self.add(self.nsec, self.nsec_keys, name, (rrset, rrsigs, expires(rrset, rrsigs)), max_records)
+
+            elif rdtype == dns.rdatatype.NSEC3:
+                rdata = rrset[0]
+                if rdata.algorithm != NSEC3_SHA1 or rdata.iterations > max_iterations or len(name) - 1 != len(zone):
+                    continue
+
+                # A zone re-signed with new NSEC3 parameters invalidates the hashes cached so far
+                params = (rdata.salt, rdata.iterations)
+                if self.params != params:
+                    self.params = params
+                    self.nsec3 = {}
+                    self.nsec3_keys = []
+
+                try:
+                    key = base64.b32decode(name[0].upper().translate(BASE32HEX_TO_BASE32))
+                except TypeError:
+                    continue
+                stored += self.add(self.nsec3, self.nsec3_keys, key, (rrset, rrsigs, expires(rrset, rrsigs)), max_records)
+
+        return stored
+
+    def lookup(self, zone, qname, rrtype, now):
+        '''
+
+        Prove a query's name or type absent with the NSEC records, or else the NSEC3 records
+
+        :param zone: dns.name.Name of the zone
+        :param qname: dns.name.Name of the query
+        :param rrtype: Numeric RR Type
+        :param now: Timestamp
+        :return: Tuple of (rcode, list of entries), None if the records do not prove it
+        '''
+
+        proof = self.lookup_nsec(zone, qname, rrtype, now)
+        if proof is None and self.params is not None:
+            proof = self.lookup_nsec3(zone, qname, rrtype, now)
+        return proof
+
+    def lookup_nsec(self, zone, qname, rrtype, now):
+        '''
+
+        Prove a query's name or type absent with NSEC records (RFC 4035 section 5.4)
+
+        :return: Tuple of (rcode, list of entries), None if the records do not prove it
+        '''
+
+        owner, entry = self.find(self.nsec, self.nsec_keys, qname, now)
+        if entry is None:
+            return None
+
+        rdata = entry[0][0]
+        if owner == qname:
+            if type_in_bitmap(rdata.windows, rrtype) or type_in_bitmap(rdata.windows, dns.rdatatype.CNAME):
+                return None
+            # The parent side of a delegation cannot deny types of the child zone's apex
+            if type_in_bitmap(rdata.windows, dns.rdatatype.NS) and not type_in_bitmap(rdata.windows, dns.rdatatype.SOA) and rrtype != dns.rdatatype.DS:
+                return None
+            return RCODE_NOERROR, [entry]
+
+        if not covers(owner, rdata.next, qname) or self._below_cut(rdata.windows, owner, qname):
+            return None
+
+        # No wildcard at the closest encloser may have synthesized the name
+        closest = max(qname.fullcompare(owner)[2], qname.fullcompare(rdata.next)[2])
+        wildcard = dns.name.Name(('*',) + qname.labels[-closest:])
+        wildcard_owner, wildcard_entry = self.find(self.nsec, self.nsec_keys, wildcard, now)
+        if wildcard_entry is None or wildcard_owner == wildcard or not covers(wildcard_owner, wildcard_entry[0][0].next, wildcard):
+            return None
+
+        return RCODE_NXDOMAIN, [entry, wildcard_entry]
+
+    def lookup_nsec3(self, zone, qname, rrtype, now):
+        '''
+
+        Prove a query's name or type absent with NSEC3 records: a matching record for NODATA, or a closest encloser proof
+        for NXDOMAIN (RFC 5155 sections 8.4 - 8.6)
+
+        :return: Tuple of (rcode, list of entries), None if the records do not prove it
+        '''
+
+        salt, iterations = self.params
+
+        def match(name):
+            key = nsec3_hash(name, salt, iterations)
+            owner, entry = self.find(self.nsec3, self.nsec3_keys, key, now)
+            return key, owner, entry
+
+        key, owner, entry = match(qname)
+        if entry is not None and owner == key:
+            rdata = entry[0][0]
+            if type_in_bitmap(rdata.windows, rrtype) or type_in_bitmap(rdata.windows, dns.rdatatype.CNAME):
+                return None
+            if type_in_bitmap(rdata.windows, dns.rdatatype.NS) and not type_in_bitmap(rdata.windows, dns.rdatatype.SOA):
+                return None
+            return RCODE_NOERROR, [entry]
+
+        # Find the closest encloser, remembering the covering record of the next closer name
+        next_closer = entry if entry is not None and self._covers_nsec3(owner, entry, key) else None
+        name = qname
+        while name != zone:
+            name = name.parent()
+            key, owner, entry = match(name)
+            if entry is not None and owner == key:
+                break
+
+            next_closer = entry if entry is not None and self._covers_nsec3(owner, entry, key) else None
+        else:
+            return None
+
+        windows = entry[0][0].windows
+        if next_closer is None or type_in_bitmap(windows, dns.rdatatype.DNAME):
+            return None
+        if type_in_bitmap(windows, dns.rdatatype.NS) and not type_in_bitmap(windows, dns.rdatatype.SOA):
+            return None
+
+        wildcard_key, wildcard_owner, wildcard_entry = match(dns.name.Name(('*',) + name.labels))
+        if wildcard_entry is None or wildcard_owner == wildcard_key or not self._covers_nsec3(wildcard_owner, wildcard_entry, wildcard_key):
+            return None
+
+        return RCODE_NXDOMAIN, [entry, next_closer, wildcard_entry]
+
+    def lookup_next_closer(self, qname, encloser, now):
+        '''
+
+        Prove that no name between a wildcard's parent and a name synthesized from the wildcard exists: an NSEC record
+        covering the name whose closest encloser is the wildcard's parent, or an NSEC3 record covering the next closer name
+
+        :param qname: dns.name.Name synthesized from the wildcard
+        :param encloser: dns.name.Name of the wildcard's parent
+        :param now: Timestamp
+        :return: Entry proving it, None if the records do not prove it
+        '''
+
+        owner, entry = self.find(self.nsec, self.nsec_keys, qname, now)
+        if entry is not None and owner != qname:
+            rdata = entry[0][0]
+            closest = max(qname.fullcompare(owner)[2], qname.fullcompare(rdata.next)[2])
+            if covers(owner, rdata.next, qname) and not self._below_cut(rdata.windows, owner, qname) and closest == len(encloser):
+                return entry
+
+        if self.params is None:
+            return None
+
+        # An Opt-Out record still proves that no signed name is closer (RFC 5155 section 8.8)
+        key = nsec3_hash(dns.name.Name(qname.labels[-(len(encloser) + 1):]), *self.params)
+        owner, entry = self.find(self.nsec3, self.nsec3_keys, key, now)
+        if entry is None or owner == key or not covers(owner, entry[0][0].next, key):
+            return None
+        return entry
+
+    def _covers_nsec3(self, owner, entry, key):
+
+        rdata = entry[0][0]
+        return not rdata.flags & NSEC3_OPT_OUT and covers(owner, rdata.next, key)
+
+    def _below_cut(self, windows, owner, qname):
+        '''
+
+        Check whether an NSEC record's owner is a delegation point (or DNAME) above the query name, in which case the
+        record says nothing about names below it
+
+        '''
+
+        if not qname.is_subdomain(owner):
+            return False
+        if type_in_bitmap(windows, dns.rdatatype.DNAME):
+            return True
+        return type_in_bitmap(windows, dns.rdatatype.NS) and not type_in_bitmap(windows, dns.rdatatype.SOA)
+
+class DenialCache:
+
+    def __init__(self, max_zones=1000, max_records=1000, max_iterations=100):
+        '''
+
+        Initialize a DenialCache: aggressive use of DNSSEC-validated NSEC / NSEC3 records (RFC 8198). The denial records
+        of validated NXDOMAIN / NODATA responses are kept for each zone (and DS trust anchor), and later queries for
+        names or types they prove absent are answered locally with a negative response built from the cached records.
+
+        NSEC3 records with the Opt-Out flag set or more than max_iterations hash iterations are not used to deny names.
+
+        :param max_zones: Maximum number of zones with cached denial records (least recently stored are evicted first)
+        :param max_records: Maximum number of NSEC and of NSEC3 records cached per zone
+        :param max_iterations: Highest NSEC3 iteration count accepted (RFC 9276)
+        :return: DenialCache object
+        '''
+
+        self.max_zones = max_zones
+        self.max_records = max_records
+        self.max_iterations = max_iterations
+        self.stats = {'stored': 0, 'nxdomain': 0, 'nodata': 0}
+
+        self._zones = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._zones)
+
+    def clear(self):
+
+        with self._lock:
+            self._zones.clear()
+
+    def add(self, zone, ds_ta, response):
+        '''
+
+        Store the SOA and NSEC / NSEC3 records of a validated negative response. Records are kept until their TTL (capped
+        at the SOA minimum TTL, RFC 9077) or signature expiration, whichever comes first.
+
+        :param zone: dns.name.Name of the zone
+        :param ds_ta: DS trust anchor string the response was validated against
+        :param response: Validated dns.message.Message with no answer to its question
+        :return: Number of denial records stored
+        '''
+
+        signed = signed_records(zone, response)
+        if (zone, dns.rdatatype.SOA) not in signed or (zone, (dns.rdatatype.RRSIG, dns.rdatatype.SOA)) not in signed:
+            return 0
+
+        with self._lock:
+            denials = self._zones.pop((zone, ds_ta), None) or ZoneDenials()
+            self._zones[(zone, ds_ta)] = denials
+            while len(self._zones) > self.max_zones:
+                self._zones.popitem(last=False)
+
+            stored = self._fill(denials, zone, signed, time.time())
+
+        self.stats['stored'] += stored
+        return stored
+
+    def lookup(self, zone, ds_ta, qname, rrtype):
+        '''
+
+        Check whether cached denial records prove a query's name or type absent
+
+        :param zone: dns.name.Name of the zone
+        :param ds_ta: DS trust anchor string
+        :param qname: dns.name.Name of the query
+        :param rrtype: Numeric RR Type
+        :return: Tuple of (rcode, list of (rrset, RRSIG rrset, remaining TTL) proving the denial, starting with the SOA), None if the query cannot be answered from the cache
+        '''
+
+        denials = self._zones.get((zone, ds_ta))
+        if denials is None or denials.soa is None or not qname.is_subdomain(zone):
+            return None
+
+        now = time.time()
+        if denials.soa[2] <= now:
+            return None
+
+        with self._lock:
+            proof = denials.lookup(zone, qname, rrtype, now)
+
+        if proof is None:
+            return None
+
+        rcode, entries = proof
+        self.stats['nxdomain' if rcode == RCODE_NXDOMAIN else 'nodata'] += 1
+        unique = []
+        for entry in [denials.soa] + entries:
+            if entry not in unique:
+                unique.append(entry)
+        return rcode, [(rrset, rrsigs, max(0, int(expires - now))) for rrset, rrsigs, expires in unique]
+
+    def _fill(self, denials, zone, signed, now):
+        '''
+
+        Add the signed SOA and NSEC / NSEC3 records of a response to a zone's denial records. Records are kept until their
+        TTL (capped at the SOA minimum TTL, RFC 9077) or signature expiration, whichever comes first.
+
+        :param denials: ZoneDenials object
+        :param zone: dns.name.Name of the zone
+        :param signed: Dict returned by signed_records, holding a signed SOA
+        :param now: Timestamp
+        :return: Number of denial records stored
+        '''
+
+        soa = signed[(zone, dns.rdatatype.SOA)]
+        soa_rrsigs = signed[(zone, (dns.rdatatype.RRSIG, dns.rdatatype.SOA))]
+        max_ttl = min(soa.ttl, soa[0].minimum)
+
+        def expires(rrset, rrsigs):
+            return min(now + min(rrset.ttl, max_ttl), min([rrsig.expiration for rrsig in rrsigs]))
+
+        denials.soa = (soa, soa_rrsigs, expires(soa, soa_rrsigs))
+
+        return denials.fill(zone, signed, expires, self.max_records, self.max_iterations)
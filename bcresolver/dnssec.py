@@ -0,0 +1,526 @@
+__author__ = 'mdavid'
+
+import hashlib
+import logging
+import select
+import socket
+import struct
+import threading
+import time
+
+import dns.exception
+import dns.flags
+import dns.message
+import dns.name
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+import dns.rrset
+from dns.dnssec import ValidationFailure, validate
+
+# Local Import(s)
+from cache import TTLCache
+from denial import DenialCache, prove_denial, prove_wildcard
+
+# Setup Logging
+log = logging.getLogger(__name__)
+
+# DS digest types (RFC 4034, RFC 4509, RFC 6605)
+DS_DIGEST_TYPES = {1: hashlib.sha1, 2: hashlib.sha256, 4: hashlib.sha384}
+
+def ds_digest(zone, dnskey, digest_type):
+    '''
+
+    Compute the DS digest of a DNSKEY
+
+    :param zone: dns.name.Name of the zone
+    :param dnskey: DNSKEY rdata
+    :param digest_type: DS digest type
+    :return: Digest bytes
+    '''
+
+    return DS_DIGEST_TYPES[digest_type](zone.canonicalize().to_wire() + dnskey.to_digestable(zone)).digest()
+
+def check_dnskeys(zone, dnskeys, rrsigs, ds_ta):
+    '''
+
+    Check a zone's DNSKEY set against the Blockchain DS trust anchor: a key matching the DS record must sign the set
+
+    :param zone: dns.name.Name of the zone
+    :param dnskeys: DNSKEY rrset
+    :param rrsigs: RRSIG rrset covering the DNSKEY set
+    :param ds_ta: DS trust anchor string (zone IN DS keytag algorithm digest-type digest)
+    :return: Boolean
+    '''
+
+    ds = dns.rdata.from_text(dns.rdataclass.IN, dns.rdatatype.DS, ds_ta.split(' DS ', 1)[1])
+    if ds.digest_type not in DS_DIGEST_TYPES:
+        log.warn('Unsupported DS Digest Type for %s: %d' % (zone, ds.digest_type))
+        return False
+
+    ksks = [key for key in dnskeys if key.algorithm == ds.algorithm and ds_digest(zone, key, ds.digest_type) == ds.digest]
+    if not ksks:
+        log.info('No DNSKEY Matches the Blockchain DS Record for %s' % zone)
+        return False
+
+    try:
+        validate(dnskeys, rrsigs, {zone: dns.rrset.from_rdata_list(zone, dnskeys.ttl, ksks)})
+    except ValidationFailure as e:
+        log.info('DNSKEY Set for %s Failed Validation: %s' % (zone, str(e)))
+        return False
+
+    return True
+
+class EngineResultData(object):
+    '''
+
+    Answer data of an EngineResult, with the accessors of pyUnbound's ub_data
+    '''
+
+    __slots__ = ('rrset',)
+
+    def __init__(self, rrset):
+        self.rrset = rrset
+
+    def as_address_list(self):
+        return [rdata.address for rdata in self.rrset]
+
+    def as_domain_list(self):
+        if self.rrset.rdtype == dns.rdatatype.TXT:
+            return [''.join(rdata.strings) for rdata in self.rrset]
+        return [rdata.to_text() for rdata in self.rrset]
+
+    def as_mx_list(self):
+        return [(rdata.preference, rdata.exchange.to_text()) for rdata in self.rrset]
+
+class EngineResult(object):
+    '''
+
+    Validated query result, with the attributes of pyUnbound's ub_result used by NamecoinResolver. proven is set on
+    negative results whose NSEC / NSEC3 records were checked to deny the query's name or type
+    '''
+
+    __slots__ = ('secure', 'bogus', 'havedata', 'proven', 'data', 'ttl', 'rcode', 'packet')
+
+    def __init__(self, packet, rcode):
+        self.secure = 0
+        self.bogus = 0
+        self.havedata = 0
+        self.proven = 0
+        self.data = None
+        self.ttl = None
+        self.rcode = rcode
+        self.packet = packet
+
+class DnspythonEngine:
+
+    def __init__(self, resolv_conf='/etc/resolv.conf', timeout=5.0, port=53, dnskey_cache_size=1000, dnskey_cache_bytes=2*1024*1024, aggressive_nsec=True):
+        '''
+
+        Initialize a DnspythonEngine: queries delegated nameservers directly over reusable sockets and validates
+        answers against the Blockchain-stored DS record with dns.dnssec (an alternative to pyUnbound)
+
+        :param resolv_conf: resolv.conf used for nameserver address lookups
+        :param timeout: Default query timeout in seconds
+        :param port: Nameserver port
+        :param dnskey_cache_size: Maximum number of cached validated DNSKEY sets
+        :param dnskey_cache_bytes: Memory budget in bytes for cached validated DNSKEY sets
+        :param aggressive_nsec: Cache the NSEC / NSEC3 records of validated negative responses and answer queries they prove absent without a network round trip (RFC 8198)
+        :return: DnspythonEngine object
+        '''
+
+        self.resolv_conf = resolv_conf
+        self.timeout = timeout
+        self.port = port
+        self.dnskey_cache = TTLCache(max_entries=dnskey_cache_size, max_bytes=dnskey_cache_bytes)
+        self.denial_cache = DenialCache(max_zones=dnskey_cache_size) if aggressive_nsec else None
+
+        self._local = threading.local()
+        self._tcp_pool = {}
+        self._tcp_lock = threading.Lock()
+        self._stub = None
+
+    def warm(self):
+        '''
+
+        Build the stub resolver used for nameserver address lookups
+
+        :return: None
+        '''
+
+        self._get_stub()
+
+    def _get_stub(self):
+
+        if self._stub is None:
+            self._stub = dns.resolver.Resolver(filename=self.resolv_conf)
+        return self._stub
+
+    def resolve_addresses(self, hostname, timeout=None):
+        '''
+
+        Resolve a nameserver hostname to its IPv4 and IPv6 addresses
+
+        :param hostname: Nameserver hostname
+        :param timeout: Time budget in seconds (None for the default timeout)
+        :return: Tuple of (list of IP Addresses, IPv4 first, lowest TTL of the address records or None)
+        '''
+
+        expires = time.time() + (timeout or self.timeout)
+
+        addresses = []
+        ttls = []
+        for rrtype in ('A', 'AAAA'):
+            try:
+                answer = self._get_stub().query(hostname, rrtype, lifetime=max(0.001, expires - time.time()))
+            except dns.exception.DNSException as e:
+                log.info('Unable to Resolve Nameserver Address %s [%s]: %s' % (hostname, rrtype, e.__class__.__name__))
+                continue
+
+            addresses.extend([rdata.address for rdata in answer])
+            ttls.append(answer.rrset.ttl)
+
+        return addresses, min(ttls) if ttls else None
+
+    def query(self, zone, address, ds_ta, name, rrtype, timeout=None):
+        '''
+
+        Query a zone's nameserver and validate the response against the zone's DS trust anchor
+
+        :param zone: Zone name (for example: mattdavid.bit.)
+        :param address: Nameserver IP Address
+        :param ds_ta: DS trust anchor string (zone IN DS keytag algorithm digest-type digest)
+        :param name: DNS Record Name Query
+        :param rrtype: Numeric RR Type
+        :param timeout: Time budget in seconds (None for the default timeout)
+        :return: Tuple of (status, EngineResult object). Status is non-zero if the nameserver did not answer
+        '''
+
+        expires = time.time() + (timeout or self.timeout)
+        zone = dns.name.from_text(zone)
+        qname = dns.name.from_text(name)
+
+        if self.denial_cache is not None:
+            denial = self.denial_cache.lookup(zone, ds_ta, qname, rrtype)
+            if denial is not None:
+                return 0, self._denial_result(qname, rrtype, *denial)
+
+        try:
+            keys = self._get_dnskeys(zone, address, ds_ta, expires)
+            packet, response = self._exchange(qname, rrtype, address, expires)
+        except (socket.error, dns.exception.DNSException) as e:
+            log.info('DNS Query to %s Failed: %s [%d]: %s' % (address, name, rrtype, str(e)))
+            return -1, None
+
+        result = EngineResult(packet, response.rcode())
+        if keys is None:
+            result.bogus = 1
+            return 0, result
+
+        if not self._validate_sections(zone, keys, response) or not self._check_wildcards(zone, response):
+            result.bogus = 1
+            return 0, result
+
+        rrset, target = self._find_answer(zone, response, qname, rrtype)
+        if rrset is None and target is not None:
+            if prove_denial(zone, response, target, rrtype) != response.rcode():
+                log.info('Negative Response Without Denial Proof: %s [%d]' % (target, rrtype))
+                result.bogus = 1
+                return 0, result
+            result.proven = 1
+
+        result.secure = 1
+        if rrset is not None:
+            result.havedata = 1
+            result.data = EngineResultData(rrset)
+            result.ttl = rrset.ttl
+        elif self.denial_cache is not None and result.proven and not response.answer:
+            self.denial_cache.add(zone, ds_ta, response)
+
+        return 0, result
+
+    def _denial_result(self, qname, rrtype, rcode, proof):
+        '''
+
+        Build a validated negative result from cached denial records, with a response packet carrying them in its
+        authority section
+
+        :param qname: dns.name.Name of the query
+        :param rrtype: Numeric RR Type
+        :param rcode: Response code (NOERROR for NODATA, NXDOMAIN)
+        :param proof: List of (rrset, RRSIG rrset, remaining TTL) returned by DenialCache.lookup
+        :return: EngineResult object
+        '''
+
+        response = dns.message.make_response(dns.message.make_query(qname, rrtype, want_dnssec=True))
+        response.set_rcode(rcode)
+        for rrset, rrsigs, ttl in proof:
+            for records in (rrset, rrsigs):
+                records = records.copy()
+                records.ttl = ttl
+                response.authority.append(records)
+
+        result = EngineResult(response.to_wire(), rcode)
+        result.secure = 1
+        result.proven = 1
+        result.ttl = min([ttl for rrset, rrsigs, ttl in proof])
+        return result
+
+    def prepare(self, zone, address, ds_ta, timeout=None):
+        '''
+
+        Fetch and validate a zone's DNSKEY set against a DS trust anchor ahead of the first query that needs it (for
+        example a DS record that is about to change)
+
+        :param zone: Zone name (for example: mattdavid.bit.)
+        :param address: Nameserver IP Address
+        :param ds_ta: DS trust anchor string
+        :param timeout: Time budget in seconds (None for the default timeout)
+        :return: Boolean, True if the DNSKEY set validated and is cached
+        '''
+
+        try:
+            keys = self._get_dnskeys(dns.name.from_text(zone), address, ds_ta, time.time() + (timeout or self.timeout))
+        except (socket.error, dns.exception.DNSException) as e:
+            log.info('DNSKEY Query to %s Failed: %s: %s' % (address, zone, str(e)))
+            return False
+        return keys is not None
+
+    def _get_dnskeys(self, zone, address, ds_ta, expires):
+        '''
+
+        Get the zone's DNSKEY set, validated against the DS trust anchor. Validated sets are cached until the
+        expiration of their RRSIG.
+
+        :param zone: dns.name.Name of the zone
+        :param address: Nameserver IP Address
+        :param ds_ta: DS trust anchor string
+        :param expires: Absolute time the query must finish by
+        :return: Tuple of DNSKEY rdata, None if the set does not validate
+        '''
+
+        keys = self.dnskey_cache.get((zone, ds_ta))
+        if keys is not None:
+            return keys
+
+        packet, response = self._exchange(zone, dns.rdatatype.DNSKEY, address, expires)
+        try:
+            dnskeys = response.find_rrset(response.answer, zone, dns.rdataclass.IN, dns.rdatatype.DNSKEY)
+            rrsigs = response.find_rrset(response.answer, zone, dns.rdataclass.IN, dns.rdatatype.RRSIG, dns.rdatatype.DNSKEY)
+        except KeyError:
+            log.info('No Signed DNSKEY Set for %s' % zone)
+            return None
+
+        if not check_dnskeys(zone, dnskeys, rrsigs, ds_ta):
+            return None
+
+        # Cached as a tuple of rdata, which sizeof() measures in full (unlike an rrset)
+        keys = tuple(dnskeys)
+        ttl = min([rrsig.expiration for rrsig in rrsigs]) - int(time.time())
+        self.dnskey_cache.set((zone, ds_ta), keys, ttl)
+        return keys
+
+    def _validate_sections(self, zone, keys, response):
+        '''
+
+        Validate the RRSIGs of every in-zone rrset in the answer and authority sections (the NSEC / NSEC3 records of
+        NXDOMAIN and NODATA responses are then checked to cover the query, see prove_denial)
+
+        :param zone: dns.name.Name of the zone
+        :param keys: Validated DNSKEY rdata of the zone
+        :param response: dns.message.Message
+        :return: Boolean
+        '''
+
+        validated = 0
+        for section in (response.answer, response.authority):
+            for rrset in section:
+                if rrset.rdtype == dns.rdatatype.RRSIG or not rrset.name.is_subdomain(zone):
+                    continue
+
+                try:
+                    rrsigs = response.find_rrset(section, rrset.name, rrset.rdclass, dns.rdatatype.RRSIG, rrset.rdtype)
+                    validate(rrset, rrsigs, {zone: keys})
+                except KeyError:
+                    log.info('Unsigned RRset in Response: %s %s' % (rrset.name, dns.rdatatype.to_text(rrset.rdtype)))
+                    return False
+                except ValidationFailure as e:
+                    log.info('RRset Failed Validation: %s %s: %s' % (rrset.name, dns.rdatatype.to_text(rrset.rdtype), str(e)))
+                    return False
+                validated += 1
+
+        return validated > 0
+
+    def _check_wildcards(self, zone, response):
+        '''
+
+        Check the denial proof of every answer rrset synthesized from a wildcard, whose RRSIG labels field is lower than
+        the owner's label count (RFC 4035 section 5.3.4, see prove_wildcard)
+
+        :param zone: dns.name.Name of the zone
+        :param response: Validated dns.message.Message
+        :return: Boolean
+        '''
+
+        for rrsigs in response.answer:
+            if rrsigs.rdtype != dns.rdatatype.RRSIG or not rrsigs.name.is_subdomain(zone):
+                continue
+
+            # The leftmost label of a wildcard owner is not counted (RFC 4034 section 3.1.3)
+            labels = min([rrsig.labels for rrsig in rrsigs])
+            if labels >= len(rrsigs.name) - 1 - int(rrsigs.name.is_wild()):
+                continue
+
+            if not prove_wildcard(zone, response, rrsigs.name, dns.name.Name(rrsigs.name.labels[-(labels + 1):])):
+                log.info('Wildcard Answer Without Denial Proof: %s %s' % (rrsigs.name, dns.rdatatype.to_text(rrsigs.covers)))
+                return False
+
+        return True
+
+    def _find_answer(self, zone, response, qname, rrtype):
+        '''
+
+        Find the answer rrset for a query, following in-zone CNAMEs
+
+        :param zone: dns.name.Name of the zone
+        :param response: dns.message.Message
+        :param qname: dns.name.Name of the query
+        :param rrtype: Numeric RR Type
+        :return: Tuple of (rrset or None, name the response holds no data for or None). Both are None if a CNAME leads out of the zone
+        '''
+
+        for _ in range(8):
+            try:
+                return response.find_rrset(response.answer, qname, dns.rdataclass.IN, rrtype), None
+            except KeyError:
+                pass
+
+            try:
+                cname = response.find_rrset(response.answer, qname, dns.rdataclass.IN, dns.rdatatype.CNAME)
+            except KeyError:
+                return None, qname
+
+            qname = cname[0].target
+            if not qname.is_subdomain(zone):
+                return None, None
+
+        return None, None
+
+    def _exchange(self, qname, rrtype, address, expires):
+        '''
+
+        Send a DNSSEC-enabled query over UDP, retrying over TCP if the response is truncated
+
+        :param qname: dns.name.Name of the query
+        :param rrtype: Numeric RR Type
+        :param address: Nameserver IP Address
+        :param expires: Absolute time the query must finish by
+        :return: Tuple of (response wire data, dns.message.Message)
+        '''
+
+        query = dns.message.make_query(qname, rrtype, want_dnssec=True)
+        query.flags |= dns.flags.CD
+        wire = query.to_wire()
+
+        packet = self._udp(wire, query.id, address, expires)
+        response = dns.message.from_wire(packet)
+        if response.flags & dns.flags.TC:
+            packet = self._tcp(wire, address, expires)
+            response = dns.message.from_wire(packet)
+
+        if not query.is_response(response):
+            raise dns.exception.FormError('Response does not match query')
+
+        return packet, response
+
+    def _udp(self, wire, query_id, address, expires):
+        '''
+
+        Exchange a query over this thread's UDP socket for the address family
+
+        :param wire: Query wire data
+        :param query_id: Query message ID
+        :param address: Nameserver IP Address
+        :param expires: Absolute time the query must finish by
+        :return: Response wire data
+        '''
+
+        family = socket.AF_INET6 if ':' in address else socket.AF_INET
+        sock = getattr(self._local, 'udp%d' % family, None)
+        if sock is None:
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sock.setblocking(0)
+            setattr(self._local, 'udp%d' % family, sock)
+
+        sock.sendto(wire, (address, self.port))
+        while True:
+            remaining = expires - time.time()
+            if remaining <= 0 or not select.select([sock], [], [], remaining)[0]:
+                raise dns.exception.Timeout()
+
+            packet, source = sock.recvfrom(65535)
+            # Late answers to earlier (timed out) queries on this socket are dropped
+            if source[0] == address and len(packet) >= 2 and struct.unpack('!H', packet[:2])[0] == query_id:
+                return packet
+
+    def _tcp(self, wire, address, expires):
+        '''
+
+        Exchange a query over a pooled TCP connection to the nameserver (reconnecting once if it was closed)
+
+        :param wire: Query wire data
+        :param address: Nameserver IP Address
+        :param expires: Absolute time the query must finish by
+        :return: Response wire data
+        '''
+
+        for attempt in range(2):
+            with self._tcp_lock:
+                idle = self._tcp_pool.get(address)
+                sock = idle.pop() if idle else None
+
+            fresh = sock is None
+            if fresh:
+                sock = socket.socket(socket.AF_INET6 if ':' in address else socket.AF_INET, socket.SOCK_STREAM)
+                sock.settimeout(max(0.001, expires - time.time()))
+                sock.connect((address, self.port))
+
+            try:
+                sock.settimeout(max(0.001, expires - time.time()))
+                sock.sendall(struct.pack('!H', len(wire)) + wire)
+                length = struct.unpack('!H', self._recv_exact(sock, 2))[0]
+                packet = self._recv_exact(sock, length)
+            except socket.error:
+                sock.close()
+                if fresh or attempt:
+                    raise
+                continue
+
+            with self._tcp_lock:
+                self._tcp_pool.setdefault(address, []).append(sock)
+            return packet
+
+    def _recv_exact(self, sock, length):
+
+        data = ''
+        while len(data) < length:
+            chunk = sock.recv(length - len(data))
+            if not chunk:
+                raise socket.error('Connection closed by nameserver')
+            data += chunk
+        return data
+
+    def close(self):
+        '''
+
+        Close pooled TCP connections
+
+        :return: None
+        '''
+
+        with self._tcp_lock:
+            for sockets in self._tcp_pool.values():
+                for sock in sockets:
+                    sock.close()
+            self._tcp_pool = {}
@@ -0,0 +1,183 @@
+__author__ = 'mdavid'
+
+import json
+import logging
+import os
+import threading
+import time
+
+# Local Import(s)
+from stats import SpaceSaving
+
+# Setup Logging
+log = logging.getLogger(__name__)
+
+class HeavyHitters:
+
+    def __init__(self, capacity=1000, top=100, min_count=2, pin=True, refresh=True, refresh_interval=30.0, decay_interval=600.0, dump_interval=300.0, dump_path=None):
+        '''
+
+        Initialize HeavyHitters: constant-memory counts of the most queried SLDs and (name, query type) pairs, kept by
+        NamecoinResolver.resolve() in SpaceSaving sketches. Every refresh_interval seconds (see start), the top entries
+        are pinned in the resolver's caches so LRU eviction skips them, and those about to expire are refreshed ahead of
+        the next query. The top entries are also written to dump_path as JSON every dump_interval seconds.
+
+        :param capacity: Number of SLDs (and of queries) counted by each sketch
+        :param top: Number of top SLDs (and of top queries) pinned, refreshed and reported
+        :param min_count: Minimum guaranteed count (count less its error bound) before an entry is pinned and refreshed
+        :param pin: Pin the top entries in the resolver's caches
+        :param refresh: Refresh the top entries that expire before the next maintenance pass
+        :param refresh_interval: Seconds between maintenance passes (pinning, refreshing, decay and dumps)
+        :param decay_interval: Seconds between halvings of every count, so the top entries follow recent traffic (None never decays)
+        :param dump_interval: Seconds between dumps to dump_path
+        :param dump_path: File the report is written to (None disables dumps)
+        :return: HeavyHitters object
+        '''
+
+        self.top = top
+        self.min_count = min_count
+        self.pin = pin
+        self.refresh = refresh
+        self.refresh_interval = refresh_interval
+        self.decay_interval = decay_interval
+        self.dump_interval = dump_interval
+        self.dump_path = dump_path
+        self.stats = {'refreshed': 0, 'failed': 0, 'dumps': 0}
+
+        self.slds = SpaceSaving(capacity)
+        self.queries = SpaceSaving(capacity)
+
+        self._hot = (frozenset(), frozenset())
+        self._decayed = time.time()
+        self._dumped = time.time()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def observe(self, sld, name, qtype):
+        '''
+
+        Count one query
+
+        :param sld: Second Level Domain label, as used for the resolver's Namecoin record and delegation cache keys (not lowercased: Namecoin names are case-sensitive)
+        :param name: DNS Record Name Query
+        :param qtype: String representation of query type
+        :return: None
+        '''
+
+        self.slds.add(sld)
+        self.queries.add((name.lower(), qtype))
+
+    def hot(self):
+        '''
+
+        :return: Tuple of (frozenset of top SLDs, frozenset of top (name, qtype) queries) with a guaranteed count of at least min_count
+        '''
+
+        slds = frozenset([sld for sld, count, error in self.slds.top(self.top) if count - error >= self.min_count])
+        queries = frozenset([query for query, count, error in self.queries.top(self.top) if count - error >= self.min_count])
+        return slds, queries
+
+    def maintain(self, resolver):
+        '''
+
+        Run one maintenance pass: decay counts if due, pin the top entries in the resolver's caches, refresh the top
+        entries about to expire and dump the report if due
+
+        :param resolver: NamecoinResolver the counts come from
+        :return: None
+        '''
+
+        now = time.time()
+        if self.decay_interval and now - self._decayed >= self.decay_interval:
+            self.slds.decay()
+            self.queries.decay()
+            self._decayed = now
+
+        self._hot = slds, queries = self.hot()
+        if self.pin:
+            resolver._pin_hot(slds, queries)
+
+        if self.refresh:
+            for sld in slds:
+                self._refresh(resolver._refresh_hot_record, sld)
+            for name, qtype in queries:
+                self._refresh(resolver._refresh_hot_answer, name, qtype)
+
+        if self.dump_path and now - self._dumped >= self.dump_interval:
+            self.dump()
+            self._dumped = now
+
+    def _refresh(self, refresh, *args):
+
+        try:
+            if refresh(*args, refresh_before=self.refresh_interval):
+                self.stats['refreshed'] += 1
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except BaseException as e:
+            self.stats['failed'] += 1
+            log.info('Refresh of Heavy Hitter %s Failed: %s' % ('/'.join(args), e.__class__.__name__))
+
+    def report(self, k=None):
+        '''
+
+        :param k: Number of top entries listed (Default is top)
+        :return: Dict of the top SLDs and queries as [key, count, error] lists (most frequent first), the number of queries counted and refresh counts
+        '''
+
+        k = self.top if k is None else k
+
+        report = dict(self.stats)
+        report['total'] = self.queries.total
+        report['slds'] = [[sld, count, error] for sld, count, error in self.slds.top(k)]
+        report['queries'] = [[name, qtype, count, error] for (name, qtype), count, error in self.queries.top(k)]
+        report['pinned'] = len(self._hot[0]) + len(self._hot[1]) if self.pin else 0
+        return report
+
+    def dump(self, path=None):
+        '''
+
+        Write the report to a file as JSON (replacing it atomically)
+
+        :param path: File path (Default is dump_path)
+        :return: None
+        '''
+
+        path = path or self.dump_path
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(self.report(), time=int(time.time())), f)
+        os.rename(tmp_path, path)
+        self.stats['dumps'] += 1
+
+    def start(self, resolver):
+        '''
+
+        Run maintenance passes from a background thread, every refresh_interval seconds
+
+        :param resolver: NamecoinResolver the counts come from
+        :return: None
+        '''
+
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(resolver,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, resolver):
+
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.maintain(resolver)
+            except Exception as e:
+                log.error('Heavy Hitter Maintenance Failed: %s' % str(e))
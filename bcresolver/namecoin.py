@@ -2,7 +2,22 @@ __author__ = 'mdavid'
 
 import base64
 import json
-import requests
+
+# requests is imported on first use (see load_requests) to keep "import bcresolver" cheap
+requests = None
+
+def load_requests():
+    '''
+
+    Import requests on first use
+
+    :return: requests module
+    '''
+
+    global requests
+    if requests is None:
+        import requests
+    return requests
 
 class NamecoinException(Exception):
     def __init__(self, message=None, code=0):
@@ -22,7 +37,7 @@ class NamecoinClient:
         self.password = password
         self.timeout = timeout
 
-    def send(self, method='getinfo', params=[]):
+    def send(self, method='getinfo', params=[], timeout=None):
 
         headers = {
             'User-Agent': 'bitcoin-json-rpc/0.3.50',
@@ -39,7 +54,7 @@ class NamecoinClient:
             'id': 1}
 
         try:
-            response = requests.post('http://%s:%d/' % (self.host, self.port), data=json.dumps(req_data), headers=headers, timeout=self.timeout)
+            response = load_requests().post('http://%s:%d/' % (self.host, self.port), data=json.dumps(req_data), headers=headers, timeout=self.timeout if timeout is None else timeout)
         except:
             raise NamecoinException('Unable to connect to Namecoin node', 500)
 
@@ -56,11 +71,32 @@ class NamecoinClient:
     ############################################
     # Domain Information and Registration
     ############################################
-    def get_domain(self, name):
+    def get_domain(self, name, timeout=None):
         try:
-            response = self.send('name_show', ['d/%s' % name])
+            response = self.send('name_show', ['d/%s' % name], timeout=timeout)
         except NamecoinException as e:
             if e.code == -4:
                 return None
             raise
-        return response
\ No newline at end of file
+        return response
+
+    def name_pending(self, timeout=None):
+        return self.send('name_pending', [], timeout=timeout) or []
+
+    ############################################
+    # Name Scanning and Block Data
+    ############################################
+    def name_scan(self, start='', count=500, timeout=None):
+        return self.send('name_scan', [start, count], timeout=timeout) or []
+
+    def get_block_count(self, timeout=None):
+        return self.send('getblockcount', [], timeout=timeout) or 0
+
+    def get_block_hash(self, height, timeout=None):
+        return self.send('getblockhash', [height], timeout=timeout)
+
+    def get_block(self, block_hash, verbosity=1, timeout=None):
+        return self.send('getblock', [block_hash, verbosity], timeout=timeout)
+
+    def get_raw_transaction(self, txid, timeout=None):
+        return self.send('getrawtransaction', [txid, 1], timeout=timeout)
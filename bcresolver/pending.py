@@ -0,0 +1,172 @@
+__author__ = 'mdavid'
+
+import json
+import logging
+import threading
+
+# Local Import(s)
+from namecoin import NamecoinClient, NamecoinException
+from records import NamecoinRecord
+
+# Setup Logging
+log = logging.getLogger(__name__)
+
+class PendingUpdateWatcher:
+
+    def __init__(self, resolver, host=None, user=None, password=None, port=8336, poll_interval=10, max_staged=1000, client=None):
+        '''
+
+        Initialize a PendingUpdateWatcher: polls namecoind's name_pending for unconfirmed d/ name updates and stages
+        each one on the resolver ahead of time (import chain applied, delegation parsed, new nameserver addresses looked
+        up and, with the dnspython engine, the DNSKEY set validated against the new DS record). Once an update leaves
+        the mempool and name_show returns it, the staged delegation and record are swapped into the resolver's caches, so
+        a nameserver or DS rotation does not fail validation against the old delegation until the caches expire.
+
+        With the default Unbound engine only the nameserver address lookups are staged: Unbound fetches the DNSKEY set on
+        the first query after the swap. Answers already cached under the old delegation are kept until their TTL runs out.
+
+        :param resolver: NamecoinResolver whose caches are updated
+        :param host: Namecoin Node Hostname (DNS Name or IP Address)
+        :param user: Namecoin Node Username
+        :param password: Namecoin Node Password
+        :param port: Namecoin Node Port (Default is 8336)
+        :param poll_interval: Seconds between name_pending calls (see start)
+        :param max_staged: Maximum number of updates staged at once (further updates are left to the normal cache expiry)
+        :param client: NamecoinClient object (Default is a new client for host / port)
+        :return: PendingUpdateWatcher object
+        '''
+
+        self.resolver = resolver
+        self.client = client or NamecoinClient(host or '127.0.0.1', port or 8336, user, password)
+        self.poll_interval = poll_interval
+        self.max_staged = max_staged
+
+        # SLD -> staged update (see NamecoinResolver._stage_update) with the pending txid and value
+        self.staged = {}
+        self.stats = {'polls': 0, 'staged': 0, 'installed': 0, 'abandoned': 0, 'skipped': 0, 'failed': 0}
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        '''
+
+        Stage new pending d/ updates and install the staged updates that have left the mempool
+
+        :return: None
+        '''
+
+        self.stats['polls'] += 1
+
+        pending = {}
+        for entry in self.client.name_pending():
+            name = entry.get('name') or ''
+            if name.startswith('d/') and len(name) > 2 and entry.get('value'):
+                pending[name[2:]] = entry
+
+        for sld, entry in pending.items():
+            staged = self.staged.get(sld)
+            if staged is None or staged['txid'] != entry.get('txid'):
+                self._stage(sld, entry)
+
+        for sld in [sld for sld in self.staged.keys() if sld not in pending]:
+            self._confirm(sld)
+
+    def _stage(self, sld, entry):
+        '''
+
+        Stage one pending update
+
+        :param sld: Second Level Domain label
+        :param entry: name_pending entry
+        :return: None
+        '''
+
+        if sld not in self.staged and len(self.staged) >= self.max_staged:
+            self.stats['skipped'] += 1
+            return
+
+        try:
+            nc_record = NamecoinRecord(json.loads(entry['value'].replace('\'','"')))
+            staged = self.resolver._stage_update(sld, nc_record)
+        except BaseException as e:
+            log.info('Unable to Stage Pending Namecoin Update for d/%s: %s' % (sld, e.__class__.__name__))
+            self.stats['failed'] += 1
+            self.staged.pop(sld, None)
+            return
+
+        staged['txid'] = entry.get('txid')
+        staged['value'] = entry['value']
+        self.staged[sld] = staged
+        self.stats['staged'] += 1
+        log.info('Staged Pending Namecoin Update for d/%s' % sld)
+
+    def _confirm(self, sld):
+        '''
+
+        Install a staged update that left the mempool if name_show now returns it, otherwise abandon it (replaced or
+        dropped). It stays staged if namecoind cannot be reached.
+
+        :param sld: Second Level Domain label
+        :return: None
+        '''
+
+        staged = self.staged[sld]
+        try:
+            nc_domain = self.resolver.nc_name_resolver.name_show(sld)
+        except NamecoinException as e:
+            log.warn('Unable to Check Pending Namecoin Update for d/%s: %s' % (sld, str(e)))
+            return
+
+        del self.staged[sld]
+        nc_domain = nc_domain or {}
+        if (staged['txid'] and nc_domain.get('txid') == staged['txid']) or nc_domain.get('value') == staged['value']:
+            self.resolver._install_update(sld, staged)
+            self.stats['installed'] += 1
+        else:
+            log.info('Pending Namecoin Update for d/%s Did Not Confirm' % sld)
+            self.stats['abandoned'] += 1
+
+    def report(self):
+        '''
+
+        :return: Dict with the poll, staged, installed, abandoned, skipped and failed counts and the number of updates currently staged
+        '''
+
+        report = dict(self.stats)
+        report['pending'] = len(self.staged)
+        return report
+
+    def start(self):
+        '''
+
+        Poll name_pending from a background thread, every poll_interval seconds
+
+        :return: None
+        '''
+
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except NamecoinException as e:
+                log.warn('Unable to Poll Pending Namecoin Updates: %s' % str(e))
+            except Exception as e:
+                log.error('Pending Namecoin Update Poll Failed: %s' % str(e))
+            self._stop.wait(self.poll_interval)
@@ -0,0 +1,363 @@
+__author__ = 'mdavid'
+
+import bisect
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import struct
+import threading
+from Queue import Queue
+
+from bcresolver import NamecoinResolver, ResolutionTimeoutException
+import wire
+
+# Setup Logging
+log = logging.getLogger(__name__)
+
+class WorkerUnavailableException(BaseException):
+    pass
+
+def shard_key(name):
+    '''
+
+    Key a query is routed by: the SLD of a .bit name, so every name of a zone goes to the same worker
+
+    :param name: DNS Record Name Query (for example: www.mattdavid.bit)
+    :return: Lowercase SLD label (the whole name if it has no SLD)
+    '''
+
+    labels = name.rstrip('.').lower().split('.')
+    return labels[-2] if len(labels) > 1 else labels[0]
+
+class HashRing:
+
+    def __init__(self, nodes, replicas=100):
+        '''
+
+        Initialize a HashRing: consistent hashing of keys onto nodes, each node placed at several points on the ring
+
+        :param nodes: List of node identifiers (str or int)
+        :param replicas: Points per node
+        :return: HashRing object
+        '''
+
+        self.nodes = list(nodes)
+        self._points = sorted([(self._hash('%s-%d' % (node, i)), node) for node in self.nodes for i in range(replicas)])
+        self._hashes = [point[0] for point in self._points]
+
+    def _hash(self, key):
+        return struct.unpack('<Q', hashlib.md5(key).digest()[:8])[0]
+
+    def get_nodes(self, key):
+        '''
+
+        :param key: Routing key
+        :return: List of every node, in ring order starting with the node owning key (the failover order)
+        '''
+
+        if not self._points:
+            return []
+
+        nodes = []
+        start = bisect.bisect(self._hashes, self._hash(key))
+        for i in range(len(self._points)):
+            node = self._points[(start + i) % len(self._points)][1]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == len(self.nodes):
+                    break
+        return nodes
+
+def _worker_main(conn, resolver_options, threads):
+    '''
+
+    Worker process: run calls received on conn against one NamecoinResolver with a pool of threads
+
+    :param conn: multiprocessing Connection to the pool
+    :param resolver_options: Dict of NamecoinResolver keyword arguments
+    :param threads: Number of concurrent calls
+    :return: None
+    '''
+
+    resolver = NamecoinResolver(**resolver_options)
+    resolver.warm()
+
+    pending = Queue()
+    send_lock = threading.Lock()
+
+    def work():
+        while True:
+            request = pending.get()
+            if request is None:
+                return
+
+            request_id, method, args = request
+            try:
+                reply = (request_id, True, getattr(resolver, method)(*args))
+            except BaseException as e:
+                reply = (request_id, False, e)
+
+            with send_lock:
+                try:
+                    conn.send(reply)
+                except Exception as e:
+                    # Unpicklable result or exception
+                    conn.send((request_id, False, RuntimeError('%s: %s' % (reply[2].__class__.__name__, str(e)))))
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, IOError):
+            break
+        if request is None:
+            break
+        pending.put(request)
+
+    for _ in workers:
+        pending.put(None)
+    for worker in workers:
+        worker.join()
+
+class PoolWorker:
+
+    def __init__(self, index, resolver_options, threads=16):
+        '''
+
+        Initialize a PoolWorker: the pool's handle on one worker process
+
+        :param index: Worker number (its node on the hash ring)
+        :param resolver_options: Dict of NamecoinResolver keyword arguments
+        :param threads: Concurrent calls in the worker process
+        :return: PoolWorker object
+        '''
+
+        self.index = index
+        self.resolver_options = resolver_options
+        self.threads = threads
+        self.process = None
+
+        self._conn = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._broken = True
+
+    @property
+    def alive(self):
+        return not self._broken and self.process is not None and self.process.is_alive()
+
+    def start(self):
+
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_main, args=(child_conn, self.resolver_options, self.threads), name='bcresolver-worker-%d' % self.index)
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+        self._conn = parent_conn
+        self._broken = False
+
+        receiver = threading.Thread(target=self._receive, args=(parent_conn,))
+        receiver.daemon = True
+        receiver.start()
+
+    def stop(self, timeout=5.0):
+        '''
+
+        Stop the worker process, failing its outstanding calls with WorkerUnavailableException
+
+        :param timeout: Seconds to wait for in-flight calls to finish before the process is terminated
+        :return: None
+        '''
+
+        self._broken = True
+        if self.process is None:
+            return
+
+        try:
+            with self._send_lock:
+                self._conn.send(None)
+        except (IOError, OSError, EOFError):
+            pass
+
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+        self._conn.close()
+        self._fail_pending()
+        self.process = None
+
+    def call(self, method, args, timeout=None):
+        '''
+
+        Run a NamecoinResolver method in the worker
+
+        :param method: Method name (for example: resolve_with_ttl)
+        :param args: Tuple of arguments
+        :param timeout: Seconds to wait for the reply (None for no limit)
+        :return: Method return value; exceptions raised in the worker are re-raised
+        '''
+
+        if not self.alive:
+            raise WorkerUnavailableException('Worker %d is not running' % self.index)
+
+        request_id = next(self._ids)
+        slot = {'done': threading.Event()}
+        with self._lock:
+            self._pending[request_id] = slot
+
+        try:
+            with self._send_lock:
+                self._conn.send((request_id, method, args))
+        except (IOError, OSError, EOFError) as e:
+            self._broken = True
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise WorkerUnavailableException('Worker %d: %s' % (self.index, str(e)))
+
+        if not slot['done'].wait(timeout):
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise ResolutionTimeoutException('No reply from worker %d within %.1fs' % (self.index, timeout))
+
+        if 'error' in slot:
+            raise slot['error']
+        return slot['value']
+
+    def _receive(self, conn):
+
+        while True:
+            try:
+                request_id, ok, result = conn.recv()
+            except (EOFError, IOError, OSError):
+                break
+
+            with self._lock:
+                slot = self._pending.pop(request_id, None)
+            if slot is None:
+                continue
+
+            slot['value' if ok else 'error'] = result
+            slot['done'].set()
+
+        if conn is self._conn:
+            self._broken = True
+            self._fail_pending()
+
+    def _fail_pending(self):
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for slot in pending.values():
+            slot['error'] = WorkerUnavailableException('Worker %d stopped' % self.index)
+            slot['done'].set()
+
+class ResolverPool:
+
+    def __init__(self, workers=None, resolver_options=None, threads=16, replicas=100, request_timeout=60.0):
+        '''
+
+        Initialize a ResolverPool: NamecoinResolver worker processes, each query routed to a worker by consistent hashing
+        of its SLD so each zone's warm state (Namecoin records, delegations, validation contexts, DNSKEY sets) lives in
+        one worker. Queries for a stopped worker fail over to the next worker on the ring.
+
+        :param workers: Number of worker processes (Default is the number of CPUs)
+        :param resolver_options: Dict of NamecoinResolver keyword arguments used in every worker
+        :param threads: Concurrent resolutions per worker
+        :param replicas: Hash ring points per worker
+        :param request_timeout: Seconds to wait for a worker reply when the call has no deadline
+        :return: ResolverPool object
+        '''
+
+        count = workers or multiprocessing.cpu_count()
+        self.workers = [PoolWorker(index, resolver_options or {}, threads) for index in range(count)]
+        self.ring = HashRing(range(count), replicas)
+        self.request_timeout = request_timeout
+        self.stats = {'calls': 0, 'failovers': 0}
+
+    def start(self):
+
+        for worker in self.workers:
+            worker.start()
+
+    def close(self):
+
+        for worker in self.workers:
+            worker.stop()
+
+    def restart(self, index, timeout=5.0):
+        '''
+
+        Restart one worker; its shard's queries fail over to the next worker on the ring meanwhile
+
+        :param index: Worker number
+        :param timeout: Seconds to wait for in-flight calls before the process is terminated
+        :return: None
+        '''
+
+        worker = self.workers[index]
+        worker.stop(timeout)
+        worker.start()
+
+    def worker_for(self, name):
+        '''
+
+        :param name: DNS Record Name Query
+        :return: Index of the worker currently serving name
+        '''
+
+        for index in self.ring.get_nodes(shard_key(name)):
+            if self.workers[index].alive:
+                return index
+        return None
+
+    def _call(self, key, method, args, deadline=None):
+        '''
+
+        Run a resolver method on the worker owning key, failing over along the ring
+
+        :param key: Routing key (see shard_key)
+        :param method: NamecoinResolver method name
+        :param args: Tuple of arguments
+        :param deadline: Time budget in seconds of the call (None for no limit)
+        :return: Method return value
+        '''
+
+        self.stats['calls'] += 1
+        timeout = deadline + 1.0 if deadline else self.request_timeout
+
+        for index in self.ring.get_nodes(key):
+            try:
+                return self.workers[index].call(method, args, timeout)
+            except WorkerUnavailableException:
+                log.info('Worker %d Unavailable for %s, Failing Over' % (index, key))
+                self.stats['failovers'] += 1
+
+        raise WorkerUnavailableException('No resolver worker available')
+
+    def resolve(self, name, qtype, deadline=None):
+        return self.resolve_with_ttl(name, qtype, deadline)[0]
+
+    def resolve_with_ttl(self, name, qtype, deadline=None):
+        return self._call(shard_key(name), 'resolve_with_ttl', (name, qtype, deadline), deadline)
+
+    def resolve_all(self, name, qtypes, deadline=None):
+        return self._call(shard_key(name), 'resolve_all', (name, qtypes, deadline), deadline)
+
+    def resolve_wire(self, query, deadline=None):
+
+        try:
+            key = shard_key(wire.parse_question(query).name)
+        except wire.WireFormatException:
+            key = ''
+        return self._call(key, 'resolve_wire', (query, deadline), deadline)
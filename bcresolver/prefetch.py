@@ -0,0 +1,284 @@
+__author__ = 'mdavid'
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from Queue import Queue
+
+# Setup Logging
+log = logging.getLogger(__name__)
+
+# Recent queries per SLD that a new query is compared with when learning
+RECENT_PER_SLD = 4
+
+# Query types fetched along with each query type for the same name
+SIBLING_QTYPES = {
+    'A': ('AAAA',),
+    'AAAA': ('A',)
+}
+
+def wallet_currencies(name, qtype, value):
+    '''
+
+    Wallet Name lookups: a _wallet TXT record lists currencies, each of which is looked up next as _<currency>._wallet TXT
+
+    :param name: DNS Record Name Query (for example: _wallet.wallet.mattdavid.bit)
+    :param qtype: String representation of query type
+    :param value: Resolved value
+    :return: List of (name, qtype) tuples
+    '''
+
+    if qtype != 'TXT' or not name.lower().startswith('_wallet.') or not isinstance(value, basestring):
+        return []
+
+    return [('_%s.%s' % (currency.lower(), name), 'TXT') for currency in value.split() if currency.isalnum()]
+
+def antecedent(name, qtype):
+    '''
+
+    Class of queries a learned pattern applies to: the query type and, for underscore (service) names, the first label
+
+    :param name: Lowercase DNS Record Name Query
+    :param qtype: String representation of query type
+    :return: Tuple of (qtype, first label or '')
+    '''
+
+    label = name.split('.', 1)[0]
+    return qtype, label if label.startswith('_') else ''
+
+class PrefetchPolicy:
+
+    def __init__(self, rules=None, derive=(wallet_currencies,), learn=False, window=2.0, min_support=5, min_confidence=0.5, max_patterns=1000, max_per_query=4, budget=20.0, max_pending=256, workers=2, tracked=10000, failure_backoff=300.0):
+        '''
+
+        Initialize a PrefetchPolicy: after a successful resolve(), queue the queries likely to follow it at low
+        (PRIORITY_REFRESH) priority so their answers are cached when they arrive
+
+        Likely next queries come from rules (other query types for the same name), derive functions (computed from the
+        answer, for example the currencies listed in a _wallet TXT record) and, with learn, from query pairs observed
+        for the same SLD within window seconds (a query type followed by a query for the same name, or for a name
+        prefixed with more labels, such as _btc.).
+
+        :param rules: Dict of query type -> tuple of query types for the same name (Default is SIBLING_QTYPES, {} for none)
+        :param derive: Tuple of functions (name, qtype, value) -> list of (name, qtype)
+        :param learn: Learn follow-up patterns from observed queries
+        :param window: Seconds within which a query counts as following the previous query for its SLD
+        :param min_support: Observations of a learned pattern before it is used
+        :param min_confidence: Fraction of queries of a class that must be followed by the pattern before it is used
+        :param max_patterns: Maximum number of learned patterns kept
+        :param max_per_query: Maximum number of prefetches queued after one query
+        :param budget: Maximum prefetches started per second (further candidates are dropped)
+        :param max_pending: Maximum prefetches waiting for a worker thread
+        :param workers: Number of prefetch threads
+        :param tracked: Number of prefetched answers (and failed prefetches) tracked
+        :param failure_backoff: Seconds before a prefetch that failed (for example AAAA for an IPv4-only name) is queued again
+        :return: PrefetchPolicy object
+        '''
+
+        self.rules = SIBLING_QTYPES if rules is None else rules
+        self.derive = tuple(derive or ())
+        self.learn = learn
+        self.window = window
+        self.min_support = min_support
+        self.min_confidence = min_confidence
+        self.max_patterns = max_patterns
+        self.max_per_query = max_per_query
+        self.budget = budget
+        self.max_pending = max_pending
+        self.workers = workers
+        self.tracked = tracked
+        self.failure_backoff = failure_backoff
+        self.stats = {'queued': 0, 'dropped': 0, 'fetched': 0, 'cached': 0, 'failed': 0, 'used': 0}
+
+        self._lock = threading.Lock()
+        self._pending = Queue()
+        self._threads = []
+        self._inflight = set()
+
+        # (name, qtype) -> (expires, fetched): prefetched answers until they expire, failed prefetches until their backoff ends
+        self._prefetched = OrderedDict()
+        self._tokens = budget
+        self._refilled = time.time()
+
+        # Learning state: SLD -> [(query, time)] (newest first); antecedent -> count; antecedent -> {(prefix, qtype): count}
+        self._recent = OrderedDict()
+        self._antecedents = {}
+        self._patterns = {}
+        self._pattern_count = 0
+
+    def observe(self, resolver, name, qtype, value, cached=False):
+        '''
+
+        Record a successful resolution and queue its likely follow-up queries
+
+        :param resolver: NamecoinResolver that answered (and runs the prefetches)
+        :param name: DNS Record Name Query
+        :param qtype: String representation of query type
+        :param value: Resolved value
+        :param cached: The answer came from the answer cache (its follow-up queries were queued when it was resolved, so none are queued again)
+        :return: None
+        '''
+
+        key = (name.lower().rstrip('.'), qtype)
+        now = time.time()
+
+        with self._lock:
+            entry = self._prefetched.pop(key, None)
+            if entry is not None and entry[1] and entry[0] > now:
+                self.stats['used'] += 1
+
+            if self.learn:
+                self._learn(key, now)
+
+        if cached:
+            return
+
+        for candidate in self.predict(name, qtype, value)[:self.max_per_query]:
+            self._schedule(resolver, candidate, now)
+
+    def predict(self, name, qtype, value=None):
+        '''
+
+        :param name: DNS Record Name Query
+        :param qtype: String representation of query type
+        :param value: Resolved value (used by derive functions)
+        :return: List of (lowercase name, qtype) tuples likely to be queried next
+        '''
+
+        name = name.lower().rstrip('.')
+        candidates = [(name, sibling) for sibling in self.rules.get(qtype, ())]
+
+        for derive in self.derive:
+            candidates.extend([(derived[0].lower(), derived[1]) for derived in derive(name, qtype, value)])
+
+        if self.learn:
+            for prefix, next_qtype in self.learned(antecedent(name, qtype)):
+                candidates.append((prefix + name, next_qtype))
+
+        predicted = []
+        for candidate in candidates:
+            if candidate != (name, qtype) and candidate not in predicted:
+                predicted.append(candidate)
+        return predicted
+
+    def learned(self, query_class):
+        '''
+
+        :param query_class: Tuple of (qtype, first label or '') (see antecedent)
+        :return: List of (name prefix, qtype) patterns meeting min_support and min_confidence, most frequent first
+        '''
+
+        with self._lock:
+            total = self._antecedents.get(query_class, 0)
+            patterns = self._patterns.get(query_class, {}).items()
+
+        usable = [(count, pattern) for pattern, count in patterns if count >= self.min_support and count >= total * self.min_confidence]
+        usable.sort(reverse=True)
+        return [pattern for count, pattern in usable]
+
+    def _learn(self, key, now):
+        '''
+
+        Count key as following each recent query (within the window) for its SLD whose name it equals or extends (lock
+        held)
+
+        :param key: Tuple of (lowercase name, qtype)
+        :param now: Timestamp
+        :return: None
+        '''
+
+        labels = key[0].split('.')
+        sld = labels[-2] if len(labels) > 1 else key[0]
+
+        history = [entry for entry in self._recent.pop(sld, ()) if now - entry[1] <= self.window and entry[0] != key]
+        self._recent[sld] = ([(key, now)] + history)[:RECENT_PER_SLD]
+        if len(self._recent) > self.tracked:
+            self._recent.popitem(last=False)
+
+        query_class = antecedent(key[0], key[1])
+        self._antecedents[query_class] = self._antecedents.get(query_class, 0) + 1
+
+        for (previous_name, previous_qtype), _ in history:
+            if key[0] != previous_name and not key[0].endswith('.' + previous_name):
+                continue
+
+            pattern = (key[0][:len(key[0]) - len(previous_name)], key[1])
+            patterns = self._patterns.setdefault(antecedent(previous_name, previous_qtype), {})
+            if pattern not in patterns:
+                if self._pattern_count >= self.max_patterns:
+                    continue
+                self._pattern_count += 1
+            patterns[pattern] = patterns.get(pattern, 0) + 1
+
+    def _schedule(self, resolver, key, now):
+        '''
+
+        Queue a prefetch unless it is in flight, already prefetched, failed recently, or over budget
+
+        :param resolver: NamecoinResolver object
+        :param key: Tuple of (name, qtype)
+        :param now: Timestamp
+        :return: None
+        '''
+
+        with self._lock:
+            if key in self._inflight or self._prefetched.get(key, (0, False))[0] > now:
+                return
+
+            self._tokens = min(self.budget, self._tokens + (now - self._refilled) * self.budget)
+            self._refilled = now
+            if self._tokens < 1 or self._pending.qsize() >= self.max_pending:
+                self.stats['dropped'] += 1
+                return
+
+            self._tokens -= 1
+            self._inflight.add(key)
+            self.stats['queued'] += 1
+
+            if not self._threads:
+                for _ in range(self.workers):
+                    thread = threading.Thread(target=self._work)
+                    thread.daemon = True
+                    thread.start()
+                    self._threads.append(thread)
+
+        self._pending.put((resolver, key))
+
+    def _work(self):
+
+        while True:
+            resolver, key = self._pending.get()
+
+            ttl = None
+            try:
+                ttl = resolver._prefetch(key[0], key[1])
+            except BaseException as e:
+                log.debug('Prefetch Failed for %s [%s]: %s' % (key[0], key[1], e.__class__.__name__))
+
+            with self._lock:
+                self._inflight.discard(key)
+                if ttl is None:
+                    self.stats['failed'] += 1
+                    self._prefetched[key] = (time.time() + self.failure_backoff, False)
+                elif ttl == 0:
+                    self.stats['cached'] += 1
+                else:
+                    self.stats['fetched'] += 1
+                    self._prefetched[key] = (time.time() + ttl, True)
+
+                if len(self._prefetched) > self.tracked:
+                    self._prefetched.popitem(last=False)
+
+    def report(self):
+        '''
+
+        :return: Dict of prefetch counts (queued, dropped, fetched, cached, failed, used) with hit_rate (used / fetched) and the number of learned patterns
+        '''
+
+        with self._lock:
+            report = dict(self.stats)
+            report['patterns'] = self._pattern_count
+
+        report['hit_rate'] = float(report['used']) / report['fetched'] if report['fetched'] else None
+        return report
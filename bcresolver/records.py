@@ -0,0 +1,167 @@
+__author__ = 'mdavid'
+
+def compact(obj):
+    '''
+
+    Convert a parsed JSON value into a compact form: ASCII unicode strings become (interned when short) byte strings
+    and lists become tuples
+
+    :param obj: Parsed JSON value
+    :return: Compact equivalent of obj
+    '''
+
+    if isinstance(obj, unicode):
+        try:
+            obj = obj.encode('ascii')
+        except UnicodeError:
+            return obj
+        return intern(obj) if len(obj) <= 64 else obj
+
+    if isinstance(obj, list):
+        return tuple([compact(x) for x in obj])
+
+    if isinstance(obj, dict):
+        return dict([(compact(k), compact(v)) for k, v in obj.iteritems()])
+
+    return obj
+
+def parse_links(value):
+    '''
+
+    Normalize a Namecoin import or delegate item: a name string, a [name, selector] pair, or a list of either
+
+    :param value: Parsed (compact) import or delegate item
+    :return: Tuple of (name, selector) tuples, empty if value is unset or malformed
+    '''
+
+    if not value:
+        return ()
+
+    if isinstance(value, basestring):
+        return ((value, ''),)
+
+    # A single [name, selector] pair
+    if len(value) == 2 and all([isinstance(x, basestring) for x in value]) and not value[1].startswith('d/'):
+        return ((value[0], value[1]),)
+
+    links = []
+    for item in value:
+        if isinstance(item, basestring):
+            links.append((item, ''))
+        elif isinstance(item, tuple) and item and isinstance(item[0], basestring):
+            links.append((item[0], item[1] if len(item) > 1 and isinstance(item[1], basestring) else ''))
+    return tuple(links)
+
+class NamecoinRecord(object):
+    '''
+
+    Compact copy of the parts of a Namecoin d/ name value used for resolution. The name_show txid, address and raw
+    value string are not kept.
+    '''
+
+    __slots__ = ('ns', 'ds', 'ip', 'ip6', 'alias', 'map', 'imports', 'delegate')
+
+    # Value items merged across import chains (imports and delegate describe the chain itself)
+    VALUE_FIELDS = ('ns', 'ds', 'ip', 'ip6', 'alias', 'map')
+
+    def __init__(self, value):
+        '''
+
+        Initialize a NamecoinRecord from a parsed Namecoin value
+
+        :param value: Parsed Namecoin value dict
+        :return: NamecoinRecord object
+        '''
+
+        for field in self.VALUE_FIELDS:
+            setattr(self, field, compact(value.get(field)))
+
+        self.imports = parse_links(compact(value.get('import')))
+        delegate = parse_links(compact(value.get('delegate')))
+        self.delegate = delegate[0] if delegate else None
+
+    def __eq__(self, other):
+        return isinstance(other, NamecoinRecord) and all([getattr(self, field) == getattr(other, field) for field in self.__slots__])
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def links(self):
+        '''
+
+        :return: Tuple of (name, selector) tuples this record imports or delegates to (the delegate only, if set)
+        '''
+
+        return (self.delegate,) if self.delegate else self.imports
+
+    def merge(self, imported):
+        '''
+
+        Combine this record with an imported one: items set in this record override the imported items
+
+        :param imported: NamecoinRecord being imported
+        :return: New NamecoinRecord without imports or delegate
+        '''
+
+        merged = NamecoinRecord({})
+        for field in self.VALUE_FIELDS:
+            value = getattr(self, field)
+            setattr(merged, field, getattr(imported, field) if value is None else value)
+        return merged
+
+    def select(self, selector):
+        '''
+
+        Select the record of a subdomain through the map item, for import and delegate selectors
+
+        :param selector: Subdomain, relative to this record's name (for example: www or a.b). Empty selects this record
+        :return: NamecoinRecord object, None if the subdomain is not in the map
+        '''
+
+        record = self
+        labels = selector.split('.') if selector else []
+        labels.reverse()
+        for label in labels:
+            entry = (record.map or {}).get(label)
+            if isinstance(entry, basestring):
+                entry = {'ip': entry}
+            if not isinstance(entry, dict):
+                return None
+            record = NamecoinRecord(entry)
+        return record
+
+    def get(self, key, default=None):
+        '''
+
+        Dict-style access to the record fields
+
+        :param key: Field name
+        :param default: Value returned if the field is unset
+        :return: Field value or default
+        '''
+
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+class Delegation(object):
+    '''
+
+    Parsed delegation of a Namecoin-based zone: its nameservers and the DS record used as Unbound trust anchor
+    '''
+
+    __slots__ = ('sld', 'ns', 'ds_ta')
+
+    def __init__(self, sld, ns, ds_ta):
+        '''
+
+        Initialize a Delegation
+
+        :param sld: Zone name (for example: mattdavid.bit.)
+        :param ns: Tuple of nameserver hostnames
+        :param ds_ta: DS trust anchor string for the zone
+        :return: Delegation object
+        '''
+
+        self.sld = intern(sld) if isinstance(sld, str) else sld
+        self.ns = tuple(ns)
+        self.ds_ta = ds_ta
@@ -0,0 +1,336 @@
+__author__ = 'mdavid'
+
+import argparse
+import hashlib
+import json
+import random
+import resource
+import sys
+import threading
+import time
+from Queue import Queue
+
+from bcresolver import NamecoinResolver, RDATATYPE
+from cli import parse_line, resolve_one
+from namecoin import NamecoinException
+from stats import LatencyTracker
+
+# Marks the end of the schedule for the workers
+_DONE = object()
+
+# Stand-in DS trust anchor digest (the stand-in engine does not validate)
+STAND_IN_DS = [[40039, 8, 2, 'NZbut7iqVxCP0IGCX7J1DA/DrbrkFJzEML1PetAxVzQ=']]
+
+def parse_log_line(line, default_qtype='A'):
+    '''
+
+    Parse one query log line of the form "timestamp name [qtype]"
+
+    :param line: Query log line
+    :param default_qtype: Query type used when the line has none
+    :return: Tuple of (timestamp, name, qtype), None for blank and comment lines
+    '''
+
+    fields = line.split(None, 1)
+    if not fields or fields[0].startswith('#') or len(fields) < 2:
+        return None
+
+    query = parse_line(fields[1], default_qtype)
+    if query is None:
+        return None
+
+    return float(fields[0]), query[0], query[1]
+
+class InjectedFault:
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, seed=None):
+        '''
+
+        Initialize an InjectedFault: latency and failures injected into a stand-in backend
+
+        :param latency: Base latency in seconds added to every call
+        :param jitter: Maximum extra latency in seconds (uniformly distributed)
+        :param failure_rate: Fraction of calls that fail (0.0 - 1.0)
+        :param seed: Random seed, for reproducible runs
+        :return: InjectedFault object
+        '''
+
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def apply(self, timeout=None):
+        '''
+
+        Sleep for the injected latency (capped at timeout) and decide whether the call fails
+
+        :param timeout: Maximum seconds to sleep (None for no limit)
+        :return: Boolean, True if the call should fail (or the latency exceeded timeout)
+        '''
+
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.failure_rate
+
+        if timeout is not None and delay > timeout:
+            time.sleep(max(0, timeout))
+            return True
+
+        if delay:
+            time.sleep(delay)
+        return failed
+
+class StandInNamecoinResolver:
+
+    def __init__(self, host, user, password, port, fault=None):
+        '''
+
+        Initialize a StandInNamecoinResolver: answers name_show for every d/ name with a synthesized delegation, in place
+        of a namecoind node (use as NamecoinResolver nc_name_resolver)
+
+        :param host: Ignored (nc_name_resolver interface)
+        :param user: Ignored (nc_name_resolver interface)
+        :param password: Ignored (nc_name_resolver interface)
+        :param port: Ignored (nc_name_resolver interface)
+        :param fault: InjectedFault for name_show calls
+        :return: StandInNamecoinResolver object
+        '''
+
+        self.fault = fault or InjectedFault()
+
+    def name_show(self, name, timeout=None):
+
+        if self.fault.apply(timeout):
+            raise NamecoinException('Injected namecoind failure', 500)
+
+        return {'value': json.dumps({'ds': STAND_IN_DS, 'ns': ['ns1.%s.bit' % name, 'ns2.%s.bit' % name]})}
+
+class StandInResultData(object):
+
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+
+    def as_address_list(self):
+        return list(self.values)
+
+    def as_domain_list(self):
+        return list(self.values)
+
+    def as_mx_list(self):
+        return [(10, value) for value in self.values]
+
+class StandInResult(object):
+
+    __slots__ = ('secure', 'bogus', 'havedata', 'data', 'ttl', 'packet')
+
+    def __init__(self, values, ttl):
+        self.secure = 1
+        self.bogus = 0
+        self.havedata = 1 if values else 0
+        self.data = StandInResultData(values)
+        self.ttl = ttl
+        self.packet = None
+
+class StandInEngine:
+
+    def __init__(self, fault=None, ttl=300):
+        '''
+
+        Initialize a StandInEngine: answers every query with synthesized, already-validated data in place of the
+        authoritative nameservers (use as NamecoinResolver engine)
+
+        :param fault: InjectedFault for each query (failures look like an unreachable nameserver)
+        :param ttl: TTL of the synthesized answers
+        :return: StandInEngine object
+        '''
+
+        self.fault = fault or InjectedFault()
+        self.ttl = ttl
+
+    def warm(self):
+        pass
+
+    def resolve_addresses(self, hostname, timeout=None):
+        return ['192.0.2.%d' % (ord(hashlib.md5(hostname).digest()[0]) % 254 + 1)], self.ttl
+
+    def query(self, zone, address, ds_ta, name, rrtype, timeout=None):
+
+        if self.fault.apply(timeout):
+            return -1, None
+
+        digest = hashlib.md5(name.lower()).digest()
+        if rrtype == RDATATYPE['A']:
+            values = ['10.%d.%d.%d' % tuple([ord(c) for c in digest[:3]])]
+        elif rrtype == RDATATYPE['AAAA']:
+            values = ['2001:db8::%x' % ord(digest[0])]
+        else:
+            values = [digest.encode('hex')]
+
+        return 0, StandInResult(values, self.ttl)
+
+def peak_rss_kb():
+    '''
+
+    :return: Peak resident set size of this process in KB
+    '''
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+def replay(resolver, queries, speed=1.0, workers=64, deadline=None):
+    '''
+
+    Replay timestamped queries against a resolver in open loop: each query is issued at its (speed-scaled) offset in
+    the log, whether or not earlier queries have finished. Latency is measured from the scheduled send time, so time
+    spent waiting for a free worker counts (no coordinated omission).
+
+    :param resolver: NamecoinResolver object
+    :param queries: Iterable of (timestamp, name, qtype) tuples in timestamp order
+    :param speed: Replay speed multiplier (2.0 replays twice as fast as recorded)
+    :param workers: Number of resolutions in flight
+    :param deadline: Time budget in seconds for each resolution (None for no limit)
+    :return: Report dict (see build_report)
+    '''
+
+    pending = Queue()
+    latencies = LatencyTracker(size=None, min_samples=1)
+    errors = {}
+    no_answer = [0]
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            query = pending.get()
+            if query is _DONE:
+                return
+
+            scheduled, name, qtype = query
+            record = resolve_one(resolver, name, qtype, deadline)
+            latencies.record(time.time() - scheduled)
+            with lock:
+                if record['error']:
+                    errors[record['error']] = errors.get(record['error'], 0) + 1
+                elif record['value'] is None:
+                    no_answer[0] += 1
+
+    threads = [threading.Thread(target=work) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    start = time.time()
+    first = None
+    sent = 0
+    for timestamp, name, qtype in queries:
+        if first is None:
+            first = timestamp
+
+        scheduled = start + (timestamp - first) / speed
+        delay = scheduled - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+        pending.put((scheduled, name, qtype))
+        sent += 1
+
+    for _ in threads:
+        pending.put(_DONE)
+    for thread in threads:
+        thread.join()
+
+    return build_report(sent, time.time() - start, latencies, errors, no_answer[0])
+
+def build_report(sent, duration, latencies, errors, no_answer=0):
+    '''
+
+    Summarize a replay run
+
+    :param sent: Number of queries issued
+    :param duration: Run time in seconds
+    :param latencies: LatencyTracker holding every query latency
+    :param errors: Dict of exception class name -> count
+    :param no_answer: Number of queries that completed without an answer (no nameserver answered)
+    :return: Dict with queries, duration_s, throughput_qps, latency_ms (p50, p99, p999, max), errors, no_answer and peak_rss_kb
+    '''
+
+    def ms(seconds):
+        return round(seconds * 1000, 3) if seconds is not None else None
+
+    return {
+        'queries': sent,
+        'duration_s': round(duration, 3),
+        'throughput_qps': round(sent / duration, 1) if duration > 0 else None,
+        'latency_ms': {
+            'p50': ms(latencies.percentile(0.5)),
+            'p99': ms(latencies.percentile(0.99)),
+            'p999': ms(latencies.percentile(0.999)),
+            'max': ms(latencies.percentile(1.0))
+        },
+        'errors': errors,
+        'no_answer': no_answer,
+        'peak_rss_kb': peak_rss_kb()
+    }
+
+def build_stand_in_resolver(args):
+    '''
+
+    Build a NamecoinResolver backed by the stand-in namecoind and nameservers
+
+    :param args: argparse Namespace
+    :return: NamecoinResolver object
+    '''
+
+    namecoin_fault = InjectedFault(args.namecoin_latency / 1000.0, args.namecoin_jitter / 1000.0, args.namecoin_failure_rate, args.seed)
+    dns_fault = InjectedFault(args.dns_latency / 1000.0, args.dns_jitter / 1000.0, args.dns_failure_rate, args.seed)
+
+    return NamecoinResolver(
+        nc_name_resolver=StandInNamecoinResolver,
+        nc_name_resolver_options={'fault': namecoin_fault},
+        engine=StandInEngine(dns_fault),
+        native_records=args.native_records,
+        serve_stale=args.serve_stale,
+        max_concurrent=args.max_concurrent
+    )
+
+def main(argv=None, stdout=None):
+    '''
+
+    bcresolver-replay console entry point: replay a query log against stand-in backends and print a JSON report
+
+    :param argv: Command line arguments (defaults to sys.argv[1:])
+    :param stdout: Output stream (defaults to sys.stdout)
+    :return: Exit status
+    '''
+
+    parser = argparse.ArgumentParser(prog='bcresolver-replay', description='Replay a "timestamp name [qtype]" query log against NamecoinResolver with stand-in namecoind and nameservers')
+    parser.add_argument('file', help='Query log file')
+    parser.add_argument('-s', '--speed', type=float, default=1.0, help='Replay speed multiplier (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, default=64, help='Number of resolutions in flight (default: %(default)s)')
+    parser.add_argument('-d', '--deadline', type=float, default=None, help='Time budget in seconds for each resolution (default: no limit)')
+    parser.add_argument('--namecoin-latency', type=float, default=5.0, help='namecoind latency in ms (default: %(default)s)')
+    parser.add_argument('--namecoin-jitter', type=float, default=0.0, help='Extra random namecoind latency in ms (default: %(default)s)')
+    parser.add_argument('--namecoin-failure-rate', type=float, default=0.0, help='Fraction of failing name_show calls (default: %(default)s)')
+    parser.add_argument('--dns-latency', type=float, default=20.0, help='Nameserver latency in ms (default: %(default)s)')
+    parser.add_argument('--dns-jitter', type=float, default=0.0, help='Extra random nameserver latency in ms (default: %(default)s)')
+    parser.add_argument('--dns-failure-rate', type=float, default=0.0, help='Fraction of unanswered nameserver queries (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for injected faults')
+    parser.add_argument('--native-records', action='store_true', help='Answer A/AAAA/CNAME from Namecoin value data when possible')
+    parser.add_argument('--serve-stale', type=int, default=0, help='Serve-stale grace period in seconds (default: %(default)s)')
+    parser.add_argument('--max-concurrent', type=int, default=None, help='Admission control concurrency limit (default: disabled)')
+    args = parser.parse_args(argv)
+
+    stdout = stdout or sys.stdout
+
+    with open(args.file) as infile:
+        queries = [query for query in (parse_log_line(line) for line in infile) if query]
+
+    report = replay(build_stand_in_resolver(args), queries, args.speed, args.workers, args.deadline)
+    stdout.write(json.dumps(report, indent=2, sort_keys=True) + '\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+__author__ = 'mdavid'
+
+import argparse
+import json
+import logging
+import socket
+import sys
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from cli import add_resolver_arguments, build_resolver, resolve_one, resolve_stream
+
+# Setup Logging
+log = logging.getLogger(__name__)
+
+class ResolverHTTPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, resolver, concurrency=8, deadline=None, max_batch=10000):
+        '''
+
+        Initialize a ResolverHTTPServer: a threaded HTTP/1.1 server answering resolution requests from one shared resolver
+
+        :param address: Tuple of (listen address, port)
+        :param resolver: NamecoinResolver object shared by every request
+        :param concurrency: Resolutions in flight per batch request
+        :param deadline: Default time budget in seconds for each resolution (None for no limit)
+        :param max_batch: Maximum number of queries in one batch request
+        :return: ResolverHTTPServer object
+        '''
+
+        HTTPServer.__init__(self, address, ResolverRequestHandler)
+        self.resolver = resolver
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.max_batch = max_batch
+
+class ResolverRequestHandler(BaseHTTPRequestHandler):
+    '''
+
+    GET /resolve?name=<name>&qtype=<qtype>[&deadline=<seconds>]
+        One JSON result (see cli.resolve_one). Overloaded resolvers answer 503.
+
+    POST /batch[?deadline=<seconds>]
+        JSON list of [name, qtype] pairs (or {"name": ..., "qtype": ...} objects). Results are streamed as JSON lines,
+        in completion order, with chunked transfer encoding.
+
+    GET /top[?k=<entries>]
+        Most queried SLDs and names (see HeavyHitters.report). 404 unless the resolver tracks them (--top-k).
+
+    GET /health
+        {"status": "ok"}
+    '''
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'bcresolver'
+
+    def do_GET(self):
+
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+
+        if url.path == '/health':
+            return self.send_json(200, {'status': 'ok'})
+
+        if url.path == '/top':
+            return self.send_top(params)
+
+        if url.path != '/resolve':
+            return self.send_json(404, {'error': 'Not Found'})
+
+        name = params.get('name')
+        if not name:
+            return self.send_json(400, {'error': 'Missing name parameter'})
+
+        try:
+            deadline = self.get_deadline(params)
+        except ValueError:
+            return self.send_json(400, {'error': 'Invalid deadline parameter'})
+
+        record = resolve_one(self.server.resolver, name, params.get('qtype', 'A').upper(), deadline)
+        self.send_json(503 if record['error'] == 'OverloadException' else 200, record)
+
+    def do_POST(self):
+
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+
+        if url.path != '/batch':
+            self.read_body()
+            return self.send_json(404, {'error': 'Not Found'})
+
+        try:
+            queries = self.parse_batch(self.read_body())
+            deadline = self.get_deadline(params)
+        except ValueError as e:
+            return self.send_json(400, {'error': str(e)})
+
+        if len(queries) > self.server.max_batch:
+            return self.send_json(413, {'error': 'Batch larger than %d queries' % self.server.max_batch})
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        stream = resolve_stream(self.server.resolver, queries, self.server.concurrency, deadline)
+        try:
+            for record in stream:
+                self.write_chunk(json.dumps(record) + '\n')
+            self.write_chunk('')
+        except socket.error as e:
+            log.info('Batch Client Disconnected: %s' % str(e))
+            self.close_connection = 1
+
+            # Let the in-flight resolutions finish so the stream's worker threads exit
+            for _ in stream:
+                pass
+
+    def send_top(self, params):
+
+        heavy_hitters = getattr(self.server.resolver, 'heavy_hitters', None)
+        if heavy_hitters is None:
+            return self.send_json(404, {'error': 'Heavy hitter tracking is not enabled'})
+
+        try:
+            k = int(params['k']) if 'k' in params else None
+            if k is not None and k < 0:
+                raise ValueError(k)
+        except ValueError:
+            return self.send_json(400, {'error': 'Invalid k parameter'})
+
+        self.send_json(200, heavy_hitters.report(k))
+
+    def read_body(self):
+        '''
+
+        :return: Request body (empty if there is no Content-Length)
+        '''
+
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length > 0 else ''
+
+    def parse_batch(self, body):
+        '''
+
+        Parse a batch request body
+
+        :param body: JSON request body
+        :return: List of (name, qtype) tuples
+        '''
+
+        try:
+            items = json.loads(body)
+        except ValueError:
+            raise ValueError('Request body is not valid JSON')
+
+        if not isinstance(items, list):
+            raise ValueError('Request body must be a JSON list')
+
+        queries = []
+        for item in items:
+            if isinstance(item, dict):
+                item = [item.get('name'), item.get('qtype', 'A')]
+            if not isinstance(item, list) or not item or not isinstance(item[0], basestring):
+                raise ValueError('Invalid query: %s' % json.dumps(item))
+            queries.append((item[0].encode('utf-8'), str(item[1] if len(item) > 1 else 'A').upper()))
+        return queries
+
+    def get_deadline(self, params):
+        '''
+
+        :param params: Dict of query string parameters
+        :return: Deadline in seconds from the deadline parameter, or the server default
+        '''
+
+        if 'deadline' not in params:
+            return self.server.deadline
+
+        deadline = float(params['deadline'])
+        if deadline <= 0:
+            raise ValueError('Invalid deadline parameter')
+        return deadline
+
+    def send_json(self, status, obj):
+
+        body = json.dumps(obj)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 503:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+
+        self.wfile.write('%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        log.debug('%s - %s' % (self.address_string(), format % args))
+
+def main(argv=None):
+    '''
+
+    bcresolver-server console entry point: serve resolutions over HTTP/JSON from one warm, shared resolver
+
+    :param argv: Command line arguments (defaults to sys.argv[1:])
+    :return: Exit status
+    '''
+
+    parser = argparse.ArgumentParser(prog='bcresolver-server', description='HTTP/JSON .bit resolution service (GET /resolve, POST /batch)')
+    parser.add_argument('-l', '--listen', default='127.0.0.1', help='Listen address (default: %(default)s)')
+    parser.add_argument('-p', '--listen-port', type=int, default=8053, help='Listen port (default: %(default)s)')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='Resolutions in flight per batch request (default: %(default)s)')
+    parser.add_argument('-d', '--deadline', type=float, default=None, help='Default time budget in seconds for each resolution (default: no limit)')
+    parser.add_argument('--max-batch', type=int, default=10000, help='Maximum queries per batch request (default: %(default)s)')
+    add_resolver_arguments(parser)
+    args = parser.parse_args(argv)
+
+    resolver = build_resolver(args)
+    resolver.warm()
+
+    server = ResolverHTTPServer((args.listen, args.listen_port), resolver, args.concurrency, args.deadline, args.max_batch)
+    log.info('Serving on %s:%d' % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
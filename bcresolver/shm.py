@@ -0,0 +1,262 @@
+__author__ = 'mdavid'
+
+import cPickle
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+# Local Import(s)
+from backends import CacheBackend
+
+# Setup Logging
+log = logging.getLogger(__name__)
+
+MAGIC = 0x42435348
+VERSION = 1
+
+# magic, version, buckets, ways, slot size
+FILE_HEADER = struct.Struct('<IIIII')
+
+# sequence, payload length, expires, key hash
+SLOT_HEADER = struct.Struct('<IIdQ')
+SEQUENCE = struct.Struct('<I')
+
+def key_hash(key):
+    '''
+
+    Stable (cross-process) 64-bit hash of a cache key
+
+    :param key: Cache key (str, int or tuple of those)
+    :return: Non-zero 64-bit hash
+    '''
+
+    return struct.unpack('<Q', hashlib.md5(repr(key)).digest()[:8])[0] or 1
+
+class SharedMemoryCache(CacheBackend):
+
+    def __init__(self, path=None, size=16*1024*1024, slot_size=1024, ways=4, read_retries=8):
+        '''
+
+        Initialize a SharedMemoryCache: a fixed-size hash table of expiring entries in a memory-mapped file, shared by
+        every process that maps it
+
+        Each bucket holds a few fixed-size slots guarded by a sequence counter (seqlock): readers never lock, they copy the
+        slot and retry if a writer changed it meanwhile. Writers take a file lock over the whole bucket while they pick
+        and write slots. When a bucket is full the entry expiring first is overwritten. Entries are pickled, so the file must only be writable by trusted processes
+        (it is created with mode 0600).
+
+        :param path: File backing the table (for example: /dev/shm/bcresolver.cache), shared by all processes opening it. None for an unlinked temporary file shared with forked children
+        :param size: Table size in bytes (rounded down to whole buckets)
+        :param slot_size: Slot size in bytes; larger entries are not stored
+        :param ways: Slots per bucket
+        :param read_retries: Read attempts before a slot being written is treated as a miss
+        :return: SharedMemoryCache object
+        '''
+
+        self.path = path
+        self.slot_size = slot_size
+        self.ways = ways
+        self.read_retries = read_retries
+        self.buckets = max(1, (size - FILE_HEADER.size) // (slot_size * ways))
+        self.size = FILE_HEADER.size + self.buckets * ways * slot_size
+        self.stats = {'hits': 0, 'misses': 0, 'sets': 0, 'too_large': 0, 'torn_reads': 0}
+
+        if path is None:
+            fd, tmp_path = tempfile.mkstemp(prefix='bcresolver-shm-')
+            os.unlink(tmp_path)
+        else:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0600)
+
+        self._fd = fd
+        self._write_lock = threading.Lock()
+
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size == 0:
+                os.ftruncate(fd, self.size)
+                self._map = mmap.mmap(fd, self.size, mmap.MAP_SHARED)
+                FILE_HEADER.pack_into(self._map, 0, MAGIC, VERSION, self.buckets, ways, slot_size)
+            else:
+                self._map = mmap.mmap(fd, 0, mmap.MAP_SHARED)
+                magic, version, buckets, ways, slot_size = FILE_HEADER.unpack_from(self._map)
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError('Not a bcresolver shared cache file: %s' % path)
+
+                # Geometry of the existing table wins so that all processes agree on it
+                self.buckets, self.ways, self.slot_size = buckets, ways, slot_size
+                self.size = len(self._map)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _slot_offsets(self, khash):
+
+        first = FILE_HEADER.size + (khash % self.buckets) * self.ways * self.slot_size
+        return [first + way * self.slot_size for way in range(self.ways)]
+
+    def _read_slot(self, offset, khash):
+        '''
+
+        Copy a slot's payload if it holds khash, using the seqlock read protocol
+
+        :param offset: Slot offset
+        :param khash: Key hash
+        :return: Tuple of (payload, expires), None if the slot does not hold khash or kept changing
+        '''
+
+        for _ in range(self.read_retries):
+            sequence, length, expires, slot_hash = SLOT_HEADER.unpack_from(self._map, offset)
+            if sequence & 1:
+                continue
+            if slot_hash != khash or length == 0:
+                return None
+
+            payload = self._map[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + length]
+            if SEQUENCE.unpack_from(self._map, offset)[0] == sequence:
+                return payload, expires
+
+        self.stats['torn_reads'] += 1
+        return None
+
+    def get(self, key):
+        '''
+
+        Get an entry, expired or not
+
+        :param key: Cache key
+        :return: Tuple of (value, expires timestamp), (None, None) if the key is not stored
+        '''
+
+        khash = key_hash(key)
+        for offset in self._slot_offsets(khash):
+            slot = self._read_slot(offset, khash)
+            if slot is None:
+                continue
+
+            try:
+                stored_key, value = cPickle.loads(slot[0])
+            except Exception as e:
+                log.warn('Unable to Load Shared Cache Entry: %s' % str(e))
+                continue
+
+            if stored_key == key:
+                self.stats['hits'] += 1
+                return value, slot[1]
+
+        self.stats['misses'] += 1
+        return None, None
+
+    def set(self, key, value, expires):
+        '''
+
+        Store an entry, overwriting the same key, an empty slot or the slot expiring first in the key's bucket (in that
+        order). Other slots holding the same key are cleared.
+
+        :param key: Cache key
+        :param value: Picklable value
+        :param expires: Expiry timestamp
+        :return: Boolean, False if the entry does not fit in a slot
+        '''
+
+        payload = cPickle.dumps((key, value), cPickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.slot_size - SLOT_HEADER.size:
+            self.stats['too_large'] += 1
+            return False
+
+        khash = key_hash(key)
+        offsets = self._slot_offsets(khash)
+        with self._write_lock:
+            self._lock_bucket(offsets, fcntl.LOCK_EX)
+            try:
+                slots = [(offset,) + SLOT_HEADER.unpack_from(self._map, offset)[1:] for offset in offsets]
+
+                # The key's own slot wins over an empty one, so an older value can't be left behind
+                same = [offset for offset, length, slot_expires, slot_hash in slots if slot_hash == khash]
+                empty = [offset for offset, length, slot_expires, slot_hash in slots if length == 0]
+                if same:
+                    victim = same[0]
+                elif empty:
+                    victim = empty[0]
+                else:
+                    victim = min(slots, key=lambda slot: slot[2])[0]
+
+                for offset in same[1:]:
+                    self._write_slot(offset, 0, '', 0.0)
+                self._write_slot(victim, khash, payload, expires)
+            finally:
+                self._lock_bucket(offsets, fcntl.LOCK_UN)
+
+        self.stats['sets'] += 1
+        return True
+
+    def delete(self, key):
+        '''
+
+        Remove an entry
+
+        :param key: Cache key
+        :return: None
+        '''
+
+        khash = key_hash(key)
+        offsets = self._slot_offsets(khash)
+        with self._write_lock:
+            self._lock_bucket(offsets, fcntl.LOCK_EX)
+            try:
+                for offset in offsets:
+                    if SLOT_HEADER.unpack_from(self._map, offset)[3] == khash:
+                        self._write_slot(offset, 0, '', 0.0)
+            finally:
+                self._lock_bucket(offsets, fcntl.LOCK_UN)
+
+    def clear(self):
+
+        bucket_size = self.ways * self.slot_size
+        with self._write_lock:
+            for first in range(FILE_HEADER.size, self.size, bucket_size):
+                offsets = range(first, first + bucket_size, self.slot_size)
+                self._lock_bucket(offsets, fcntl.LOCK_EX)
+                try:
+                    for offset in offsets:
+                        self._write_slot(offset, 0, '', 0.0)
+                finally:
+                    self._lock_bucket(offsets, fcntl.LOCK_UN)
+
+    def _lock_bucket(self, offsets, operation):
+        '''
+
+        Lock or unlock a bucket's slots in the backing file (shared with other processes)
+
+        :param offsets: Slot offsets of the bucket
+        :param operation: fcntl.LOCK_EX or fcntl.LOCK_UN
+        :return: None
+        '''
+
+        fcntl.lockf(self._fd, operation, self.ways * self.slot_size, offsets[0])
+
+    def _write_slot(self, offset, khash, payload, expires):
+        '''
+
+        Write a slot, making the sequence odd while the slot is inconsistent (bucket lock held)
+
+        :param offset: Slot offset
+        :param khash: Key hash (0 for an empty slot)
+        :param payload: Pickled entry
+        :param expires: Expiry timestamp
+        :return: None
+        '''
+
+        sequence = SEQUENCE.unpack_from(self._map, offset)[0]
+        SEQUENCE.pack_into(self._map, offset, (sequence + 1) & 0xffffffff)
+        self._map[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + len(payload)] = payload
+        SLOT_HEADER.pack_into(self._map, offset, (sequence + 1) & 0xffffffff, len(payload), expires, khash)
+        SEQUENCE.pack_into(self._map, offset, (sequence + 2) & 0xffffffff)
+
+    def close(self):
+
+        self._map.close()
+        os.close(self._fd)
@@ -0,0 +1,175 @@
+__author__ = 'mdavid'
+
+import heapq
+import threading
+from collections import deque
+
+class LatencyTracker:
+
+    def __init__(self, size=512, min_samples=20):
+        '''
+
+        Initialize a LatencyTracker: a sliding window of recent request latencies
+
+        :param size: Number of most recent samples kept
+        :param min_samples: Number of samples required before percentiles are reported
+        :return: LatencyTracker object
+        '''
+
+        self.min_samples = min_samples
+
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds):
+        '''
+
+        Record one request latency
+
+        :param seconds: Latency in seconds
+        :return: None
+        '''
+
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        '''
+
+        Get a latency percentile over the current window
+
+        :param p: Percentile as a fraction (for example: 0.95)
+        :return: Latency in seconds, None if fewer than min_samples samples were recorded
+        '''
+
+        with self._lock:
+            if len(self._samples) < max(1, self.min_samples):
+                return None
+            samples = sorted(self._samples)
+
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+class SpaceSaving:
+
+    def __init__(self, capacity=1000):
+        '''
+
+        Initialize a SpaceSaving sketch: approximate counts of the most frequent keys in a stream, in constant memory
+        (Metwally et al., "Efficient Computation of Frequent and Top-k Elements in Data Streams"). At most capacity keys
+        are counted; a new key replaces the least counted one and inherits its count as its error bound. Every key seen
+        more than total / capacity times is guaranteed to be counted.
+
+        :param capacity: Number of keys counted
+        :return: SpaceSaving object
+        '''
+
+        self.capacity = capacity
+        self.total = 0
+
+        # Key -> [count, error]; heap of (count, key) with stale entries skipped (and compacted) lazily
+        self._counters = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._counters)
+
+    def __contains__(self, key):
+        return key in self._counters
+
+    def add(self, key, count=1):
+        '''
+
+        Count occurrences of a key
+
+        :param key: Key (hashable)
+        :param count: Number of occurrences
+        :return: None
+        '''
+
+        with self._lock:
+            self.total += count
+            counter = self._counters.get(key)
+            if counter is None:
+                if len(self._counters) < self.capacity:
+                    counter = self._counters[key] = [0, 0]
+                else:
+                    floor, evicted = self._pop_min()
+                    del self._counters[evicted]
+                    counter = self._counters[key] = [floor, floor]
+
+            counter[0] += count
+            heapq.heappush(self._heap, (counter[0], key))
+            if len(self._heap) > 4 * self.capacity:
+                self._rebuild_heap()
+
+    def _pop_min(self):
+        '''
+
+        Remove the least counted key from the heap (lock held)
+
+        :return: Tuple of (count, key)
+        '''
+
+        while True:
+            count, key = heapq.heappop(self._heap)
+            counter = self._counters.get(key)
+            if counter is not None and counter[0] == count:
+                return count, key
+
+    def _rebuild_heap(self):
+
+        self._heap = [(counter[0], key) for key, counter in self._counters.iteritems()]
+        heapq.heapify(self._heap)
+
+    def count(self, key):
+        '''
+
+        :param key: Key
+        :return: Tuple of (estimated count, maximum overestimation), (0, 0) if the key is not counted
+        '''
+
+        counter = self._counters.get(key)
+        return tuple(counter) if counter is not None else (0, 0)
+
+    def top(self, k=None):
+        '''
+
+        :param k: Number of keys returned (None for every counted key)
+        :return: List of (key, estimated count, maximum overestimation), most frequent first
+        '''
+
+        with self._lock:
+            counted = [(counter[0], counter[1], key) for key, counter in self._counters.iteritems()]
+
+        counted.sort(key=lambda entry: (-entry[0], entry[1]))
+        return [(key, count, error) for count, error, key in counted[:k]]
+
+    def decay(self, factor=0.5):
+        '''
+
+        Scale every count down so the sketch follows recent traffic (keys whose count drops to 0 are forgotten)
+
+        :param factor: Multiplier applied to every count and error
+        :return: None
+        '''
+
+        with self._lock:
+            self.total = int(self.total * factor)
+            for key, counter in self._counters.items():
+                counter[0] = int(counter[0] * factor)
+                counter[1] = int(counter[1] * factor)
+                if not counter[0]:
+                    del self._counters[key]
+
+            self._rebuild_heap()
+
+    def clear(self):
+
+        with self._lock:
+            self.total = 0
+            self._counters = {}
+            self._heap = []
@@ -0,0 +1,241 @@
+__author__ = 'mdavid'
+
+import socket
+import struct
+
+HEADER = struct.Struct('!HHHHHH')
+RR_FIXED = struct.Struct('!HHIH')
+TTL = struct.Struct('!I')
+
+# Response codes
+RCODE_NOERROR = 0
+RCODE_FORMERR = 1
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+RCODE_NOTIMP = 4
+RCODE_REFUSED = 5
+
+# Header flag bits
+FLAG_QR = 0x8000
+FLAG_OPCODE = 0x7800
+FLAG_AA = 0x0400
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+FLAG_RA = 0x0080
+FLAG_AD = 0x0020
+FLAG_CD = 0x0010
+
+RDATATYPE_OPT = 41
+RDATACLASS_IN = 1
+
+class WireFormatException(BaseException):
+    pass
+
+class Question(object):
+    '''
+
+    Parsed header and question of a DNS query message
+    '''
+
+    __slots__ = ('id', 'flags', 'name', 'rrtype', 'rrclass', 'raw', 'end')
+
+    def __init__(self, msg_id, flags, name, rrtype, rrclass, raw):
+        '''
+
+        Initialize a Question
+
+        :param msg_id: Message ID
+        :param flags: Header flags
+        :param name: Query name (dotted, without trailing dot)
+        :param rrtype: Numeric RR Type
+        :param rrclass: Numeric RR Class
+        :param raw: Question section as sent
+        :return: Question object
+        '''
+
+        self.id = msg_id
+        self.flags = flags
+        self.name = name
+        self.rrtype = rrtype
+        self.rrclass = rrclass
+        self.raw = raw
+        self.end = HEADER.size + len(raw)
+
+def skip_name(data, offset):
+    '''
+
+    Skip over a (possibly compressed) domain name
+
+    :param data: DNS message
+    :param offset: Offset of the name
+    :return: Offset of the first byte after the name
+    '''
+
+    while True:
+        if offset >= len(data):
+            raise WireFormatException('Truncated name')
+        length = ord(data[offset])
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += length + 1
+
+def encode_name(name):
+    '''
+
+    Encode a dotted domain name in uncompressed wire format
+
+    :param name: Domain name (for example: www.mattdavid.bit.)
+    :return: Encoded name
+    '''
+
+    labels = [label for label in name.rstrip('.').split('.') if label]
+    for label in labels:
+        if len(label) > 63:
+            raise ValueError('Label too long: %s' % label)
+    return ''.join([chr(len(label)) + label for label in labels]) + '\x00'
+
+def encode_rdata(rrtype, value):
+    '''
+
+    Encode A, AAAA and CNAME record data
+
+    :param rrtype: Numeric RR Type (1, 28 or 5)
+    :param value: IP address or domain name
+    :return: Encoded rdata
+    '''
+
+    if rrtype == 1:
+        return socket.inet_aton(value)
+    if rrtype == 28:
+        return socket.inet_pton(socket.AF_INET6, value)
+    if rrtype == 5:
+        return encode_name(value)
+
+    raise NotImplementedError('Unsupported RR Type for Encoding: %d' % rrtype)
+
+def set_flags(packet, flags):
+    '''
+
+    Set header flag bits in a DNS message
+
+    :param packet: DNS message
+    :param flags: Flag bits to set
+    :return: DNS message with the flags set
+    '''
+
+    return packet[:2] + struct.pack('!H', struct.unpack_from('!H', packet, 2)[0] | flags) + packet[4:]
+
+def parse_question(data):
+    '''
+
+    Parse the header and the (single) question of a DNS query. Names are read label by label without compression,
+    as queries carry no earlier names to point to.
+
+    :param data: DNS query message
+    :return: Question object
+    '''
+
+    if len(data) < HEADER.size:
+        raise WireFormatException('Message shorter than a DNS header')
+
+    msg_id, flags, qdcount, ancount, nscount, arcount = HEADER.unpack_from(data)
+    if flags & FLAG_QR or qdcount != 1:
+        raise WireFormatException('Not a single-question query')
+
+    labels = []
+    offset = HEADER.size
+    while True:
+        if offset >= len(data):
+            raise WireFormatException('Truncated question')
+        length = ord(data[offset])
+        if length == 0:
+            offset += 1
+            break
+        if length & 0xC0:
+            raise WireFormatException('Compressed question name')
+        labels.append(data[offset + 1:offset + 1 + length])
+        offset += length + 1
+
+    if offset + 4 > len(data):
+        raise WireFormatException('Truncated question')
+
+    rrtype, rrclass = struct.unpack_from('!HH', data, offset)
+    return Question(msg_id, flags, '.'.join(labels), rrtype, rrclass, data[HEADER.size:offset + 4])
+
+def ttl_offsets(packet):
+    '''
+
+    Find the TTL fields of all resource records in a DNS message (EDNS OPT pseudo-records excluded)
+
+    :param packet: DNS message
+    :return: Tuple of (tuple of TTL field offsets, tuple of the TTL values)
+    '''
+
+    qdcount, ancount, nscount, arcount = struct.unpack_from('!HHHH', packet, 4)
+
+    offset = HEADER.size
+    for _ in range(qdcount):
+        offset = skip_name(packet, offset) + 4
+
+    offsets = []
+    ttls = []
+    for _ in range(ancount + nscount + arcount):
+        offset = skip_name(packet, offset)
+        if offset + RR_FIXED.size > len(packet):
+            raise WireFormatException('Truncated resource record')
+        rrtype, rrclass, ttl, rdlength = RR_FIXED.unpack_from(packet, offset)
+        if rrtype != RDATATYPE_OPT:
+            offsets.append(offset + 4)
+            ttls.append(ttl)
+        offset += RR_FIXED.size + rdlength
+
+    return tuple(offsets), tuple(ttls)
+
+def patch_response(packet, offsets, ttls, question, elapsed):
+    '''
+
+    Copy a cached response for a query: set the query's message ID, RD flag and question (keeping its 0x20 case
+    pattern) and age every TTL by the seconds elapsed since the response was cached
+
+    :param packet: Cached DNS response
+    :param offsets: TTL field offsets in packet (see ttl_offsets)
+    :param ttls: Original TTL values in packet
+    :param question: Question object for the query
+    :param elapsed: Seconds since packet was cached
+    :return: DNS response
+    '''
+
+    response = bytearray(packet)
+    flags = struct.unpack_from('!H', packet, 2)[0] & ~FLAG_RD | question.flags & FLAG_RD
+    struct.pack_into('!HH', response, 0, question.id, flags)
+    response[HEADER.size:question.end] = question.raw
+
+    for offset, ttl in zip(offsets, ttls):
+        TTL.pack_into(response, offset, max(0, ttl - elapsed))
+
+    return str(response)
+
+def build_response(question, rcode=RCODE_NOERROR, answers=(), authenticated=False):
+    '''
+
+    Build a DNS response for a query
+
+    :param question: Question object for the query
+    :param rcode: Response code
+    :param answers: List of (numeric RR Type, TTL, encoded rdata) answer records for the query name
+    :param authenticated: Set the AD flag
+    :return: DNS response
+    '''
+
+    flags = FLAG_QR | FLAG_RA | question.flags & (FLAG_OPCODE | FLAG_RD | FLAG_CD) | rcode
+    if authenticated:
+        flags |= FLAG_AD
+
+    records = ''.join([
+        '\xc0\x0c' + RR_FIXED.pack(rrtype, question.rrclass, ttl, len(rdata)) + rdata
+        for rrtype, ttl, rdata in answers
+    ])
+
+    return HEADER.pack(question.id, flags, 1, len(answers), 0, 0) + question.raw + records
@@ -0,0 +1,374 @@
+__author__ = 'mdavid'
+
+import logging
+import socket
+import threading
+import time
+
+import dns.exception
+import dns.message
+import dns.name
+import dns.query
+import dns.rdataclass
+import dns.rdatatype
+from dns.dnssec import ValidationFailure, validate
+
+# Local Import(s)
+from dnssec import EngineResult, EngineResultData, check_dnskeys
+
+# Setup Logging
+log = logging.getLogger(__name__)
+
+# In-zone CNAMEs followed by a lookup
+MAX_CNAME_CHAIN = 8
+
+class ZoneTransferException(BaseException):
+    pass
+
+class MirroredZone(object):
+    '''
+
+    Validated copy of a zone transferred with AXFR
+    '''
+
+    __slots__ = ('origin', 'ds_ta', 'address', 'serial', 'rrsets', 'cuts', 'expires', 'refresh', 'next_check')
+
+    def __init__(self, origin, ds_ta, address, serial, rrsets, cuts, expires, refresh):
+        '''
+
+        Initialize a MirroredZone
+
+        :param origin: dns.name.Name of the zone
+        :param ds_ta: DS trust anchor string the zone was validated against
+        :param address: Address of the nameserver the zone was transferred from
+        :param serial: SOA serial of the copy
+        :param rrsets: Dict of (dns.name.Name, numeric RR Type) -> validated rrset
+        :param cuts: Set of dns.name.Name delegation points below the origin (not answered from the copy)
+        :param expires: Timestamp the copy stops being served (first RRSIG expiration, less a margin)
+        :param refresh: Seconds between SOA serial checks
+        :return: MirroredZone object
+        '''
+
+        self.origin = origin
+        self.ds_ta = ds_ta
+        self.address = address
+        self.serial = serial
+        self.rrsets = rrsets
+        self.cuts = cuts
+        self.expires = expires
+        self.refresh = refresh
+        self.next_check = time.time() + refresh
+
+    def covers(self, qname):
+        return qname.is_subdomain(self.origin) and not any([qname.is_subdomain(cut) for cut in self.cuts])
+
+    def lookup(self, name, rrtype):
+        '''
+
+        Answer a query from the copy, following in-zone CNAMEs
+
+        :param name: DNS Record Name Query
+        :param rrtype: Numeric RR Type
+        :return: Tuple of (0, EngineResult object), None if the copy has no data for the query
+        '''
+
+        qname = dns.name.from_text(name)
+        for _ in range(MAX_CNAME_CHAIN):
+            if not self.covers(qname):
+                return None
+
+            rrset = self.rrsets.get((qname, rrtype))
+            if rrset is not None:
+                result = EngineResult(None, 0)
+                result.secure = 1
+                result.havedata = 1
+                result.data = EngineResultData(rrset)
+                result.ttl = max(0, min(rrset.ttl, int(self.expires - time.time())))
+                return 0, result
+
+            cname = self.rrsets.get((qname, dns.rdatatype.CNAME))
+            if cname is None or rrtype == dns.rdatatype.CNAME:
+                return None
+            qname = cname[0].target
+
+        return None
+
+class ZoneMirror:
+
+    def __init__(self, min_queries=100, window=60.0, max_zones=100, max_rrsets=100000, check_interval=(60, 3600), signature_margin=300, retry_interval=600, timeout=10.0, port=53):
+        '''
+
+        Initialize a ZoneMirror: once a delegated zone receives min_queries uncached queries within window seconds, its
+        whole signed zone is transferred with AXFR (from a background thread) and every RRset is validated against the
+        DNSKEY set the Blockchain DS record authenticates. Queries for names in the zone are then answered from the copy
+        instead of one validated network lookup each. The SOA serial is checked every SOA refresh interval and the copy
+        is dropped (and transferred again) when it changes, when the Blockchain DS record changes, or shortly before its
+        first signature expires. Zones whose nameservers refuse the transfer or serve records that fail validation are
+        retried after retry_interval seconds.
+
+        Names the copy has no data for, and names at or below delegations inside the zone, are resolved over the
+        network as usual (a transfer is not authenticated as complete, so it does not prove names absent).
+
+        :param min_queries: Uncached queries for a zone within window seconds before it is transferred
+        :param window: Seconds over which queries are counted
+        :param max_zones: Maximum number of zones mirrored at once
+        :param max_rrsets: Largest zone (in RRsets) accepted
+        :param check_interval: Tuple of (minimum, maximum) seconds between SOA serial checks (the SOA refresh value is clamped to it)
+        :param signature_margin: Seconds before the first signature expiration the copy stops being served
+        :param retry_interval: Seconds before a failed transfer is tried again
+        :param timeout: Transfer and SOA query timeout in seconds
+        :param port: Nameserver port
+        :return: ZoneMirror object
+        '''
+
+        self.min_queries = min_queries
+        self.window = window
+        self.max_zones = max_zones
+        self.max_rrsets = max_rrsets
+        self.check_interval = check_interval
+        self.signature_margin = signature_margin
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self.port = port
+
+        # Zone name (lowercase, with trailing dot) -> MirroredZone
+        self.zones = {}
+        self.stats = {'hits': 0, 'misses': 0, 'transfers': 0, 'failed': 0, 'checks': 0, 'changed': 0, 'expired': 0}
+
+        self._counts = {}
+        self._retry = {}
+        self._busy = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, resolver, delegation, name, rrtype):
+        '''
+
+        Answer a query from the zone's copy, counting it towards a transfer if the zone is not mirrored
+
+        :param resolver: NamecoinResolver (used to look up the nameservers' addresses for a transfer)
+        :param delegation: Delegation object for the name's zone
+        :param name: DNS Record Name Query
+        :param rrtype: Numeric RR Type
+        :return: Tuple of (status, EngineResult object) as returned by a DNSSEC engine, None if the query must go to the network
+        '''
+
+        key = delegation.sld.lower()
+        mirrored = self.zones.get(key)
+        now = time.time()
+
+        if mirrored is not None and (mirrored.ds_ta != delegation.ds_ta or mirrored.expires <= now):
+            log.info('Dropping Mirrored Zone %s: %s' % (key, 'DS record changed' if mirrored.ds_ta != delegation.ds_ta else 'signatures expiring'))
+            self.zones.pop(key, None)
+            self.stats['expired'] += 1
+            mirrored = None
+
+        if mirrored is None:
+            self._count(resolver, delegation, key, now)
+            return None
+
+        if mirrored.next_check <= now:
+            mirrored.next_check = now + mirrored.refresh
+            self._start(key, self._check, resolver, delegation, mirrored)
+
+        reply = mirrored.lookup(name, rrtype)
+        self.stats['hits' if reply is not None else 'misses'] += 1
+        return reply
+
+    def _count(self, resolver, delegation, key, now):
+        '''
+
+        Count an uncached query for a zone and start its transfer once it is heavily queried
+
+        :param resolver: NamecoinResolver object
+        :param delegation: Delegation object
+        :param key: Zone name
+        :param now: Timestamp
+        :return: None
+        '''
+
+        with self._lock:
+            count, start = self._counts.get(key, (0, now))
+            if now - start > self.window:
+                count, start = 0, now
+            count += 1
+
+            if count < self.min_queries or self._retry.get(key, 0) > now or len(self.zones) >= self.max_zones:
+                self._counts[key] = (count, start)
+                if len(self._counts) > 10 * self.max_zones:
+                    self._counts = dict([(k, v) for k, v in self._counts.items() if now - v[1] <= self.window])
+                return
+            self._counts.pop(key, None)
+
+        self._start(key, self._transfer, resolver, delegation)
+
+    def _start(self, key, func, *args):
+        '''
+
+        Run func in a background thread unless a transfer or check of the zone is already running
+
+        :param key: Zone name
+        :param func: Function to run
+        :param args: Arguments for func
+        :return: None
+        '''
+
+        with self._lock:
+            if key in self._busy:
+                return
+            self._busy.add(key)
+
+        def run():
+            try:
+                func(*args)
+            except Exception as e:
+                log.error('Zone Mirror Update of %s Failed: %s' % (key, str(e)))
+                # Unexpected errors (for example dns.dnssec without a crypto library) back off like refused transfers
+                if func == self._transfer:
+                    self._failed(key)
+            finally:
+                with self._lock:
+                    self._busy.discard(key)
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def _transfer(self, resolver, delegation):
+        '''
+
+        Transfer a zone from the first of its nameservers that allows it and install the validated copy
+
+        :param resolver: NamecoinResolver object
+        :param delegation: Delegation object
+        :return: Boolean, True if the zone was mirrored
+        '''
+
+        key = delegation.sld.lower()
+        for address in resolver._get_delegation_addresses(delegation):
+            try:
+                mirrored = self.transfer(delegation, address)
+            except (socket.error, dns.exception.DNSException, EOFError) as e:
+                log.info('AXFR of %s from %s Failed: %s' % (key, address, e.__class__.__name__))
+                continue
+            except ZoneTransferException as e:
+                log.warn('AXFR of %s from %s Rejected: %s' % (key, address, str(e)))
+                break
+
+            self.zones[key] = mirrored
+            self.stats['transfers'] += 1
+            log.info('Mirrored Zone %s (serial %d, %d RRsets) from %s' % (key, mirrored.serial, len(mirrored.rrsets), address))
+            return True
+
+        self._failed(key)
+        return False
+
+    def _failed(self, key):
+        '''
+
+        Count a failed transfer and hold off transferring the zone again for retry_interval seconds
+
+        :param key: Zone name
+        :return: None
+        '''
+
+        self.stats['failed'] += 1
+        with self._lock:
+            self._retry[key] = time.time() + self.retry_interval
+
+    def transfer(self, delegation, address):
+        '''
+
+        Transfer a zone with AXFR and validate it: the DNSKEY set against the Blockchain DS record, every other RRset
+        (except delegations and glue below the origin) against the DNSKEY set
+
+        :param delegation: Delegation object
+        :param address: Nameserver IP Address
+        :return: MirroredZone object
+        '''
+
+        origin = dns.name.from_text(delegation.sld)
+        rrsets = {}
+        for message in dns.query.xfr(address, origin, timeout=self.timeout, lifetime=self.timeout, port=self.port, relativize=False):
+            for rrset in message.answer:
+                existing = rrsets.get((rrset.name, rrset.rdtype, rrset.covers))
+                if existing is not None:
+                    existing.union_update(rrset)
+                    continue
+
+                if len(rrsets) >= self.max_rrsets:
+                    raise ZoneTransferException('More than %d RRsets' % self.max_rrsets)
+                rrsets[(rrset.name, rrset.rdtype, rrset.covers)] = rrset
+
+        soa = rrsets.get((origin, dns.rdatatype.SOA, dns.rdatatype.NONE))
+        dnskeys = rrsets.get((origin, dns.rdatatype.DNSKEY, dns.rdatatype.NONE))
+        key_rrsigs = rrsets.get((origin, dns.rdatatype.RRSIG, dns.rdatatype.DNSKEY))
+        if soa is None or dnskeys is None or key_rrsigs is None:
+            raise ZoneTransferException('No SOA or signed DNSKEY set at the zone apex')
+
+        if not check_dnskeys(origin, dnskeys, key_rrsigs, delegation.ds_ta):
+            raise ZoneTransferException('DNSKEY set does not validate against the Blockchain DS record')
+
+        cuts = set([name for name, rdtype, covers in rrsets if rdtype == dns.rdatatype.NS and name != origin])
+
+        validated = {}
+        expirations = []
+        for (name, rdtype, covers), rrset in rrsets.items():
+            if rdtype == dns.rdatatype.RRSIG:
+                continue
+            if not name.is_subdomain(origin):
+                raise ZoneTransferException('Out of zone RRset: %s' % name)
+            if any([name.is_subdomain(cut) for cut in cuts]):
+                continue
+
+            rrsigs = rrsets.get((name, dns.rdatatype.RRSIG, rdtype))
+            if rrsigs is None:
+                raise ZoneTransferException('Unsigned RRset: %s %s' % (name, dns.rdatatype.to_text(rdtype)))
+
+            try:
+                validate(rrset, rrsigs, {origin: dnskeys})
+            except ValidationFailure as e:
+                raise ZoneTransferException('RRset %s %s failed validation: %s' % (name, dns.rdatatype.to_text(rdtype), str(e)))
+
+            validated[(name, rdtype)] = rrset
+            expirations.append(min([rrsig.expiration for rrsig in rrsigs]))
+
+        refresh = min(max(soa[0].refresh, self.check_interval[0]), self.check_interval[1])
+        return MirroredZone(origin, delegation.ds_ta, address, soa[0].serial, validated, cuts, min(expirations) - self.signature_margin, refresh)
+
+    def _check(self, resolver, delegation, mirrored):
+        '''
+
+        Compare the copy's SOA serial with the nameserver's, transferring the zone again if it changed
+
+        :param resolver: NamecoinResolver object
+        :param delegation: Delegation object
+        :param mirrored: MirroredZone object
+        :return: None
+        '''
+
+        query = dns.message.make_query(mirrored.origin, dns.rdatatype.SOA)
+        try:
+            response = dns.query.udp(query, mirrored.address, timeout=self.timeout, port=self.port)
+            serial = response.find_rrset(response.answer, mirrored.origin, dns.rdataclass.IN, dns.rdatatype.SOA)[0].serial
+        except (socket.error, dns.exception.DNSException, KeyError) as e:
+            log.info('SOA Check of Mirrored Zone %s Failed: %s' % (mirrored.origin, e.__class__.__name__))
+            return
+
+        self.stats['checks'] += 1
+        if serial == mirrored.serial:
+            return
+
+        log.info('Mirrored Zone %s Changed (serial %d -> %d)' % (mirrored.origin, mirrored.serial, serial))
+        self.stats['changed'] += 1
+        self.zones.pop(delegation.sld.lower(), None)
+        self._transfer(resolver, delegation)
+
+    def report(self):
+        '''
+
+        :return: Dict of lookup, transfer and check counts with the mirrored zones' serials and sizes
+        '''
+
+        report = dict(self.stats)
+        report['zones'] = dict([(key, {'serial': mirrored.serial, 'rrsets': len(mirrored.rrsets)}) for key, mirrored in self.zones.items()])
+        return report
@@ -0,0 +1,25 @@
+__author__ = 'mdavid'
+
+import sys
+import time
+
+if __name__ == '__main__':
+
+    start = time.time()
+    from bcresolver import NamecoinResolver
+    import_time = time.time() - start
+
+    print('import bcresolver: %.2f ms' % (import_time * 1000))
+    print('Heavy modules loaded at import: %s' % [m for m in ('unbound', 'dns', 'requests') if m in sys.modules])
+
+    nc_resolver = NamecoinResolver(
+        host='127.0.0.1',
+        user='rpcuser',
+        password='rpcpassword',
+        port=8336,
+        temp_dir='/tmp'
+    )
+
+    start = time.time()
+    nc_resolver.warm()
+    print('NamecoinResolver.warm(): %.2f ms' % ((time.time() - start) * 1000))
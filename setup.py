@@ -5,6 +5,10 @@ install_requires = [
     'requests>=2.5.1'
 ]
 
+extras_require = {
+    'dnspython-engine': ['pycryptodome>=3.4']
+}
+
 test_requires = [
     'mock>=1.0.1'
 ]
@@ -14,8 +18,16 @@ setup(
     version='0.0.3',
     packages=['bcresolver'],
     install_requires=install_requires,
+    extras_require=extras_require,
     tests_require=test_requires,
     test_suite='tests',
+    entry_points={
+        'console_scripts': [
+            'bcresolver = bcresolver.cli:main',
+            'bcresolver-replay = bcresolver.replay:main',
+            'bcresolver-server = bcresolver.server:main'
+        ]
+    },
     url='https://github.com/netkicorp/blockchain-resolver',
     download_url='https://github.com/netkicorp/blockchain-resolver/tarball/0.0.3',
     platforms=['any'],
@@ -0,0 +1,79 @@
+__author__ = 'mdavid'
+
+import threading
+import time
+from unittest import TestCase
+from bcresolver.admission import AdmissionController, OverloadException, PRIORITY_INTERACTIVE, PRIORITY_REFRESH
+
+class TestAdmissionController(TestCase):
+
+    def wait_for_waiters(self, controller, count):
+
+        for i in range(200):
+            if controller.waiting() >= count:
+                return
+            time.sleep(0.005)
+        self.fail('waiters never queued')
+
+    def test_go_right(self):
+
+        controller = AdmissionController(max_concurrent=2, max_queue=2)
+        controller.acquire()
+        controller.acquire()
+
+        self.assertEqual(2, controller.active)
+        controller.release()
+        controller.release()
+        self.assertEqual(0, controller.active)
+        self.assertEqual(2, controller.stats['admitted'])
+
+    def test_queue_full(self):
+
+        controller = AdmissionController(max_concurrent=1, max_queue=0)
+        controller.acquire()
+
+        self.assertRaises(OverloadException, controller.acquire)
+        self.assertEqual(1, controller.stats['shed'])
+        self.assertEqual(1, controller.active)
+
+    def test_refresh_shed_first(self):
+
+        controller = AdmissionController(max_concurrent=1, max_queue=4, max_refresh_queue=0)
+        controller.acquire()
+
+        self.assertRaises(OverloadException, controller.acquire, PRIORITY_REFRESH)
+
+    def test_wait_timeout(self):
+
+        controller = AdmissionController(max_concurrent=1, max_queue=4)
+        controller.acquire()
+
+        self.assertRaises(OverloadException, controller.acquire, PRIORITY_INTERACTIVE, 0.05)
+        self.assertEqual(0, controller.waiting())
+        self.assertEqual(1, controller.stats['timeouts'])
+
+    def test_interactive_admitted_before_refresh(self):
+
+        controller = AdmissionController(max_concurrent=1, max_queue=4)
+        controller.acquire()
+
+        order = []
+        def waiter(priority):
+            controller.acquire(priority)
+            order.append(priority)
+            controller.release()
+
+        refresh = threading.Thread(target=waiter, args=(PRIORITY_REFRESH,))
+        refresh.start()
+        self.wait_for_waiters(controller, 1)
+
+        interactive = threading.Thread(target=waiter, args=(PRIORITY_INTERACTIVE,))
+        interactive.start()
+        self.wait_for_waiters(controller, 2)
+
+        controller.release()
+        refresh.join(1)
+        interactive.join(1)
+
+        self.assertEqual([PRIORITY_INTERACTIVE, PRIORITY_REFRESH], order)
+        self.assertEqual(0, controller.active)
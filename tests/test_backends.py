@@ -0,0 +1,272 @@
+__author__ = 'mdavid'
+
+import socket
+import threading
+import time
+from mock import *
+from unittest import TestCase
+from bcresolver import NamecoinResolver
+from bcresolver.backends import encode_entry, decode_entry, FLAG_ZLIB, MemoryCacheBackend, MemcachedCache
+from bcresolver.cache import TTLCache
+from bcresolver.records import Delegation, NamecoinRecord
+from bcresolver.replay import StandInNamecoinResolver, StandInEngine
+
+def wait_for(condition, timeout=2.0):
+
+    expires = time.time() + timeout
+    while not condition() and time.time() < expires:
+        time.sleep(0.005)
+    return condition()
+
+class StandInMemcached:
+
+    def __init__(self):
+        '''
+
+        Minimal memcached server (text protocol get / set / delete / flush_all) on a local port
+
+        '''
+
+        self.items = {}
+        self.commands = []
+        self.connections = 0
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+
+    def serve(self):
+
+        while True:
+            try:
+                conn, source = self.sock.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self.serve_connection, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def serve_connection(self, conn):
+
+        rfile = conn.makefile('rb')
+        while True:
+            line = rfile.readline()
+            if not line:
+                conn.close()
+                return
+
+            parts = line.split()
+            self.commands.append(parts[0])
+            if parts[0] == 'get':
+                item = self.items.get(parts[1])
+                if item is not None and item[1] > time.time():
+                    conn.sendall('VALUE %s %d %d\r\n%s\r\n' % (parts[1], item[0], len(item[2]), item[2]))
+                conn.sendall('END\r\n')
+            elif parts[0] == 'set':
+                data = rfile.read(int(parts[4]) + 2)[:-2]
+                self.items[parts[1]] = (int(parts[2]), time.time() + int(parts[3]), data)
+            elif parts[0] == 'delete':
+                self.items.pop(parts[1], None)
+            elif parts[0] == 'flush_all':
+                self.items.clear()
+
+    def close(self):
+
+        self.sock.close()
+
+class TestEntryEncoding(TestCase):
+
+    def test_go_right(self):
+
+        record = NamecoinRecord({u'ns': [u'ns1.testdomain.bit'], u'ip': u'10.0.0.1', u'map': {u'www': {u'ip': u'10.0.0.2'}}})
+        chain = (record, ('testdomain', 'other'))
+
+        key, value, expires = decode_entry(*encode_entry(('chain', 'testdomain'), chain, 2000.5))
+
+        self.assertEqual(('chain', 'testdomain'), key)
+        self.assertEqual(record, value[0])
+        self.assertEqual(('testdomain', 'other'), value[1])
+        self.assertEqual(2000.5, expires)
+
+    def test_delegation(self):
+
+        delegation = Delegation('testdomain.bit.', ('ns1.testdomain.bit',), 'testdomain.bit. IN DS 1 8 2 AB')
+
+        value = decode_entry(*encode_entry(('delegation', 'testdomain'), delegation, 2000.0))[1]
+
+        self.assertTrue(isinstance(value, Delegation))
+        self.assertEqual(('testdomain.bit.', ('ns1.testdomain.bit',), 'testdomain.bit. IN DS 1 8 2 AB'), (value.sld, value.ns, value.ds_ta))
+
+    def test_compressed(self):
+
+        value = ['10.0.0.%d' % (i % 4) for i in range(200)]
+        payload, flags = encode_entry('key', value, 2000.0)
+
+        self.assertEqual(FLAG_ZLIB, flags)
+        self.assertEqual(value, decode_entry(payload, flags)[1])
+        self.assertEqual(0, encode_entry('key', value, 2000.0, compress_min=None)[1])
+
+    def test_unencodable(self):
+
+        self.assertRaises(ValueError, encode_entry, 'key', object(), 2000.0)
+
+    def test_malformed(self):
+
+        self.assertRaises(ValueError, decode_entry, 'garbage')
+        self.assertRaises(ValueError, decode_entry, 'garbage', FLAG_ZLIB)
+
+        payload = encode_entry('key', ('\x00bcr', 'Unknown', ()), 2000.0)[0]
+        self.assertRaises(ValueError, decode_entry, payload)
+
+class TestMemoryCacheBackend(TestCase):
+
+    def test_go_right(self):
+
+        backend = MemoryCacheBackend(max_entries=2)
+        backend.set('a', 1, 2000.0)
+        backend.set('b', 2, 2000.0)
+        backend.set('c', 3, 2000.0)
+
+        self.assertEqual((None, None), backend.get('a'))
+        self.assertEqual((3, 2000.0), backend.get('c'))
+
+        backend.delete('c')
+        self.assertEqual((None, None), backend.get('c'))
+        backend.clear()
+        self.assertEqual(0, len(backend))
+
+    def test_shared_by_resolvers(self):
+
+        backend = MemoryCacheBackend()
+        resolvers = [NamecoinResolver(nc_name_resolver=StandInNamecoinResolver, engine=StandInEngine(), shared_cache=backend) for _ in range(2)]
+        resolvers[1].nc_name_resolver = Mock()
+
+        value = resolvers[0].resolve('www.mattdavid.bit', 'A')
+
+        self.assertEqual(value, resolvers[1].resolve('www.mattdavid.bit', 'A'))
+        self.assertEqual(0, resolvers[1].nc_name_resolver.name_show.call_count)
+
+class TestMemcachedCache(TestCase):
+
+    def setUp(self):
+
+        self.server = StandInMemcached()
+        self.cache = MemcachedCache(['127.0.0.1:%d' % self.server.port], timeout=1.0)
+
+    def tearDown(self):
+
+        self.cache.close()
+        self.server.close()
+
+    def test_go_right(self):
+
+        expires = time.time() + 60
+
+        self.assertTrue(self.cache.set(('answer', ('www.testdomain.bit', 'A')), '10.0.0.1', expires))
+        self.assertEqual(('10.0.0.1', expires), self.cache.get(('answer', ('www.testdomain.bit', 'A'))))
+        self.assertEqual((None, None), self.cache.get(('answer', ('www.testdomain.bit', 'AAAA'))))
+        self.assertEqual(1, self.cache.stats['hits'])
+        self.assertEqual(1, self.cache.stats['misses'])
+
+        # One pooled connection serves every request
+        self.assertEqual(1, self.server.connections)
+
+    def test_key_format(self):
+
+        self.cache.set('key', 'value', time.time() + 60)
+        self.assertTrue(wait_for(lambda: self.server.items))
+
+        key = self.server.items.keys()[0]
+        self.assertTrue(key.startswith('bcr:'))
+        self.assertEqual(44, len(key))
+
+    def test_expiry(self):
+
+        self.assertFalse(self.cache.set('key', 'value', time.time() - 1))
+
+        self.cache.grace = 30
+        self.assertTrue(self.cache.set('key', 'value', time.time() - 1))
+        self.assertEqual('value', self.cache.get('key')[0])
+
+    def test_delete_and_clear(self):
+
+        self.cache.set('a', 1, time.time() + 60)
+        self.cache.set('b', 2, time.time() + 60)
+
+        self.cache.delete('a')
+        self.assertEqual((None, None), self.cache.get('a'))
+        self.assertEqual(2, self.cache.get('b')[0])
+
+        self.cache.clear()
+        self.assertEqual((None, None), self.cache.get('b'))
+
+    def test_too_large(self):
+
+        self.cache.max_item_size = 100
+        self.cache.compress_min = None
+
+        self.assertFalse(self.cache.set('key', 'x' * 200, time.time() + 60))
+        self.assertEqual(1, self.cache.stats['too_large'])
+        self.assertEqual({}, self.server.items)
+
+    def test_key_collision(self):
+
+        self.cache.set('key', 'value', time.time() + 60)
+        self.assertTrue(wait_for(lambda: self.server.items))
+        self.cache._key = lambda key: self.server.items.keys()[0]
+
+        self.assertEqual((None, None), self.cache.get('other'))
+
+    def test_corrupt_entry(self):
+
+        self.cache.set('key', 'value', time.time() + 60)
+        self.assertTrue(wait_for(lambda: self.server.items))
+        key = self.server.items.keys()[0]
+        self.server.items[key] = (0, time.time() + 60, 'garbage')
+
+        self.assertEqual((None, None), self.cache.get('key'))
+
+    def test_server_down(self):
+
+        self.server.close()
+        cache = MemcachedCache(['127.0.0.1:1'], timeout=0.1, retry_interval=60)
+
+        self.assertEqual((None, None), cache.get('key'))
+        self.assertFalse(cache.set('key', 'value', time.time() + 60))
+        self.assertEqual(1, cache.stats['errors'])
+
+    def test_servers_sharded(self):
+
+        other = StandInMemcached()
+        cache = MemcachedCache([('127.0.0.1', self.server.port), ('127.0.0.1', other.port)], timeout=1.0)
+        try:
+            for i in range(20):
+                cache.set('key%d' % i, i, time.time() + 60)
+
+            self.assertEqual(range(20), [cache.get('key%d' % i)[0] for i in range(20)])
+            self.assertEqual(20, len(self.server.items) + len(other.items))
+            self.assertTrue(self.server.items and other.items)
+        finally:
+            cache.close()
+            other.close()
+
+    def test_tiered(self):
+
+        # Two nodes, each with a local TTLCache in front of the same memcached server
+        l1 = TTLCache(ttl=60, shared=self.cache, namespace='nc')
+        other_l1 = TTLCache(ttl=60, shared=MemcachedCache(['127.0.0.1:%d' % self.server.port]), namespace='nc')
+        record = NamecoinRecord({u'ns': [u'ns1.testdomain.bit'], u'ds': [[1, 8, 2, u'AB']]})
+
+        l1.set('testdomain', record)
+
+        self.assertEqual(record, other_l1.get('testdomain'))
+        gets = self.server.commands.count('get')
+        self.assertEqual(record, other_l1.get('testdomain'))
+        self.assertEqual(gets, self.server.commands.count('get'))
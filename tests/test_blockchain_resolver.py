@@ -1,8 +1,13 @@
 __author__ = 'mdavid'
 
+import gc
+import struct
+import time
 from mock import *
 from unittest import TestCase
 from bcresolver import *
+from bcresolver import wire
+from bcresolver.namecoin import NamecoinException
 
 class TestBuildTempUnboundConfig(TestCase):
 
@@ -128,6 +133,13 @@ class TestResolve(TestCase):
         self.result_obj.data.as_address_list.return_value = ['127.0.0.1']
         self.ns_ctx.resolve.return_value = (0, self.result_obj)
 
+        # Nameserver AAAA lookups find no IPv6 addresses
+        self.aaaa_result_obj = Mock(secure=1, bogus=0, havedata=0)
+        self.aaaa_result_obj.data.as_address_list.return_value = []
+        def ns_resolve(name, rrtype, rrclass):
+            return (0, self.aaaa_result_obj) if rrtype == RDATATYPE['AAAA'] else DEFAULT
+        self.ns_ctx.resolve.side_effect = ns_resolve
+
         self.result_obj2 = Mock()
         self.result_obj2.secure = 1
         self.result_obj2.bogus = 0
@@ -166,7 +178,7 @@ class TestResolve(TestCase):
         self.assertEqual(1, self.result_obj.data.as_address_list.call_count)
         self.assertEqual(1, self.result_obj2.data.as_domain_list.call_count)
 
-        self.assertEqual(1, self.ns_ctx.resolve.call_count)
+        self.assertEqual(2, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -203,7 +215,7 @@ class TestResolve(TestCase):
         self.assertEqual(1, self.result_obj.data.as_address_list.call_count)
         self.assertEqual(1, self.result_obj2.data.as_domain_list.call_count)
 
-        self.assertEqual(1, self.ns_ctx.resolve.call_count)
+        self.assertEqual(2, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -242,7 +254,7 @@ class TestResolve(TestCase):
         self.assertEqual(1, self.result_obj.data.as_address_list.call_count)
         self.assertEqual(1, self.result_obj2.data.as_address_list.call_count)
 
-        self.assertEqual(1, self.ns_ctx.resolve.call_count)
+        self.assertEqual(2, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -281,7 +293,7 @@ class TestResolve(TestCase):
         self.assertEqual(1, self.result_obj.data.as_address_list.call_count)
         self.assertEqual(1, self.result_obj2.data.as_address_list.call_count)
 
-        self.assertEqual(1, self.ns_ctx.resolve.call_count)
+        self.assertEqual(2, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -320,7 +332,7 @@ class TestResolve(TestCase):
         self.assertEqual(1, self.result_obj.data.as_address_list.call_count)
         self.assertEqual(1, self.result_obj2.data.as_mx_list.call_count)
 
-        self.assertEqual(1, self.ns_ctx.resolve.call_count)
+        self.assertEqual(2, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -380,7 +392,7 @@ class TestResolve(TestCase):
         self.assertEqual(1, self.result_obj.data.as_address_list.call_count)
         self.assertEqual(0, self.result_obj2.data.as_mx_list.call_count)
 
-        self.assertEqual(1, self.ns_ctx.resolve.call_count)
+        self.assertEqual(2, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -422,7 +434,7 @@ class TestResolve(TestCase):
         self.assertEqual(1, self.mockBuildUnboundConfig.call_count)
         self.assertEqual(1, self.mockDeleteUnboundConfig.call_count)
 
-        self.assertEqual(1, self.ns_ctx.resolve.call_count)
+        self.assertEqual(2, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -542,7 +554,7 @@ class TestResolve(TestCase):
         self.assertEqual(0, self.mockBuildUnboundConfig.call_count)
         self.assertEqual(0, self.mockDeleteUnboundConfig.call_count)
 
-        self.assertEqual(4, self.ns_ctx.resolve.call_count)
+        self.assertEqual(8, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -559,7 +571,9 @@ class TestResolve(TestCase):
 
         self.ns_ctx.resolve.side_effect = (
             (-1, 'Resolution Failed'),
-            (0, result_obj)
+            (0, self.aaaa_result_obj),
+            (0, result_obj),
+            (0, self.aaaa_result_obj)
         )
 
         ret_val = self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT')
@@ -576,7 +590,7 @@ class TestResolve(TestCase):
         self.assertEqual(1, self.mockBuildUnboundConfig.call_count)
         self.assertEqual(1, self.mockDeleteUnboundConfig.call_count)
 
-        self.assertEqual(2, self.ns_ctx.resolve.call_count)
+        self.assertEqual(4, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -611,7 +625,9 @@ class TestResolve(TestCase):
 
         self.ns_ctx.resolve.side_effect = (
             (0, bogus_result_obj),
-            (0, result_obj)
+            (0, self.aaaa_result_obj),
+            (0, result_obj),
+            (0, self.aaaa_result_obj)
         )
 
         ret_val = self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT')
@@ -628,7 +644,7 @@ class TestResolve(TestCase):
         self.assertEqual(1, self.mockBuildUnboundConfig.call_count)
         self.assertEqual(1, self.mockDeleteUnboundConfig.call_count)
 
-        self.assertEqual(2, self.ns_ctx.resolve.call_count)
+        self.assertEqual(4, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -682,7 +698,7 @@ class TestResolve(TestCase):
         self.assertEqual(2, self.mockBuildUnboundConfig.call_count)
         self.assertEqual(2, self.mockDeleteUnboundConfig.call_count)
 
-        self.assertEqual(2, self.ns_ctx.resolve.call_count)
+        self.assertEqual(4, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -736,7 +752,7 @@ class TestResolve(TestCase):
         self.assertEqual(2, self.mockBuildUnboundConfig.call_count)
         self.assertEqual(2, self.mockDeleteUnboundConfig.call_count)
 
-        self.assertEqual(2, self.ns_ctx.resolve.call_count)
+        self.assertEqual(4, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -790,7 +806,7 @@ class TestResolve(TestCase):
         self.assertEqual(2, self.mockBuildUnboundConfig.call_count)
         self.assertEqual(2, self.mockDeleteUnboundConfig.call_count)
 
-        self.assertEqual(2, self.ns_ctx.resolve.call_count)
+        self.assertEqual(4, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -844,7 +860,7 @@ class TestResolve(TestCase):
         self.assertEqual(2, self.mockBuildUnboundConfig.call_count)
         self.assertEqual(2, self.mockDeleteUnboundConfig.call_count)
 
-        self.assertEqual(2, self.ns_ctx.resolve.call_count)
+        self.assertEqual(4, self.ns_ctx.resolve.call_count)
         self.assertEqual(1, self.ns_ctx.resolvconf.call_count)
         self.assertEqual(1, self.ns_ctx.add_ta_file.call_count)
         self.assertFalse(self.ns_ctx.add_ta.called)
@@ -863,3 +879,1312 @@ class TestResolve(TestCase):
         self.assertEqual('temp_config_file', self.wallet_ctx.config.call_args[0][0])
         self.assertEqual('temp_config_file', self.mockDeleteUnboundConfig.call_args[0][0])
 
+
+class TestImportTime(TestCase):
+
+    def test_heavy_modules_not_imported(self):
+
+        import subprocess
+        import sys
+
+        output = subprocess.check_output([
+            sys.executable,
+            '-c',
+            'import sys, time; start = time.time(); import bcresolver; elapsed = time.time() - start; '
+            'print(",".join([m for m in ("unbound", "dns", "requests") if m in sys.modules])); print(elapsed)'
+        ])
+
+        loaded, elapsed = output.splitlines()[0:2]
+        self.assertEqual('', loaded)
+        self.assertTrue(float(elapsed) < 1.0)
+
+class TestWarm(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.ub_ctx')
+        self.patcher2 = patch('bcresolver.namecoin.requests')
+        self.mockUnboundContext = self.patcher1.start()
+        self.mockRequests = self.patcher2.start()
+
+        self.nc_resolver = NamecoinResolver()
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.patcher2.stop()
+
+    def test_go_right(self):
+
+        self.nc_resolver.warm()
+
+        self.assertEqual(1, self.mockUnboundContext.call_count)
+        self.assertEqual(1, self.mockUnboundContext.return_value.resolvconf.call_count)
+        self.assertEqual(1, self.mockUnboundContext.return_value.add_ta_file.call_count)
+        self.assertEqual(self.mockUnboundContext.return_value, self.nc_resolver._ns_ctx)
+
+    def test_ns_ctx_reused(self):
+
+        self.nc_resolver.warm()
+        self.nc_resolver.warm()
+        self.nc_resolver._get_ns_ctx()
+
+        self.assertEqual(1, self.mockUnboundContext.call_count)
+
+    def test_no_trust_anchor_file(self):
+
+        self.mockOSPatcher = patch('bcresolver.os.path.isfile')
+        self.mockOS = self.mockOSPatcher.start()
+        self.mockOS.return_value = False
+
+        self.assertRaises(Exception, self.nc_resolver.warm)
+        self.assertIsNone(self.nc_resolver._ns_ctx)
+
+        self.mockOSPatcher.stop()
+
+class TestResolveAll(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.patcher2 = patch('bcresolver.ub_ctx')
+        self.patcher3 = patch('bcresolver.NamecoinResolver._build_temp_unbound_config')
+        self.patcher4 = patch('bcresolver.NamecoinResolver._delete_temp_unbound_config')
+
+        self.mockNamecoinClient = self.patcher1.start()
+        self.mockUnboundContext = self.patcher2.start()
+        self.mockBuildUnboundConfig = self.patcher3.start()
+        self.mockDeleteUnboundConfig = self.patcher4.start()
+
+        self.mockNamecoinClient.return_value.get_domain.return_value = {
+            'value': json.dumps({
+                'ds': [[40039, 8, 2, 'NZbut7iqVxCP0IGCX7J1DA/DrbrkFJzEML1PetAxVzQ=']],
+                'ns': ['pdns83.ultradns.org', 'pdns83.ultradns.com']
+            })
+        }
+
+        self.ns_ctx = Mock()
+        self.ns_result = Mock()
+        self.ns_result.bogus = 0
+        self.ns_result.data.as_address_list.return_value = ['127.0.0.1']
+        self.ns_ctx.resolve.return_value = (0, self.ns_result)
+
+        self.txt_result = Mock(secure=1, bogus=0, havedata=1)
+        self.txt_result.data.as_domain_list.return_value = ['btc']
+        self.a_result = Mock(secure=1, bogus=0, havedata=1)
+        self.a_result.data.as_address_list.return_value = ['10.0.0.1']
+        self.empty_result = Mock(secure=1, bogus=0, havedata=0)
+
+        self.answers = [{'TXT': (0, self.txt_result), 'A': (0, self.a_result), 'AAAA': (0, self.empty_result)}]
+        self.wallet_ctxs = []
+
+        def build_ctx():
+            ctx = Mock()
+            answers = self.answers[len(self.wallet_ctxs)]
+            def resolve_async(name, qtype, callback, rrtype, rrclass):
+                callback(qtype, answers[qtype][0], answers[qtype][1])
+                return 0, 1
+            ctx.resolve_async.side_effect = resolve_async
+            self.wallet_ctxs.append(ctx)
+            return ctx
+
+        def unbound_context():
+            if self.mockUnboundContext.call_count == 1:
+                return self.ns_ctx
+            return build_ctx()
+
+        self.mockUnboundContext.side_effect = unbound_context
+        self.mockBuildUnboundConfig.return_value = 'temp_config_file'
+
+        self.nc_resolver = NamecoinResolver()
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.patcher2.stop()
+        self.patcher3.stop()
+        self.patcher4.stop()
+
+    def test_go_right(self):
+
+        ret_val = self.nc_resolver.resolve_all('_wallet.wallet.testdomain.bit', ['TXT', 'A'])
+
+        self.assertEqual({'TXT': 'btc', 'A': '10.0.0.1'}, ret_val)
+        self.assertEqual(1, self.mockNamecoinClient.return_value.get_domain.call_count)
+        self.assertEqual(2, self.ns_ctx.resolve.call_count)
+        self.assertEqual(1, len(self.wallet_ctxs))
+        self.assertEqual(2, self.wallet_ctxs[0].resolve_async.call_count)
+        self.assertEqual(1, self.wallet_ctxs[0].wait.call_count)
+        self.assertEqual(1, self.wallet_ctxs[0].config.call_count)
+        self.assertEqual('testdomain.bit. IN DS 40039 8 2 3596EEB7B8AA57108FD081825FB2750C0FC3ADBAE4149CC430BD4F7AD0315734', self.wallet_ctxs[0].add_ta.call_args[0][0])
+        self.assertEqual(1, self.mockBuildUnboundConfig.call_count)
+        self.assertEqual(1, self.mockDeleteUnboundConfig.call_count)
+
+    def test_retry_failed_qtype_on_next_nameserver(self):
+
+        self.answers.append({'AAAA': (0, self.a_result)})
+
+        ret_val = self.nc_resolver.resolve_all('_wallet.wallet.testdomain.bit', ['TXT', 'AAAA'])
+
+        self.assertEqual({'TXT': 'btc', 'AAAA': '10.0.0.1'}, ret_val)
+        self.assertEqual(1, self.mockNamecoinClient.return_value.get_domain.call_count)
+        self.assertEqual(2, len(self.wallet_ctxs))
+        self.assertEqual(2, self.wallet_ctxs[0].resolve_async.call_count)
+        self.assertEqual(1, self.wallet_ctxs[1].resolve_async.call_count)
+        self.assertEqual('AAAA', self.wallet_ctxs[1].resolve_async.call_args[0][1])
+
+    def test_failed_qtype_returns_exception(self):
+
+        self.answers.append({'AAAA': (0, self.empty_result)})
+
+        ret_val = self.nc_resolver.resolve_all('_wallet.wallet.testdomain.bit', ['TXT', 'AAAA'])
+
+        self.assertEqual('btc', ret_val['TXT'])
+        self.assertIsInstance(ret_val['AAAA'], EmptyResultException)
+        self.assertEqual(2, len(self.wallet_ctxs))
+
+    def test_unsupported_qtype_not_retried(self):
+
+        self.answers[0]['SRV'] = (0, self.a_result)
+
+        ret_val = self.nc_resolver.resolve_all('_wallet.wallet.testdomain.bit', ['TXT', 'SRV'])
+
+        self.assertEqual('btc', ret_val['TXT'])
+        self.assertIsInstance(ret_val['SRV'], NotImplementedError)
+        self.assertEqual(1, len(self.wallet_ctxs))
+
+    def test_invalid_qtype(self):
+
+        self.assertRaises(ValueError, self.nc_resolver.resolve_all, '_wallet.wallet.testdomain.bit', ['TXT', 'NOTATYPE'])
+        self.assertEqual(0, len(self.wallet_ctxs))
+
+class TestNamecoinRecordCache(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.mockNamecoinClient = self.patcher1.start()
+        self.mockNamecoinClient.return_value.get_domain.return_value = {
+            'value': json.dumps({'ip': '10.0.0.1'})
+        }
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+
+    def test_go_right(self):
+
+        nc_resolver = NamecoinResolver()
+
+        self.assertEqual('10.0.0.1', nc_resolver._get_nc_record('testdomain').ip)
+        self.assertEqual('10.0.0.1', nc_resolver._get_nc_record('testdomain').ip)
+        self.assertEqual(1, self.mockNamecoinClient.return_value.get_domain.call_count)
+
+    def test_cache_disabled(self):
+
+        nc_resolver = NamecoinResolver(nc_cache_ttl=0)
+
+        nc_resolver._get_nc_record('testdomain')
+        nc_resolver._get_nc_record('testdomain')
+        self.assertEqual(2, self.mockNamecoinClient.return_value.get_domain.call_count)
+
+    def test_no_value_not_cached(self):
+
+        self.mockNamecoinClient.return_value.get_domain.return_value = None
+        nc_resolver = NamecoinResolver()
+
+        self.assertRaises(NamecoinValueException, nc_resolver._get_nc_record, 'testdomain')
+        self.assertRaises(NamecoinValueException, nc_resolver._get_nc_record, 'testdomain')
+        self.assertEqual(2, self.mockNamecoinClient.return_value.get_domain.call_count)
+
+class TestImportChains(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.mockNamecoinClient = self.patcher1.start()
+
+        self.values = {
+            'common': {'ns': ['ns1.example.com'], 'ds': [[1, 8, 2, 'abcd']], 'ip': '10.0.0.1'},
+            'first': {'import': 'd/common', 'ip': '10.0.0.2'},
+            'second': {'import': [['d/common']]},
+            'delegated': {'delegate': ['d/common', 'www']},
+            'cycle1': {'import': 'd/cycle2'},
+            'cycle2': {'import': 'd/cycle1'},
+            'foreign': {'import': 'id/someone'}
+        }
+        self.values['common']['map'] = {'www': {'ip': '10.0.0.3'}}
+
+        def get_domain(name, timeout=None):
+            return {'value': json.dumps(self.values[name])} if name in self.values else None
+        self.mockNamecoinClient.return_value.get_domain.side_effect = get_domain
+
+        self.nc_resolver = NamecoinResolver()
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+
+    def fetched(self, name):
+
+        return len([c for c in self.mockNamecoinClient.return_value.get_domain.call_args_list if c[0][0] == name])
+
+    def test_go_right(self):
+
+        record = self.nc_resolver._get_resolved_record('first')
+
+        self.assertEqual('10.0.0.2', record.ip)
+        self.assertEqual(('ns1.example.com',), record.ns)
+        self.assertEqual(((1, 8, 2, 'abcd'),), record.ds)
+
+    def test_common_import_fetched_once(self):
+
+        self.nc_resolver._get_resolved_record('first')
+        self.nc_resolver._get_resolved_record('second')
+        self.nc_resolver._get_resolved_record('first')
+
+        self.assertEqual(1, self.fetched('common'))
+        self.assertEqual(1, self.fetched('first'))
+        self.assertEqual('10.0.0.1', self.nc_resolver._get_resolved_record('second').ip)
+
+    def test_memoized(self):
+
+        record = self.nc_resolver._get_resolved_record('first')
+
+        self.assertTrue(self.nc_resolver._get_resolved_record('first') is record)
+
+    def test_delegate_with_selector(self):
+
+        record = self.nc_resolver._get_resolved_record('delegated')
+
+        self.assertEqual('10.0.0.3', record.ip)
+        self.assertIsNone(record.ns)
+
+    def test_no_links_not_memoized(self):
+
+        self.nc_resolver._get_resolved_record('common')
+
+        self.assertEqual(0, len(self.nc_resolver.chain_cache))
+
+    def test_cycle(self):
+
+        self.assertRaises(ImportChainException, self.nc_resolver._get_resolved_record, 'cycle1')
+
+    def test_depth_limit(self):
+
+        for i in range(6):
+            self.values['link%d' % i] = {'import': 'd/link%d' % (i + 1)}
+        self.values['link6'] = {'ip': '10.0.0.9'}
+
+        self.assertRaises(ImportChainException, NamecoinResolver(max_chain_depth=5)._get_resolved_record, 'link0')
+        self.assertEqual('10.0.0.9', NamecoinResolver(max_chain_depth=6)._get_resolved_record('link0').ip)
+
+    def test_only_d_names(self):
+
+        self.assertRaises(ImportChainException, self.nc_resolver._get_resolved_record, 'foreign')
+
+    def test_missing_link(self):
+
+        self.values['dangling'] = {'import': 'd/missing'}
+
+        self.assertRaises(NamecoinValueException, self.nc_resolver._get_resolved_record, 'dangling')
+
+    def test_changed_link_invalidates_dependents(self):
+
+        self.nc_resolver._get_resolved_record('first')
+        self.nc_resolver._get_resolved_record('second')
+        self.nc_resolver.delegation_cache.set('second', 'delegation')
+
+        # common's record expires and comes back changed
+        self.values['common']['ip'] = '10.0.0.5'
+        self.nc_resolver.nc_cache.delete('common')
+
+        self.assertEqual('10.0.0.5', self.nc_resolver._get_resolved_record('second').ip)
+        self.assertEqual('10.0.0.2', self.nc_resolver._get_resolved_record('first').ip)
+        self.assertIsNone(self.nc_resolver.delegation_cache.get('second'))
+        self.assertEqual(2, self.fetched('common'))
+
+    def test_unchanged_link_keeps_dependents(self):
+
+        self.nc_resolver = NamecoinResolver(serve_stale=60)
+        self.nc_resolver._get_resolved_record('second')
+        resolved = self.nc_resolver.chain_cache.get('second')
+
+        self.nc_resolver._fetch_nc_record('common')
+
+        self.assertTrue(self.nc_resolver.chain_cache.get('second') is resolved)
+
+    def test_resolve_native_through_import(self):
+
+        self.nc_resolver = NamecoinResolver(native_records=True)
+        self.values['native'] = {'ip': '10.0.0.7'}
+        self.values['importer'] = {'import': 'd/native'}
+
+        self.assertEqual('10.0.0.7', self.nc_resolver.resolve('importer.bit', 'A'))
+
+class TestNameIndexRejection(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.mockNamecoinClient = self.patcher1.start()
+        self.mockNamecoinClient.return_value.get_domain.return_value = {'value': json.dumps({'ip': '10.0.0.1'})}
+
+        self.mockIndex = Mock()
+        self.mockIndex.might_exist.side_effect = lambda sld: sld == 'registered'
+
+        self.nc_resolver = NamecoinResolver(native_records=True, name_index=self.mockIndex)
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+
+    def test_go_right(self):
+
+        self.assertEqual('10.0.0.1', self.nc_resolver.resolve('registered.bit', 'A'))
+        self.assertEqual(1, self.mockNamecoinClient.return_value.get_domain.call_count)
+
+    def test_rejected(self):
+
+        self.assertRaises(NamecoinValueException, self.nc_resolver.resolve, 'unregistered.bit', 'A')
+        self.mockIndex.might_exist.assert_called_once_with('unregistered')
+        self.assertEqual(0, self.mockNamecoinClient.return_value.get_domain.call_count)
+
+    def test_rejected_wire(self):
+
+        query = wire.HEADER.pack(0x1234, 0x0100, 1, 0, 0, 0) + wire.encode_name('unregistered.bit') + struct.pack('!HH', 1, 1)
+
+        self.assertEqual(wire.RCODE_NXDOMAIN, wire.HEADER.unpack_from(self.nc_resolver.resolve_wire(query))[1] & 0xf)
+        self.assertEqual(0, self.mockNamecoinClient.return_value.get_domain.call_count)
+
+class TestResolveNative(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.patcher2 = patch('bcresolver.ub_ctx')
+        self.mockNamecoinClient = self.patcher1.start()
+        self.mockUnboundContext = self.patcher2.start()
+
+        self.nc_value = {
+            'ip': '10.0.0.1',
+            'ip6': ['2001:db8::1', '2001:db8::2'],
+            'map': {
+                'www': {'alias': ''},
+                'mail': '10.0.0.2',
+                'ext': {'alias': 'www.example.com.'},
+                'sub': {'map': {'': {'ip': '10.0.0.3'}, 'deep': {'ip6': '2001:db8::3'}}},
+                '*': {'ip': '10.0.0.4'}
+            }
+        }
+        self.mockNamecoinClient.return_value.get_domain.return_value = {'value': json.dumps(self.nc_value)}
+
+        self.nc_resolver = NamecoinResolver(native_records=True)
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.patcher2.stop()
+
+    def test_go_right_a_rr(self):
+
+        self.assertEqual('10.0.0.1', self.nc_resolver.resolve('testdomain.bit', 'A'))
+        self.assertEqual(0, self.mockUnboundContext.call_count)
+
+    def test_go_right_aaaa_rr(self):
+
+        self.assertEqual('2001:db8::1', self.nc_resolver.resolve('testdomain.bit', 'AAAA'))
+        self.assertEqual('2001:db8::3', self.nc_resolver.resolve('deep.sub.testdomain.bit', 'AAAA'))
+
+    def test_go_right_cname_rr(self):
+
+        self.assertEqual('testdomain.bit.', self.nc_resolver.resolve('www.testdomain.bit', 'CNAME'))
+        self.assertEqual('www.example.com.', self.nc_resolver.resolve('ext.testdomain.bit', 'CNAME'))
+
+    def test_legacy_string_map_entry(self):
+
+        self.assertEqual('10.0.0.2', self.nc_resolver.resolve('mail.testdomain.bit', 'A'))
+
+    def test_empty_label_map_entry(self):
+
+        self.assertEqual('10.0.0.3', self.nc_resolver.resolve('sub.testdomain.bit', 'A'))
+
+    def test_wildcard_map_entry(self):
+
+        self.assertEqual('10.0.0.4', self.nc_resolver.resolve('other.testdomain.bit', 'A'))
+
+    def test_no_data_for_qtype(self):
+
+        self.assertRaises(EmptyResultException, self.nc_resolver.resolve, 'www.testdomain.bit', 'A')
+        self.assertEqual(0, self.mockUnboundContext.call_count)
+
+    def test_name_not_in_map(self):
+
+        self.assertRaises(EmptyResultException, self.nc_resolver.resolve, 'a.mail.testdomain.bit', 'A')
+
+    def test_single_name_show(self):
+
+        self.nc_resolver.resolve('testdomain.bit', 'A')
+        self.nc_resolver.resolve('www.testdomain.bit', 'CNAME')
+        self.nc_resolver.resolve('mail.testdomain.bit', 'A')
+
+        self.assertEqual(1, self.mockNamecoinClient.return_value.get_domain.call_count)
+
+    def test_native_records_disabled(self):
+
+        nc_resolver = NamecoinResolver()
+        self.assertRaises(NoDSRecordException, nc_resolver.resolve, 'testdomain.bit', 'A')
+
+    def test_ns_takes_precedence(self):
+
+        self.nc_value['ns'] = ['ns1.testdomain.bit']
+        self.mockNamecoinClient.return_value.get_domain.return_value = {'value': json.dumps(self.nc_value)}
+
+        self.assertRaises(NoDSRecordException, self.nc_resolver.resolve, 'testdomain.bit', 'A')
+
+    def test_resolve_all(self):
+
+        ret_val = self.nc_resolver.resolve_all('testdomain.bit', ['A', 'AAAA', 'CNAME'])
+
+        self.assertEqual('10.0.0.1', ret_val['A'])
+        self.assertEqual('2001:db8::1', ret_val['AAAA'])
+        self.assertIsInstance(ret_val['CNAME'], EmptyResultException)
+        self.assertEqual(0, self.mockUnboundContext.call_count)
+
+class TestResolveCaching(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.patcher2 = patch('bcresolver.ub_ctx')
+        self.patcher3 = patch('bcresolver.NamecoinResolver._build_temp_unbound_config')
+        self.patcher4 = patch('bcresolver.NamecoinResolver._delete_temp_unbound_config')
+
+        self.mockNamecoinClient = self.patcher1.start()
+        self.mockUnboundContext = self.patcher2.start()
+        self.mockBuildUnboundConfig = self.patcher3.start()
+        self.mockDeleteUnboundConfig = self.patcher4.start()
+
+        self.mockNamecoinClient.return_value.get_domain.return_value = {
+            'value': json.dumps({
+                'ds': [[40039, 8, 2, 'NZbut7iqVxCP0IGCX7J1DA/DrbrkFJzEML1PetAxVzQ=']],
+                'ns': ['pdns83.ultradns.org']
+            })
+        }
+
+        self.result_obj = Mock(secure=1, bogus=0, havedata=1, ttl=300)
+        self.result_obj.data.as_address_list.return_value = ['127.0.0.1']
+        self.result_obj.data.as_domain_list.return_value = ['btc']
+        self.mockUnboundContext.return_value.resolve.return_value = (0, self.result_obj)
+
+        self.nc_resolver = NamecoinResolver()
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.patcher2.stop()
+        self.patcher3.stop()
+        self.patcher4.stop()
+
+    def test_answer_cached(self):
+
+        self.assertEqual(('btc', 300), self.nc_resolver.resolve_with_ttl('_wallet.wallet.testdomain.bit', 'TXT'))
+        self.assertEqual('btc', self.nc_resolver.resolve('_WALLET.wallet.testdomain.bit.', 'TXT'))
+
+        self.assertEqual(1, self.mockNamecoinClient.return_value.get_domain.call_count)
+        self.assertEqual(1, self.mockBuildUnboundConfig.call_count)
+        self.assertEqual(1, len(self.nc_resolver.answer_cache))
+
+    def test_answer_without_ttl_not_cached(self):
+
+        self.result_obj.ttl = None
+
+        self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT')
+        self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT')
+
+        self.assertEqual(2, self.mockBuildUnboundConfig.call_count)
+        self.assertEqual(1, self.mockNamecoinClient.return_value.get_domain.call_count)
+
+    def test_delegation_cached(self):
+
+        self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT')
+        self.nc_resolver.resolve('www.testdomain.bit', 'A')
+
+        delegation = self.nc_resolver.delegation_cache.get('testdomain')
+        self.assertEqual('testdomain.bit.', delegation.sld)
+        self.assertEqual(('pdns83.ultradns.org',), delegation.ns)
+        self.assertEqual('testdomain.bit. IN DS 40039 8 2 3596EEB7B8AA57108FD081825FB2750C0FC3ADBAE4149CC430BD4F7AD0315734', delegation.ds_ta)
+        self.assertEqual(1, self.mockNamecoinClient.return_value.get_domain.call_count)
+
+    def test_byte_budgets(self):
+
+        nc_resolver = NamecoinResolver(nc_cache_bytes=1024, answer_cache_bytes=2048)
+
+        self.assertEqual(1024, nc_resolver.nc_cache.max_bytes)
+        self.assertEqual(1024, nc_resolver.delegation_cache.max_bytes)
+        self.assertEqual(1024, nc_resolver.ns_address_cache.max_bytes)
+        self.assertEqual(1024, nc_resolver.chain_cache.max_bytes)
+        self.assertEqual(2048, nc_resolver.answer_cache.max_bytes)
+        self.assertEqual(2048, nc_resolver.wire_cache.max_bytes)
+
+class TestResolveDeadline(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.patcher2 = patch('bcresolver.ub_ctx')
+        self.patcher3 = patch('bcresolver.NamecoinResolver._build_temp_unbound_config')
+        self.patcher4 = patch('bcresolver.NamecoinResolver._delete_temp_unbound_config')
+        self.patcher5 = patch('bcresolver.select')
+
+        self.mockNamecoinClient = self.patcher1.start()
+        self.mockUnboundContext = self.patcher2.start()
+        self.mockBuildUnboundConfig = self.patcher3.start()
+        self.mockDeleteUnboundConfig = self.patcher4.start()
+        self.mockSelect = self.patcher5.start()
+
+        self.mockNamecoinClient.return_value.get_domain.return_value = {
+            'value': json.dumps({
+                'ds': [[40039, 8, 2, 'NZbut7iqVxCP0IGCX7J1DA/DrbrkFJzEML1PetAxVzQ=']],
+                'ns': ['pdns83.ultradns.org', 'pdns83.ultradns.com']
+            })
+        }
+
+        self.result_obj = Mock(secure=1, bogus=0, havedata=1, ttl=300)
+        self.result_obj.data.as_address_list.return_value = ['127.0.0.1']
+        self.result_obj.data.as_domain_list.return_value = ['btc']
+
+        self.ctx = self.mockUnboundContext.return_value
+        def resolve_async(name, qtype, callback, rrtype, rrclass):
+            callback(qtype, 0, self.result_obj)
+            return 0, 1
+        self.ctx.resolve_async.side_effect = resolve_async
+        self.mockSelect.select.return_value = ([], [], [])
+
+        self.nc_resolver = NamecoinResolver()
+
+        # Collect now, so a full collection of earlier tests' mocks does not eat into the short deadlines below
+        gc.collect()
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.patcher2.stop()
+        self.patcher3.stop()
+        self.patcher4.stop()
+        self.patcher5.stop()
+
+    def test_go_right(self):
+
+        ret_val = self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT', deadline=5)
+
+        self.assertEqual('btc', ret_val)
+        self.assertFalse(self.ctx.resolve.called)
+        self.assertEqual(3, self.ctx.resolve_async.call_count)
+
+        timeout = self.mockNamecoinClient.call_args[1]['timeout']
+        self.assertTrue(0 < timeout <= 5)
+
+    def test_no_deadline_uses_default_timeout(self):
+
+        self.ctx.resolve.return_value = (0, self.result_obj)
+
+        self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT')
+
+        self.assertEqual(60, self.mockNamecoinClient.call_args[1]['timeout'])
+        self.assertFalse(self.ctx.resolve_async.called)
+
+    def test_namecoin_timeout(self):
+
+        def get_domain(name):
+            time.sleep(0.02)
+            raise NamecoinException('Unable to connect to Namecoin node', 500)
+        self.mockNamecoinClient.return_value.get_domain.side_effect = get_domain
+
+        self.assertRaises(ResolutionTimeoutException, self.nc_resolver.resolve, '_wallet.wallet.testdomain.bit', 'TXT', 0.01)
+
+    def test_namecoin_error_within_deadline(self):
+
+        self.mockNamecoinClient.return_value.get_domain.side_effect = NamecoinException('Unable to connect to Namecoin node', 500)
+
+        self.assertRaises(NamecoinException, self.nc_resolver.resolve, '_wallet.wallet.testdomain.bit', 'TXT', 5)
+
+    def test_dns_timeout(self):
+
+        self.ctx.resolve_async.side_effect = None
+        self.ctx.resolve_async.return_value = (0, 42)
+
+        self.assertRaises(ResolutionTimeoutException, self.nc_resolver.resolve, '_wallet.wallet.testdomain.bit', 'TXT', 0.05)
+
+        # The nameserver address lookups never answer, so work stops there
+        self.assertEqual(2, self.ctx.resolve_async.call_count)
+        self.assertEqual(42, self.ctx.cancel.call_args[0][0])
+        self.assertEqual(0, self.mockBuildUnboundConfig.call_count)
+
+    def test_dns_timeout_cleans_up_config(self):
+
+        calls = []
+        def resolve_async(name, qtype, callback, rrtype, rrclass):
+            calls.append(name)
+            if len(calls) <= 2:
+                callback(qtype, 0, self.result_obj)
+            return 0, len(calls)
+        self.ctx.resolve_async.side_effect = resolve_async
+
+        self.assertRaises(ResolutionTimeoutException, self.nc_resolver.resolve, '_wallet.wallet.testdomain.bit', 'TXT', 0.05)
+
+        self.assertEqual(1, self.mockBuildUnboundConfig.call_count)
+        self.assertEqual(1, self.mockDeleteUnboundConfig.call_count)
+        self.assertEqual(3, self.ctx.cancel.call_args[0][0])
+
+    def test_resolve_all_deadline(self):
+
+        ret_val = self.nc_resolver.resolve_all('_wallet.wallet.testdomain.bit', ['TXT', 'A'], deadline=5)
+
+        self.assertEqual({'TXT': 'btc', 'A': '127.0.0.1'}, ret_val)
+
+class TestLocalNamecoinResolverHedging(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.mockNamecoinClient = self.patcher1.start()
+
+        self.delays = {'namecoin1.local': 0, 'namecoin2.local': 0}
+        self.failures = set()
+
+        def build_client(host, port, user, password, timeout):
+            client = Mock()
+            def get_domain(name):
+                time.sleep(self.delays[host])
+                if host in self.failures:
+                    raise NamecoinException('Unable to connect to Namecoin node', 500)
+                return {'name': 'd/%s' % name, 'host': host}
+            client.get_domain.side_effect = get_domain
+            return client
+        self.mockNamecoinClient.side_effect = build_client
+
+        self.nc_resolver = LocalNamecoinResolver('namecoin1.local', 'user', 'password', 8336, hedge_percentile=0.9, hedge_hosts=[('namecoin2.local', 8336)], hedge_min_samples=5)
+        for i in range(5):
+            self.nc_resolver.latency.record(0.01)
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+
+    def test_fast_primary_not_hedged(self):
+
+        ret_val = self.nc_resolver.name_show('mattdavid')
+
+        self.assertEqual('namecoin1.local', ret_val['host'])
+        self.assertEqual(1, self.mockNamecoinClient.call_count)
+        self.assertEqual({'requests': 1, 'hedged': 0, 'hedge_wins': 0}, self.nc_resolver.stats)
+
+    def test_slow_primary_hedged(self):
+
+        self.delays['namecoin1.local'] = 0.5
+
+        ret_val = self.nc_resolver.name_show('mattdavid')
+
+        self.assertEqual('namecoin2.local', ret_val['host'])
+        self.assertEqual(2, self.mockNamecoinClient.call_count)
+        self.assertEqual('namecoin2.local', self.mockNamecoinClient.call_args[1]['host'])
+        self.assertEqual({'requests': 1, 'hedged': 1, 'hedge_wins': 1}, self.nc_resolver.stats)
+
+    def test_hedged_primary_wins(self):
+
+        self.delays['namecoin1.local'] = 0.05
+        self.delays['namecoin2.local'] = 0.5
+
+        ret_val = self.nc_resolver.name_show('mattdavid')
+
+        self.assertEqual('namecoin1.local', ret_val['host'])
+        self.assertEqual({'requests': 1, 'hedged': 1, 'hedge_wins': 0}, self.nc_resolver.stats)
+
+    def test_first_reply_error_waits_for_other(self):
+
+        self.delays['namecoin1.local'] = 0.05
+        self.delays['namecoin2.local'] = 0.1
+        self.failures.add('namecoin1.local')
+
+        ret_val = self.nc_resolver.name_show('mattdavid')
+
+        self.assertEqual('namecoin2.local', ret_val['host'])
+
+    def test_both_fail(self):
+
+        self.delays['namecoin1.local'] = 0.05
+        self.failures.update(['namecoin1.local', 'namecoin2.local'])
+
+        self.assertRaises(NamecoinException, self.nc_resolver.name_show, 'mattdavid')
+
+    def test_hedge_shares_timeout(self):
+
+        self.delays['namecoin1.local'] = 0.5
+        self.delays['namecoin2.local'] = 0.5
+
+        start = time.time()
+        self.assertRaises(NamecoinException, self.nc_resolver.name_show, 'mattdavid', timeout=0.2)
+
+        self.assertTrue(time.time() - start < 0.4)
+        self.assertEqual(0.2, self.mockNamecoinClient.call_args_list[0][1]['timeout'])
+        self.assertTrue(self.mockNamecoinClient.call_args_list[1][1]['timeout'] < 0.2)
+
+    def test_timeout_before_hedge(self):
+
+        self.delays['namecoin1.local'] = 0.5
+        for i in range(10):
+            self.nc_resolver.latency.record(1.0)
+
+        start = time.time()
+        self.assertRaises(NamecoinException, self.nc_resolver.name_show, 'mattdavid', timeout=0.1)
+
+        self.assertTrue(time.time() - start < 0.3)
+        self.assertEqual(1, self.mockNamecoinClient.call_count)
+        self.assertEqual(0, self.nc_resolver.stats['hedged'])
+
+    def test_not_enough_samples(self):
+
+        nc_resolver = LocalNamecoinResolver('namecoin1.local', 'user', 'password', 8336, hedge_percentile=0.9, hedge_hosts=[('namecoin2.local', 8336)], hedge_min_samples=50)
+        self.delays['namecoin1.local'] = 0.05
+
+        ret_val = nc_resolver.name_show('mattdavid')
+
+        self.assertEqual('namecoin1.local', ret_val['host'])
+        self.assertEqual(0, nc_resolver.stats['hedged'])
+        self.assertEqual(1, len(nc_resolver.latency))
+
+    def test_options_from_namecoin_resolver(self):
+
+        nc_resolver = NamecoinResolver(nc_name_resolver_options={'hedge_percentile': 0.99, 'hedge_hosts': [('namecoin2.local', 8336)]})
+
+        self.assertEqual(0.99, nc_resolver.nc_name_resolver.hedge_percentile)
+        self.assertEqual([('namecoin2.local', 8336)], nc_resolver.nc_name_resolver.hedge_hosts)
+
+class TestServeStale(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.patcher2 = patch('bcresolver.ub_ctx')
+        self.patcher3 = patch('bcresolver.NamecoinResolver._build_temp_unbound_config')
+        self.patcher4 = patch('bcresolver.NamecoinResolver._delete_temp_unbound_config')
+        self.patcher5 = patch('bcresolver.cache.time')
+
+        self.mockNamecoinClient = self.patcher1.start()
+        self.mockUnboundContext = self.patcher2.start()
+        self.mockBuildUnboundConfig = self.patcher3.start()
+        self.mockDeleteUnboundConfig = self.patcher4.start()
+        self.mockTime = self.patcher5.start()
+        self.mockTime.time.return_value = 1000.0
+
+        self.get_domain = self.mockNamecoinClient.return_value.get_domain
+        self.get_domain.return_value = {'value': json.dumps({'ip': '10.0.0.1'})}
+
+        self.nc_resolver = NamecoinResolver(native_records=True, serve_stale=3600, stale_answer_timeout=0.05)
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.patcher2.stop()
+        self.patcher3.stop()
+        self.patcher4.stop()
+        self.patcher5.stop()
+
+    def test_stale_namecoin_record_on_error(self):
+
+        self.assertEqual('10.0.0.1', self.nc_resolver.resolve('testdomain.bit', 'A'))
+
+        self.mockTime.time.return_value = 1100.0
+        self.get_domain.side_effect = NamecoinException('Unable to connect to Namecoin node', 500)
+
+        self.assertEqual('10.0.0.1', self.nc_resolver.resolve('testdomain.bit', 'A'))
+        self.assertEqual(2, self.get_domain.call_count)
+
+    def test_refreshed_namecoin_record(self):
+
+        self.nc_resolver.resolve('testdomain.bit', 'A')
+
+        self.mockTime.time.return_value = 1100.0
+        self.get_domain.return_value = {'value': json.dumps({'ip': '10.0.0.2'})}
+
+        self.assertEqual('10.0.0.2', self.nc_resolver.resolve('testdomain.bit', 'A'))
+
+    def test_slow_refresh_continues_in_background(self):
+
+        self.nc_resolver.resolve('testdomain.bit', 'A')
+
+        self.mockTime.time.return_value = 1100.0
+        def get_domain(name):
+            time.sleep(0.2)
+            return {'value': json.dumps({'ip': '10.0.0.2'})}
+        self.get_domain.side_effect = get_domain
+
+        start = time.time()
+        self.assertEqual('10.0.0.1', self.nc_resolver.resolve('testdomain.bit', 'A'))
+        self.assertTrue(time.time() - start < 0.2)
+
+        time.sleep(0.3)
+        self.assertEqual('10.0.0.2', self.nc_resolver.resolve('testdomain.bit', 'A'))
+        self.assertEqual(2, self.get_domain.call_count)
+
+    def test_definitive_error_not_served_stale(self):
+
+        self.nc_resolver.resolve('testdomain.bit', 'A')
+
+        self.mockTime.time.return_value = 1100.0
+        self.get_domain.return_value = None
+
+        self.assertRaises(NamecoinValueException, self.nc_resolver.resolve, 'testdomain.bit', 'A')
+
+    def test_serve_stale_disabled(self):
+
+        nc_resolver = NamecoinResolver(native_records=True)
+        nc_resolver.resolve('testdomain.bit', 'A')
+
+        self.mockTime.time.return_value = 1100.0
+        self.get_domain.side_effect = NamecoinException('Unable to connect to Namecoin node', 500)
+
+        self.assertRaises(NamecoinException, nc_resolver.resolve, 'testdomain.bit', 'A')
+
+    def test_stale_answer(self):
+
+        self.get_domain.return_value = {
+            'value': json.dumps({
+                'ds': [[40039, 8, 2, 'NZbut7iqVxCP0IGCX7J1DA/DrbrkFJzEML1PetAxVzQ=']],
+                'ns': ['pdns83.ultradns.org']
+            })
+        }
+
+        result_obj = Mock(secure=1, bogus=0, havedata=1, ttl=300)
+        result_obj.data.as_address_list.return_value = ['127.0.0.1']
+        result_obj.data.as_domain_list.return_value = ['btc']
+        self.mockUnboundContext.return_value.resolve.return_value = (0, result_obj)
+
+        self.assertEqual(('btc', 300), self.nc_resolver.resolve_with_ttl('_wallet.wallet.testdomain.bit', 'TXT'))
+
+        # Nameserver lookups now fail
+        self.mockTime.time.return_value = 1400.0
+        self.mockUnboundContext.return_value.resolve.return_value = (-1, None)
+
+        self.assertEqual(('btc', 30), self.nc_resolver.resolve_with_ttl('_wallet.wallet.testdomain.bit', 'TXT'))
+        self.assertEqual({'TXT': 'btc'}, self.nc_resolver.resolve_all('_wallet.wallet.testdomain.bit', ['TXT']))
+
+class TestAdmissionControl(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.patcher2 = patch('bcresolver.ub_ctx')
+
+        self.mockNamecoinClient = self.patcher1.start()
+        self.mockUnboundContext = self.patcher2.start()
+
+        self.get_domain = self.mockNamecoinClient.return_value.get_domain
+        self.get_domain.return_value = {'value': json.dumps({'ip': '10.0.0.1'})}
+
+        self.nc_resolver = NamecoinResolver(native_records=True, max_concurrent=1, max_queue=0)
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.patcher2.stop()
+
+    def test_go_right(self):
+
+        self.assertEqual('10.0.0.1', self.nc_resolver.resolve('testdomain.bit', 'A'))
+        self.assertEqual(0, self.nc_resolver.admission.active)
+        self.assertEqual(1, self.nc_resolver.admission.stats['admitted'])
+
+    def test_overload(self):
+
+        self.nc_resolver.admission.acquire()
+
+        self.assertRaises(OverloadException, self.nc_resolver.resolve, 'testdomain.bit', 'A')
+        self.assertRaises(OverloadException, self.nc_resolver.resolve_all, 'testdomain.bit', ['A'])
+        self.assertEqual(0, self.get_domain.call_count)
+
+    def test_slot_released_on_error(self):
+
+        self.get_domain.side_effect = NamecoinException('Unable to connect to Namecoin node', 500)
+
+        self.assertRaises(NamecoinException, self.nc_resolver.resolve, 'testdomain.bit', 'A')
+        self.assertEqual(0, self.nc_resolver.admission.active)
+
+    def test_disabled_by_default(self):
+
+        self.assertIsNone(NamecoinResolver().admission)
+
+class TestResolveWire(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.patcher2 = patch('bcresolver.ub_ctx')
+        self.patcher3 = patch('bcresolver.NamecoinResolver._build_temp_unbound_config')
+        self.patcher4 = patch('bcresolver.NamecoinResolver._delete_temp_unbound_config')
+        self.patcher5 = patch('bcresolver.time')
+
+        self.mockNamecoinClient = self.patcher1.start()
+        self.mockUnboundContext = self.patcher2.start()
+        self.mockBuildUnboundConfig = self.patcher3.start()
+        self.mockDeleteUnboundConfig = self.patcher4.start()
+        self.mockTime = self.patcher5.start()
+        self.mockTime.time.return_value = 1000.0
+
+        self.get_domain = self.mockNamecoinClient.return_value.get_domain
+        self.get_domain.return_value = {
+            'value': json.dumps({
+                'ds': [[40039, 8, 2, 'NZbut7iqVxCP0IGCX7J1DA/DrbrkFJzEML1PetAxVzQ=']],
+                'ns': ['pdns83.ultradns.org']
+            })
+        }
+
+        # Unbound answer packet (ID 0) for www.testdomain.bit A
+        self.packet = wire.build_response(wire.parse_question(self.make_query('www.testdomain.bit', msg_id=0)), answers=[(1, 300, '\x0a\x00\x00\x01')])
+
+        self.result_obj = Mock(secure=1, bogus=0, havedata=1, ttl=300, packet=self.packet)
+        self.result_obj.data.as_address_list.return_value = ['127.0.0.1']
+        self.mockUnboundContext.return_value.resolve.return_value = (0, self.result_obj)
+
+        self.nc_resolver = NamecoinResolver()
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.patcher2.stop()
+        self.patcher3.stop()
+        self.patcher4.stop()
+        self.patcher5.stop()
+
+    def make_query(self, name, rrtype=1, msg_id=0x1234, flags=0x0100):
+
+        return struct.pack('!HHHHHH', msg_id, flags, 1, 0, 0, 0) + wire.encode_name(name) + struct.pack('!HH', rrtype, 1)
+
+    def test_go_right(self):
+
+        response = self.nc_resolver.resolve_wire(self.make_query('www.testdomain.bit'))
+
+        self.assertEqual(0x1234, struct.unpack_from('!H', response)[0])
+        self.assertTrue(struct.unpack_from('!H', response, 2)[0] & wire.FLAG_AD)
+        self.assertEqual(len(self.packet), len(response))
+        self.assertTrue(response.endswith('\x00\x00\x01\x2c\x00\x04\x0a\x00\x00\x01'))
+
+    def test_cache_hit_patches_id_and_ttl(self):
+
+        self.nc_resolver.resolve_wire(self.make_query('www.testdomain.bit'))
+
+        self.mockTime.time.return_value = 1100.0
+        query = self.make_query('WWW.testdomain.bit', msg_id=0x4321)
+        response = self.nc_resolver.resolve_wire(query)
+
+        self.assertEqual(0x4321, struct.unpack_from('!H', response)[0])
+        self.assertEqual(query[12:], response[12:len(query)])
+        self.assertTrue(response.endswith('\x00\x00\x00\xc8\x00\x04\x0a\x00\x00\x01'))
+        self.assertEqual(3, self.mockUnboundContext.return_value.resolve.call_count)
+        self.assertEqual(1, self.get_domain.call_count)
+
+    def test_bogus_result(self):
+
+        self.result_obj.bogus = 1
+
+        response = self.nc_resolver.resolve_wire(self.make_query('www.testdomain.bit'))
+
+        self.assertEqual(wire.RCODE_SERVFAIL, struct.unpack_from('!H', response, 2)[0] & 0xf)
+        self.assertEqual(0, len(self.nc_resolver.wire_cache))
+
+    def test_name_not_registered(self):
+
+        self.get_domain.return_value = None
+
+        response = self.nc_resolver.resolve_wire(self.make_query('www.testdomain.bit'))
+        self.assertEqual(wire.RCODE_NXDOMAIN, struct.unpack_from('!H', response, 2)[0] & 0xf)
+
+    def test_not_bit_domain(self):
+
+        response = self.nc_resolver.resolve_wire(self.make_query('www.example.com'))
+
+        self.assertEqual(wire.RCODE_REFUSED, struct.unpack_from('!H', response, 2)[0] & 0xf)
+        self.assertEqual(0, self.get_domain.call_count)
+
+    def test_unsupported_opcode(self):
+
+        response = self.nc_resolver.resolve_wire(self.make_query('www.testdomain.bit', flags=0x2800))
+        self.assertEqual(wire.RCODE_NOTIMP, struct.unpack_from('!H', response, 2)[0] & 0xf)
+
+    def test_malformed_query(self):
+
+        self.assertIsNone(self.nc_resolver.resolve_wire('\x12\x34'))
+
+    def test_native_answer(self):
+
+        self.get_domain.return_value = {'value': json.dumps({'ip': '10.0.0.2'})}
+        nc_resolver = NamecoinResolver(native_records=True)
+
+        response = nc_resolver.resolve_wire(self.make_query('testdomain.bit'))
+
+        self.assertEqual(1, struct.unpack_from('!H', response, 6)[0])
+        self.assertTrue(response.endswith('\x00\x04\x0a\x00\x00\x02'))
+        self.assertEqual(0, self.mockUnboundContext.return_value.resolve.call_count)
+
+class TestDnspythonEngine(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.patcher2 = patch('bcresolver.ub_ctx')
+        self.patcher3 = patch('bcresolver.NamecoinResolver._build_temp_unbound_config')
+        self.patcher4 = patch('bcresolver.dnssec.DnspythonEngine')
+
+        self.mockNamecoinClient = self.patcher1.start()
+        self.mockUnboundContext = self.patcher2.start()
+        self.mockBuildUnboundConfig = self.patcher3.start()
+        self.mockEngine = self.patcher4.start()
+
+        self.mockNamecoinClient.return_value.get_domain.return_value = {
+            'value': json.dumps({
+                'ds': [[40039, 8, 2, 'NZbut7iqVxCP0IGCX7J1DA/DrbrkFJzEML1PetAxVzQ=']],
+                'ns': ['pdns83.ultradns.org', 'pdns84.ultradns.org']
+            })
+        }
+
+        self.result_obj = Mock(secure=1, bogus=0, havedata=1, ttl=300)
+        self.result_obj.data.as_domain_list.return_value = ['btc']
+
+        self.engine = self.mockEngine.return_value
+        self.engine.resolve_addresses.return_value = (['127.0.0.1'], 300)
+        self.engine.query.return_value = (0, self.result_obj)
+
+        self.nc_resolver = NamecoinResolver(engine='dnspython')
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.patcher2.stop()
+        self.patcher3.stop()
+        self.patcher4.stop()
+
+    def test_go_right(self):
+
+        self.assertEqual('btc', self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT'))
+
+        self.assertEqual(1, self.engine.resolve_addresses.call_count)
+        self.assertEqual('pdns83.ultradns.org', self.engine.resolve_addresses.call_args[0][0])
+        self.assertEqual(1, self.engine.query.call_count)
+        self.assertEqual(('testdomain.bit.', '127.0.0.1', 'testdomain.bit. IN DS 40039 8 2 3596EEB7B8AA57108FD081825FB2750C0FC3ADBAE4149CC430BD4F7AD0315734', '_wallet.wallet.testdomain.bit', 16, None), self.engine.query.call_args[0])
+        self.assertEqual(0, self.mockUnboundContext.call_count)
+        self.assertEqual(0, self.mockBuildUnboundConfig.call_count)
+
+    def test_bogus_result_tries_next_nameserver(self):
+
+        bogus_obj = Mock(secure=0, bogus=1, havedata=0)
+        self.engine.query.side_effect = [(0, bogus_obj), (0, self.result_obj)]
+
+        self.assertEqual('btc', self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT'))
+        self.assertEqual(2, self.engine.query.call_count)
+
+    def test_resolve_all(self):
+
+        ret_val = self.nc_resolver.resolve_all('_wallet.wallet.testdomain.bit', ['TXT', 'CNAME'])
+
+        self.assertEqual({'TXT': 'btc', 'CNAME': 'btc'}, ret_val)
+        self.assertEqual(2, self.engine.query.call_count)
+
+    def test_nxdomain_not_retried(self):
+
+        self.engine.query.return_value = (0, Mock(secure=1, bogus=0, havedata=0, proven=1, rcode=3))
+
+        self.assertRaises(NXDomainException, self.nc_resolver.resolve, '_btc._wallet.testdomain.bit', 'TXT')
+        self.assertEqual(1, self.engine.query.call_count)
+
+    def test_unproven_nxdomain_retried(self):
+
+        self.engine.query.return_value = (0, Mock(secure=1, bogus=0, havedata=0, proven=0, rcode=3))
+
+        try:
+            self.nc_resolver.resolve('_btc._wallet.testdomain.bit', 'TXT')
+            self.assertTrue(False)
+        except NXDomainException:
+            raise
+        except EmptyResultException:
+            pass
+        self.assertEqual(2, self.engine.query.call_count)
+
+        self.engine.query.reset_mock()
+        ret_val = self.nc_resolver.resolve_all('_btc._wallet.testdomain.bit', ['TXT', 'CNAME'])
+
+        self.assertNotIsInstance(ret_val['TXT'], NXDomainException)
+        self.assertEqual(4, self.engine.query.call_count)
+
+    def test_nodata_is_not_nxdomain(self):
+
+        self.engine.query.return_value = (0, Mock(secure=1, bogus=0, havedata=0, rcode=0))
+
+        try:
+            self.nc_resolver.resolve('_btc._wallet.testdomain.bit', 'TXT')
+            self.assertTrue(False)
+        except NXDomainException:
+            raise
+        except EmptyResultException:
+            pass
+
+    def test_resolve_all_nxdomain(self):
+
+        self.engine.query.return_value = (0, Mock(secure=1, bogus=0, havedata=0, proven=1, rcode=3))
+
+        ret_val = self.nc_resolver.resolve_all('_btc._wallet.testdomain.bit', ['TXT', 'CNAME'])
+
+        self.assertIsInstance(ret_val['TXT'], NXDomainException)
+        self.assertIsInstance(ret_val['CNAME'], NXDomainException)
+        self.assertEqual(2, self.engine.query.call_count)
+
+    def test_deadline_bounds_queries(self):
+
+        self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT', deadline=2.0)
+
+        self.assertTrue(0 < self.engine.query.call_args[0][5] <= 2.0)
+        self.assertTrue(0 < self.engine.resolve_addresses.call_args[0][1] <= 2.0)
+
+    def test_unknown_engine(self):
+
+        self.assertRaises(ValueError, NamecoinResolver, engine='bind')
+
+class TestSharedCache(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.patcher2 = patch('bcresolver.ub_ctx')
+
+        self.mockNamecoinClient = self.patcher1.start()
+        self.mockUnboundContext = self.patcher2.start()
+
+        self.get_domain = self.mockNamecoinClient.return_value.get_domain
+        self.get_domain.return_value = {'value': json.dumps({'ip': '10.0.0.1'})}
+
+        self.shared = SharedMemoryCache(size=256 * 1024)
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.patcher2.stop()
+        self.shared.close()
+
+    def test_go_right(self):
+
+        first = NamecoinResolver(native_records=True, shared_cache=self.shared)
+        second = NamecoinResolver(native_records=True, shared_cache=self.shared)
+
+        self.assertEqual('10.0.0.1', first.resolve('testdomain.bit', 'A'))
+        self.assertEqual('10.0.0.1', second.resolve('testdomain.bit', 'A'))
+        self.assertEqual(1, self.get_domain.call_count)
+
+class TestNameserverAddresses(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.NamecoinClient')
+        self.patcher2 = patch('bcresolver.ub_ctx')
+        self.patcher3 = patch('bcresolver.NamecoinResolver._build_temp_unbound_config')
+        self.patcher4 = patch('bcresolver.NamecoinResolver._delete_temp_unbound_config')
+
+        self.mockNamecoinClient = self.patcher1.start()
+        self.mockUnboundContext = self.patcher2.start()
+        self.mockBuildUnboundConfig = self.patcher3.start()
+        self.mockDeleteUnboundConfig = self.patcher4.start()
+
+        self.value = {
+            'ds': [[40039, 8, 2, 'NZbut7iqVxCP0IGCX7J1DA/DrbrkFJzEML1PetAxVzQ=']],
+            'ns': ['pdns83.ultradns.org']
+        }
+        self.mockNamecoinClient.return_value.get_domain.side_effect = lambda name: {'value': json.dumps(self.value)}
+
+        self.ns_ctx = Mock()
+        self.wallet_ctx = Mock()
+        self.mockUnboundContext.side_effect = [self.ns_ctx] + [self.wallet_ctx] * 4
+
+        self.addresses = {RDATATYPE['A']: ['192.0.2.1'], RDATATYPE['AAAA']: ['2001:db8::1']}
+        def ns_resolve(name, rrtype, rrclass):
+            result = Mock(secure=0, bogus=0, havedata=1, ttl=300)
+            result.data.as_address_list.return_value = self.addresses[rrtype]
+            return 0, result
+        self.ns_ctx.resolve.side_effect = ns_resolve
+
+        self.result_obj = Mock(secure=1, bogus=0, havedata=1, ttl=300)
+        self.result_obj.data.as_domain_list.return_value = ['btc']
+        self.result_obj.data.as_address_list.return_value = ['10.0.0.1']
+        self.wallet_ctx.resolve.return_value = (0, self.result_obj)
+
+        self.nc_resolver = NamecoinResolver()
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.patcher2.stop()
+        self.patcher3.stop()
+        self.patcher4.stop()
+
+    def test_go_right(self):
+
+        self.assertEqual('btc', self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT'))
+
+        self.assertEqual([RDATATYPE['A'], RDATATYPE['AAAA']], [c[0][1] for c in self.ns_ctx.resolve.call_args_list])
+        self.assertEqual(('192.0.2.1', '2001:db8::1'), self.nc_resolver.ns_address_cache.get('pdns83.ultradns.org'))
+        self.assertEqual('192.0.2.1', self.mockBuildUnboundConfig.call_args[0][1])
+
+    def test_addresses_cached(self):
+
+        self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT')
+        self.nc_resolver.resolve('www.testdomain.bit', 'A')
+
+        self.assertEqual(2, self.ns_ctx.resolve.call_count)
+        self.assertEqual(2, self.wallet_ctx.resolve.call_count)
+
+    def test_ipv6_only_nameserver(self):
+
+        self.addresses[RDATATYPE['A']] = []
+
+        self.assertEqual('btc', self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT'))
+        self.assertEqual('2001:db8::1', self.mockBuildUnboundConfig.call_args[0][1])
+
+    def test_unreachable_address_tries_next(self):
+
+        self.addresses[RDATATYPE['A']] = ['192.0.2.1', '192.0.2.2']
+        self.wallet_ctx.resolve.side_effect = ((-1, None), (0, self.result_obj))
+
+        self.assertEqual('btc', self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT'))
+        self.assertEqual(['192.0.2.1', '192.0.2.2'], [c[0][1] for c in self.mockBuildUnboundConfig.call_args_list])
+
+    def test_answering_address_not_retried(self):
+
+        self.value['ns'] = ['pdns83.ultradns.org', 'pdns83.ultradns.com']
+        bogus_obj = Mock(secure=1, bogus=1, havedata=1)
+        self.wallet_ctx.resolve.side_effect = ((0, bogus_obj), (0, self.result_obj))
+
+        self.assertEqual('btc', self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT'))
+
+        # The bogus answer moves on to the next nameserver, not to the first nameserver's IPv6 address
+        self.assertEqual(['192.0.2.1', '192.0.2.1'], [c[0][1] for c in self.mockBuildUnboundConfig.call_args_list])
+
+    def test_ip_literal_nameservers(self):
+
+        self.value['ns'] = ['2001:db8::53', '192.0.2.53']
+
+        self.assertEqual('btc', self.nc_resolver.resolve('_wallet.wallet.testdomain.bit', 'TXT'))
+        self.assertFalse(self.ns_ctx.resolve.called)
+        self.assertEqual('2001:db8::53', self.mockBuildUnboundConfig.call_args[0][1])
+
+    def test_resolve_all_unreachable_address_tries_next(self):
+
+        replies = [{'TXT': (-1, None)}, {'TXT': (0, self.result_obj)}]
+        self.nc_resolver._query_nameserver = Mock(side_effect=lambda *args, **kwargs: replies.pop(0))
+
+        self.assertEqual({'TXT': 'btc'}, self.nc_resolver.resolve_all('_wallet.wallet.testdomain.bit', ['TXT']))
+        self.assertEqual(['192.0.2.1', '2001:db8::1'], [c[0][1] for c in self.nc_resolver._query_nameserver.call_args_list])
+
+    def test_is_ip_address(self):
+
+        self.assertTrue(is_ip_address('192.0.2.1'))
+        self.assertTrue(is_ip_address('2001:db8::1'))
+        self.assertFalse(is_ip_address('pdns83.ultradns.org'))
+        self.assertFalse(is_ip_address('192.0.2'))
@@ -0,0 +1,224 @@
+__author__ = 'mdavid'
+
+from mock import *
+from unittest import TestCase
+from bcresolver.bloom import BloomFilter, NameIndex
+from bcresolver.namecoin import NamecoinException
+
+class TestBloomFilter(TestCase):
+
+    def test_go_right(self):
+
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add('name%d' % i)
+
+        # Names whose bits were all set already (about one in a hundred) are not counted
+        self.assertAlmostEqual(1000, len(bloom), delta=20)
+        self.assertTrue(all(['name%d' % i in bloom for i in range(1000)]))
+
+    def test_false_positive_rate(self):
+
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add('name%d' % i)
+
+        false_positives = len([i for i in range(10000) if 'other%d' % i in bloom])
+        self.assertLess(false_positives, 300)
+        self.assertAlmostEqual(0.01, bloom.false_positive_rate(), delta=0.002)
+
+    def test_sizing(self):
+
+        bloom = BloomFilter(1000000, 0.001)
+
+        self.assertEqual(10, bloom.hashes)
+        self.assertLess(bloom.memory_bytes(), 2 * 1024 * 1024)
+        self.assertEqual(0.0, bloom.false_positive_rate())
+
+    def test_add_again(self):
+
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(100):
+            bloom.add('name%d' % i)
+        false_positive_rate = bloom.false_positive_rate()
+
+        for i in range(100):
+            bloom.add('name%d' % i)
+
+        self.assertEqual(100, len(bloom))
+        self.assertEqual(false_positive_rate, bloom.false_positive_rate())
+
+    def test_unicode(self):
+
+        bloom = BloomFilter(10)
+        bloom.add(u'caf\xe9')
+
+        self.assertIn(u'caf\xe9', bloom)
+        self.assertIn(u'caf\xe9'.encode('utf-8'), bloom)
+
+class TestNameIndex(TestCase):
+
+    def setUp(self):
+
+        self.mockClient = Mock()
+        self.mockClient.get_block_count.return_value = 100
+        self.block_hashes = {}
+        self.mockClient.get_block_hash.side_effect = lambda height: self.block_hashes.get(height, 'hash%d' % height)
+
+        names = [{'name': 'd/name%03d' % i} for i in range(25)] + [{'name': 'id/someone'}]
+        def name_scan(start, count):
+            offset = 0 if not start else [x['name'] for x in names].index(start)
+            return names[offset:offset + count]
+        self.mockClient.name_scan.side_effect = name_scan
+
+        self.index = NameIndex(client=self.mockClient, capacity=100, scan_batch=10)
+
+    def test_not_ready(self):
+
+        self.assertFalse(self.index.ready)
+        self.assertTrue(self.index.might_exist('anything'))
+        self.assertEqual(0, self.index.report()['names'])
+
+    def test_build(self):
+
+        self.index.build()
+
+        self.assertTrue(self.index.ready)
+        self.assertEqual(100, self.index.height)
+        self.assertEqual(25, len(self.index.filter))
+        self.assertTrue(all([self.index.might_exist('name%03d' % i) for i in range(25)]))
+        self.assertFalse(self.index.might_exist('someone'))
+        self.assertFalse(self.index.might_exist('neverregistered'))
+
+    def test_build_sized_for_growth(self):
+
+        self.index.capacity = 10
+        self.index.build()
+
+        self.assertEqual(50, self.index.filter.capacity)
+
+    def test_update(self):
+
+        self.index.build()
+        self.mockClient.get_block_count.return_value = 102
+        self.mockClient.get_block.side_effect = lambda block_hash, verbosity: {
+            'hash101': {'tx': [{'vout': [{'scriptPubKey': {'nameOp': {'op': 'name_firstupdate', 'name': 'd/fresh'}}}, {'scriptPubKey': {}}]}]},
+            'hash102': {'tx': ['txid1']}
+        }[block_hash]
+        self.mockClient.get_raw_transaction.return_value = {'vout': [{'scriptPubKey': {'nameOp': {'op': 'name_update', 'name': 'd/older'}}}]}
+
+        self.index.update()
+
+        self.assertEqual(102, self.index.height)
+        self.assertTrue(self.index.might_exist('fresh'))
+        self.assertTrue(self.index.might_exist('older'))
+        self.mockClient.get_raw_transaction.assert_called_once_with('txid1')
+        self.assertEqual(2, self.index.stats['blocks'])
+
+    def test_update_after_reorg(self):
+
+        self.index.build()
+        self.mockClient.get_block_count.return_value = 102
+        self.mockClient.get_block.return_value = {'tx': []}
+        self.index.update()
+
+        # Block 102 is replaced by a block registering d/replacement, and block 103 follows it
+        self.block_hashes[102] = 'hash102b'
+        self.mockClient.get_block_count.return_value = 103
+        self.mockClient.get_block.side_effect = lambda block_hash, verbosity: {
+            'hash102b': {'tx': [{'vout': [{'scriptPubKey': {'nameOp': {'op': 'name_firstupdate', 'name': 'd/replacement'}}}]}]},
+            'hash103': {'tx': []}
+        }[block_hash]
+
+        self.index.update()
+
+        self.assertEqual(103, self.index.height)
+        self.assertTrue(self.index.might_exist('replacement'))
+        self.assertEqual(['hash102b', 'hash103'], [c[0][0] for c in self.mockClient.get_block.call_args_list[-2:]])
+        self.assertEqual(1, self.index.stats['reorgs'])
+        self.assertEqual(1, self.index.stats['builds'])
+
+    def test_update_after_shorter_chain(self):
+
+        self.index.build()
+        self.mockClient.get_block_count.return_value = 102
+        self.mockClient.get_block.return_value = {'tx': []}
+        self.index.update()
+
+        self.block_hashes[102] = 'hash102b'
+        self.mockClient.get_block_count.return_value = 101
+
+        self.index.update()
+
+        self.assertEqual(101, self.index.height)
+        self.assertEqual({100: 'hash100', 101: 'hash101'}, self.index._hashes)
+        self.assertEqual(1, self.index.stats['reorgs'])
+
+    def test_update_after_deep_reorg(self):
+
+        self.index.reorg_depth = 2
+        self.index.build()
+        self.mockClient.get_block_count.return_value = 103
+        self.mockClient.get_block.return_value = {'tx': []}
+        self.index.update()
+        self.assertEqual([102, 103], sorted(self.index._hashes))
+
+        self.block_hashes.update({102: 'hash102b', 103: 'hash103b'})
+        self.index.update()
+
+        self.assertEqual(2, self.index.stats['builds'])
+        self.assertEqual(1, self.index.stats['reorgs'])
+        self.assertEqual({103: 'hash103b'}, self.index._hashes)
+
+    def test_update_builds_first(self):
+
+        self.index.update()
+
+        self.assertTrue(self.index.ready)
+        self.assertEqual(0, self.mockClient.get_block.call_count)
+
+    def test_update_rebuilds_when_full(self):
+
+        self.index.build()
+        for i in range(100):
+            self.index.filter.add('extra%d' % i)
+
+        self.index.update()
+
+        self.assertEqual(2, self.index.stats['builds'])
+        self.assertEqual(25, len(self.index.filter))
+
+    def test_report(self):
+
+        self.index.build()
+        self.index.might_exist('name001')
+        self.index.might_exist('neverregistered')
+
+        report = self.index.report()
+
+        self.assertEqual(25, report['names'])
+        self.assertEqual(100, report['capacity'])
+        self.assertEqual(self.index.filter.memory_bytes(), report['memory_bytes'])
+        self.assertLess(report['false_positive_rate'], 0.001)
+        self.assertEqual(2, report['checks'])
+        self.assertEqual(1, report['rejected'])
+
+    def test_background_update(self):
+
+        self.index.poll_interval = 0.01
+        calls = []
+        def get_block_count():
+            calls.append(1)
+            if len(calls) == 1:
+                raise NamecoinException('Unable to connect to Namecoin node', 500)
+            return 100
+        self.mockClient.get_block_count.side_effect = get_block_count
+
+        self.index.start()
+        for _ in range(100):
+            if self.index.ready:
+                break
+            self.index._stop.wait(0.01)
+        self.index.stop()
+
+        self.assertTrue(self.index.ready)
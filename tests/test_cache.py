@@ -0,0 +1,222 @@
+__author__ = 'mdavid'
+
+import time
+from mock import *
+from unittest import TestCase
+from bcresolver.cache import TTLCache, sizeof
+
+class TestTTLCache(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.cache.time')
+        self.mockTime = self.patcher1.start()
+        self.mockTime.time.return_value = 1000.0
+
+        self.cache = TTLCache(ttl=60, max_entries=2)
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+
+    def test_go_right(self):
+
+        self.cache.set('key', 'value')
+        self.assertEqual('value', self.cache.get('key'))
+        self.assertTrue('key' in self.cache)
+        self.assertEqual(1, len(self.cache))
+
+    def test_missing_key(self):
+
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual('default', self.cache.get('key', 'default'))
+
+    def test_expired(self):
+
+        self.cache.set('key', 'value')
+        self.mockTime.time.return_value = 1060.0
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_entry_ttl(self):
+
+        self.cache.set('key', 'value', ttl=10)
+        self.mockTime.time.return_value = 1009.0
+        self.assertEqual('value', self.cache.get('key'))
+        self.mockTime.time.return_value = 1010.0
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_zero_ttl_not_stored(self):
+
+        self.cache.set('key', 'value', ttl=0)
+        self.assertEqual(0, len(self.cache))
+
+    def test_lru_eviction(self):
+
+        self.cache.set('key1', 'value1')
+        self.cache.set('key2', 'value2')
+        self.cache.get('key1')
+        self.cache.set('key3', 'value3')
+
+        self.assertEqual('value1', self.cache.get('key1'))
+        self.assertIsNone(self.cache.get('key2'))
+        self.assertEqual('value3', self.cache.get('key3'))
+
+    def test_delete(self):
+
+        self.cache.set('key', 'value')
+        self.cache.delete('key')
+        self.cache.delete('missing')
+        self.assertIsNone(self.cache.get('key'))
+
+class TestTTLCachePinning(TestCase):
+
+    def setUp(self):
+
+        self.cache = TTLCache(ttl=60, max_entries=2)
+
+    def test_pinned_not_evicted(self):
+
+        self.cache.pin(['key1'])
+        self.cache.set('key1', 'value1')
+        self.cache.set('key2', 'value2')
+        self.cache.set('key3', 'value3')
+
+        self.assertEqual('value1', self.cache.get('key1'))
+        self.assertIsNone(self.cache.get('key2'))
+
+    def test_only_pinned_left(self):
+
+        self.cache.pin(['key1', 'key2'])
+        self.cache.set('key1', 'value1')
+        self.cache.set('key2', 'value2')
+        self.cache.set('key3', 'value3')
+
+        # Entries that are not pinned go first, even the most recently used one
+        self.assertEqual(2, len(self.cache))
+        self.assertIsNone(self.cache.get('key3'))
+        self.assertEqual('value1', self.cache.get('key1'))
+
+        self.cache.pin(['key1', 'key2', 'key3'])
+        self.cache.set('key3', 'value3')
+        self.assertIsNone(self.cache.get('key2'))
+
+    def test_pin_replaced(self):
+
+        self.cache.pin(['key1'])
+        self.cache.pin(['key2'])
+        self.cache.set('key1', 'value1')
+        self.cache.set('key2', 'value2')
+        self.cache.set('key3', 'value3')
+
+        self.assertIsNone(self.cache.get('key1'))
+        self.assertEqual('value2', self.cache.get('key2'))
+
+    def test_pinned_entries_expire(self):
+
+        self.cache.pin(['key1'])
+        self.cache.set('key1', 'value1', ttl=0.01)
+        time.sleep(0.02)
+
+        self.assertIsNone(self.cache.get('key1'))
+
+class TestTTLCacheByteBudget(TestCase):
+
+    def setUp(self):
+
+        self.cache = TTLCache(ttl=60, max_entries=1000, max_bytes=sizeof('key0') + sizeof('x' * 100) + 10)
+
+    def test_go_right(self):
+
+        self.cache.set('key0', 'x' * 100)
+
+        self.assertEqual('x' * 100, self.cache.get('key0'))
+        self.assertEqual(sizeof('key0') + sizeof('x' * 100), self.cache.bytes)
+
+    def test_evicts_to_budget(self):
+
+        self.cache.set('key0', 'x' * 50)
+        self.cache.set('key1', 'x' * 50)
+        self.cache.set('key2', 'x' * 50)
+
+        self.assertIsNone(self.cache.get('key0'))
+        self.assertEqual('x' * 50, self.cache.get('key2'))
+        self.assertTrue(self.cache.bytes <= self.cache.max_bytes)
+
+    def test_oversized_entry_not_stored(self):
+
+        self.cache.set('key0', 'x' * 50)
+        self.cache.set('key1', 'x' * 500)
+
+        self.assertIsNone(self.cache.get('key1'))
+        self.assertEqual('x' * 50, self.cache.get('key0'))
+
+    def test_replace_and_delete_accounting(self):
+
+        self.cache.set('key0', 'x' * 50)
+        self.cache.set('key0', 'x' * 60)
+        self.assertEqual(sizeof('key0') + sizeof('x' * 60), self.cache.bytes)
+
+        self.cache.delete('key0')
+        self.assertEqual(0, self.cache.bytes)
+
+class TestSizeof(TestCase):
+
+    def test_containers(self):
+
+        self.assertTrue(sizeof(['abc', 'def']) > sizeof([]) + sizeof('abc'))
+        self.assertTrue(sizeof({'abc': ('def',)}) > sizeof({}) + sizeof('abc') + sizeof('def'))
+
+    def test_slots(self):
+
+        class Slotted(object):
+            __slots__ = ('value',)
+
+        obj = Slotted()
+        obj.value = 'x' * 100
+        self.assertTrue(sizeof(obj) >= sizeof('x' * 100))
+
+class TestTTLCacheStale(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.cache.time')
+        self.mockTime = self.patcher1.start()
+        self.mockTime.time.return_value = 1000.0
+
+        self.cache = TTLCache(ttl=60, max_entries=10, stale_ttl=100)
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+
+    def test_go_right(self):
+
+        self.cache.set('key', 'value')
+        self.mockTime.time.return_value = 1100.0
+
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual('value', self.cache.get_stale('key'))
+        self.assertEqual(1, len(self.cache))
+
+    def test_fresh_value(self):
+
+        self.cache.set('key', 'value')
+        self.assertEqual('value', self.cache.get_stale('key'))
+
+    def test_past_grace_period(self):
+
+        self.cache.set('key', 'value')
+        self.mockTime.time.return_value = 1160.0
+
+        self.assertIsNone(self.cache.get_stale('key'))
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(0, self.cache.bytes)
+
+    def test_no_grace_period(self):
+
+        cache = TTLCache(ttl=60, max_entries=10)
+        cache.set('key', 'value')
+        self.mockTime.time.return_value = 1060.0
+
+        self.assertIsNone(cache.get('key'))
+        self.assertIsNone(cache.get_stale('key'))
@@ -0,0 +1,140 @@
+__author__ = 'mdavid'
+
+import json
+from mock import *
+from StringIO import StringIO
+from unittest import TestCase
+from bcresolver import EmptyResultException
+from bcresolver.cli import parse_line, resolve_one, resolve_stream, main
+
+class TestParseLine(TestCase):
+
+    def test_go_right(self):
+
+        self.assertEqual(('www.mattdavid.bit', 'AAAA'), parse_line('www.mattdavid.bit aaaa\n'))
+
+    def test_default_qtype(self):
+
+        self.assertEqual(('www.mattdavid.bit', 'A'), parse_line('www.mattdavid.bit\n'))
+        self.assertEqual(('www.mattdavid.bit', 'TXT'), parse_line('www.mattdavid.bit', 'TXT'))
+
+    def test_blank_and_comment(self):
+
+        self.assertIsNone(parse_line('\n'))
+        self.assertIsNone(parse_line('# comment\n'))
+
+class TestResolveOne(TestCase):
+
+    def setUp(self):
+
+        self.mockResolver = Mock()
+
+    def test_go_right(self):
+
+        self.mockResolver.resolve_with_ttl.return_value = ('127.0.0.1', 300)
+
+        record = resolve_one(self.mockResolver, 'www.mattdavid.bit', 'A')
+
+        self.assertEqual('www.mattdavid.bit', record['name'])
+        self.assertEqual('A', record['qtype'])
+        self.assertEqual('127.0.0.1', record['value'])
+        self.assertEqual(300, record['ttl'])
+        self.assertIsNone(record['error'])
+        self.assertTrue(record['latency_ms'] >= 0)
+
+    def test_error(self):
+
+        self.mockResolver.resolve_with_ttl.side_effect = EmptyResultException()
+
+        record = resolve_one(self.mockResolver, 'www.mattdavid.bit', 'A')
+
+        self.assertIsNone(record['value'])
+        self.assertEqual('EmptyResultException', record['error'])
+
+    def test_keyboard_interrupt(self):
+
+        self.mockResolver.resolve_with_ttl.side_effect = KeyboardInterrupt()
+        self.assertRaises(KeyboardInterrupt, resolve_one, self.mockResolver, 'www.mattdavid.bit', 'A')
+
+class TestResolveStream(TestCase):
+
+    def test_go_right(self):
+
+        mockResolver = Mock()
+        mockResolver.resolve_with_ttl.side_effect = lambda name, qtype, deadline: ('%s/%s' % (name, qtype), 60)
+
+        queries = [('name%d.bit' % i, 'A') for i in range(50)]
+        results = list(resolve_stream(mockResolver, iter(queries), concurrency=4))
+
+        self.assertEqual(50, len(results))
+        self.assertEqual(sorted(['name%d.bit/A' % i for i in range(50)]), sorted([r['value'] for r in results]))
+
+    def test_lazy_input(self):
+
+        consumed = []
+        def queries():
+            for i in range(100):
+                consumed.append(i)
+                yield ('name%d.bit' % i, 'A')
+
+        mockResolver = Mock()
+        mockResolver.resolve_with_ttl.return_value = ('127.0.0.1', 60)
+
+        stream = resolve_stream(mockResolver, queries(), concurrency=2)
+        stream.next()
+
+        # Bounded queues keep the input from being read ahead in full
+        self.assertTrue(len(consumed) < 100)
+
+    def test_empty_input(self):
+
+        self.assertEqual([], list(resolve_stream(Mock(), iter([]), concurrency=4)))
+
+class TestMain(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.cli.NamecoinResolver')
+        self.mockNamecoinResolver = self.patcher1.start()
+        self.mockNamecoinResolver.return_value.resolve_with_ttl.return_value = ('btc', 300)
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+
+    def test_go_right(self):
+
+        stdin = StringIO('_wallet.wallet.mattdavid.bit TXT\n\n# skipped\nwww.mattdavid.bit\n')
+        stdout = StringIO()
+
+        ret_val = main(['--host', 'namecoin.local', '--port', '4242', '-c', '2', '-t', 'aaaa', '-d', '2.5'], stdin=stdin, stdout=stdout)
+
+        self.assertEqual(0, ret_val)
+        self.assertEqual('namecoin.local', self.mockNamecoinResolver.call_args[1]['host'])
+        self.assertEqual(4242, self.mockNamecoinResolver.call_args[1]['port'])
+        self.assertIsNone(self.mockNamecoinResolver.call_args[1]['shared_cache'])
+        self.assertEqual(2.5, self.mockNamecoinResolver.return_value.resolve_with_ttl.call_args[0][2])
+
+        records = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(2, len(records))
+        self.assertEqual(set([('_wallet.wallet.mattdavid.bit', 'TXT'), ('www.mattdavid.bit', 'AAAA')]), set([(r['name'], r['qtype']) for r in records]))
+        self.assertEqual(['btc', 'btc'], [r['value'] for r in records])
+
+    def test_memcached(self):
+
+        main(['--memcached', '10.0.0.5:11211', '--memcached', '10.0.0.6:11212'], stdin=StringIO(''), stdout=StringIO())
+
+        shared = self.mockNamecoinResolver.call_args[1]['shared_cache']
+        self.assertEqual([('10.0.0.5', 11211), ('10.0.0.6', 11212)], shared.servers)
+
+    def test_top_k(self):
+
+        main(['--top-k', '20'], stdin=StringIO(''), stdout=StringIO())
+
+        heavy_hitters = self.mockNamecoinResolver.call_args[1]['heavy_hitters']
+        heavy_hitters.stop()
+        self.assertEqual(20, heavy_hitters.top)
+        self.assertIsNone(heavy_hitters.dump_path)
+
+        main([], stdin=StringIO(''), stdout=StringIO())
+        self.assertIsNone(self.mockNamecoinResolver.call_args[1]['heavy_hitters'])
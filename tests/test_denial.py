@@ -0,0 +1,271 @@
+__author__ = 'mdavid'
+
+import base64
+import string
+import time
+from unittest import TestCase
+
+import dns.message
+import dns.name
+import dns.rdatatype
+import dns.rrset
+
+from bcresolver.denial import DenialCache, covers, nsec3_hash, prove_denial, prove_wildcard, type_in_bitmap, RCODE_NOERROR, RCODE_NXDOMAIN
+
+ZONE = dns.name.from_text('testdomain.bit.')
+DS_TA = 'testdomain.bit. IN DS 12345 8 2 AB'
+BASE32_TO_BASE32HEX = string.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', '0123456789ABCDEFGHIJKLMNOPQRSTUV')
+
+def rrsig(covered, expiration='20301231000000'):
+    return '%s 8 2 3600 %s 20200101000000 12345 testdomain.bit. c2lnbmF0dXJl' % (covered, expiration)
+
+def signed(name, rdtype, rdata, ttl=3600):
+    return [dns.rrset.from_text(name, ttl, 'IN', rdtype, rdata), dns.rrset.from_text(name, ttl, 'IN', 'RRSIG', rrsig(rdtype))]
+
+def negative_response(qname, rcode, *rrsets):
+
+    response = dns.message.make_response(dns.message.make_query(qname, 'A', want_dnssec=True))
+    response.set_rcode(rcode)
+    response.authority = signed('testdomain.bit.', 'SOA', 'ns1.testdomain.bit. admin.testdomain.bit. 1 3600 600 86400 300') + list(rrsets)
+    return response
+
+def hashed(name, salt='', iterations=0):
+    return base64.b32encode(nsec3_hash(dns.name.from_text(name), salt, iterations)).translate(BASE32_TO_BASE32HEX)
+
+class TestHelpers(TestCase):
+
+    def test_type_in_bitmap(self):
+
+        windows = dns.rrset.from_text('www.testdomain.bit.', 300, 'IN', 'NSEC', 'testdomain.bit. A RRSIG NSEC TYPE1234')[0].windows
+
+        self.assertTrue(type_in_bitmap(windows, dns.rdatatype.A))
+        self.assertTrue(type_in_bitmap(windows, dns.rdatatype.NSEC))
+        self.assertTrue(type_in_bitmap(windows, 1234))
+        self.assertFalse(type_in_bitmap(windows, dns.rdatatype.AAAA))
+        self.assertFalse(type_in_bitmap(windows, dns.rdatatype.TXT))
+
+    def test_nsec3_hash(self):
+
+        # RFC 5155 Appendix A
+        self.assertEqual('0P9MHAVEQVM6T7VBL5LOP2U3T2RP3TOM', hashed('example.', 'aabbccdd'.decode('hex'), 12))
+
+    def test_covers(self):
+
+        self.assertTrue(covers(1, 5, 3))
+        self.assertFalse(covers(1, 5, 5))
+        self.assertFalse(covers(1, 5, 1))
+        self.assertTrue(covers(5, 1, 7))
+        self.assertTrue(covers(5, 1, 0))
+        self.assertFalse(covers(5, 1, 3))
+
+class TestNSEC(TestCase):
+
+    def setUp(self):
+
+        self.cache = DenialCache()
+        self.apex_nsec = signed('testdomain.bit.', 'NSEC', 'www.testdomain.bit. NS SOA RRSIG NSEC DNSKEY', 300)
+        self.www_nsec = signed('www.testdomain.bit.', 'NSEC', 'testdomain.bit. A RRSIG NSEC', 300)
+
+        self.assertEqual(2, self.cache.add(ZONE, DS_TA, negative_response('missing.testdomain.bit.', RCODE_NXDOMAIN, *(self.apex_nsec + self.www_nsec))))
+
+    def lookup(self, name, rrtype='A', ds_ta=DS_TA):
+        return self.cache.lookup(ZONE, ds_ta, dns.name.from_text(name), dns.rdatatype.from_text(rrtype))
+
+    def test_nxdomain(self):
+
+        rcode, proof = self.lookup('other.testdomain.bit.')
+
+        self.assertEqual(RCODE_NXDOMAIN, rcode)
+        self.assertEqual([dns.rdatatype.SOA, dns.rdatatype.NSEC], [rrset.rdtype for rrset, rrsigs, ttl in proof])
+        self.assertEqual(ZONE, proof[1][0].name)
+        self.assertEqual(dns.rdatatype.NSEC, proof[1][1].covers)
+        self.assertEqual(1, self.cache.stats['nxdomain'])
+
+    def test_nxdomain_wraps(self):
+
+        rcode, proof = self.lookup('zzz.testdomain.bit.')
+
+        self.assertEqual(RCODE_NXDOMAIN, rcode)
+        self.assertEqual(['testdomain.bit.', 'www.testdomain.bit.', 'testdomain.bit.'], [rrset.name.to_text() for rrset, rrsigs, ttl in proof])
+
+    def test_nxdomain_below_existing_name(self):
+
+        self.assertEqual(RCODE_NXDOMAIN, self.lookup('a.www.testdomain.bit.')[0])
+
+    def test_nodata(self):
+
+        rcode, proof = self.lookup('www.testdomain.bit.', 'AAAA')
+
+        self.assertEqual(RCODE_NOERROR, rcode)
+        self.assertEqual('www.testdomain.bit.', proof[1][0].name.to_text())
+        self.assertEqual(1, self.cache.stats['nodata'])
+
+    def test_existing_data(self):
+
+        self.assertIsNone(self.lookup('www.testdomain.bit.', 'A'))
+        self.assertIsNone(self.lookup('testdomain.bit.', 'DNSKEY'))
+
+    def test_ttl_capped_by_soa_minimum(self):
+
+        self.assertTrue(all([ttl <= 300 for rrset, rrsigs, ttl in self.lookup('other.testdomain.bit.')[1]]))
+
+        self.cache._zones[(ZONE, DS_TA)].nsec[ZONE] = tuple(self.cache._zones[(ZONE, DS_TA)].nsec[ZONE][:2]) + (time.time() - 1,)
+        self.assertIsNone(self.lookup('other.testdomain.bit.'))
+
+    def test_partial_chain(self):
+
+        self.cache.clear()
+        self.cache.add(ZONE, DS_TA, negative_response('other.testdomain.bit.', RCODE_NXDOMAIN, *self.apex_nsec))
+
+        self.assertEqual(RCODE_NXDOMAIN, self.lookup('other.testdomain.bit.')[0])
+        self.assertIsNone(self.lookup('zzz.testdomain.bit.'))
+
+    def test_wildcard_exists(self):
+
+        self.cache.add(ZONE, DS_TA, negative_response('www.testdomain.bit.', RCODE_NOERROR, *signed('*.testdomain.bit.', 'NSEC', 'www.testdomain.bit. TXT RRSIG NSEC', 300)))
+
+        # The apex NSEC covers the name, but the wildcard could synthesize an answer for it
+        self.assertIsNone(self.lookup('other.testdomain.bit.'))
+
+    def test_delegation(self):
+
+        self.cache.add(ZONE, DS_TA, negative_response('sub.testdomain.bit.', RCODE_NOERROR, *signed('sub.testdomain.bit.', 'NSEC', 'www.testdomain.bit. NS RRSIG NSEC', 300)))
+
+        self.assertIsNone(self.lookup('host.sub.testdomain.bit.'))
+        self.assertIsNone(self.lookup('sub.testdomain.bit.', 'A'))
+        self.assertEqual(RCODE_NOERROR, self.lookup('sub.testdomain.bit.', 'DS')[0])
+
+    def test_other_trust_anchor(self):
+
+        self.assertIsNone(self.lookup('other.testdomain.bit.', ds_ta='testdomain.bit. IN DS 54321 8 2 CD'))
+        self.assertIsNone(self.cache.lookup(dns.name.from_text('otherdomain.bit.'), DS_TA, dns.name.from_text('other.otherdomain.bit.'), dns.rdatatype.A))
+
+    def test_unsigned_records_ignored(self):
+
+        self.cache.clear()
+        self.assertEqual(0, self.cache.add(ZONE, DS_TA, negative_response('other.testdomain.bit.', RCODE_NXDOMAIN, self.apex_nsec[0])))
+        self.assertIsNone(self.lookup('other.testdomain.bit.'))
+
+    def test_max_zones(self):
+
+        self.cache.max_zones = 1
+        other = dns.name.from_text('otherdomain.bit.')
+        response = negative_response('x.otherdomain.bit.', RCODE_NXDOMAIN)
+        response.authority = [rrset for rrset in response.authority]
+        for rrset in response.authority:
+            rrset.name = other
+        self.cache.add(other, DS_TA, response)
+
+        self.assertEqual(1, len(self.cache))
+        self.assertIsNone(self.lookup('other.testdomain.bit.'))
+
+class TestNSEC3(TestCase):
+
+    def setUp(self):
+
+        self.cache = DenialCache()
+        self.apex, self.www = hashed('testdomain.bit.'), hashed('www.testdomain.bit.')
+
+    def nsec3(self, flags=0, iterations=0):
+
+        records = []
+        for owner, next, types in ((self.apex, self.www, 'NS SOA RRSIG DNSKEY NSEC3PARAM'), (self.www, self.apex, 'A RRSIG')):
+            records += signed('%s.testdomain.bit.' % owner.lower(), 'NSEC3', '1 %d %d - %s %s' % (flags, iterations, next, types), 300)
+        return records
+
+    def lookup(self, name, rrtype='A'):
+        return self.cache.lookup(ZONE, DS_TA, dns.name.from_text(name), dns.rdatatype.from_text(rrtype))
+
+    def test_nxdomain(self):
+
+        self.assertEqual(2, self.cache.add(ZONE, DS_TA, negative_response('missing.testdomain.bit.', RCODE_NXDOMAIN, *self.nsec3())))
+
+        rcode, proof = self.lookup('other.testdomain.bit.')
+
+        self.assertEqual(RCODE_NXDOMAIN, rcode)
+        self.assertEqual(dns.rdatatype.SOA, proof[0][0].rdtype)
+        self.assertEqual(self.apex.lower(), proof[1][0].name[0])
+
+    def test_nodata(self):
+
+        self.cache.add(ZONE, DS_TA, negative_response('www.testdomain.bit.', RCODE_NOERROR, *self.nsec3()))
+
+        self.assertEqual(RCODE_NOERROR, self.lookup('www.testdomain.bit.', 'TXT')[0])
+        self.assertIsNone(self.lookup('www.testdomain.bit.', 'A'))
+
+    def test_opt_out(self):
+
+        self.cache.add(ZONE, DS_TA, negative_response('missing.testdomain.bit.', RCODE_NXDOMAIN, *self.nsec3(flags=1)))
+
+        self.assertIsNone(self.lookup('other.testdomain.bit.'))
+
+    def test_too_many_iterations(self):
+
+        self.assertEqual(0, self.cache.add(ZONE, DS_TA, negative_response('missing.testdomain.bit.', RCODE_NXDOMAIN, *self.nsec3(iterations=500))))
+
+    def test_parameters_changed(self):
+
+        self.cache.add(ZONE, DS_TA, negative_response('missing.testdomain.bit.', RCODE_NXDOMAIN, *self.nsec3()))
+        self.cache.add(ZONE, DS_TA, negative_response('missing.testdomain.bit.', RCODE_NXDOMAIN, *signed('%s.testdomain.bit.' % self.apex.lower(), 'NSEC3', '1 0 5 - %s A' % self.www)))
+
+        denials = self.cache._zones[(ZONE, DS_TA)]
+        self.assertEqual(('', 5), denials.params)
+        self.assertEqual(1, len(denials.nsec3))
+
+class TestProofs(TestCase):
+
+    def wildcard_response(self, *rrsets):
+
+        response = dns.message.make_response(dns.message.make_query('other.testdomain.bit.', 'A', want_dnssec=True))
+        response.answer = signed('other.testdomain.bit.', 'A', '10.0.0.2')
+        response.authority = list(rrsets)
+        return response
+
+    def test_prove_denial(self):
+
+        response = negative_response('missing.testdomain.bit.', RCODE_NXDOMAIN, *signed('testdomain.bit.', 'NSEC', 'www.testdomain.bit. NS SOA RRSIG NSEC DNSKEY'))
+
+        self.assertEqual(RCODE_NXDOMAIN, prove_denial(ZONE, response, dns.name.from_text('missing.testdomain.bit.'), dns.rdatatype.A))
+        self.assertEqual(RCODE_NOERROR, prove_denial(ZONE, response, ZONE, dns.rdatatype.A))
+        self.assertIsNone(prove_denial(ZONE, response, dns.name.from_text('zzz.testdomain.bit.'), dns.rdatatype.A))
+
+    def test_prove_denial_without_soa(self):
+
+        response = negative_response('missing.testdomain.bit.', RCODE_NXDOMAIN)
+        response.authority = signed('testdomain.bit.', 'NSEC', 'www.testdomain.bit. NS SOA RRSIG NSEC DNSKEY')
+
+        self.assertIsNone(prove_denial(ZONE, response, dns.name.from_text('missing.testdomain.bit.'), dns.rdatatype.A))
+
+    def test_prove_wildcard_nsec(self):
+
+        response = self.wildcard_response(*signed('*.testdomain.bit.', 'NSEC', 'www.testdomain.bit. A RRSIG NSEC'))
+
+        self.assertTrue(prove_wildcard(ZONE, response, dns.name.from_text('other.testdomain.bit.'), ZONE))
+        self.assertTrue(prove_wildcard(ZONE, response, dns.name.from_text('sub.other.testdomain.bit.'), ZONE))
+        self.assertFalse(prove_wildcard(ZONE, response, dns.name.from_text('zzz.testdomain.bit.'), ZONE))
+
+        # The record proves other.testdomain.bit absent, so no wildcard below it was used
+        self.assertFalse(prove_wildcard(ZONE, response, dns.name.from_text('sub.other.testdomain.bit.'), dns.name.from_text('other.testdomain.bit.')))
+
+    def test_prove_wildcard_nsec_at_name(self):
+
+        response = self.wildcard_response(*signed('other.testdomain.bit.', 'NSEC', 'www.testdomain.bit. TXT RRSIG NSEC'))
+
+        self.assertFalse(prove_wildcard(ZONE, response, dns.name.from_text('other.testdomain.bit.'), ZONE))
+
+    def test_prove_wildcard_nsec3(self):
+
+        apex, www = hashed('testdomain.bit.'), hashed('www.testdomain.bit.')
+        records = []
+        for owner, next in ((apex, www), (www, apex)):
+            records += signed('%s.testdomain.bit.' % owner.lower(), 'NSEC3', '1 1 0 - %s A RRSIG' % next, 300)
+        response = self.wildcard_response(*records)
+
+        # The next closer name is other.testdomain.bit in both cases; Opt-Out records still prove it absent
+        self.assertTrue(prove_wildcard(ZONE, response, dns.name.from_text('other.testdomain.bit.'), ZONE))
+        self.assertTrue(prove_wildcard(ZONE, response, dns.name.from_text('sub.other.testdomain.bit.'), ZONE))
+        self.assertFalse(prove_wildcard(ZONE, response, dns.name.from_text('www.testdomain.bit.'), ZONE))
+
+    def test_prove_wildcard_without_records(self):
+
+        self.assertFalse(prove_wildcard(ZONE, self.wildcard_response(), dns.name.from_text('other.testdomain.bit.'), ZONE))
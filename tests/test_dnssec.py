@@ -0,0 +1,458 @@
+__author__ = 'mdavid'
+
+import socket
+import struct
+import threading
+import time
+from mock import *
+from unittest import TestCase, skipUnless
+
+import dns.dnssec
+import dns.flags
+import dns.message
+import dns.name
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+import dns.rdtypes.ANY.DNSKEY
+import dns.rdtypes.ANY.RRSIG
+import dns.rrset
+
+from bcresolver.dnssec import DnspythonEngine, ds_digest
+
+try:
+    from Crypto.Hash import SHA256
+    from Crypto.PublicKey import RSA
+    from Crypto.Signature import pkcs1_15
+    from Crypto.Util import number
+except ImportError:
+    RSA = None
+
+ZONE = dns.name.from_text('testdomain.bit.')
+DNSKEY = dns.rdata.from_text(dns.rdataclass.IN, dns.rdatatype.DNSKEY, '257 3 8 AwEAAcBMmWlC4b9wp6t5fFuN7SV2Du7VMmJyZ6sUgVaXYoIs0HFO8yKt')
+DS_TA = 'testdomain.bit. IN DS %d 8 2 %s' % (dns.dnssec.key_id(DNSKEY), ds_digest(ZONE, DNSKEY, 2).encode('hex'))
+
+def rrsig(covered, labels=2, expiration='20301231000000'):
+    return '%s 8 %d 3600 %s 20200101000000 12345 testdomain.bit. c2lnbmF0dXJl' % (covered, labels, expiration)
+
+def rsa_dnskey(key):
+    exponent = number.long_to_bytes(key.e)
+    return dns.rdtypes.ANY.DNSKEY.DNSKEY(dns.rdataclass.IN, dns.rdatatype.DNSKEY, 257, 3, 8, chr(len(exponent)) + exponent + number.long_to_bytes(key.n))
+
+def rsa_rrsig(rrset, key, dnskey, labels=None):
+
+    # Signed data of RFC 4034 section 3.1.8.1 (RSA/SHA-256). An rrset synthesized from a wildcard is signed as the wildcard
+    labels = len(rrset.name) - 1 if labels is None else labels
+    owner = rrset.name if labels == len(rrset.name) - 1 else dns.name.Name(('*',) + rrset.name.labels[-(labels + 1):])
+    inception = int(time.time()) - 3600
+    expiration = int(time.time()) + 86400
+    data = struct.pack('!HBBIIIH', rrset.rdtype, 8, labels, rrset.ttl, expiration, inception, dns.dnssec.key_id(dnskey))
+    data += ZONE.to_digestable()
+    for rdata in sorted(rrset):
+        rdata_wire = rdata.to_digestable()
+        data += owner.to_digestable() + struct.pack('!HHIH', rrset.rdtype, rrset.rdclass, rrset.ttl, len(rdata_wire)) + rdata_wire
+
+    signature = pkcs1_15.new(key).sign(SHA256.new(data))
+    return dns.rrset.from_rdata(rrset.name, rrset.ttl, dns.rdtypes.ANY.RRSIG.RRSIG(dns.rdataclass.IN, dns.rdatatype.RRSIG, rrset.rdtype, 8, labels, rrset.ttl, expiration, inception, dns.dnssec.key_id(dnskey), ZONE, signature))
+
+class StandInNameserver:
+
+    def __init__(self):
+
+        # The UDP port picked by the OS may already be taken for TCP
+        for _ in range(20):
+            self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp.bind(('127.0.0.1', 0))
+            self.port = self.udp.getsockname()[1]
+
+            self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                self.tcp.bind(('127.0.0.1', self.port))
+                break
+            except socket.error:
+                self.udp.close()
+                self.tcp.close()
+        self.tcp.listen(5)
+
+        self.queries = []
+        self.tcp_connections = 0
+        self.truncate = False
+        self.signed = True
+        self.wildcard = False
+        self.denial = []
+        self.key = None
+        self.dnskey = DNSKEY
+
+        for target in (self.serve_udp, self.serve_tcp):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def respond(self, wire, over_tcp):
+
+        query = dns.message.from_wire(wire)
+        question = query.question[0]
+        self.queries.append((question.name.to_text(), dns.rdatatype.to_text(question.rdtype), over_tcp))
+
+        response = dns.message.make_response(query)
+        if self.truncate and not over_tcp:
+            response.flags |= dns.flags.TC
+            return response.to_wire()
+
+        if question.rdtype == dns.rdatatype.DNSKEY:
+            response.answer.append(dns.rrset.from_rdata(ZONE, 3600, self.dnskey))
+            response.answer.append(self.sign(response.answer[0]))
+        elif question.rdtype == dns.rdatatype.A and question.name.to_text() == 'www.testdomain.bit.':
+            response.answer.append(dns.rrset.from_text(question.name, 300, 'IN', 'A', '10.0.0.1'))
+            if self.signed:
+                response.answer.append(self.sign(response.answer[0]))
+        elif question.rdtype == dns.rdatatype.A and self.wildcard:
+            # Synthesized from *.testdomain.bit.
+            response.answer.append(dns.rrset.from_text(question.name, 300, 'IN', 'A', '10.0.0.2'))
+            response.answer.append(self.sign(response.answer[0], 2))
+            for rrset in self.denial:
+                response.authority.extend([rrset, self.sign(rrset)])
+        else:
+            response.set_rcode(3)
+            response.authority.append(dns.rrset.from_text(ZONE, 60, 'IN', 'SOA', 'ns1.testdomain.bit. admin.testdomain.bit. 1 3600 600 86400 60'))
+            response.authority.append(self.sign(response.authority[0]))
+            for rrset in self.denial:
+                response.authority.extend([rrset, self.sign(rrset)])
+
+        return response.to_wire()
+
+    def sign(self, rrset, labels=None):
+
+        labels = len(rrset.name) - 1 if labels is None else labels
+        if self.key is None:
+            return dns.rrset.from_text(rrset.name, rrset.ttl, 'IN', 'RRSIG', rrsig(dns.rdatatype.to_text(rrset.rdtype), labels))
+        return rsa_rrsig(rrset, self.key, self.dnskey, labels)
+
+    def serve_udp(self):
+
+        while True:
+            wire, source = self.udp.recvfrom(65535)
+            self.udp.sendto(self.respond(wire, False), source)
+
+    def serve_tcp(self):
+
+        while True:
+            conn, source = self.tcp.accept()
+            self.tcp_connections += 1
+            thread = threading.Thread(target=self.serve_connection, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def serve_connection(self, conn):
+
+        while True:
+            header = conn.recv(2)
+            if len(header) < 2:
+                conn.close()
+                return
+            wire = conn.recv(struct.unpack('!H', header)[0])
+            response = self.respond(wire, True)
+            conn.sendall(struct.pack('!H', len(response)) + response)
+
+class TestDnspythonEngine(TestCase):
+
+    def setUp(self):
+
+        self.nameserver = StandInNameserver()
+
+        self.patcher1 = patch('bcresolver.dnssec.validate')
+        self.mockValidate = self.patcher1.start()
+
+        self.engine = DnspythonEngine(timeout=2.0, port=self.nameserver.port)
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.engine.close()
+
+    def query(self, name='www.testdomain.bit', rrtype=dns.rdatatype.A):
+
+        return self.engine.query('testdomain.bit.', '127.0.0.1', DS_TA, name, rrtype)
+
+    def test_go_right(self):
+
+        status, result = self.query()
+
+        self.assertEqual(0, status)
+        self.assertTrue(result.secure)
+        self.assertFalse(result.bogus)
+        self.assertTrue(result.havedata)
+        self.assertEqual(['10.0.0.1'], result.data.as_address_list())
+        self.assertEqual(300, result.ttl)
+        self.assertEqual(dns.message.from_wire(result.packet).answer[0].name.to_text(), 'www.testdomain.bit.')
+
+        # DNSKEY set and answer
+        self.assertEqual(2, self.mockValidate.call_count)
+
+    def test_dnskeys_cached(self):
+
+        self.query()
+        self.query()
+
+        self.assertEqual([('testdomain.bit.', 'DNSKEY', False), ('www.testdomain.bit.', 'A', False), ('www.testdomain.bit.', 'A', False)], self.nameserver.queries)
+
+    def test_dnskey_cache_budget(self):
+
+        self.engine = DnspythonEngine(timeout=2.0, port=self.nameserver.port, dnskey_cache_bytes=4096)
+        self.query()
+
+        self.assertEqual(4096, self.engine.dnskey_cache.max_bytes)
+        self.assertEqual((DNSKEY,), self.engine.dnskey_cache.get((ZONE, DS_TA)))
+        self.assertTrue(self.engine.dnskey_cache.bytes >= len(DNSKEY.key))
+
+    def test_dnskeys_expired(self):
+
+        dnskeys = Mock()
+        self.engine.dnskey_cache.set((ZONE, DS_TA), dnskeys, 0)
+
+        self.query()
+        self.assertEqual(('testdomain.bit.', 'DNSKEY', False), self.nameserver.queries[0])
+
+    def test_prepare(self):
+
+        self.assertTrue(self.engine.prepare('testdomain.bit.', '127.0.0.1', DS_TA))
+        self.query()
+
+        self.assertEqual([('testdomain.bit.', 'DNSKEY', False), ('www.testdomain.bit.', 'A', False)], self.nameserver.queries)
+
+    def test_prepare_ds_mismatch(self):
+
+        other_ds = 'testdomain.bit. IN DS 12345 8 2 %s' % ('AB' * 32)
+        self.assertFalse(self.engine.prepare('testdomain.bit.', '127.0.0.1', other_ds))
+
+    def test_ds_mismatch(self):
+
+        other_ds = 'testdomain.bit. IN DS 12345 8 2 %s' % ('AB' * 32)
+        status, result = self.engine.query('testdomain.bit.', '127.0.0.1', other_ds, 'www.testdomain.bit', dns.rdatatype.A)
+
+        self.assertEqual(0, status)
+        self.assertTrue(result.bogus)
+        self.assertEqual(0, len(self.engine.dnskey_cache))
+
+    def test_failed_validation(self):
+
+        self.mockValidate.side_effect = dns.dnssec.ValidationFailure('verify failure')
+
+        status, result = self.query()
+        self.assertTrue(result.bogus)
+        self.assertFalse(result.secure)
+
+    def test_unsigned_answer(self):
+
+        self.nameserver.signed = False
+
+        status, result = self.query()
+        self.assertTrue(result.bogus)
+
+    def test_nxdomain(self):
+
+        self.nameserver.denial = [dns.rrset.from_text(ZONE, 60, 'IN', 'NSEC', 'www.testdomain.bit. NS SOA RRSIG NSEC DNSKEY')]
+
+        status, result = self.query('missing.testdomain.bit')
+
+        self.assertEqual(0, status)
+        self.assertTrue(result.secure)
+        self.assertTrue(result.proven)
+        self.assertFalse(result.havedata)
+        self.assertEqual(3, result.rcode)
+
+    def test_nxdomain_without_proof(self):
+
+        # A signed SOA alone (for example replayed from an earlier negative response) proves nothing
+        status, result = self.query('missing.testdomain.bit')
+
+        self.assertEqual(0, status)
+        self.assertTrue(result.bogus)
+        self.assertFalse(result.secure)
+        self.assertEqual(0, len(self.engine.denial_cache))
+
+    def test_nxdomain_not_covered(self):
+
+        self.nameserver.denial = [dns.rrset.from_text(ZONE, 60, 'IN', 'NSEC', 'aaa.testdomain.bit. NS SOA RRSIG NSEC DNSKEY')]
+
+        status, result = self.query('missing.testdomain.bit')
+        self.assertTrue(result.bogus)
+
+    def test_nxdomain_for_existing_name(self):
+
+        # An NSEC record at the query name proves NODATA, not NXDOMAIN
+        self.nameserver.denial = [
+            dns.rrset.from_text(ZONE, 60, 'IN', 'NSEC', 'www.testdomain.bit. NS SOA RRSIG NSEC DNSKEY'),
+            dns.rrset.from_text('www.testdomain.bit.', 60, 'IN', 'NSEC', 'testdomain.bit. A RRSIG NSEC')
+        ]
+
+        status, result = self.query('www.testdomain.bit', dns.rdatatype.TXT)
+        self.assertTrue(result.bogus)
+
+    def test_wildcard_answer(self):
+
+        self.nameserver.wildcard = True
+        self.nameserver.denial = [dns.rrset.from_text('*.testdomain.bit.', 60, 'IN', 'NSEC', 'www.testdomain.bit. A RRSIG NSEC')]
+
+        status, result = self.query('other.testdomain.bit')
+
+        self.assertTrue(result.secure)
+        self.assertFalse(result.bogus)
+        self.assertEqual(['10.0.0.2'], result.data.as_address_list())
+
+    def test_wildcard_answer_without_proof(self):
+
+        # A wildcard answer replayed for a name that exists would hide its own records
+        self.nameserver.wildcard = True
+
+        status, result = self.query('other.testdomain.bit')
+
+        self.assertTrue(result.bogus)
+        self.assertFalse(result.secure)
+
+    def test_wildcard_answer_for_existing_name(self):
+
+        self.nameserver.wildcard = True
+        self.nameserver.denial = [dns.rrset.from_text('other.testdomain.bit.', 60, 'IN', 'NSEC', 'www.testdomain.bit. TXT RRSIG NSEC')]
+
+        status, result = self.query('other.testdomain.bit')
+        self.assertTrue(result.bogus)
+
+    def test_wildcard_answer_below_existing_name(self):
+
+        # sub.other.testdomain.bit would be synthesized from *.other.testdomain.bit, not *.testdomain.bit
+        self.nameserver.wildcard = True
+        self.nameserver.denial = [dns.rrset.from_text('other.testdomain.bit.', 60, 'IN', 'NSEC', 'www.testdomain.bit. TXT RRSIG NSEC')]
+
+        status, result = self.query('sub.other.testdomain.bit')
+        self.assertTrue(result.bogus)
+
+    def test_aggressive_nsec(self):
+
+        self.nameserver.denial = [dns.rrset.from_text(ZONE, 60, 'IN', 'NSEC', 'www.testdomain.bit. NS SOA RRSIG NSEC DNSKEY')]
+        self.query('missing.testdomain.bit')
+
+        # Answered from the cached NSEC record, without a query
+        status, result = self.query('other.testdomain.bit', dns.rdatatype.TXT)
+
+        self.assertEqual(0, status)
+        self.assertTrue(result.secure)
+        self.assertFalse(result.havedata)
+        self.assertEqual(3, result.rcode)
+        self.assertEqual([('testdomain.bit.', 'DNSKEY', False), ('missing.testdomain.bit.', 'A', False)], self.nameserver.queries)
+
+        response = dns.message.from_wire(result.packet)
+        self.assertEqual('other.testdomain.bit.', response.question[0].name.to_text())
+        self.assertEqual(3, response.rcode())
+        self.assertEqual([dns.rdatatype.SOA, dns.rdatatype.RRSIG, dns.rdatatype.NSEC, dns.rdatatype.RRSIG], [rrset.rdtype for rrset in response.authority])
+
+        # Names after www are not covered
+        self.query('zzz.testdomain.bit')
+        self.assertEqual(3, len(self.nameserver.queries))
+
+    def test_aggressive_nsec_disabled(self):
+
+        self.engine = DnspythonEngine(timeout=2.0, port=self.nameserver.port, aggressive_nsec=False)
+        self.nameserver.denial = [dns.rrset.from_text(ZONE, 60, 'IN', 'NSEC', 'www.testdomain.bit. NS SOA RRSIG NSEC DNSKEY')]
+        self.query('missing.testdomain.bit')
+        self.query('other.testdomain.bit')
+
+        self.assertEqual(3, len(self.nameserver.queries))
+
+    def test_truncated_response_retried_over_tcp(self):
+
+        self.nameserver.truncate = True
+
+        status, result = self.query()
+        status, result = self.query()
+
+        self.assertEqual(['10.0.0.1'], result.data.as_address_list())
+        self.assertIn(('www.testdomain.bit.', 'A', True), self.nameserver.queries)
+        self.assertEqual(1, self.nameserver.tcp_connections)
+
+    def test_timeout(self):
+
+        silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        silent.bind(('127.0.0.1', 0))
+        engine = DnspythonEngine(timeout=0.1, port=silent.getsockname()[1])
+
+        start = time.time()
+        self.assertEqual((-1, None), engine.query('testdomain.bit.', '127.0.0.1', DS_TA, 'www.testdomain.bit', dns.rdatatype.A))
+        self.assertTrue(time.time() - start < 1.0)
+        silent.close()
+
+@skipUnless(RSA is not None, 'pycryptodome is not installed')
+class TestDnspythonEngineSignatures(TestCase):
+
+    def setUp(self):
+
+        key = RSA.generate(1024)
+        dnskey = rsa_dnskey(key)
+        self.ds_ta = 'testdomain.bit. IN DS %d 8 2 %s' % (dns.dnssec.key_id(dnskey), ds_digest(ZONE, dnskey, 2).encode('hex'))
+
+        self.nameserver = StandInNameserver()
+        self.nameserver.key = key
+        self.nameserver.dnskey = dnskey
+        self.engine = DnspythonEngine(timeout=2.0, port=self.nameserver.port)
+
+    def tearDown(self):
+
+        self.engine.close()
+
+    def query(self, name='www.testdomain.bit', rrtype=dns.rdatatype.A):
+
+        return self.engine.query('testdomain.bit.', '127.0.0.1', self.ds_ta, name, rrtype)
+
+    def test_go_right(self):
+
+        status, result = self.query()
+
+        self.assertTrue(result.secure)
+        self.assertFalse(result.bogus)
+        self.assertEqual(['10.0.0.1'], result.data.as_address_list())
+
+    def test_forged_signature(self):
+
+        self.nameserver.key = RSA.generate(1024)
+
+        status, result = self.query()
+        self.assertTrue(result.bogus)
+
+    def test_nxdomain(self):
+
+        self.nameserver.denial = [dns.rrset.from_text(ZONE, 60, 'IN', 'NSEC', 'www.testdomain.bit. NS SOA RRSIG NSEC DNSKEY')]
+
+        status, result = self.query('missing.testdomain.bit')
+
+        self.assertTrue(result.secure)
+        self.assertTrue(result.proven)
+        self.assertEqual(3, result.rcode)
+
+    def test_wildcard_answer(self):
+
+        self.nameserver.wildcard = True
+        self.nameserver.denial = [dns.rrset.from_text('*.testdomain.bit.', 60, 'IN', 'NSEC', 'www.testdomain.bit. A RRSIG NSEC')]
+
+        status, result = self.query('other.testdomain.bit')
+
+        self.assertTrue(result.secure)
+        self.assertEqual(['10.0.0.2'], result.data.as_address_list())
+
+    def test_replayed_wildcard_answer(self):
+
+        # The wildcard answer and its signature are genuine, but nothing proves the query name does not exist
+        self.nameserver.wildcard = True
+
+        status, result = self.query('other.testdomain.bit')
+
+        self.assertTrue(result.bogus)
+        self.assertFalse(result.secure)
+
+    def test_replayed_soa(self):
+
+        # The SOA and its signature are genuine, but no NSEC record covers the query name
+        status, result = self.query('missing.testdomain.bit')
+
+        self.assertTrue(result.bogus)
+        self.assertFalse(result.secure)
@@ -0,0 +1,161 @@
+__author__ = 'mdavid'
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from mock import *
+from unittest import TestCase
+from bcresolver import NamecoinResolver
+from bcresolver.hotset import HeavyHitters
+from bcresolver.namecoin import NamecoinException
+from bcresolver.replay import StandInNamecoinResolver, StandInEngine
+
+class TestHeavyHitters(TestCase):
+
+    def setUp(self):
+
+        self.engine = StandInEngine()
+        self.engine.query = Mock(wraps=self.engine.query)
+        self.heavy_hitters = HeavyHitters(capacity=10, top=2, refresh_interval=30)
+        self.nc_resolver = NamecoinResolver(nc_name_resolver=StandInNamecoinResolver, engine=self.engine, heavy_hitters=self.heavy_hitters)
+
+        for _ in range(3):
+            self.nc_resolver.resolve('www.mattdavid.bit', 'A')
+        self.nc_resolver.resolve('WWW.mattdavid.bit.', 'A')
+        self.nc_resolver.resolve('mail.mattdavid.bit', 'A')
+        self.nc_resolver.resolve('www.otherdomain.bit', 'A')
+
+    def test_observe(self):
+
+        report = self.heavy_hitters.report()
+
+        self.assertEqual(6, report['total'])
+        self.assertEqual([['mattdavid', 5, 0], ['otherdomain', 1, 0]], report['slds'])
+        self.assertEqual(['www.mattdavid.bit', 'A', 4, 0], report['queries'][0])
+        self.assertEqual(2, len(report['queries']))
+        self.assertEqual(3, len(self.heavy_hitters.report(k=10)['queries']))
+
+    def test_hot(self):
+
+        slds, queries = self.heavy_hitters.hot()
+
+        # Entries seen once are not hot
+        self.assertEqual(frozenset(['mattdavid']), slds)
+        self.assertEqual(frozenset([('www.mattdavid.bit', 'A')]), queries)
+
+    def test_maintain_pins(self):
+
+        self.heavy_hitters.maintain(self.nc_resolver)
+
+        self.assertEqual(frozenset([('www.mattdavid.bit', 'A')]), self.nc_resolver.answer_cache._pinned)
+        self.assertEqual(frozenset(['mattdavid']), self.nc_resolver.nc_cache._pinned)
+        self.assertEqual(frozenset(['mattdavid']), self.nc_resolver.delegation_cache._pinned)
+        self.assertEqual(2, self.heavy_hitters.report()['pinned'])
+
+    def test_mixed_case_sld(self):
+
+        self.nc_resolver.nc_name_resolver = Mock(wraps=self.nc_resolver.nc_name_resolver)
+        for _ in range(3):
+            self.nc_resolver.resolve('www.MattDavid.bit', 'A')
+
+        self.heavy_hitters.refresh_interval = 600
+        self.heavy_hitters.maintain(self.nc_resolver)
+
+        # Pinned and refreshed under the SLD the caches are keyed by
+        self.assertIn('MattDavid', self.nc_resolver.nc_cache._pinned)
+        self.assertIn('MattDavid', self.nc_resolver.nc_cache._entries)
+        self.assertIn(call('MattDavid'), self.nc_resolver.nc_name_resolver.name_show.call_args_list)
+
+    def test_pin_disabled(self):
+
+        self.heavy_hitters.pin = False
+        self.heavy_hitters.maintain(self.nc_resolver)
+
+        self.assertEqual(frozenset(), self.nc_resolver.answer_cache._pinned)
+
+    def test_fresh_entries_not_refreshed(self):
+
+        queries = self.engine.query.call_count
+        self.heavy_hitters.maintain(self.nc_resolver)
+
+        self.assertEqual(queries, self.engine.query.call_count)
+        self.assertEqual(0, self.heavy_hitters.stats['refreshed'])
+
+    def test_refresh_before_expiry(self):
+
+        # Answers (300s) and Namecoin records (60s) expire before the next pass
+        self.heavy_hitters.refresh_interval = 600
+        self.nc_resolver.nc_name_resolver = Mock(wraps=self.nc_resolver.nc_name_resolver)
+        queries = self.engine.query.call_count
+
+        self.heavy_hitters.maintain(self.nc_resolver)
+
+        self.assertEqual(queries + 1, self.engine.query.call_count)
+        self.assertEqual('www.mattdavid.bit', self.engine.query.call_args[0][3])
+        self.assertEqual('mattdavid', self.nc_resolver.nc_name_resolver.name_show.call_args[0][0])
+        self.assertEqual(2, self.heavy_hitters.stats['refreshed'])
+
+    def test_refresh_expired(self):
+
+        self.nc_resolver.answer_cache.clear()
+        self.heavy_hitters.maintain(self.nc_resolver)
+
+        self.assertIsNotNone(self.nc_resolver.answer_cache.get(('www.mattdavid.bit', 'A')))
+        self.assertEqual(1, self.heavy_hitters.stats['refreshed'])
+
+    def test_refresh_failed(self):
+
+        self.heavy_hitters.refresh_interval = 600
+        self.nc_resolver.nc_name_resolver = Mock()
+        self.nc_resolver.nc_name_resolver.name_show.side_effect = NamecoinException('Unable to connect to Namecoin node', 500)
+
+        self.heavy_hitters.maintain(self.nc_resolver)
+
+        self.assertEqual(1, self.heavy_hitters.stats['failed'])
+
+    def test_refresh_disabled(self):
+
+        self.heavy_hitters.refresh = False
+        self.nc_resolver.answer_cache.clear()
+        self.heavy_hitters.maintain(self.nc_resolver)
+
+        self.assertIsNone(self.nc_resolver.answer_cache.get(('www.mattdavid.bit', 'A')))
+
+    def test_decay(self):
+
+        self.heavy_hitters.decay_interval = 0.01
+        time.sleep(0.02)
+        self.heavy_hitters.maintain(self.nc_resolver)
+
+        self.assertEqual([['mattdavid', 2, 0]], self.heavy_hitters.report()['slds'])
+        self.assertEqual(frozenset(['mattdavid']), self.nc_resolver.nc_cache._pinned)
+
+    def test_dump(self):
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            self.heavy_hitters.dump_path = os.path.join(tmp_dir, 'top.json')
+            self.heavy_hitters.dump_interval = 0
+            self.heavy_hitters.maintain(self.nc_resolver)
+
+            with open(self.heavy_hitters.dump_path) as f:
+                dumped = json.load(f)
+            self.assertEqual(['mattdavid', 5, 0], dumped['slds'][0])
+            self.assertEqual(['top.json'], os.listdir(tmp_dir))
+            self.assertEqual(1, self.heavy_hitters.stats['dumps'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_start_stop(self):
+
+        self.heavy_hitters.refresh_interval = 0.01
+        self.heavy_hitters.start(self.nc_resolver)
+
+        expires = time.time() + 2.0
+        while not self.nc_resolver.answer_cache._pinned and time.time() < expires:
+            time.sleep(0.005)
+        self.heavy_hitters.stop()
+
+        self.assertEqual(frozenset([('www.mattdavid.bit', 'A')]), self.nc_resolver.answer_cache._pinned)
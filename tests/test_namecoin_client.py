@@ -165,3 +165,71 @@ class TestGetDomain(TestCase):
             self.assertEqual('invalid_error', e.message)
             self.assertEqual(1024, e.code)
 
+class TestScanAndBlocks(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.namecoin.NamecoinClient.send')
+        self.mockSend = self.patcher1.start()
+
+        self.nc_client = NamecoinClient('namecoin.local', 4242, 'billybob', '1234567890', 42)
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+
+    def test_name_scan(self):
+
+        self.mockSend.return_value = [{'name': 'd/mattdavid'}]
+
+        self.assertEqual([{'name': 'd/mattdavid'}], self.nc_client.name_scan('d/a', 10))
+        self.mockSend.assert_called_with('name_scan', ['d/a', 10], timeout=None)
+
+    def test_name_scan_empty(self):
+
+        # send() returns None for an empty result list
+        self.mockSend.return_value = None
+
+        self.assertEqual([], self.nc_client.name_scan())
+
+    def test_name_pending(self):
+
+        self.mockSend.return_value = None
+        self.assertEqual([], self.nc_client.name_pending())
+        self.mockSend.assert_called_with('name_pending', [], timeout=None)
+
+    def test_blocks(self):
+
+        self.mockSend.return_value = 'result'
+
+        self.nc_client.get_block_hash(42)
+        self.mockSend.assert_called_with('getblockhash', [42], timeout=None)
+        self.nc_client.get_block('abcd', 2)
+        self.mockSend.assert_called_with('getblock', ['abcd', 2], timeout=None)
+        self.nc_client.get_raw_transaction('ef01')
+        self.mockSend.assert_called_with('getrawtransaction', ['ef01', 1], timeout=None)
+
+
+class TestNamecoinSendTimeout(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.namecoin.requests')
+        self.mockRequests = self.patcher1.start()
+        self.mockRequests.post.return_value.text = json.dumps({'result': {'name': 'd/mattdavid'}})
+
+        self.nc_client = NamecoinClient('namecoin.local', 4242, 'billybob', '1234567890', 42)
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+
+    def test_timeout_override(self):
+
+        self.nc_client.send('name_show', ['d/mattdavid'], timeout=1.5)
+        self.assertEqual(1.5, self.mockRequests.post.call_args[1]['timeout'])
+
+    def test_get_domain_timeout(self):
+
+        self.nc_client.get_domain('mattdavid', timeout=2.5)
+        self.assertEqual(2.5, self.mockRequests.post.call_args[1]['timeout'])
@@ -0,0 +1,180 @@
+__author__ = 'mdavid'
+
+import json
+import threading
+from mock import *
+from unittest import TestCase
+from bcresolver import NamecoinResolver
+from bcresolver.namecoin import NamecoinException
+from bcresolver.pending import PendingUpdateWatcher
+from bcresolver.replay import StandInNamecoinResolver, StandInEngine, STAND_IN_DS
+
+NEW_DS = [[12345, 8, 2, 'NZbut7iqVxCP0IGCX7J1DA/DrbrkFJzEML1PetAxVzQ=']]
+NEW_VALUE = json.dumps({'ds': NEW_DS, 'ns': ['ns1.newhost.net', 'ns2.newhost.net']})
+
+class TestPendingUpdateWatcher(TestCase):
+
+    def setUp(self):
+
+        self.engine = StandInEngine()
+        self.engine.prepare = Mock(return_value=True)
+        self.nc_resolver = NamecoinResolver(nc_name_resolver=StandInNamecoinResolver, engine=self.engine)
+
+        self.mockClient = Mock()
+        self.mockClient.name_pending.return_value = [
+            {'op': 'name_update', 'name': 'd/mattdavid', 'value': NEW_VALUE, 'txid': 'aa01'},
+            {'op': 'name_update', 'name': 'id/someone', 'value': '{}', 'txid': 'aa02'}
+        ]
+
+        self.watcher = PendingUpdateWatcher(self.nc_resolver, client=self.mockClient)
+
+        # Warm the caches with the current delegation
+        self.nc_resolver.resolve('www.mattdavid.bit', 'A')
+
+    def confirm(self, nc_domain):
+
+        self.mockClient.name_pending.return_value = []
+        self.nc_resolver.nc_name_resolver = Mock()
+        self.nc_resolver.nc_name_resolver.name_show.return_value = nc_domain
+        self.watcher.poll()
+
+    def test_stage(self):
+
+        self.watcher.poll()
+
+        self.assertEqual(['mattdavid'], self.watcher.staged.keys())
+        delegation = self.watcher.staged['mattdavid']['delegation']
+        self.assertEqual(('ns1.newhost.net', 'ns2.newhost.net'), delegation.ns)
+        self.assertIn(' 12345 8 2 ', delegation.ds_ta)
+
+        # New nameservers are looked up and the zone's DNSKEY set validated ahead of time
+        self.assertIsNotNone(self.nc_resolver.ns_address_cache.get('ns1.newhost.net'))
+        self.assertIsNotNone(self.nc_resolver.ns_address_cache.get('ns2.newhost.net'))
+        self.assertEqual(1, self.engine.prepare.call_count)
+        self.assertEqual('mattdavid.bit.', self.engine.prepare.call_args[0][0])
+        self.assertTrue(self.watcher.staged['mattdavid']['prepared'])
+
+        # The caches in use are untouched until the update confirms
+        self.assertEqual(('ns1.mattdavid.bit', 'ns2.mattdavid.bit'), self.nc_resolver.delegation_cache.get('mattdavid').ns)
+        self.assertEqual(1, self.watcher.report()['pending'])
+
+    def test_staged_once(self):
+
+        self.watcher.poll()
+        self.watcher.poll()
+
+        self.assertEqual(1, self.watcher.stats['staged'])
+        self.assertEqual(1, self.engine.prepare.call_count)
+
+    def test_stage_prepare_next_address(self):
+
+        # The first nameserver does not answer: the DNSKEY set is fetched from the next address
+        self.engine.prepare.side_effect = [False, True]
+        self.watcher.poll()
+
+        self.assertEqual([self.nc_resolver.ns_address_cache.get(ns)[0] for ns in ('ns1.newhost.net', 'ns2.newhost.net')], [c[0][1] for c in self.engine.prepare.call_args_list])
+        self.assertTrue(self.watcher.staged['mattdavid']['prepared'])
+
+    def test_stage_unbound_engine(self):
+
+        self.nc_resolver.engine = None
+        self.nc_resolver._get_ns_ctx = Mock()
+        self.nc_resolver._get_ns_addresses = Mock(return_value=['192.0.2.1'])
+        self.watcher.poll()
+
+        self.assertEqual(2, self.nc_resolver._get_ns_addresses.call_count)
+        self.assertFalse(self.watcher.staged['mattdavid']['prepared'])
+
+    def test_replaced(self):
+
+        self.watcher.poll()
+        self.mockClient.name_pending.return_value = [{'name': 'd/mattdavid', 'value': json.dumps({'ip': '10.0.0.1'}), 'txid': 'aa03'}]
+        self.watcher.poll()
+
+        self.assertEqual(2, self.watcher.stats['staged'])
+        self.assertIsNone(self.watcher.staged['mattdavid']['delegation'])
+
+    def test_install_on_confirm(self):
+
+        self.watcher.poll()
+        self.confirm({'value': NEW_VALUE, 'txid': 'aa01'})
+
+        self.assertEqual(('ns1.newhost.net', 'ns2.newhost.net'), self.nc_resolver.delegation_cache.get('mattdavid').ns)
+        self.assertEqual(('ns1.newhost.net', 'ns2.newhost.net'), self.nc_resolver.nc_cache.get('mattdavid').ns)
+        self.assertEqual({}, self.watcher.staged)
+        self.assertEqual(1, self.watcher.stats['installed'])
+
+        # Resolution goes straight to the new delegation, without a name_show call
+        self.assertTrue(self.nc_resolver.resolve('mail.mattdavid.bit', 'A').startswith('10.'))
+        self.assertEqual(1, self.nc_resolver.nc_name_resolver.name_show.call_count)
+
+    def test_install_without_delegation(self):
+
+        self.mockClient.name_pending.return_value = [{'name': 'd/mattdavid', 'value': json.dumps({'ip': '10.0.0.1'}), 'txid': 'aa03'}]
+        self.watcher.poll()
+        self.confirm({'value': json.dumps({'ip': '10.0.0.1'}), 'txid': 'aa03'})
+
+        self.assertIsNone(self.nc_resolver.delegation_cache.get('mattdavid'))
+        self.assertEqual('10.0.0.1', self.nc_resolver.nc_cache.get('mattdavid').ip)
+
+    def test_abandoned(self):
+
+        self.watcher.poll()
+        self.confirm({'value': json.dumps({'ds': STAND_IN_DS, 'ns': ['ns1.mattdavid.bit']}), 'txid': 'bb01'})
+
+        self.assertEqual(('ns1.mattdavid.bit', 'ns2.mattdavid.bit'), self.nc_resolver.delegation_cache.get('mattdavid').ns)
+        self.assertEqual({}, self.watcher.staged)
+        self.assertEqual(1, self.watcher.stats['abandoned'])
+
+    def test_namecoin_unreachable(self):
+
+        self.watcher.poll()
+        self.mockClient.name_pending.return_value = []
+        self.nc_resolver.nc_name_resolver = Mock()
+        self.nc_resolver.nc_name_resolver.name_show.side_effect = NamecoinException('Unable to connect to Namecoin node', 500)
+        self.watcher.poll()
+
+        self.assertEqual(['mattdavid'], self.watcher.staged.keys())
+        self.assertEqual(0, self.watcher.stats['installed'])
+
+    def test_invalid_value(self):
+
+        self.mockClient.name_pending.return_value = [{'name': 'd/mattdavid', 'value': 'not json', 'txid': 'aa01'}]
+        self.watcher.poll()
+
+        self.assertEqual({}, self.watcher.staged)
+        self.assertEqual(1, self.watcher.stats['failed'])
+
+    def test_max_staged(self):
+
+        self.watcher.max_staged = 1
+        self.mockClient.name_pending.return_value = [{'name': 'd/name%d' % i, 'value': NEW_VALUE, 'txid': 'cc%02d' % i} for i in range(3)]
+        self.watcher.poll()
+
+        self.assertEqual(1, len(self.watcher.staged))
+        self.assertEqual(2, self.watcher.stats['skipped'])
+
+    def test_import_chain(self):
+
+        self.nc_resolver.nc_cache.set('common', self.nc_resolver.nc_cache.get('mattdavid'))
+        value = json.dumps({'import': 'd/common', 'ip': '10.0.0.1'})
+        self.mockClient.name_pending.return_value = [{'name': 'd/mattdavid', 'value': value, 'txid': 'aa04'}]
+        self.watcher.poll()
+        self.confirm({'value': value, 'txid': 'aa04'})
+
+        resolved = self.nc_resolver._get_resolved_record('mattdavid')
+        self.assertEqual('10.0.0.1', resolved.ip)
+        self.assertEqual(('ns1.mattdavid.bit', 'ns2.mattdavid.bit'), resolved.ns)
+        self.assertIn('mattdavid', self.nc_resolver._chain_dependents['common'])
+
+    def test_start_stop(self):
+
+        polled = threading.Event()
+        self.mockClient.name_pending.side_effect = lambda: polled.set() or []
+
+        self.watcher.poll_interval = 0.01
+        self.watcher.start()
+        self.assertTrue(polled.wait(2.0))
+        self.watcher.stop()
+
+        self.assertGreaterEqual(self.watcher.stats['polls'], 1)
@@ -0,0 +1,141 @@
+__author__ = 'mdavid'
+
+import os
+import time
+from mock import *
+from unittest import TestCase
+from bcresolver import EmptyResultException, NamecoinValueException, ResolutionTimeoutException
+from bcresolver.pool import shard_key, HashRing, PoolWorker, ResolverPool, WorkerUnavailableException
+from bcresolver.replay import StandInNamecoinResolver, StandInEngine
+
+class TestShardKey(TestCase):
+
+    def test_go_right(self):
+
+        self.assertEqual('mattdavid', shard_key('www.MattDavid.bit.'))
+        self.assertEqual('mattdavid', shard_key('mattdavid.bit'))
+        self.assertEqual('bit', shard_key('bit'))
+
+class TestHashRing(TestCase):
+
+    def test_go_right(self):
+
+        ring = HashRing(range(4))
+        nodes = ring.get_nodes('mattdavid')
+
+        self.assertEqual([0, 1, 2, 3], sorted(nodes))
+        self.assertEqual(nodes, ring.get_nodes('mattdavid'))
+
+    def test_spread(self):
+
+        ring = HashRing(range(4))
+        owners = [ring.get_nodes('name%d' % i)[0] for i in range(1000)]
+
+        for node in range(4):
+            self.assertGreater(owners.count(node), 150)
+
+    def test_consistent(self):
+
+        # Removing a node only moves the keys it owned
+        before = HashRing(range(4))
+        after = HashRing([0, 1, 3])
+
+        for i in range(200):
+            key = 'name%d' % i
+            if before.get_nodes(key)[0] != 2:
+                self.assertEqual(before.get_nodes(key)[0], after.get_nodes(key)[0])
+            else:
+                self.assertEqual(before.get_nodes(key)[1], after.get_nodes(key)[0])
+
+    def test_empty(self):
+
+        self.assertEqual([], HashRing([]).get_nodes('mattdavid'))
+
+class TestPoolWorker(TestCase):
+
+    def test_not_started(self):
+
+        self.assertRaises(WorkerUnavailableException, PoolWorker(0, {}).call, 'resolve_with_ttl', ('www.mattdavid.bit', 'A', None))
+
+class TestResolverPool(TestCase):
+
+    def setUp(self):
+
+        self.pool = ResolverPool(workers=3, threads=2, resolver_options={
+            'nc_name_resolver': StandInNamecoinResolver,
+            'engine': StandInEngine(),
+            'native_records': True
+        })
+        self.pool.start()
+
+    def tearDown(self):
+
+        self.pool.close()
+
+    def test_go_right(self):
+
+        value, ttl = self.pool.resolve_with_ttl('www.mattdavid.bit', 'A')
+
+        self.assertTrue(value.startswith('10.'))
+        self.assertEqual(300, ttl)
+        self.assertEqual(value, self.pool.resolve('www.mattdavid.bit', 'A'))
+
+    def test_resolve_all(self):
+
+        results = self.pool.resolve_all('mattdavid.bit', ['A', 'AAAA'])
+
+        self.assertTrue(results['AAAA'].startswith('2001:db8::'))
+
+    def test_exception_reraised(self):
+
+        self.assertRaises(ValueError, self.pool.resolve, 'www.example.com', 'A')
+
+    def test_same_shard_same_worker(self):
+
+        self.assertEqual(self.pool.worker_for('www.mattdavid.bit'), self.pool.worker_for('mail.MattDavid.bit'))
+
+    def test_failover_and_restart(self):
+
+        index = self.pool.worker_for('www.mattdavid.bit')
+        self.pool.workers[index].stop()
+
+        self.assertNotEqual(index, self.pool.worker_for('www.mattdavid.bit'))
+        self.assertTrue(self.pool.resolve('www.mattdavid.bit', 'A').startswith('10.'))
+        self.assertEqual(1, self.pool.stats['failovers'])
+
+        self.pool.restart(index)
+
+        self.assertEqual(index, self.pool.worker_for('www.mattdavid.bit'))
+        self.assertTrue(self.pool.resolve('www.mattdavid.bit', 'A').startswith('10.'))
+        self.assertEqual(1, self.pool.stats['failovers'])
+
+    def test_worker_killed(self):
+
+        index = self.pool.worker_for('www.mattdavid.bit')
+        os.kill(self.pool.workers[index].process.pid, 9)
+        self.pool.workers[index].process.join()
+
+        self.assertTrue(self.pool.resolve('www.mattdavid.bit', 'A').startswith('10.'))
+        self.assertFalse(self.pool.workers[index].alive)
+
+    def test_no_workers(self):
+
+        for worker in self.pool.workers:
+            worker.stop()
+
+        self.assertRaises(WorkerUnavailableException, self.pool.resolve, 'www.mattdavid.bit', 'A')
+
+class TestResolverPoolTimeout(TestCase):
+
+    def test_timeout(self):
+
+        pool = ResolverPool(workers=1, threads=1, request_timeout=0.2, resolver_options={
+            'nc_name_resolver': StandInNamecoinResolver,
+            'nc_name_resolver_options': {'fault': Mock(apply=lambda timeout=None: time.sleep(1) or False)},
+            'engine': StandInEngine()
+        })
+        pool.start()
+        try:
+            self.assertRaises(ResolutionTimeoutException, pool.resolve, 'www.mattdavid.bit', 'A')
+        finally:
+            pool.close()
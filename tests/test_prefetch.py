@@ -0,0 +1,240 @@
+__author__ = 'mdavid'
+
+import time
+from mock import *
+from unittest import TestCase
+from bcresolver import NamecoinResolver
+from bcresolver.prefetch import wallet_currencies, antecedent, PrefetchPolicy
+from bcresolver.replay import StandInNamecoinResolver, StandInEngine
+
+def wait_for(condition, timeout=2.0):
+
+    expires = time.time() + timeout
+    while not condition() and time.time() < expires:
+        time.sleep(0.005)
+    return condition()
+
+class TestWalletCurrencies(TestCase):
+
+    def test_go_right(self):
+
+        self.assertEqual([('_btc._wallet.wallet.mattdavid.bit', 'TXT'), ('_ltc._wallet.wallet.mattdavid.bit', 'TXT')], wallet_currencies('_wallet.wallet.mattdavid.bit', 'TXT', 'btc LTC'))
+
+    def test_not_wallet(self):
+
+        self.assertEqual([], wallet_currencies('wallet.mattdavid.bit', 'TXT', 'btc'))
+        self.assertEqual([], wallet_currencies('_wallet.wallet.mattdavid.bit', 'A', 'btc'))
+        self.assertEqual([], wallet_currencies('_wallet.wallet.mattdavid.bit', 'TXT', None))
+        self.assertEqual([], wallet_currencies('_wallet.wallet.mattdavid.bit', 'TXT', '../etc'))
+
+class TestAntecedent(TestCase):
+
+    def test_go_right(self):
+
+        self.assertEqual(('TXT', '_wallet'), antecedent('_wallet.wallet.mattdavid.bit', 'TXT'))
+        self.assertEqual(('A', ''), antecedent('www.mattdavid.bit', 'A'))
+
+class TestPrefetchPolicy(TestCase):
+
+    def setUp(self):
+
+        self.mockResolver = Mock()
+        self.mockResolver._prefetch.return_value = 300
+
+    def test_predict(self):
+
+        policy = PrefetchPolicy()
+
+        self.assertEqual([('www.mattdavid.bit', 'AAAA')], policy.predict('WWW.mattdavid.bit', 'A'))
+        self.assertEqual([('_btc._wallet.mattdavid.bit', 'TXT')], policy.predict('_wallet.mattdavid.bit', 'TXT', 'btc'))
+        self.assertEqual([], PrefetchPolicy(rules={}).predict('www.mattdavid.bit', 'A'))
+        self.assertEqual([('www.mattdavid.bit', 'TXT')], PrefetchPolicy(rules={'A': ('A', 'TXT')}).predict('www.mattdavid.bit', 'A'))
+
+    def test_prefetch_and_used(self):
+
+        policy = PrefetchPolicy()
+
+        policy.observe(self.mockResolver, 'www.mattdavid.bit', 'A', '10.0.0.1')
+        self.assertTrue(wait_for(lambda: policy.stats['fetched'] == 1))
+        self.mockResolver._prefetch.assert_called_once_with('www.mattdavid.bit', 'AAAA')
+
+        policy.observe(self.mockResolver, 'www.mattdavid.bit', 'AAAA', '2001:db8::1')
+        self.assertEqual(1, policy.report()['used'])
+
+        # The AAAA query predicts A, which is prefetched too but not used (yet)
+        self.assertTrue(wait_for(lambda: policy.stats['fetched'] == 2))
+        self.assertEqual(0.5, policy.report()['hit_rate'])
+
+    def test_already_prefetched_not_queued(self):
+
+        policy = PrefetchPolicy()
+
+        policy.observe(self.mockResolver, 'www.mattdavid.bit', 'A', '10.0.0.1')
+        self.assertTrue(wait_for(lambda: policy.stats['fetched'] == 1))
+        policy.observe(self.mockResolver, 'www.mattdavid.bit', 'A', '10.0.0.1')
+
+        self.assertEqual(1, policy.stats['queued'])
+
+    def test_cached_and_failed(self):
+
+        policy = PrefetchPolicy()
+
+        self.mockResolver._prefetch.return_value = 0
+        policy.observe(self.mockResolver, 'www.mattdavid.bit', 'A', '10.0.0.1')
+        self.assertTrue(wait_for(lambda: policy.stats['cached'] == 1))
+
+        self.mockResolver._prefetch.side_effect = ValueError()
+        policy.observe(self.mockResolver, 'mail.mattdavid.bit', 'A', '10.0.0.1')
+        self.assertTrue(wait_for(lambda: policy.stats['failed'] == 1))
+        self.assertIsNone(policy.report()['hit_rate'])
+
+    def test_failed_backoff(self):
+
+        policy = PrefetchPolicy()
+        self.mockResolver._prefetch.return_value = None
+
+        policy.observe(self.mockResolver, 'www.mattdavid.bit', 'A', '10.0.0.1')
+        self.assertTrue(wait_for(lambda: policy.stats['failed'] == 1))
+        policy.observe(self.mockResolver, 'www.mattdavid.bit', 'A', '10.0.0.1')
+
+        self.assertEqual(1, policy.stats['queued'])
+        self.assertEqual(0, policy.report()['used'])
+
+        # Retried once the backoff is over
+        policy.failure_backoff = 0
+        policy.observe(self.mockResolver, 'mail.mattdavid.bit', 'A', '10.0.0.1')
+        self.assertTrue(wait_for(lambda: policy.stats['failed'] == 2))
+        policy.observe(self.mockResolver, 'mail.mattdavid.bit', 'A', '10.0.0.1')
+        self.assertTrue(wait_for(lambda: policy.stats['failed'] == 3))
+
+    def test_cached_answer_not_followed(self):
+
+        policy = PrefetchPolicy()
+
+        policy.observe(self.mockResolver, 'www.mattdavid.bit', 'A', '10.0.0.1', cached=True)
+
+        self.assertEqual(0, policy.stats['queued'])
+        self.assertEqual(0, self.mockResolver._prefetch.call_count)
+
+    def test_budget(self):
+
+        self.mockResolver._prefetch.side_effect = lambda name, qtype: time.sleep(0.05) or 300
+        policy = PrefetchPolicy(budget=2)
+
+        for i in range(5):
+            policy.observe(self.mockResolver, 'www%d.mattdavid.bit' % i, 'A', '10.0.0.1')
+
+        self.assertEqual(2, policy.stats['queued'])
+        self.assertEqual(3, policy.stats['dropped'])
+
+    def test_max_pending(self):
+
+        self.mockResolver._prefetch.side_effect = lambda name, qtype: time.sleep(0.2) or 300
+        policy = PrefetchPolicy(budget=100, max_pending=1, workers=1)
+
+        for i in range(4):
+            policy.observe(self.mockResolver, 'www%d.mattdavid.bit' % i, 'A', '10.0.0.1')
+            time.sleep(0.01)
+
+        self.assertEqual(2, policy.stats['queued'])
+        self.assertEqual(2, policy.stats['dropped'])
+
+    def test_learn(self):
+
+        policy = PrefetchPolicy(rules={}, derive=(), learn=True, min_support=3)
+        self.mockResolver._prefetch.return_value = 0
+
+        for i in range(3):
+            name = 'wallet.name%d.bit' % i
+            policy.observe(self.mockResolver, '_wallet.%s' % name, 'TXT', 'btc ltc')
+            policy.observe(self.mockResolver, '_btc._wallet.%s' % name, 'TXT', '1CpLXM15vjULK3ZPGUTDMUcGATGR9xGitv')
+            policy.observe(self.mockResolver, '_ltc._wallet.%s' % name, 'TXT', 'LdP8Qox1VAhCzLJNqrr74YovaWYyNBUWvL')
+            policy.observe(self.mockResolver, 'www.%s' % name, 'A', '10.0.0.1')
+
+        self.assertEqual([('_btc.', 'TXT'), ('_ltc.', 'TXT')], sorted(policy.learned(('TXT', '_wallet'))))
+        self.assertEqual([('_btc._wallet.wallet.other.bit', 'TXT'), ('_ltc._wallet.wallet.other.bit', 'TXT')], sorted(policy.predict('_wallet.wallet.other.bit', 'TXT')))
+
+        # Unrelated names and query classes learn nothing
+        self.assertEqual([], policy.learned(('A', '')))
+        self.assertEqual([], policy.predict('wallet.other.bit', 'TXT'))
+
+    def test_learn_window_and_confidence(self):
+
+        policy = PrefetchPolicy(rules={}, derive=(), learn=True, min_support=2, window=0.0)
+        self.mockResolver._prefetch.return_value = 0
+
+        for i in range(3):
+            policy.observe(self.mockResolver, 'www.name%d.bit' % i, 'A', '10.0.0.1')
+            time.sleep(0.001)
+            policy.observe(self.mockResolver, 'www.name%d.bit' % i, 'AAAA', '2001:db8::1')
+
+        self.assertEqual([], policy.learned(('A', '')))
+
+        policy.window = 2.0
+        for i in range(2):
+            policy.observe(self.mockResolver, 'www.other%d.bit' % i, 'A', '10.0.0.1')
+            policy.observe(self.mockResolver, 'www.other%d.bit' % i, 'AAAA', '2001:db8::1')
+
+        # 2 of 5 A queries were followed by AAAA: below min_confidence
+        self.assertEqual([], policy.learned(('A', '')))
+        policy.min_confidence = 0.4
+        self.assertEqual([('', 'AAAA')], policy.learned(('A', '')))
+
+    def test_max_patterns(self):
+
+        policy = PrefetchPolicy(rules={}, derive=(), learn=True, max_patterns=1)
+
+        policy.observe(self.mockResolver, 'www.mattdavid.bit', 'A', '10.0.0.1')
+        policy.observe(self.mockResolver, 'www.mattdavid.bit', 'AAAA', '2001:db8::1')
+        policy.observe(self.mockResolver, 'www.mattdavid.bit', 'TXT', 'v=spf1 -all')
+
+        self.assertEqual(1, policy.report()['patterns'])
+
+class TestResolverPrefetch(TestCase):
+
+    def setUp(self):
+
+        self.policy = PrefetchPolicy()
+        self.nc_resolver = NamecoinResolver(nc_name_resolver=StandInNamecoinResolver, engine=StandInEngine(), prefetch=self.policy)
+
+    def test_go_right(self):
+
+        self.assertTrue(self.nc_resolver.resolve('www.mattdavid.bit', 'A').startswith('10.'))
+        self.assertTrue(wait_for(lambda: self.policy.stats['fetched'] == 1))
+        self.assertIsNotNone(self.nc_resolver.answer_cache.get(('www.mattdavid.bit', 'AAAA')))
+
+        self.assertTrue(self.nc_resolver.resolve('www.mattdavid.bit', 'AAAA').startswith('2001:db8::'))
+        self.assertEqual(1, self.policy.report()['used'])
+
+    def test_prefetch_cached(self):
+
+        self.nc_resolver.prefetch = None
+        self.nc_resolver.resolve('www.mattdavid.bit', 'AAAA')
+
+        self.assertEqual(0, self.nc_resolver._prefetch('www.mattdavid.bit', 'AAAA'))
+        self.assertEqual(300, self.nc_resolver._prefetch('www.mattdavid.bit', 'A'))
+
+    def test_failed_resolution_not_observed(self):
+
+        self.nc_resolver.engine = StandInEngine(Mock(apply=lambda timeout=None: True))
+
+        self.assertIsNone(self.nc_resolver.resolve('www.mattdavid.bit', 'A'))
+        self.assertEqual(0, self.policy.stats['queued'])
+
+    def test_ipv4_only_name(self):
+
+        engine = StandInEngine()
+        query = engine.query
+        engine.query = Mock(side_effect=lambda zone, address, ds_ta, name, rrtype, timeout=None: (-1, None) if rrtype == 28 else query(zone, address, ds_ta, name, rrtype, timeout))
+        self.nc_resolver.engine = engine
+
+        for _ in range(10):
+            self.nc_resolver.resolve('www.mattdavid.bit', 'A')
+        self.assertTrue(wait_for(lambda: self.policy.stats['failed'] == 1))
+
+        aaaa_queries = len([args for args in engine.query.call_args_list if args[0][4] == 28])
+        for _ in range(10):
+            self.nc_resolver.resolve('www.mattdavid.bit', 'A')
+
+        self.assertEqual(1, self.policy.stats['queued'])
+        self.assertEqual(aaaa_queries, len([args for args in engine.query.call_args_list if args[0][4] == 28]))
@@ -0,0 +1,94 @@
+__author__ = 'mdavid'
+
+from unittest import TestCase
+from bcresolver.records import compact, parse_links, Delegation, NamecoinRecord
+
+class TestCompact(TestCase):
+
+    def test_go_right(self):
+
+        value = compact({u'ns': [u'ns1.example.com', u'ns2.example.com'], u'ds': [[1, 8, 2, u'abcd']]})
+
+        self.assertEqual({'ns': ('ns1.example.com', 'ns2.example.com'), 'ds': ((1, 8, 2, 'abcd'),)}, value)
+        self.assertTrue(isinstance(value['ns'][0], str))
+
+    def test_interned(self):
+
+        self.assertTrue(compact(u'ns1.' + u'example.com') is compact(u'ns1.example' + u'.com'))
+
+    def test_non_ascii(self):
+
+        self.assertEqual(u'caf\xe9', compact(u'caf\xe9'))
+
+class TestParseLinks(TestCase):
+
+    def test_go_right(self):
+
+        self.assertEqual((('d/common', ''),), parse_links('d/common'))
+        self.assertEqual((('d/common', 'www'),), parse_links(('d/common', 'www')))
+        self.assertEqual((('d/a', ''), ('d/b', '')), parse_links(('d/a', 'd/b')))
+        self.assertEqual((('d/a', 'www'), ('d/b', '')), parse_links((('d/a', 'www'), ('d/b',))))
+
+    def test_unset_and_malformed(self):
+
+        self.assertEqual((), parse_links(None))
+        self.assertEqual((), parse_links((1, 2, 3)))
+
+class TestNamecoinRecord(TestCase):
+
+    def test_go_right(self):
+
+        record = NamecoinRecord({
+            u'ns': [u'ns1.example.com'],
+            u'ds': [[1, 8, 2, u'abcd']],
+            u'ip': u'10.0.0.1',
+            u'email': u'hostmaster@example.com'
+        })
+
+        self.assertEqual(('ns1.example.com',), record.ns)
+        self.assertEqual(((1, 8, 2, 'abcd'),), record.ds)
+        self.assertEqual('10.0.0.1', record.get('ip'))
+        self.assertIsNone(record.ip6)
+        self.assertIsNone(record.get('email'))
+        self.assertEqual('default', record.get('alias', 'default'))
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual((), record.links())
+
+    def test_links(self):
+
+        self.assertEqual((('d/a', ''), ('d/b', '')), NamecoinRecord({u'import': [[u'd/a'], [u'd/b']]}).links())
+        self.assertEqual((('d/c', ''),), NamecoinRecord({u'import': u'd/a', u'delegate': u'd/c'}).links())
+
+    def test_merge(self):
+
+        record = NamecoinRecord({u'ip': u'10.0.0.1', u'import': u'd/common'})
+        merged = record.merge(NamecoinRecord({u'ip': u'10.0.0.2', u'ns': [u'ns1.example.com']}))
+
+        self.assertEqual('10.0.0.1', merged.ip)
+        self.assertEqual(('ns1.example.com',), merged.ns)
+        self.assertEqual((), merged.links())
+
+    def test_select(self):
+
+        record = NamecoinRecord({u'map': {u'www': {u'ip': u'10.0.0.1', u'map': {u'a': u'10.0.0.2'}}}})
+
+        self.assertTrue(record.select('') is record)
+        self.assertEqual('10.0.0.1', record.select('www').ip)
+        self.assertEqual('10.0.0.2', record.select('a.www').ip)
+        self.assertIsNone(record.select('mail'))
+
+    def test_equality(self):
+
+        self.assertEqual(NamecoinRecord({u'ip': u'10.0.0.1'}), NamecoinRecord({u'ip': u'10.0.0.1'}))
+        self.assertNotEqual(NamecoinRecord({u'ip': u'10.0.0.1'}), NamecoinRecord({u'ip': u'10.0.0.2'}))
+        self.assertNotEqual(NamecoinRecord({u'ip': u'10.0.0.1'}), None)
+
+class TestDelegation(TestCase):
+
+    def test_go_right(self):
+
+        delegation = Delegation('example.bit.', ['ns1.example.com'], 'example.bit. IN DS 1 8 2 ABCD')
+
+        self.assertEqual('example.bit.', delegation.sld)
+        self.assertEqual(('ns1.example.com',), delegation.ns)
+        self.assertEqual('example.bit. IN DS 1 8 2 ABCD', delegation.ds_ta)
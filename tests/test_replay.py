@@ -0,0 +1,156 @@
+__author__ = 'mdavid'
+
+import json
+import os
+import tempfile
+import time
+from mock import *
+from StringIO import StringIO
+from unittest import TestCase
+from bcresolver import NamecoinResolver, RDATATYPE
+from bcresolver.namecoin import NamecoinException
+from bcresolver.replay import parse_log_line, InjectedFault, StandInNamecoinResolver, StandInEngine, replay, main
+
+class TestParseLogLine(TestCase):
+
+    def test_go_right(self):
+
+        self.assertEqual((1450000000.25, 'www.mattdavid.bit', 'AAAA'), parse_log_line('1450000000.25 www.mattdavid.bit aaaa\n'))
+
+    def test_default_qtype(self):
+
+        self.assertEqual((12.0, 'www.mattdavid.bit', 'A'), parse_log_line('12 www.mattdavid.bit\n'))
+
+    def test_blank_comment_and_missing_name(self):
+
+        self.assertIsNone(parse_log_line('\n'))
+        self.assertIsNone(parse_log_line('# timestamp name qtype\n'))
+        self.assertIsNone(parse_log_line('12\n'))
+
+class TestInjectedFault(TestCase):
+
+    def test_no_fault(self):
+
+        self.assertFalse(InjectedFault().apply())
+
+    def test_always_fails(self):
+
+        self.assertTrue(InjectedFault(failure_rate=1.0).apply())
+
+    def test_latency_over_timeout(self):
+
+        start = time.time()
+        self.assertTrue(InjectedFault(latency=5.0).apply(timeout=0.01))
+        self.assertLess(time.time() - start, 1.0)
+
+    def test_seeded(self):
+
+        first = InjectedFault(failure_rate=0.5, seed=7)
+        second = InjectedFault(failure_rate=0.5, seed=7)
+        self.assertEqual([first.apply() for _ in range(20)], [second.apply() for _ in range(20)])
+
+class TestStandIns(TestCase):
+
+    def test_namecoin_name_show(self):
+
+        value = json.loads(StandInNamecoinResolver(None, None, None, None).name_show('mattdavid')['value'])
+
+        self.assertEqual(['ns1.mattdavid.bit', 'ns2.mattdavid.bit'], value['ns'])
+        self.assertTrue(value['ds'])
+
+    def test_namecoin_failure(self):
+
+        self.assertRaises(NamecoinException, StandInNamecoinResolver(None, None, None, None, fault=InjectedFault(failure_rate=1.0)).name_show, 'mattdavid')
+
+    def test_engine_query(self):
+
+        status, result = StandInEngine().query('mattdavid', '192.0.2.1', None, 'www.mattdavid.bit', RDATATYPE['A'], 1.0)
+
+        self.assertEqual(0, status)
+        self.assertTrue(result.secure)
+        self.assertEqual(1, len(result.data.as_address_list()))
+        self.assertEqual(result.data.as_address_list(), StandInEngine().query('mattdavid', '192.0.2.1', None, 'WWW.mattdavid.bit', RDATATYPE['A'])[1].data.as_address_list())
+
+    def test_engine_failure(self):
+
+        self.assertEqual((-1, None), StandInEngine(InjectedFault(failure_rate=1.0)).query('mattdavid', '192.0.2.1', None, 'www.mattdavid.bit', RDATATYPE['A'], 1.0))
+
+class TestReplay(TestCase):
+
+    def build_resolver(self, namecoin_fault=None, dns_fault=None):
+
+        return NamecoinResolver(nc_name_resolver=StandInNamecoinResolver, nc_name_resolver_options={'fault': namecoin_fault}, engine=StandInEngine(dns_fault))
+
+    def test_go_right(self):
+
+        queries = [(100.0 + i * 0.01, 'www%d.mattdavid.bit' % (i % 5), 'A') for i in range(20)]
+
+        report = replay(self.build_resolver(), queries, speed=2.0, workers=4)
+
+        self.assertEqual(20, report['queries'])
+        self.assertEqual({}, report['errors'])
+        self.assertGreater(report['throughput_qps'], 0)
+        self.assertLessEqual(report['latency_ms']['p50'], report['latency_ms']['p99'])
+        self.assertLessEqual(report['latency_ms']['p99'], report['latency_ms']['p999'])
+        self.assertGreater(report['peak_rss_kb'], 0)
+
+    def test_open_loop_schedule(self):
+
+        # Ten queries logged 0.1s apart replayed at 10x take ~0.09s, not 10 * injected latency
+        queries = [(i * 0.1, 'www.mattdavid%d.bit' % i, 'A') for i in range(10)]
+
+        start = time.time()
+        report = replay(self.build_resolver(dns_fault=InjectedFault(latency=0.05)), queries, speed=10.0, workers=10)
+
+        self.assertLess(time.time() - start, 0.5)
+        self.assertGreaterEqual(report['latency_ms']['p50'], 50)
+
+    def test_latency_counts_queueing(self):
+
+        # One worker, queries all due at once: later queries wait behind earlier ones and that wait is measured
+        queries = [(0.0, 'www.mattdavid%d.bit' % i, 'A') for i in range(4)]
+
+        report = replay(self.build_resolver(namecoin_fault=InjectedFault(latency=0.02)), queries, workers=1)
+
+        self.assertGreaterEqual(report['latency_ms']['max'], 80)
+
+    def test_error_breakdown(self):
+
+        queries = [(0.0, 'www.mattdavid.bit', 'A'), (0.0, 'www.mattdavid.bit', 'ANY'), (0.0, 'mattdavid.bit', 'AAAA')]
+
+        report = replay(self.build_resolver(namecoin_fault=InjectedFault(failure_rate=1.0)), queries, workers=2)
+
+        self.assertEqual({'NamecoinException': 3}, report['errors'])
+        self.assertEqual(0, report['no_answer'])
+
+    def test_no_answer(self):
+
+        queries = [(0.0, 'www.mattdavid.bit', 'A'), (0.0, 'mattdavid.bit', 'AAAA')]
+
+        report = replay(self.build_resolver(dns_fault=InjectedFault(failure_rate=1.0)), queries, workers=2)
+
+        self.assertEqual({}, report['errors'])
+        self.assertEqual(2, report['no_answer'])
+
+class TestMain(TestCase):
+
+    def setUp(self):
+
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as outfile:
+            outfile.write('# timestamp name qtype\n0.00 www.mattdavid.bit A\n0.01 mattdavid.bit AAAA\n0.02 www.mattdavid.bit\n')
+
+    def tearDown(self):
+
+        os.unlink(self.path)
+
+    def test_go_right(self):
+
+        stdout = StringIO()
+
+        self.assertEqual(0, main([self.path, '--speed', '10', '--namecoin-latency', '0', '--dns-latency', '0', '--seed', '1'], stdout))
+
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(3, report['queries'])
+        self.assertEqual({}, report['errors'])
+        self.assertIn('p999', report['latency_ms'])
@@ -0,0 +1,137 @@
+__author__ = 'mdavid'
+
+import httplib
+import json
+import threading
+from mock import *
+from unittest import TestCase
+from bcresolver import EmptyResultException
+from bcresolver.admission import OverloadException
+from bcresolver.server import ResolverHTTPServer
+
+class TestResolverHTTPServer(TestCase):
+
+    def setUp(self):
+
+        self.mockResolver = Mock()
+
+        def resolve_with_ttl(name, qtype, deadline=None):
+            if name == 'empty.mattdavid.bit':
+                raise EmptyResultException()
+            if name == 'busy.mattdavid.bit':
+                raise OverloadException()
+            return '10.0.0.1' if qtype == 'A' else 'v=spf1 -all', 300
+        self.mockResolver.resolve_with_ttl.side_effect = resolve_with_ttl
+
+        self.server = ResolverHTTPServer(('127.0.0.1', 0), self.mockResolver, concurrency=2, max_batch=5)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.conn = httplib.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=5)
+
+    def tearDown(self):
+
+        self.conn.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, method, path, body=None):
+
+        self.conn.request(method, path, body)
+        response = self.conn.getresponse()
+        return response, response.read()
+
+    def test_resolve(self):
+
+        response, body = self.request('GET', '/resolve?name=www.mattdavid.bit&qtype=a')
+        record = json.loads(body)
+
+        self.assertEqual(200, response.status)
+        self.assertEqual('application/json', response.getheader('Content-Type'))
+        self.assertEqual('10.0.0.1', record['value'])
+        self.assertEqual(300, record['ttl'])
+        self.assertIsNone(record['error'])
+        self.mockResolver.resolve_with_ttl.assert_called_once_with('www.mattdavid.bit', 'A', None)
+
+    def test_keep_alive(self):
+
+        self.request('GET', '/resolve?name=www.mattdavid.bit')
+        sock = self.conn.sock
+        response, body = self.request('GET', '/resolve?name=mattdavid.bit&qtype=TXT')
+
+        self.assertTrue(self.conn.sock is sock)
+        self.assertEqual('v=spf1 -all', json.loads(body)['value'])
+
+    def test_resolve_error(self):
+
+        response, body = self.request('GET', '/resolve?name=empty.mattdavid.bit&deadline=1.5')
+
+        self.assertEqual(200, response.status)
+        self.assertEqual('EmptyResultException', json.loads(body)['error'])
+        self.mockResolver.resolve_with_ttl.assert_called_once_with('empty.mattdavid.bit', 'A', 1.5)
+
+    def test_overloaded(self):
+
+        response, body = self.request('GET', '/resolve?name=busy.mattdavid.bit')
+
+        self.assertEqual(503, response.status)
+        self.assertEqual('1', response.getheader('Retry-After'))
+
+    def test_bad_requests(self):
+
+        self.assertEqual(400, self.request('GET', '/resolve')[0].status)
+        self.assertEqual(400, self.request('GET', '/resolve?name=www.mattdavid.bit&deadline=soon')[0].status)
+        self.assertEqual(404, self.request('GET', '/nothing')[0].status)
+        self.assertEqual(404, self.request('POST', '/nothing', '[]')[0].status)
+        self.assertEqual(400, self.request('POST', '/batch', 'not json')[0].status)
+        self.assertEqual(400, self.request('POST', '/batch', '{"name": "www.mattdavid.bit"}')[0].status)
+        self.assertEqual(400, self.request('POST', '/batch', '[[42]]')[0].status)
+        self.assertEqual(413, self.request('POST', '/batch', json.dumps([['www.mattdavid.bit']] * 6))[0].status)
+        self.assertEqual(0, self.mockResolver.resolve_with_ttl.call_count)
+
+    def test_health(self):
+
+        response, body = self.request('GET', '/health')
+
+        self.assertEqual(200, response.status)
+        self.assertEqual({'status': 'ok'}, json.loads(body))
+
+    def test_top(self):
+
+        self.mockResolver.heavy_hitters.report.return_value = {'total': 3, 'slds': [['mattdavid', 3, 0]], 'queries': [['www.mattdavid.bit', 'A', 3, 0]]}
+
+        response, body = self.request('GET', '/top?k=5')
+
+        self.assertEqual(200, response.status)
+        self.assertEqual([['mattdavid', 3, 0]], json.loads(body)['slds'])
+        self.mockResolver.heavy_hitters.report.assert_called_once_with(5)
+
+        self.assertEqual(400, self.request('GET', '/top?k=-1')[0].status)
+
+    def test_top_disabled(self):
+
+        self.mockResolver.heavy_hitters = None
+
+        response, body = self.request('GET', '/top')
+
+        self.assertEqual(404, response.status)
+        self.assertIn('error', json.loads(body))
+
+    def test_batch(self):
+
+        queries = [['www.mattdavid.bit', 'A'], {'name': 'mattdavid.bit', 'qtype': 'txt'}, ['empty.mattdavid.bit']]
+
+        response, body = self.request('POST', '/batch?deadline=2', json.dumps(queries))
+        records = dict([(record['name'], record) for record in [json.loads(line) for line in body.splitlines()]])
+
+        self.assertEqual(200, response.status)
+        self.assertEqual('chunked', response.getheader('Transfer-Encoding'))
+        self.assertEqual(3, len(records))
+        self.assertEqual('10.0.0.1', records['www.mattdavid.bit']['value'])
+        self.assertEqual('v=spf1 -all', records['mattdavid.bit']['value'])
+        self.assertEqual('EmptyResultException', records['empty.mattdavid.bit']['error'])
+        self.mockResolver.resolve_with_ttl.assert_any_call('mattdavid.bit', 'TXT', 2.0)
+
+        # The connection stays usable after a chunked response
+        self.assertEqual(200, self.request('GET', '/health')[0].status)
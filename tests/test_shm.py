@@ -0,0 +1,216 @@
+__author__ = 'mdavid'
+
+import fcntl
+import os
+import tempfile
+from mock import *
+from unittest import TestCase
+from bcresolver.cache import TTLCache, sizeof
+from bcresolver.records import Delegation, NamecoinRecord
+from bcresolver.shm import SLOT_HEADER, SEQUENCE, SharedMemoryCache, key_hash
+
+class TestSharedMemoryCache(TestCase):
+
+    def setUp(self):
+
+        self.shared = SharedMemoryCache(size=64 * 1024, slot_size=256, ways=2)
+
+    def tearDown(self):
+
+        self.shared.close()
+
+    def test_go_right(self):
+
+        self.assertTrue(self.shared.set(('answer', ('www.testdomain.bit', 'A')), '10.0.0.1', 2000.0))
+        self.assertEqual(('10.0.0.1', 2000.0), self.shared.get(('answer', ('www.testdomain.bit', 'A'))))
+        self.assertEqual((None, None), self.shared.get(('answer', ('www.testdomain.bit', 'AAAA'))))
+
+    def test_slots_objects(self):
+
+        record = NamecoinRecord({u'ns': [u'ns1.testdomain.bit'], u'ip': u'10.0.0.1'})
+        self.shared.set(('nc', 'testdomain'), record, 2000.0)
+        self.shared.set(('delegation', 'testdomain'), Delegation('testdomain.bit.', ['ns1.testdomain.bit'], 'ds'), 2000.0)
+
+        self.assertEqual(('ns1.testdomain.bit',), self.shared.get(('nc', 'testdomain'))[0].ns)
+        self.assertEqual('testdomain.bit.', self.shared.get(('delegation', 'testdomain'))[0].sld)
+
+    def test_too_large(self):
+
+        self.assertFalse(self.shared.set('key', 'x' * 1024, 2000.0))
+        self.assertEqual((None, None), self.shared.get('key'))
+
+    def test_full_bucket_evicts_earliest_expiry(self):
+
+        shared = SharedMemoryCache(size=1024, slot_size=256, ways=3)
+        self.assertEqual(1, shared.buckets)
+
+        shared.set('a', 1, 3000.0)
+        shared.set('b', 2, 1000.0)
+        shared.set('c', 3, 2000.0)
+        shared.set('d', 4, 4000.0)
+
+        self.assertEqual((None, None), shared.get('b'))
+        self.assertEqual([1, 3, 4], [shared.get(key)[0] for key in ('a', 'c', 'd')])
+
+    def test_overwrite_after_earlier_slot_freed(self):
+
+        shared = SharedMemoryCache(size=1024, slot_size=256, ways=3)
+
+        shared.set('a', 1, 3000.0)
+        shared.set('key', 'old', 9000.0)
+        shared.delete('a')
+        shared.set('key', 'new', 1000.0)
+
+        self.assertEqual(1, len([offset for offset in shared._slot_offsets(key_hash('key')) if SLOT_HEADER.unpack_from(shared._map, offset)[3] == key_hash('key')]))
+
+        # Evicting the new value must not bring the old one back
+        shared.set('b', 2, 4000.0)
+        shared.set('c', 3, 5000.0)
+        shared.set('d', 4, 6000.0)
+        self.assertEqual((None, None), shared.get('key'))
+
+    def test_duplicate_slots_cleared(self):
+
+        shared = SharedMemoryCache(size=1024, slot_size=256, ways=3)
+        offsets = shared._slot_offsets(key_hash('key'))
+
+        # Left behind by an older version of the table
+        shared.set('key', 'old', 9000.0)
+        shared.set('a', 1, 3000.0)
+        shared._write_slot(offsets[1], key_hash('key'), shared._map[offsets[0] + SLOT_HEADER.size:offsets[0] + SLOT_HEADER.size + SLOT_HEADER.unpack_from(shared._map, offsets[0])[1]], 9000.0)
+
+        shared.set('key', 'new', 1000.0)
+
+        self.assertEqual(('new', 1000.0), shared.get('key'))
+        self.assertEqual(0, SLOT_HEADER.unpack_from(shared._map, offsets[1])[1])
+
+    def test_bucket_locked_while_writing(self):
+
+        offsets = self.shared._slot_offsets(key_hash('key'))
+        with patch('bcresolver.shm.fcntl.lockf') as mockLockf:
+            self.shared.set('key', 'value', 2000.0)
+
+        self.assertEqual([call(self.shared._fd, fcntl.LOCK_EX, 2 * 256, offsets[0]), call(self.shared._fd, fcntl.LOCK_UN, 2 * 256, offsets[0])], mockLockf.call_args_list)
+
+    def test_overwrite_and_delete(self):
+
+        self.shared.set('key', 'old', 2000.0)
+        self.shared.set('key', 'new', 3000.0)
+        self.assertEqual(('new', 3000.0), self.shared.get('key'))
+
+        self.shared.delete('key')
+        self.assertEqual((None, None), self.shared.get('key'))
+
+    def test_slot_being_written_is_a_miss(self):
+
+        self.shared.set('key', 'value', 2000.0)
+        for offset in self.shared._slot_offsets(key_hash('key')):
+            if SLOT_HEADER.unpack_from(self.shared._map, offset)[1]:
+                SEQUENCE.pack_into(self.shared._map, offset, SEQUENCE.unpack_from(self.shared._map, offset)[0] + 1)
+
+        self.assertEqual((None, None), self.shared.get('key'))
+        self.assertEqual(1, self.shared.stats['torn_reads'])
+
+    def test_shared_with_forked_child(self):
+
+        pid = os.fork()
+        if pid == 0:
+            self.shared.set('key', 'from child', 2000.0)
+            os._exit(0)
+
+        os.waitpid(pid, 0)
+        self.assertEqual(('from child', 2000.0), self.shared.get('key'))
+
+    def test_shared_by_path(self):
+
+        path = os.path.join(tempfile.mkdtemp(), 'bcresolver.cache')
+        first = SharedMemoryCache(path, size=64 * 1024, slot_size=256)
+        second = SharedMemoryCache(path, size=1024 * 1024, slot_size=512)
+
+        first.set('key', 'value', 2000.0)
+
+        self.assertEqual(('value', 2000.0), second.get('key'))
+        self.assertEqual((first.buckets, 256), (second.buckets, second.slot_size))
+        self.assertEqual(0600, os.stat(path).st_mode & 0777)
+
+        first.close()
+        second.close()
+        os.unlink(path)
+
+class TestTTLCacheShared(TestCase):
+
+    def setUp(self):
+
+        self.patcher1 = patch('bcresolver.cache.time')
+        self.mockTime = self.patcher1.start()
+        self.mockTime.time.return_value = 1000.0
+
+        self.shared = SharedMemoryCache(size=64 * 1024, slot_size=256)
+        self.cache = TTLCache(ttl=60, stale_ttl=100, shared=self.shared, namespace='answer')
+        self.other = TTLCache(ttl=60, stale_ttl=100, shared=self.shared, namespace='answer')
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.shared.close()
+
+    def test_go_right(self):
+
+        self.cache.set('key', 'value')
+
+        self.mockTime.time.return_value = 1010.0
+        self.assertEqual(('value', 50), self.other.get_with_ttl('key'))
+        self.assertEqual(1, len(self.other))
+
+    def test_namespaces(self):
+
+        self.cache.set('key', 'value')
+        self.assertIsNone(TTLCache(shared=self.shared, namespace='nc').get('key'))
+
+    def test_expired_shared_entry_served_stale(self):
+
+        self.cache.set('key', 'value')
+        self.mockTime.time.return_value = 1100.0
+
+        self.assertIsNone(self.other.get('key'))
+        self.assertEqual('value', self.other.get_stale('key'))
+
+        self.mockTime.time.return_value = 1200.0
+        self.assertIsNone(TTLCache(stale_ttl=100, shared=self.shared, namespace='answer').get_stale('key'))
+
+    def test_fresh_shared_entry_replaces_stale_local_entry(self):
+
+        self.cache.set('key', 'old')
+        self.mockTime.time.return_value = 1100.0
+        self.assertIsNone(self.cache.get('key'))
+
+        self.other.set('key', 'new')
+
+        self.assertEqual(('new', 60), self.cache.get_with_ttl('key'))
+        self.assertEqual('new', self.cache.get_stale('key'))
+        self.assertEqual(1, len(self.cache))
+
+    def test_fresh_shared_entry_after_grace_period(self):
+
+        cache = TTLCache(ttl=60, max_bytes=1024, stale_ttl=100, shared=self.shared, namespace='answer')
+        cache.set('key', 'old')
+        self.mockTime.time.return_value = 1200.0
+        self.other.set('key', 'new')
+
+        self.assertEqual('new', cache.get('key'))
+        self.assertEqual(sizeof('key') + sizeof('new'), cache.bytes)
+
+    def test_delete(self):
+
+        self.cache.set('key', 'value')
+        self.other.delete('key')
+
+        self.assertIsNone(TTLCache(shared=self.shared, namespace='answer').get('key'))
+
+    def test_byte_budget(self):
+
+        self.cache.set('key', 'value')
+        cache = TTLCache(max_bytes=1024, shared=self.shared, namespace='answer')
+
+        self.assertEqual('value', cache.get('key'))
+        self.assertTrue(cache.bytes > 0)
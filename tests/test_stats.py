@@ -0,0 +1,92 @@
+__author__ = 'mdavid'
+
+from unittest import TestCase
+from bcresolver.stats import LatencyTracker, SpaceSaving
+
+class TestLatencyTracker(TestCase):
+
+    def test_go_right(self):
+
+        tracker = LatencyTracker(size=100, min_samples=10)
+        for i in range(100):
+            tracker.record(i / 100.0)
+
+        self.assertEqual(100, len(tracker))
+        self.assertEqual(0.5, tracker.percentile(0.5))
+        self.assertEqual(0.95, tracker.percentile(0.95))
+        self.assertEqual(0.99, tracker.percentile(1.0))
+
+    def test_not_enough_samples(self):
+
+        tracker = LatencyTracker(min_samples=10)
+        for i in range(9):
+            tracker.record(0.1)
+
+        self.assertIsNone(tracker.percentile(0.95))
+
+    def test_sliding_window(self):
+
+        tracker = LatencyTracker(size=10, min_samples=1)
+        for i in range(10):
+            tracker.record(10.0)
+        for i in range(10):
+            tracker.record(1.0)
+
+        self.assertEqual(10, len(tracker))
+        self.assertEqual(1.0, tracker.percentile(0.99))
+
+class TestSpaceSaving(TestCase):
+
+    def test_go_right(self):
+
+        sketch = SpaceSaving(capacity=10)
+        for i in range(100):
+            sketch.add('hot')
+            if i % 2:
+                sketch.add('warm')
+            sketch.add('cold%d' % i)
+
+        top = sketch.top(2)
+        self.assertEqual(['hot', 'warm'], [key for key, count, error in top])
+        self.assertTrue(top[0][1] >= 100 and top[0][1] - top[0][2] <= 100)
+        self.assertEqual(10, len(sketch))
+        self.assertEqual(250, sketch.total)
+
+    def test_exact_below_capacity(self):
+
+        sketch = SpaceSaving(capacity=10)
+        for key, count in (('a', 5), ('b', 3), ('c', 1)):
+            sketch.add(key, count)
+
+        self.assertEqual([('a', 5, 0), ('b', 3, 0), ('c', 1, 0)], sketch.top())
+        self.assertEqual((3, 0), sketch.count('b'))
+        self.assertEqual((0, 0), sketch.count('d'))
+
+    def test_replaces_least_counted(self):
+
+        sketch = SpaceSaving(capacity=2)
+        sketch.add('a', 5)
+        sketch.add('b', 2)
+        sketch.add('c')
+
+        self.assertNotIn('b', sketch)
+        self.assertEqual((3, 2), sketch.count('c'))
+
+    def test_decay(self):
+
+        sketch = SpaceSaving(capacity=10)
+        sketch.add('a', 8)
+        sketch.add('b', 1)
+        sketch.decay()
+
+        self.assertEqual([('a', 4, 0)], sketch.top())
+        self.assertEqual(4, sketch.total)
+
+    def test_heap_compacted(self):
+
+        sketch = SpaceSaving(capacity=2)
+        for i in range(100):
+            sketch.add('a')
+
+        self.assertTrue(len(sketch._heap) <= 8)
+        self.assertEqual((100, 0), sketch.count('a'))
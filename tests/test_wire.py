@@ -0,0 +1,78 @@
+__author__ = 'mdavid'
+
+import struct
+from unittest import TestCase
+from bcresolver import wire
+
+def make_query(name, rrtype=1, msg_id=0x1234, flags=wire.FLAG_RD):
+    return struct.pack('!HHHHHH', msg_id, flags, 1, 0, 0, 0) + wire.encode_name(name) + struct.pack('!HH', rrtype, 1)
+
+class TestParseQuestion(TestCase):
+
+    def test_go_right(self):
+
+        question = wire.parse_question(make_query('www.MattDavid.bit', 28))
+
+        self.assertEqual(0x1234, question.id)
+        self.assertEqual('www.MattDavid.bit', question.name)
+        self.assertEqual(28, question.rrtype)
+        self.assertEqual(1, question.rrclass)
+        self.assertEqual(12 + len(question.raw), question.end)
+
+    def test_short_message(self):
+
+        self.assertRaises(wire.WireFormatException, wire.parse_question, '\x00' * 5)
+
+    def test_truncated_question(self):
+
+        self.assertRaises(wire.WireFormatException, wire.parse_question, make_query('mattdavid.bit')[:-3])
+
+    def test_response_rejected(self):
+
+        self.assertRaises(wire.WireFormatException, wire.parse_question, make_query('mattdavid.bit', flags=wire.FLAG_QR))
+
+class TestResponses(TestCase):
+
+    def setUp(self):
+
+        self.question = wire.parse_question(make_query('mattdavid.bit'))
+        self.response = wire.build_response(self.question, answers=[
+            (1, 300, wire.encode_rdata(1, '10.0.0.1')),
+            (1, 60, wire.encode_rdata(1, '10.0.0.2'))
+        ], authenticated=True)
+
+    def test_build_response(self):
+
+        msg_id, flags, qdcount, ancount, nscount, arcount = struct.unpack_from('!HHHHHH', self.response)
+
+        self.assertEqual(0x1234, msg_id)
+        self.assertEqual(wire.FLAG_QR | wire.FLAG_RA | wire.FLAG_RD | wire.FLAG_AD, flags)
+        self.assertEqual((1, 2, 0, 0), (qdcount, ancount, nscount, arcount))
+        self.assertTrue(self.response.endswith('\x0a\x00\x00\x02'))
+
+    def test_ttl_offsets(self):
+
+        offsets, ttls = wire.ttl_offsets(self.response)
+
+        self.assertEqual((300, 60), ttls)
+        self.assertEqual([300, 60], [struct.unpack_from('!I', self.response, offset)[0] for offset in offsets])
+
+    def test_patch_response(self):
+
+        offsets, ttls = wire.ttl_offsets(self.response)
+        question = wire.parse_question(make_query('MATTDAVID.bit', msg_id=0xbeef, flags=0))
+
+        response = wire.patch_response(self.response, offsets, ttls, question, 100)
+
+        self.assertEqual(0xbeef, struct.unpack_from('!H', response)[0])
+        self.assertFalse(struct.unpack_from('!H', response, 2)[0] & wire.FLAG_RD)
+        self.assertEqual(question.raw, response[12:question.end])
+        self.assertEqual([200, 0], [struct.unpack_from('!I', response, offset)[0] for offset in offsets])
+        self.assertEqual(len(self.response), len(response))
+
+    def test_encode_rdata(self):
+
+        self.assertEqual('\x0a\x00\x00\x01', wire.encode_rdata(1, '10.0.0.1'))
+        self.assertEqual(16, len(wire.encode_rdata(28, '2001:db8::1')))
+        self.assertEqual('\x03www\x03bit\x00', wire.encode_rdata(5, 'www.bit.'))
+        self.assertRaises(NotImplementedError, wire.encode_rdata, 16, 'text')
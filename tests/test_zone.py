@@ -0,0 +1,365 @@
+__author__ = 'mdavid'
+
+import socket
+import struct
+import threading
+import time
+from mock import *
+from unittest import TestCase
+
+import dns.dnssec
+import dns.message
+import dns.name
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+import dns.rrset
+
+from bcresolver import NamecoinResolver
+from bcresolver.dnssec import ds_digest
+from bcresolver.records import Delegation
+from bcresolver.replay import StandInNamecoinResolver, StandInEngine
+from bcresolver.zone import MirroredZone, ZoneMirror, ZoneTransferException
+
+ZONE = dns.name.from_text('testdomain.bit.')
+DNSKEY = dns.rdata.from_text(dns.rdataclass.IN, dns.rdatatype.DNSKEY, '257 3 8 AwEAAcBMmWlC4b9wp6t5fFuN7SV2Du7VMmJyZ6sUgVaXYoIs0HFO8yKt')
+DS_TA = 'testdomain.bit. IN DS %d 8 2 %s' % (dns.dnssec.key_id(DNSKEY), ds_digest(ZONE, DNSKEY, 2).encode('hex'))
+
+def rrsig(covered, expiration='20301231000000'):
+    return '%s 8 2 3600 %s 20200101000000 12345 testdomain.bit. c2lnbmF0dXJl' % (covered, expiration)
+
+def signed(name, rdtype, *rdatas):
+    rrset = dns.rrset.from_text(name, 300, 'IN', rdtype, *rdatas)
+    return [rrset, dns.rrset.from_text(name, 300, 'IN', 'RRSIG', rrsig(rdtype))]
+
+def zone_rrsets(serial=5):
+
+    soa = 'ns1.testdomain.bit. admin.testdomain.bit. %d 3600 600 86400 300' % serial
+    rrsets = signed('testdomain.bit.', 'SOA', soa)
+    rrsets.append(dns.rrset.from_rdata(ZONE, 3600, DNSKEY))
+    rrsets.append(dns.rrset.from_text(ZONE, 3600, 'IN', 'RRSIG', rrsig('DNSKEY')))
+    rrsets += signed('testdomain.bit.', 'NS', 'ns1.testdomain.bit.')
+    rrsets += signed('www.testdomain.bit.', 'A', '10.0.0.1', '10.0.0.2')
+    rrsets += signed('mail.testdomain.bit.', 'CNAME', 'www.testdomain.bit.')
+    rrsets += signed('web.testdomain.bit.', 'CNAME', 'www.otherdomain.bit.')
+
+    # Delegation with glue, left unsigned
+    rrsets.append(dns.rrset.from_text('sub.testdomain.bit.', 300, 'IN', 'NS', 'ns1.sub.testdomain.bit.'))
+    rrsets.append(dns.rrset.from_text('ns1.sub.testdomain.bit.', 300, 'IN', 'A', '10.0.0.9'))
+    rrsets.append(dns.rrset.from_text('testdomain.bit.', 3600, 'IN', 'SOA', soa))
+    return rrsets
+
+class StandInAXFRServer:
+
+    def __init__(self):
+
+        # The UDP port picked by the OS may already be taken for TCP
+        for _ in range(20):
+            self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp.bind(('127.0.0.1', 0))
+            self.port = self.udp.getsockname()[1]
+
+            self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                self.tcp.bind(('127.0.0.1', self.port))
+                break
+            except socket.error:
+                self.udp.close()
+                self.tcp.close()
+        self.tcp.listen(5)
+
+        self.serial = 5
+        self.refused = False
+        self.rrsets = zone_rrsets
+        self.transfers = 0
+
+        for target in (self.serve_udp, self.serve_tcp):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def serve_udp(self):
+
+        while True:
+            wire, source = self.udp.recvfrom(65535)
+            query = dns.message.from_wire(wire)
+            response = dns.message.make_response(query)
+            response.answer.append(self.rrsets(self.serial)[0])
+            self.udp.sendto(response.to_wire(), source)
+
+    def serve_tcp(self):
+
+        while True:
+            conn, source = self.tcp.accept()
+            thread = threading.Thread(target=self.serve_connection, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def serve_connection(self, conn):
+
+        header = conn.recv(2)
+        query = dns.message.from_wire(conn.recv(struct.unpack('!H', header)[0]))
+        self.transfers += 1
+
+        response = dns.message.make_response(query)
+        if self.refused:
+            response.set_rcode(5)
+        else:
+            response.answer = self.rrsets(self.serial)
+
+        wire = response.to_wire()
+        conn.sendall(struct.pack('!H', len(wire)) + wire)
+        conn.close()
+
+class TestMirroredZone(TestCase):
+
+    def setUp(self):
+
+        rrsets = dict([((rrset.name, rrset.rdtype), rrset) for rrset in zone_rrsets() if rrset.rdtype != dns.rdatatype.RRSIG])
+        self.zone = MirroredZone(ZONE, DS_TA, '127.0.0.1', 5, rrsets, set([dns.name.from_text('sub.testdomain.bit.')]), time.time() + 120, 3600)
+
+    def test_go_right(self):
+
+        status, result = self.zone.lookup('www.testdomain.bit', dns.rdatatype.A)
+
+        self.assertEqual(0, status)
+        self.assertTrue(result.secure and result.havedata)
+        self.assertEqual(['10.0.0.1', '10.0.0.2'], sorted(result.data.as_address_list()))
+        self.assertIn(result.ttl, (119, 120))
+
+    def test_ttl_limited_by_expiry(self):
+
+        self.zone.expires = time.time() + 60.5
+        self.assertEqual(60, self.zone.lookup('www.testdomain.bit', dns.rdatatype.A)[1].ttl)
+
+    def test_cname(self):
+
+        self.assertEqual(['10.0.0.1', '10.0.0.2'], sorted(self.zone.lookup('mail.testdomain.bit', dns.rdatatype.A)[1].data.as_address_list()))
+        self.assertEqual(['www.testdomain.bit.'], self.zone.lookup('mail.testdomain.bit', dns.rdatatype.CNAME)[1].data.as_domain_list())
+
+        # CNAMEs out of the zone are resolved over the network
+        self.assertIsNone(self.zone.lookup('web.testdomain.bit', dns.rdatatype.A))
+
+    def test_not_answered(self):
+
+        self.assertIsNone(self.zone.lookup('missing.testdomain.bit', dns.rdatatype.A))
+        self.assertIsNone(self.zone.lookup('www.testdomain.bit', dns.rdatatype.AAAA))
+        self.assertIsNone(self.zone.lookup('ns1.sub.testdomain.bit', dns.rdatatype.A))
+        self.assertIsNone(self.zone.lookup('www.otherdomain.bit', dns.rdatatype.A))
+
+class TestZoneMirror(TestCase):
+
+    def setUp(self):
+
+        self.server = StandInAXFRServer()
+
+        self.patcher1 = patch('bcresolver.dnssec.validate')
+        self.patcher2 = patch('bcresolver.zone.validate')
+        self.mockKeyValidate = self.patcher1.start()
+        self.mockValidate = self.patcher2.start()
+
+        self.mirror = ZoneMirror(min_queries=2, timeout=2.0, port=self.server.port)
+        self.delegation = Delegation('testdomain.bit.', ('ns1.testdomain.bit',), DS_TA)
+
+        self.mockResolver = Mock()
+        self.mockResolver._get_delegation_addresses.return_value = ['127.0.0.1']
+
+    def tearDown(self):
+
+        self.patcher1.stop()
+        self.patcher2.stop()
+
+    def wait_for_zone(self):
+
+        expires = time.time() + 2.0
+        while 'testdomain.bit.' not in self.mirror.zones and time.time() < expires:
+            time.sleep(0.005)
+        return self.mirror.zones.get('testdomain.bit.')
+
+    def test_transfer(self):
+
+        mirrored = self.mirror.transfer(self.delegation, '127.0.0.1')
+
+        self.assertEqual(5, mirrored.serial)
+        self.assertEqual(set([dns.name.from_text('sub.testdomain.bit.')]), mirrored.cuts)
+        self.assertIn((dns.name.from_text('www.testdomain.bit.'), dns.rdatatype.A), mirrored.rrsets)
+        self.assertNotIn((dns.name.from_text('ns1.sub.testdomain.bit.'), dns.rdatatype.A), mirrored.rrsets)
+        self.assertEqual(3600, mirrored.refresh)
+
+        # Every signed RRset is validated, the delegation and its glue are not
+        self.assertEqual(6, self.mockValidate.call_count)
+        self.assertEqual({ZONE: mirrored.rrsets[(ZONE, dns.rdatatype.DNSKEY)]}, self.mockValidate.call_args[0][2])
+
+    def test_transfer_expiry(self):
+
+        self.server.rrsets = lambda serial: [dns.rrset.from_text(r.name, r.ttl, 'IN', 'RRSIG', rrsig(dns.rdatatype.to_text(r[0].type_covered), '20291231000000')) if r.rdtype == dns.rdatatype.RRSIG and r.name.to_text() == 'www.testdomain.bit.' else r for r in zone_rrsets(serial)]
+
+        mirrored = self.mirror.transfer(self.delegation, '127.0.0.1')
+        self.assertEqual(dns.rdata.from_text(dns.rdataclass.IN, dns.rdatatype.RRSIG, rrsig('A', '20291231000000')).expiration - 300, mirrored.expires)
+
+    def test_transfer_bogus(self):
+
+        self.mockValidate.side_effect = dns.dnssec.ValidationFailure('verify failure')
+        self.assertRaises(ZoneTransferException, self.mirror.transfer, self.delegation, '127.0.0.1')
+
+    def test_transfer_ds_mismatch(self):
+
+        self.mockKeyValidate.side_effect = dns.dnssec.ValidationFailure('verify failure')
+        self.assertRaises(ZoneTransferException, self.mirror.transfer, self.delegation, '127.0.0.1')
+
+    def test_transfer_unsigned(self):
+
+        self.server.rrsets = lambda serial: zone_rrsets(serial)[:1] + [dns.rrset.from_text('extra.testdomain.bit.', 300, 'IN', 'A', '10.0.0.3')] + zone_rrsets(serial)[1:]
+        self.assertRaises(ZoneTransferException, self.mirror.transfer, self.delegation, '127.0.0.1')
+
+    def test_transfer_too_large(self):
+
+        self.mirror.max_rrsets = 5
+        self.assertRaises(ZoneTransferException, self.mirror.transfer, self.delegation, '127.0.0.1')
+
+    def test_lookup_after_threshold(self):
+
+        self.assertIsNone(self.mirror.lookup(self.mockResolver, self.delegation, 'www.testdomain.bit', dns.rdatatype.A))
+        self.assertIsNone(self.mirror.lookup(self.mockResolver, self.delegation, 'www.testdomain.bit', dns.rdatatype.A))
+        self.assertIsNotNone(self.wait_for_zone())
+
+        status, result = self.mirror.lookup(self.mockResolver, self.delegation, 'www.testdomain.bit', dns.rdatatype.A)
+        self.assertEqual(['10.0.0.1', '10.0.0.2'], sorted(result.data.as_address_list()))
+        self.assertIsNone(self.mirror.lookup(self.mockResolver, self.delegation, 'missing.testdomain.bit', dns.rdatatype.A))
+
+        report = self.mirror.report()
+        self.assertEqual(1, report['transfers'])
+        self.assertEqual(1, report['hits'])
+        self.assertEqual(1, report['misses'])
+        self.assertEqual({'serial': 5, 'rrsets': 6}, report['zones']['testdomain.bit.'])
+
+    def test_refused(self):
+
+        self.server.refused = True
+        self.mirror.lookup(self.mockResolver, self.delegation, 'www.testdomain.bit', dns.rdatatype.A)
+        self.mirror.lookup(self.mockResolver, self.delegation, 'www.testdomain.bit', dns.rdatatype.A)
+
+        expires = time.time() + 2.0
+        while not self.mirror.stats['failed'] and time.time() < expires:
+            time.sleep(0.005)
+        self.assertEqual(1, self.mirror.stats['failed'])
+
+        # Not retried before retry_interval
+        time.sleep(0.05)
+        for _ in range(4):
+            self.mirror.lookup(self.mockResolver, self.delegation, 'www.testdomain.bit', dns.rdatatype.A)
+        time.sleep(0.05)
+        self.assertEqual(1, self.server.transfers)
+
+    def test_unexpected_error_backs_off(self):
+
+        self.mockValidate.side_effect = NotImplementedError('DNSSEC validation requires pycryptodome')
+        for _ in range(2):
+            self.mirror.lookup(self.mockResolver, self.delegation, 'www.testdomain.bit', dns.rdatatype.A)
+
+        expires = time.time() + 2.0
+        while not self.mirror.stats['failed'] and time.time() < expires:
+            time.sleep(0.005)
+        self.assertEqual(1, self.mirror.stats['failed'])
+
+        time.sleep(0.05)
+        for _ in range(4):
+            self.mirror.lookup(self.mockResolver, self.delegation, 'www.testdomain.bit', dns.rdatatype.A)
+        time.sleep(0.05)
+        self.assertEqual(1, self.server.transfers)
+        self.assertEqual(1, self.mirror.stats['failed'])
+
+    def test_ds_changed(self):
+
+        self.mirror.zones['testdomain.bit.'] = self.mirror.transfer(self.delegation, '127.0.0.1')
+        delegation = Delegation('testdomain.bit.', ('ns1.testdomain.bit',), DS_TA.replace(' 8 2 ', ' 8 1 '))
+
+        self.assertIsNone(self.mirror.lookup(self.mockResolver, delegation, 'www.testdomain.bit', dns.rdatatype.A))
+        self.assertEqual({}, self.mirror.zones)
+        self.assertEqual(1, self.mirror.stats['expired'])
+
+    def test_signatures_expiring(self):
+
+        mirrored = self.mirror.transfer(self.delegation, '127.0.0.1')
+        mirrored.expires = time.time() - 1
+        self.mirror.zones['testdomain.bit.'] = mirrored
+
+        self.assertIsNone(self.mirror.lookup(self.mockResolver, self.delegation, 'www.testdomain.bit', dns.rdatatype.A))
+        self.assertEqual({}, self.mirror.zones)
+
+    def test_serial_changed(self):
+
+        mirrored = self.mirror.transfer(self.delegation, '127.0.0.1')
+        mirrored.next_check = time.time() - 1
+        self.mirror.zones['testdomain.bit.'] = mirrored
+        self.server.serial = 6
+
+        # The current copy keeps answering while the serial is checked
+        self.assertIsNotNone(self.mirror.lookup(self.mockResolver, self.delegation, 'www.testdomain.bit', dns.rdatatype.A))
+
+        expires = time.time() + 2.0
+        while (self.mirror.zones.get('testdomain.bit.') is None or self.mirror.zones['testdomain.bit.'].serial != 6) and time.time() < expires:
+            time.sleep(0.005)
+
+        self.assertEqual(6, self.mirror.zones['testdomain.bit.'].serial)
+        self.assertEqual(1, self.mirror.stats['checks'])
+        self.assertEqual(1, self.mirror.stats['changed'])
+
+    def test_serial_unchanged(self):
+
+        mirrored = self.mirror.transfer(self.delegation, '127.0.0.1')
+        mirrored.next_check = time.time() - 1
+        self.mirror.zones['testdomain.bit.'] = mirrored
+
+        self.mirror.lookup(self.mockResolver, self.delegation, 'www.testdomain.bit', dns.rdatatype.A)
+
+        expires = time.time() + 2.0
+        while not self.mirror.stats['checks'] and time.time() < expires:
+            time.sleep(0.005)
+
+        self.assertIs(mirrored, self.mirror.zones['testdomain.bit.'])
+        self.assertEqual(1, self.server.transfers)
+
+class TestResolverZoneMirror(TestCase):
+
+    def setUp(self):
+
+        self.engine = StandInEngine()
+        self.engine.query = Mock(wraps=self.engine.query)
+        self.mirror = Mock()
+        self.nc_resolver = NamecoinResolver(nc_name_resolver=StandInNamecoinResolver, engine=self.engine, zone_mirror=self.mirror)
+
+        rrsets = dict([((rrset.name, rrset.rdtype), rrset) for rrset in zone_rrsets() if rrset.rdtype != dns.rdatatype.RRSIG])
+        zone = MirroredZone(ZONE, DS_TA, '127.0.0.1', 5, rrsets, set(), time.time() + 120, 3600)
+        self.mirror.lookup.side_effect = lambda resolver, delegation, name, rrtype: zone.lookup(name.replace('mattdavid', 'testdomain'), rrtype)
+
+    def test_resolve(self):
+
+        self.assertEqual('10.0.0.1', self.nc_resolver.resolve('www.mattdavid.bit', 'A'))
+        self.assertEqual(0, self.engine.query.call_count)
+        self.assertEqual('mattdavid.bit.', self.mirror.lookup.call_args[0][1].sld)
+
+        # Answers from the copy are cached
+        self.nc_resolver.resolve('www.mattdavid.bit', 'A')
+        self.assertEqual(1, self.mirror.lookup.call_count)
+
+    def test_resolve_not_mirrored(self):
+
+        self.nc_resolver.resolve('other.mattdavid.bit', 'A')
+        self.assertEqual(1, self.engine.query.call_count)
+
+    def test_resolve_all(self):
+
+        results = self.nc_resolver.resolve_all('www.mattdavid.bit', ['A', 'AAAA'])
+
+        self.assertEqual('10.0.0.1', results['A'])
+        self.assertEqual(1, self.engine.query.call_count)
+        self.assertEqual(dns.rdatatype.AAAA, self.engine.query.call_args[0][4])
+
+    def test_delegation_addresses(self):
+
+        addresses = self.nc_resolver._get_delegation_addresses(Delegation('mattdavid.bit.', ('ns1.mattdavid.bit', '10.0.0.53'), DS_TA))
+
+        self.assertEqual(2, len(addresses))
+        self.assertEqual('10.0.0.53', addresses[1])